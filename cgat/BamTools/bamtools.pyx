@@ -12,7 +12,7 @@ from pysam.libcalignmentfile cimport *
 from pysam.libcalignedsegment cimport pysam_bam_get_cigar, \
     pysam_bam_get_qname, pysam_get_n_cigar
 from pysam.libcfaidx cimport *
-from libc.string cimport strchr
+from libc.string cimport strchr, memmove, memset
 from libc.stdint cimport int8_t
 from libc.stdio cimport puts, printf
 from libc.stdlib cimport abs
@@ -27,14 +27,17 @@ import copy
 import struct
 import hashlib
 import itertools
+import multiprocessing
 import numpy
-import pandas
 import pysam
 import sys
 
 cimport numpy
 
 import cgatcore.experiment as E
+import cgat.LazyImport as LazyImport
+
+pandas = LazyImport.LazyModule("pandas")
 
 def parse_region_string(s):
     """parse a genomic region string.
@@ -85,6 +88,7 @@ cdef struct CountsType:
     int8_t is_qcfail
     int8_t is_duplicate
     int8_t is_supplementary
+    int8_t has_primary
     int32_t mean_quality
     int32_t median_quality
 
@@ -122,6 +126,568 @@ cdef get_cigar_stats(AlignedSegment read, uint32_t[:] base_counts, uint32_t[:] b
     return base_counts, block_counts
 
 
+# numpy equivalent of CountsType
+COUNTS_DTYPE = numpy.dtype(
+    [("read_length", numpy.int32)] +
+    [(x, numpy.int8) for x in (
+        "alignments", "is_mapped", "is_unmapped", "mate_is_unmapped",
+        "is_paired", "mapped_is_read1", "mapped_is_read2",
+        "unmapped_is_read1", "unmapped_is_read2", "is_proper_pair",
+        "is_secondary", "is_qcfail", "is_duplicate", "is_supplementary",
+        "has_primary")] +
+    [("mean_quality", numpy.int32), ("median_quality", numpy.int32)],
+    align=True)
+
+assert COUNTS_DTYPE.itemsize == sizeof(CountsType)
+
+# fields in CountsType set by the primary alignment of a read
+PRIMARY_FIELDS = ("read_length", "mean_quality", "median_quality")
+
+cdef int NFLAGS = len(FLAGS)
+
+
+cdef class Bam2StatsCounter:
+    '''mergeable accumulator for the alignment statistics
+    computed by :func:`bam2stats_count`.
+
+    Counters for consecutive parts of a :term:`bam` file can be
+    combined with :meth:`merge`.
+
+    If *count_reads* is set, per-read statistics are collected.
+    Reads are indexed by the md5 hash of their name in the order
+    they first appear. If *known_reads* is given, alignments of
+    reads not in *known_reads* are skipped. If *keep_names* is
+    set, the read names are kept in :attr:`names`.
+    '''
+
+    cdef public int64_t ninput
+    # number of reads present after filtering
+    cdef public int64_t nfiltered
+    cdef public int64_t nduplicates
+    # number of reads overlapping masked regions (if bed_mask != None)
+    cdef public int64_t nmasked
+    # number of reads not overlap RNA (if bed_mask != None)
+    cdef public int64_t nnotmasked
+    # number of alignments of reads not in known_reads
+    cdef public int64_t nnotfound
+    cdef public int max_hi
+    # number of alignment pairs that are nucleotide mismatches
+    cdef public int64_t mismatch_counts
+    # number of alignment pairs where there is an insertion in the reference
+    cdef public int64_t insertion_counts
+    # number of alignment pairs where there is a deletion in the reference
+    cdef public int64_t deletion_counts
+    # number of alignment pairs that are in match state
+    # (might be a nucleotide mismatch)
+    cdef public int64_t match_counts
+    cdef int64_t flags_counts[12]
+
+    # histograms of nh, nm tags and mapping quality
+    cdef public object nh_filtered
+    cdef public object nh_all
+    cdef public object nm_filtered
+    cdef public object nm_all
+    cdef public object mapq_filtered
+    cdef public object mapq_all
+
+    # per-read counts
+    cdef public bint count_reads
+    cdef public bint add_alignment_details
+    cdef public bint keep_names
+    cdef public object known_reads
+    cdef public object reads
+    cdef public object names
+    cdef public int64_t nreads
+    cdef public object read_counts
+    cdef public object alignment_details
+    cdef CountsType * _counts
+    cdef uint16_t * _details
+
+    def __init__(self,
+                 count_reads=False,
+                 add_alignment_details=False,
+                 keep_names=False,
+                 known_reads=None):
+        cdef int x
+
+        self.count_reads = count_reads
+        self.add_alignment_details = add_alignment_details
+        self.keep_names = keep_names
+        self.known_reads = known_reads
+
+        self.ninput = self.nfiltered = self.nduplicates = 0
+        self.nmasked = self.nnotmasked = self.nnotfound = 0
+        self.max_hi = 0
+        self.mismatch_counts = self.insertion_counts = 0
+        self.deletion_counts = self.match_counts = 0
+        for x from 0 <= x < NFLAGS:
+            self.flags_counts[x] = 0
+
+        self.nh_filtered = collections.defaultdict(int)
+        self.nm_filtered = collections.defaultdict(int)
+        self.nh_all = collections.defaultdict(int)
+        self.nm_all = collections.defaultdict(int)
+        self.mapq_filtered = collections.defaultdict(int)
+        self.mapq_all = collections.defaultdict(int)
+
+        self.reads = {}
+        self.names = []
+        self.nreads = 0
+        self.read_counts = numpy.zeros(0, dtype=COUNTS_DTYPE)
+        self.alignment_details = numpy.zeros(
+            (0, NCIGAR_CODES + 1), dtype=numpy.uint16)
+        self._resize(1024)
+
+    def __reduce__(self):
+        return (Bam2StatsCounter,
+                (self.count_reads,
+                 self.add_alignment_details,
+                 self.keep_names),
+                self.__getstate__())
+
+    def __getstate__(self):
+        return dict(
+            ninput=self.ninput,
+            nfiltered=self.nfiltered,
+            nduplicates=self.nduplicates,
+            nmasked=self.nmasked,
+            nnotmasked=self.nnotmasked,
+            nnotfound=self.nnotfound,
+            max_hi=self.max_hi,
+            mismatch_counts=self.mismatch_counts,
+            insertion_counts=self.insertion_counts,
+            deletion_counts=self.deletion_counts,
+            match_counts=self.match_counts,
+            flags_counts=self.getFlagsCounts(),
+            nh_filtered=self.nh_filtered,
+            nh_all=self.nh_all,
+            nm_filtered=self.nm_filtered,
+            nm_all=self.nm_all,
+            mapq_filtered=self.mapq_filtered,
+            mapq_all=self.mapq_all,
+            reads=self.reads,
+            names=self.names,
+            read_counts=self.read_counts[:self.nreads],
+            alignment_details=self.alignment_details[:self.nreads])
+
+    def __setstate__(self, state):
+        cdef int x
+        state = dict(state)
+        flags_counts = state.pop("flags_counts")
+        f = 1
+        for x from 0 <= x < NFLAGS:
+            self.flags_counts[x] = flags_counts[FLAGS[f]]
+            f = f << 1
+        read_counts = state.pop("read_counts")
+        alignment_details = state.pop("alignment_details")
+        for key, value in state.items():
+            setattr(self, key, value)
+        self.nreads = len(read_counts)
+        self.read_counts = read_counts
+        self.alignment_details = alignment_details
+        self._resize(max(1024, self.nreads))
+
+    cdef _resize(self, int64_t size):
+        '''resize per-read arrays to hold *size* reads.'''
+        cdef int64_t n = min(size, self.nreads)
+
+        read_counts = numpy.zeros(size, dtype=COUNTS_DTYPE)
+        read_counts[:n] = self.read_counts[:n]
+        self.read_counts = read_counts
+
+        if self.add_alignment_details:
+            alignment_details = numpy.zeros(
+                (size, NCIGAR_CODES + 1), dtype=numpy.uint16)
+            alignment_details[:n] = self.alignment_details[:n]
+            self.alignment_details = alignment_details
+
+        self._update_pointers()
+
+    cdef _update_pointers(self):
+        '''point to the data of the per-read arrays.'''
+        cdef uint8_t[:] view
+        self._counts = NULL
+        self._details = NULL
+        if len(self.read_counts) > 0:
+            view = self.read_counts.view(numpy.uint8)
+            self._counts = <CountsType *>&view[0]
+        if self.add_alignment_details and len(self.alignment_details) > 0:
+            view = self.alignment_details.reshape(-1).view(numpy.uint8)
+            self._details = <uint16_t *>&view[0]
+
+    cdef int64_t _add_read(self, bytes md5, bytes name) except -1:
+        '''add read with hash *md5* and return its index.'''
+        cdef int64_t read_index = self.nreads
+        if read_index >= len(self.read_counts):
+            self._resize(2 * len(self.read_counts))
+        self.reads[md5] = read_index
+        if self.keep_names:
+            self.names.append(name)
+        self.nreads += 1
+        return read_index
+
+    def getFlagsCounts(self):
+        '''return dictionary of alignment counts per flag.'''
+        cdef int x
+        t = {}
+        f = 1
+        for x from 0 <= x < NFLAGS:
+            t[FLAGS[f]] = self.flags_counts[x]
+            f = f << 1
+        return t
+
+    def count(self,
+              AlignmentFile samfile,
+              bed_mask=None,
+              ignore_masked_reads=False,
+              contig=None,
+              start=None,
+              end=None,
+              nalignments=0):
+        '''count alignments in *samfile*.
+
+        If *contig* is given, only alignments starting within
+        *contig*:*start*-*end* are counted. Use ``*`` to count
+        alignments without coordinates. Otherwise, all alignments
+        from the current position in *samfile* are counted.
+        '''
+        cdef AlignedSegment read
+        cdef bint _ignore_masked_reads = ignore_masked_reads
+        cdef bint _count_reads = self.count_reads
+        cdef bint _add_alignment_details = self.add_alignment_details
+        # alignments starting before *start* are counted in the
+        # previous region
+        cdef bint check_start = contig is not None and contig != "*"
+        cdef int64_t _start = start or 0
+
+        # helper variables
+        cdef int last_tid = -1
+        cdef int last_pos = 0
+        cdef int64_t read_index
+        cdef int contig_tid = -1
+
+        cdef int flag
+        cdef uint32_t iteration = 0
+        cdef uint32_t report_step = 1000000
+        cdef uint8_t * v
+        cdef int32_t nm
+        cdef int32_t nh
+        cdef int32_t hi
+        cdef int x
+        cdef uint32_t f
+
+        # Todo: make this filter configurable
+        cdef int detail_filter_flags = 2304
+
+        # detailed counting
+        cdef CountsType * read_count
+        cdef uint16_t * details
+        cdef char * read_name
+        cdef char * position
+        cdef int hash_size = 5
+
+        cdef int nfields = NCIGAR_CODES + 1
+
+        cdef c_array.array base_counts = array.array(
+            "I",
+            [0] * nfields)
+        cdef c_array.array block_counts = array.array(
+            "I",
+            [0] * nfields)
+
+        cdef uint32_t [:] base_counts_view = base_counts
+        cdef uint32_t [:] block_counts_view = block_counts
+
+        if contig is None:
+            iterator = samfile
+        elif contig == "*":
+            iterator = samfile.fetch("*")
+        else:
+            iterator = samfile.fetch(contig, start, end)
+
+        for iteration, read in enumerate(iterator):
+
+            if contig is None and iteration % report_step == 0:
+                if nalignments:
+                    E.info("read {}/{} alignments: {}%".format(
+                        iteration, nalignments,
+                        100.0 * iteration / nalignments))
+                else:
+                    E.info("read {} alignments".format(
+                        iteration))
+
+            if check_start and read._delegate.core.pos < _start:
+                continue
+
+            flag = read._delegate.core.flag
+            self.ninput += 1
+
+            f = 1
+            for x from 0 <= x < NFLAGS:
+                if flag & f:
+                    self.flags_counts[x] += 1
+                f = f << 1
+
+            # get maximum NI field
+            v = bam_aux_get(read._delegate, 'HI')
+            if v != NULL:
+                hi = <int32_t>bam_aux2i(v)
+                if hi > self.max_hi: self.max_hi = hi
+
+            v = bam_aux_get(read._delegate, 'NH')
+            if v != NULL:
+                nh = <int32_t>bam_aux2i(v)
+                self.nh_all[nh] += 1
+            else:
+                nh = -1
+
+            v = bam_aux_get(read._delegate, 'NM')
+            if v != NULL:
+                nm = <int32_t>bam_aux2i(v)
+                self.nm_all[nm] += 1
+            else:
+                nm = -1
+
+            self.mapq_all[read.mapq] += 1
+
+            get_cigar_stats(read, base_counts_view, block_counts_view)
+
+            if not read.is_secondary:
+                # for consistency with samtools
+                self.mismatch_counts += nm
+                self.deletion_counts += base_counts_view[BAM_CDEL]
+                self.insertion_counts += base_counts_view[BAM_CINS]
+                self.match_counts += base_counts_view[BAM_CMATCH]
+
+            if _count_reads:
+                read_name = pysam_bam_get_qname(read._delegate)
+                # terminate string at first space to
+                # truncate read names containing more than
+                # just the id
+                position = strchr(read_name, ' ')
+                if position != NULL:
+                    position[0] = '\0'
+
+                # compute hash, truncate to half the md5 digest which
+                # should be 64 bits and provides 36,893,488,147,419,103,232
+                # hashes.
+                md5 = hashlib.md5(read_name).digest()[:hash_size]
+                if self.known_reads is not None and \
+                   md5 not in self.known_reads:
+                    self.nnotfound += 1
+                    continue
+
+                try:
+                    read_index = self.reads[md5]
+                except KeyError:
+                    read_index = self._add_read(md5, read_name)
+
+                read_count = &self._counts[read_index]
+
+                # only take primary alignments for read length. read.query_length
+                # includes soft-clipped sequence.
+                if not read.is_secondary and not read.is_supplementary:
+                    read_count.has_primary = 1
+                    read_count.read_length = read.query_length
+                    q = read.query_qualities
+                    # multiply by 1000 to increase significant digits
+                    if q:
+                        read_count.mean_quality = round(numpy.mean(q) * 1000.0)
+                        read_count.median_quality = round(numpy.median(q) * 1000.0)
+                    else:
+                        read_count.mean_quality = 0
+                        read_count.median_quality = 0
+
+                # book-keeping counts
+                read_count.alignments += 1
+
+                if read.is_qcfail: read_count.is_qcfail += 1
+                if read.is_duplicate: read_count.is_duplicate += 1
+                if read.is_paired: read_count.is_paired += 1
+
+                if read.is_unmapped:
+                    read_count.is_unmapped += 1
+                    if read.is_read1: read_count.unmapped_is_read1 += 1
+                    if read.is_read2: read_count.unmapped_is_read2 += 1
+                else:
+                    # only count is_read1 and is_read2 for mapped
+                    read_count.is_mapped += 1
+                    if read.mate_is_unmapped: read_count.mate_is_unmapped += 1
+                    if read.is_read1: read_count.mapped_is_read1 += 1
+                    if read.is_read2: read_count.mapped_is_read2 += 1
+                    if read.is_proper_pair: read_count.is_proper_pair += 1
+                    if read.is_secondary:
+                        read_count.is_secondary += 1
+                    if read.is_supplementary:
+                        read_count.is_supplementary += 1
+                    if _add_alignment_details:
+                        if not (flag & detail_filter_flags):
+                            details = &self._details[read_index * nfields]
+                            for x from 0 <= x < nfields:
+                                details[x] += base_counts_view[x]
+
+            # skip unmapped reads
+            if read._delegate.core.flag & 4:
+                continue
+
+            if read.tid != contig_tid:
+                contig_tid = read.tid
+                read_contig = samfile.get_reference_name(contig_tid)
+
+            # note: does not take into account gaps within reads
+            # or partial overlap.
+            if bed_mask:
+                if bed_mask.contains(read_contig, read.pos, read.pos + read.alen):
+                    self.nmasked += 1
+                    if _ignore_masked_reads:
+                        continue
+                else:
+                    self.nnotmasked += 1
+
+            self.nfiltered += 1
+
+            if nh >= 0: self.nh_filtered[nh] += 1
+            if nm >= 0: self.nm_filtered[nm] += 1
+            self.mapq_filtered[read.mapq] += 1
+
+            # duplicate analysis - simply count per start position
+            # ignoring sequence and strand
+            if read.tid == last_tid and read.pos == last_pos:
+                self.nduplicates += 1
+                continue
+
+            last_tid, last_pos = read.tid, read.pos
+
+    def merge(self, Bam2StatsCounter other):
+        '''add counts in *other* to this counter.
+
+        *other* is assumed to have counted alignments following
+        those counted in this counter.
+        '''
+        cdef int x
+        cdef int64_t n = other.nreads
+
+        self.ninput += other.ninput
+        self.nfiltered += other.nfiltered
+        self.nduplicates += other.nduplicates
+        self.nmasked += other.nmasked
+        self.nnotmasked += other.nnotmasked
+        self.nnotfound += other.nnotfound
+        self.max_hi = max(self.max_hi, other.max_hi)
+        self.mismatch_counts += other.mismatch_counts
+        self.insertion_counts += other.insertion_counts
+        self.deletion_counts += other.deletion_counts
+        self.match_counts += other.match_counts
+        for x from 0 <= x < NFLAGS:
+            self.flags_counts[x] += other.flags_counts[x]
+
+        for histogram, other_histogram in (
+                (self.nh_filtered, other.nh_filtered),
+                (self.nh_all, other.nh_all),
+                (self.nm_filtered, other.nm_filtered),
+                (self.nm_all, other.nm_all),
+                (self.mapq_filtered, other.mapq_filtered),
+                (self.mapq_all, other.mapq_all)):
+            for key, value in other_histogram.items():
+                histogram[key] += value
+
+        if not self.count_reads or n == 0:
+            return
+
+        # map reads in other to reads in this counter, adding new
+        # reads in order of appearance.
+        if other.keep_names:
+            names = other.names
+        else:
+            names = itertools.repeat(None)
+        mapping = numpy.zeros(n, dtype=numpy.int64)
+        for md5, name in zip(other.reads, names):
+            try:
+                mapping[other.reads[md5]] = self.reads[md5]
+            except KeyError:
+                mapping[other.reads[md5]] = self._add_read(md5, name)
+
+        counts, other_counts = self.read_counts, other.read_counts[:n]
+        for field in COUNTS_DTYPE.names:
+            if field in PRIMARY_FIELDS or field == "has_primary":
+                continue
+            counts[field][mapping] += other_counts[field]
+
+        # primary alignment fields are taken from the last primary
+        # alignment of a read
+        has_primary = other_counts["has_primary"] != 0
+        for field in PRIMARY_FIELDS + ("has_primary",):
+            counts[field][mapping[has_primary]] = \
+                other_counts[field][has_primary]
+
+        if self.add_alignment_details:
+            self.alignment_details[mapping] += other.alignment_details[:n]
+
+    def reorder(self, reads, int64_t nreads):
+        '''re-index per-read counts by the read indices in *reads*
+        of a total of *nreads* reads.'''
+        mapping = numpy.array([reads[x] for x in self.reads],
+                              dtype=numpy.int64)
+        read_counts = numpy.zeros(nreads, dtype=COUNTS_DTYPE)
+        read_counts[mapping] = self.read_counts[:self.nreads]
+        self.read_counts = read_counts
+        if self.add_alignment_details:
+            alignment_details = numpy.zeros(
+                (nreads, NCIGAR_CODES + 1), dtype=numpy.uint16)
+            alignment_details[mapping] = \
+                self.alignment_details[:self.nreads]
+            self.alignment_details = alignment_details
+        self.reads = reads
+        self.names = []
+        self.nreads = nreads
+        self._update_pointers()
+
+
+def bam2stats_shards(AlignmentFile samfile, int nshards):
+    '''split the indexed *samfile* into regions of about equal
+    numbers of alignments.
+
+    Regions are returned as a list of tuples of (contig, start, end)
+    in the order of the file. The last region ``("*", None, None)``
+    contains alignments without coordinates.
+    '''
+    stats = [x for x in samfile.get_index_statistics() if x.total > 0]
+    total = sum([x.total for x in stats])
+    shard_size = max(1, total // max(1, nshards))
+
+    shards = []
+    for x in stats:
+        length = samfile.get_reference_length(x.contig)
+        nregions = min(length, max(1, x.total // shard_size))
+        starts = numpy.linspace(0, length, nregions + 1).astype(numpy.int64)
+        for start, end in zip(starts[:-1], starts[1:]):
+            shards.append((x.contig, int(start), int(end)))
+        # do not miss alignments starting beyond the contig end
+        shards[-1] = (x.contig, shards[-1][1], None)
+    shards.append(("*", None, None))
+    return shards
+
+
+_worker = {}
+
+
+def _init_worker(filename, kwargs, counter_kwargs):
+    _worker["samfile"] = AlignmentFile(filename)
+    _worker["kwargs"] = kwargs
+    _worker["counter_kwargs"] = counter_kwargs
+
+
+def _count_shard(shard):
+    contig, start, end = shard
+    counter = Bam2StatsCounter(**_worker["counter_kwargs"])
+    counter.count(_worker["samfile"],
+                  contig=contig,
+                  start=start,
+                  end=end,
+                  **_worker["kwargs"])
+    return counter
+
+
 def bam2stats_count(AlignmentFile samfile,
                     bed_mask=None,
                     ignore_masked_reads=False,
@@ -130,57 +696,18 @@ def bam2stats_count(AlignmentFile samfile,
                     outfile_details=None,
                     add_alignment_details=False,
                     outfile_readmap=None,
-                    detailed_count=None):
+                    detailed_count=None,
+                    num_jobs=1):
+    '''count alignments in *samfile*.
+
+    If *num_jobs* is larger than 1 and *samfile* is indexed, regions
+    of the file are counted in separate processes (see
+    :func:`bam2stats_shards`) and the counts are merged. The results
+    are identical to counting serially.
     '''
-    '''
-    cdef AlignedSegment read
+    cdef Bam2StatsCounter accumulator
     cdef bint _add_alignment_details = add_alignment_details
-    # counters
-    cdef int ninput = 0
-    cdef int nduplicates = 0
-    # number of reads present after filtering
-    cdef int nfiltered = 0
-    # number of reads overlapping masked regions (if bed_mask != None)
-    cdef int nmasked = 0
-    # number of reads not overlap RNA (if bed_mask != None)
-    cdef int nnotmasked = 0
-
-    cdef bint _ignore_masked_reads = ignore_masked_reads
-    cdef int max_hi = 0
-    # count nh, nm tags
-    nh_filtered = collections.defaultdict(int)
-    nm_filtered = collections.defaultdict(int)
-    nh_all = collections.defaultdict(int)
-    nm_all = collections.defaultdict(int)
-    mapq_filtered = collections.defaultdict(int)
-    mapq_all = collections.defaultdict(int)
-
-    cdef int * flags_counts = <int*>calloc(len(FLAGS), sizeof(int))
-
-    # helper variables
-    cdef int last_tid = -1
-    cdef int last_pos = 0
-    cdef int32_t read_index
-
-    duplicates = collections.defaultdict(int)
-    counts = collections.defaultdict(int)
-    cdef int count = 0
-
-    cdef int tid = -1
-    cdef int flag
-    cdef uint32_t iteration = 0
-    cdef uint32_t report_step = 1000000
-    cdef uint32_t nalignments = 0
-    cdef uint8_t * v
-    cdef int32_t nm
-    cdef int32_t nh
-    cdef int32_t hi
     cdef int x
-    cdef int lflags = len(FLAGS)
-    cdef uint32_t f
-
-    # Todo: make this filter configurable
-    cdef int detail_filter_flags = 2304
 
     # detailed counting
     cdef FastxRecord fq
@@ -188,36 +715,14 @@ def bam2stats_count(AlignmentFile samfile,
     cdef CountsType * fastq_counts
     cdef CountsType * fastq_count
     cdef char * read_name
-    cdef char * position
     cdef bint count_fastq = False
-    cdef int fastq_notfound = 0
     cdef int chop = 0
     cdef int hash_size = 5
-
-    # number of alignment pairs that are nucleotide mismatches
-    cdef long mismatch_counts = 0
-    # number of alignment pairs where there is an insertion in the reference
-    cdef long insertion_counts = 0
-    # number of alignment pairs where there is a deletion in the reference
-    cdef long deletion_counts = 0
-    # number of alignment pairs that are in match state
-    # (might be a nucleotide mismatch)
-    cdef long match_counts = 0
+    cdef uint32_t nalignments = 0
 
     cdef uint16_t [:, :] alignment_details_view
 
-    cdef int nfields = NCIGAR_CODES + 1
-
-    cdef c_array.array base_counts = array.array(
-        "I",
-         [0] * nfields)
-    cdef c_array.array block_counts = array.array(
-             "I",
-        [0] * nfields)
-
-    cdef uint32_t [:] base_counts_view = base_counts
-    cdef uint32_t [:] block_counts_view = block_counts
-
+    reads = None
     if filename_fastq != None:
         count_fastq = True
         E.info("reading fastq file")
@@ -246,222 +751,87 @@ def bam2stats_count(AlignmentFile samfile,
             reads[name] = fastq_nreads
 
             fastq_nreads += 1
+        E.info("read names of %i reads or read pairs" % fastq_nreads)
 
     elif not is_stdin and detailed_count:
+        # reads are indexed in order of appearance while counting
         count_fastq = True
-        old_pos = samfile.tell()
-        E.info("two-pass processing to collect read names")
-        reads = {}
-        fastq_nreads = 0
-        for iteration, read in enumerate(samfile):
-
-            if iteration % report_step == 0:
-                E.info("pre-pass: read {} alignments: {} reads".format(
-                    iteration, len(reads)))
-
-            read_name = pysam_bam_get_qname(read._delegate)
-
-            # terminate string at first space to
-            # truncate read names containing more than
-            # just the id
-            position = strchr(read_name, ' ')
-            if position != NULL:
-                position[0] = '\0'
-
-            # compute hash, truncate to half the md5 digest which
-            # should be 64 bits and provides 36,893,488,147,419,103,232
-            # hashes.
-            md5 = hashlib.md5(read_name).digest()[:hash_size]
-            if md5 not in reads:
-                reads[md5] = fastq_nreads
-                fastq_nreads += 1
-                if outfile_readmap:
-                    outfile_readmap.write("{}\t{}\n".format(
-                        read_name,
-                        base64.encodestring(md5)[:-1]))
-
-        samfile.seek(old_pos)
-        nalignments = iteration
     else:
         count_fastq = False
         E.info("simple counting only")
 
-    if count_fastq:
-        E.info("read names of %i reads or read pairs" % fastq_nreads)
-        E.info("allocating %i bytes" % (fastq_nreads * sizeof(CountsType)))
-
-        fastq_counts = <CountsType *>calloc(fastq_nreads, sizeof(CountsType))
-        if fastq_counts == NULL:
-            raise ValueError("could not allocate memory for %i bytes" %
-                             (fastq_nreads * sizeof(CountsType)))
-
-    if _add_alignment_details:
-        alignment_details = numpy.zeros((fastq_nreads, NCIGAR_CODES + 1), dtype=numpy.uint16)
-
-    E.info("starting processing of alignment file")
-
-    for iteration, read in enumerate(samfile):
-
-        if iteration % report_step == 0:
-            if nalignments:
-                E.info("read {}/{} alignments: {}%".format(
-                    iteration, nalignments,
-                    100.0 * iteration / nalignments))
-            else:
-                E.info("read {} alignments".format(
-                    iteration))
-
-        flag = read._delegate.core.flag
-        ninput += 1
-
-        f = 1
-        for x from 0 <= x < lflags:
-            if flag & f:
-                flags_counts[x] += 1
-            f = f << 1
+    counter_kwargs = dict(
+        count_reads=count_fastq,
+        add_alignment_details=_add_alignment_details,
+        keep_names=count_fastq and reads is None and outfile_readmap is not None)
+    count_kwargs = dict(
+        bed_mask=bed_mask,
+        ignore_masked_reads=ignore_masked_reads)
+
+    if not is_stdin and samfile.has_index():
+        nalignments = samfile.mapped + samfile.unmapped + samfile.nocoordinate
+
+    if num_jobs > 1 and (is_stdin or not samfile.has_index()):
+        E.warn("parallel counting requires an indexed bam file "
+               "- counting in a single process")
+        num_jobs = 1
+
+    accumulator = Bam2StatsCounter(known_reads=reads, **counter_kwargs)
+
+    if num_jobs > 1:
+        shards = bam2stats_shards(samfile, num_jobs * 4)
+        E.info("counting %i regions in %i processes" % (len(shards), num_jobs))
+        pool = multiprocessing.Pool(
+            num_jobs,
+            initializer=_init_worker,
+            initargs=(samfile.filename,
+                      count_kwargs,
+                      dict(known_reads=reads, **counter_kwargs)))
+        for x, shard_counter in enumerate(pool.imap(_count_shard, shards)):
+            accumulator.merge(shard_counter)
+            E.debug("merged region %i/%i" % (x + 1, len(shards)))
+        pool.close()
+        pool.join()
+    else:
+        E.info("starting processing of alignment file")
+        accumulator.count(samfile,
+                          nalignments=nalignments,
+                          **count_kwargs)
 
-        # get maximum NI field
-        v = bam_aux_get(read._delegate, 'HI')
-        if v != NULL:
-            hi = <int32_t>bam_aux2i(v)
-            if hi > max_hi: max_hi = hi
+    E.info( "finished computing counts" )
 
-        v = bam_aux_get(read._delegate, 'NH')
-        if v != NULL:
-            nh = <int32_t>bam_aux2i(v)
-            nh_all[nh] += 1
-        else:
-            nh = -1
+    if accumulator.nnotfound:
+        E.warn( "could not match %i records in bam-file to fastq file" % accumulator.nnotfound)
 
-        v = bam_aux_get(read._delegate, 'NM')
-        if v != NULL:
-            nm = <int32_t>bam_aux2i(v)
-            nm_all[nm] += 1
+    if count_fastq:
+        if reads is not None:
+            accumulator.reorder(reads, fastq_nreads)
         else:
-            nm = -1
-
-        mapq_all[read.mapq] += 1
-
-        get_cigar_stats(read, base_counts_view, block_counts_view)
-
-        if not read.is_secondary:
-            # for consistency with samtools
-            mismatch_counts += nm
-            deletion_counts += base_counts_view[BAM_CDEL]
-            insertion_counts += base_counts_view[BAM_CINS]
-            match_counts += base_counts_view[BAM_CMATCH]
-
-        if count_fastq:
-            read_name = pysam_bam_get_qname(read._delegate)
-            # terminate string at first space to
-            # truncate read names containing more than
-            # just the id
-            position = strchr(read_name, ' ')
-            if position != NULL:
-                position[0] = '\0'
-
-            md5 = hashlib.md5(read_name).digest()[:hash_size]
-            read_index = reads[md5]
-            try:
-                fastq_count = &fastq_counts[read_index]
-            except KeyError:
-                fastq_notfound += 1
-                continue
+            reads = accumulator.reads
+            fastq_nreads = accumulator.nreads
+            E.info("read names of %i reads or read pairs" % fastq_nreads)
 
-            # only take primary alignments for read length. read.query_length
-            # includes soft-clipped sequence.
-            if not read.is_secondary and not read.is_supplementary:
-                fastq_count.read_length = read.query_length
-                q = read.query_qualities
-                # multiply by 1000 to increase significant digits
-                if q:
-                    fastq_count.mean_quality = round(numpy.mean(q) * 1000.0)
-                    fastq_count.median_quality = round(numpy.median(q) * 1000.0)
-                else:
-                    fastq_count.mean_quality = 0
-                    fastq_count.median_quality = 0
-
-            # book-keeping counts
-            fastq_count.alignments += 1
-
-            if read.is_qcfail: fastq_count.is_qcfail += 1
-            if read.is_duplicate: fastq_count.is_duplicate += 1
-            if read.is_paired: fastq_count.is_paired += 1
-
-            if read.is_unmapped:
-                fastq_count.is_unmapped += 1
-                if read.is_read1: fastq_count.unmapped_is_read1 += 1
-                if read.is_read2: fastq_count.unmapped_is_read2 += 1
-            else:
-                # only count is_read1 and is_read2 for mapped
-                fastq_count.is_mapped += 1
-                if read.mate_is_unmapped: fastq_count.mate_is_unmapped += 1
-                if read.is_read1: fastq_count.mapped_is_read1 += 1
-                if read.is_read2: fastq_count.mapped_is_read2 += 1
-                if read.is_proper_pair: fastq_count.is_proper_pair += 1
-                if read.is_secondary:
-                    fastq_count.is_secondary += 1
-                if read.is_supplementary:
-                    fastq_count.is_supplementary += 1
-                if _add_alignment_details:
-                    if not (flag & detail_filter_flags):
-                        alignment_details[read_index, :] += base_counts_view
-
-        # is paired and read2
-        #if flag & 1 and flag & 128:
-            # ignore second reads to avoid double counting pairs
-            # this needs to be done properly by counting in
-            # pairs
-        #    continue
-
-        # skip unmapped reads
-        if read._delegate.core.flag & 4:
-            continue
-
-        if read.tid != last_tid:
-            contig = samfile.getrname(read.rname)
+        if outfile_readmap:
+            for read_name, md5 in zip(accumulator.names, reads):
+                outfile_readmap.write("{}\t{}\n".format(
+                    read_name,
+                    base64.encodebytes(md5)[:-1]))
 
-        # note: does not take into account gaps within reads
-        # or partial overlap.
-        if bed_mask:
-            if bed_mask.contains(contig, read.pos, read.pos + read.alen):
-                nmasked += 1
-                if _ignore_masked_reads:
-                    continue
-            else:
-                nnotmasked += 1
-
-        nfiltered += 1
-
-        if nh >= 0: nh_filtered[nh] += 1
-        if nm >= 0: nm_filtered[nm] += 1
-        mapq_filtered[read.mapq] += 1
-
-        # duplicate analysis - simply count per start position
-        # ignoring sequence and strand
-        if read.tid == last_tid and read.pos == last_pos:
-            count += 1
-            nduplicates += 1
-            continue
-
-        if count > 1:
-            counts[count] += 1
-
-        count = 1
-        last_tid, last_pos = read.tid, read.pos
-
-    E.info( "finished computing counts" )
-
-    if fastq_notfound:
-        E.warn( "could not match %i records in bam-file to fastq file" % fastq_notfound)
+        fastq_counts = accumulator._counts
+        alignment_details = accumulator.alignment_details
 
     counter = E.Counter()
 
-    counter.alignments_input = ninput
-    counter.alignments_filtered = nfiltered
-    counter.alignments_duplicates = nduplicates
-    counter.alignments_masked = nmasked
-    counter.alignments_notmasked = nnotmasked
+    counter.alignments_input = accumulator.ninput
+    counter.alignments_filtered = accumulator.nfiltered
+    counter.alignments_duplicates = accumulator.nduplicates
+    counter.alignments_masked = accumulator.nmasked
+    counter.alignments_notmasked = accumulator.nnotmasked
+
+    mismatch_counts = accumulator.mismatch_counts
+    insertion_counts = accumulator.insertion_counts
+    deletion_counts = accumulator.deletion_counts
+    match_counts = accumulator.match_counts
 
     if match_counts == 0:
         match_counts = 1
@@ -479,11 +849,7 @@ def bam2stats_count(AlignmentFile samfile,
     counter.insertion_rate = float(insertion_counts) / (match_counts + insertion_counts)
 
     # convert flags to labels
-    t = {}
-    f = 1
-    for x from 0 <= x < lflags:
-        t[FLAGS[f]] = flags_counts[x]
-        f = f << 1
+    t = accumulator.getFlagsCounts()
 
     # count based on fastq data
     cdef int total_paired = 0
@@ -666,12 +1032,12 @@ def bam2stats_count(AlignmentFile samfile,
         counter.total_read2_is_unmapped = total_read2_is_unmapped
         counter.total_read2_is_missing = total_read2_is_missing
 
-        substitution_rates = numpy.zeros(fastq_nreads, dtype=numpy.float)
-        insertion_rates = numpy.zeros(fastq_nreads, dtype=numpy.float)
-        deletion_rates = numpy.zeros(fastq_nreads, dtype=numpy.float)
-        error_rates = numpy.zeros(fastq_nreads, dtype=numpy.float)
-        coverages = numpy.zeros(fastq_nreads, dtype=numpy.float)
-        mask = numpy.ones(fastq_nreads, dtype=numpy.int)
+        substitution_rates = numpy.zeros(fastq_nreads, dtype=float)
+        insertion_rates = numpy.zeros(fastq_nreads, dtype=float)
+        deletion_rates = numpy.zeros(fastq_nreads, dtype=float)
+        error_rates = numpy.zeros(fastq_nreads, dtype=float)
+        coverages = numpy.zeros(fastq_nreads, dtype=float)
+        mask = numpy.ones(fastq_nreads, dtype=int)
 
         if outfile_details:
             header = ["read_md5",
@@ -711,7 +1077,7 @@ def bam2stats_count(AlignmentFile samfile,
                     fastq_count = &fastq_counts[read_index]
                     # remove "\n" from base64 encoded md5
                     outfile_details.write("%s\t%s" % (
-                        base64.encodestring(qname)[:-1].decode("ascii"),
+                        base64.encodebytes(qname)[:-1].decode("ascii"),
                         "\t".join( \
                                    map(str,
                                        (fastq_count.read_length,
@@ -841,13 +1207,13 @@ def bam2stats_count(AlignmentFile samfile,
         details_df = None
 
     return (counter, t,
-            nh_filtered,
-            nh_all,
-            nm_filtered,
-            nm_all,
-            mapq_filtered,
-            mapq_all,
-            max_hi,
+            accumulator.nh_filtered,
+            accumulator.nh_all,
+            accumulator.nm_filtered,
+            accumulator.nm_all,
+            accumulator.mapq_filtered,
+            accumulator.mapq_all,
+            accumulator.max_hi,
             details_df)
 
 
@@ -1332,6 +1698,271 @@ def bam2bam_filter_bam(AlignmentFile input_samfile,
     return c
 
 
+cdef int resize_field(bam1_t * b,
+                      uint8_t * field,
+                      int nbytes_old,
+                      int nbytes_new) except -1:
+    '''resize the field starting at *field* in the variable length
+    data of *b* from *nbytes_old* to *nbytes_new* bytes.'''
+    cdef int offset = field - b.data
+    cdef int new_size = b.l_data + nbytes_new - nbytes_old
+    cdef uint8_t * data
+    if new_size > <int>b.m_data:
+        data = <uint8_t*>realloc(b.data, new_size)
+        if data == NULL:
+            raise MemoryError("could not allocate memory for read")
+        b.data = data
+        b.m_data = new_size
+    memmove(b.data + offset + nbytes_new,
+            b.data + offset + nbytes_old,
+            b.l_data - offset - nbytes_old)
+    b.l_data = new_size
+    return 0
+
+
+cdef int set_query_sequence(bam1_t * b,
+                            int32_t l_qseq,
+                            uint8_t base,
+                            uint8_t quality) except -1:
+    '''set sequence of *b* to *l_qseq* copies of *base* (4-bit
+    encoded) with quality score *quality*. If *l_qseq* is 0,
+    sequence and qualities are removed.'''
+    resize_field(b, bam_get_seq(b),
+                 (b.core.l_qseq + 1) // 2 + b.core.l_qseq,
+                 (l_qseq + 1) // 2 + l_qseq)
+    b.core.l_qseq = l_qseq
+    cdef uint8_t * seq = bam_get_seq(b)
+    memset(seq, (base << 4) | base, (l_qseq + 1) // 2)
+    if l_qseq % 2:
+        seq[l_qseq // 2] = base << 4
+    memset(bam_get_qual(b), quality, l_qseq)
+    return 0
+
+
+cdef int set_single_match(bam1_t * b) except -1:
+    '''reduce *b* to a single matched base.
+
+    The kept base is the first aligned base of the read, or the last
+    aligned base if the read is on the reverse strand. Sequence and
+    qualities are shrunk to this base.'''
+    cdef uint32_t * cigar = bam_get_cigar(b)
+    cdef uint32_t k, op, l
+    cdef int32_t qpos = 0
+    cdef int32_t keep = -1
+    cdef bint is_reverse = b.core.flag & BAM_FREVERSE
+    for k in range(b.core.n_cigar):
+        op = cigar[k] & BAM_CIGAR_MASK
+        l = cigar[k] >> BAM_CIGAR_SHIFT
+        if op == BAM_CMATCH or op == BAM_CEQUAL or op == BAM_CDIFF:
+            if not is_reverse:
+                keep = qpos
+                break
+            keep = qpos + l - 1
+        if bam_cigar_type(op) & 1:
+            qpos += l
+
+    if b.core.l_qseq > 0:
+        if keep < 0 or keep >= b.core.l_qseq:
+            raise ValueError(
+                "no aligned base in read %s" %
+                bam_get_qname(b).decode("ascii"))
+        set_query_sequence(b, 1,
+                           bam_seqi(bam_get_seq(b), keep),
+                           bam_get_qual(b)[keep])
+
+    resize_field(b, <uint8_t*>bam_get_cigar(b), 4 * b.core.n_cigar, 4)
+    b.core.n_cigar = 1
+    bam_get_cigar(b)[0] = (1 << 4) | BAM_CMATCH
+    return 0
+
+
+def bam2bam_transform_reads(AlignmentFile input_samfile,
+                            AlignmentFile output_samfile,
+                            unset_unmapped_mapq=False,
+                            set_sequence=False,
+                            strip_sequence=False,
+                            strip_quality=False,
+                            strip_match=False,
+                            keep_first_base=False):
+    '''transform all reads in *input_samfile* and write them to
+    *output_samfile*.
+
+    Reads are read into a single record and modified in place
+    without creating python objects. The transformations are applied
+    in the following order:
+
+    *unset_unmapped_mapq*
+        set the mapping quality of unmapped reads to 0.
+    *set_sequence*
+        set sequence to ``A`` and quality to ``F`` for all bases.
+    *strip_sequence*
+        remove sequence and quality scores.
+    *strip_quality*
+        remove quality scores.
+    *strip_match*
+        remove sequence and quality scores from reads without
+        mismatches (NM=0).
+    *keep_first_base*
+        keep only the first aligned base.
+
+    Multi-threaded compression and decompression is enabled by
+    opening the files with the ``threads`` option.
+
+    Returns a counter.
+    '''
+
+    cdef bint c_unset_unmapped_mapq = unset_unmapped_mapq
+    cdef bint c_set_sequence = set_sequence
+    cdef bint c_strip_sequence = strip_sequence
+    cdef bint c_strip_quality = strip_quality
+    cdef bint c_strip_match = strip_match
+    cdef bint c_keep_first_base = keep_first_base
+
+    cdef htsFile * infile = input_samfile.htsfile
+    cdef htsFile * outfile = output_samfile.htsfile
+    cdef sam_hdr_t * inheader = input_samfile.header.ptr
+    cdef sam_hdr_t * outheader = output_samfile.header.ptr
+
+    cdef bam1_t * b = bam_init1()
+    cdef uint8_t * v
+    cdef int64_t nm
+    cdef hts_pos_t end
+    cdef int ret
+    cdef int ninput = 0
+    cdef int noutput = 0
+    cdef int nunset_mapq = 0
+    cdef int nstripped = 0
+    cdef int nfirst_base = 0
+    # 4-bit code for A
+    cdef uint8_t base_a = 1
+    # quality score of F
+    cdef uint8_t quality_f = ord("F") - 33
+
+    try:
+        while True:
+            with nogil:
+                ret = sam_read1(infile, inheader, b)
+            if ret < -1:
+                raise IOError("error while reading from %s" %
+                              input_samfile.filename)
+            if ret < 0:
+                break
+            ninput += 1
+
+            if c_unset_unmapped_mapq and b.core.flag & BAM_FUNMAP:
+                b.core.qual = 0
+                nunset_mapq += 1
+
+            if c_set_sequence:
+                # can't get at length of unmapped reads
+                if b.core.flag & BAM_FUNMAP:
+                    set_query_sequence(b, 1, base_a, quality_f)
+                else:
+                    set_query_sequence(
+                        b,
+                        bam_cigar2qlen(b.core.n_cigar, bam_get_cigar(b)),
+                        base_a,
+                        quality_f)
+
+            if c_strip_sequence:
+                set_query_sequence(b, 0, 0, 0)
+                nstripped += 1
+            elif c_strip_quality:
+                if b.core.l_qseq > 0:
+                    memset(bam_get_qual(b), 0xff, b.core.l_qseq)
+                nstripped += 1
+            elif c_strip_match:
+                v = bam_aux_get(b, "NM")
+                if v != NULL:
+                    nm = bam_aux2i(v)
+                else:
+                    nm = 1
+                if nm == 0:
+                    set_query_sequence(b, 0, 0, 0)
+                    nstripped += 1
+
+            if c_keep_first_base and not b.core.flag & BAM_FUNMAP:
+                if b.core.flag & BAM_FREVERSE:
+                    end = bam_endpos(b)
+                    b.core.pos = end - 1
+                set_single_match(b)
+                b.core.bin = hts_reg2bin(b.core.pos, bam_endpos(b), 14, 5)
+                nfirst_base += 1
+
+            with nogil:
+                ret = sam_write1(outfile, outheader, b)
+            if ret < 0:
+                raise IOError("error while writing to %s" %
+                              output_samfile.filename)
+            noutput += 1
+    finally:
+        bam_destroy1(b)
+
+    c = E.Counter()
+    c.input = ninput
+    c.output = noutput
+    c.unset_mapq = nunset_mapq
+    c.stripped = nstripped
+    c.first_base = nfirst_base
+    return c
+
+
+def bam_fetch_positions(AlignmentFile samfile,
+                        contig,
+                        int64_t start,
+                        int64_t end):
+    '''return coordinates of all reads in *samfile* overlapping the
+    region *contig*:*start*-*end* as numpy arrays.
+
+    Returns a tuple of arrays ``(starts, ends, lengths, flags)`` with
+    the alignment start and end, the query length and the flag of each
+    read in the order of the file. Reads are selected as in
+    :meth:`pysam.AlignmentFile.fetch`.
+    '''
+    samfile.check_index()
+    tids = dict((y, x) for x, y in enumerate(samfile.references))
+    if contig not in tids:
+        raise ValueError("invalid contig `%s`" % contig)
+
+    cdef int tid = tids[contig]
+    cdef htsFile * hts = samfile.htsfile
+    cdef hts_itr_t * itr = sam_itr_queryi(samfile.index, tid, start, end)
+    if itr == NULL:
+        raise ValueError("could not create iterator for %s" % contig)
+
+    cdef int64_t capacity = 1024
+    cdef int64_t n = 0
+    cdef int ret
+    cdef bam1_t * b = bam_init1()
+    data = numpy.zeros((4, capacity), dtype=numpy.int64)
+    cdef int64_t [:, ::1] c_data = data
+
+    try:
+        while True:
+            with nogil:
+                ret = sam_itr_next(hts, itr, b)
+            if ret < -1:
+                raise IOError("error while reading from %s" %
+                              samfile.filename)
+            if ret < 0:
+                break
+            if n == capacity:
+                capacity *= 2
+                data = numpy.concatenate((data, numpy.zeros_like(data)),
+                                         axis=1)
+                c_data = data
+            c_data[0, n] = b.core.pos
+            c_data[1, n] = bam_endpos(b)
+            c_data[2, n] = b.core.l_qseq
+            c_data[3, n] = b.core.flag
+            n += 1
+    finally:
+        sam_itr_destroy(itr)
+        bam_destroy1(b)
+
+    return data[0, :n], data[1, :n], data[2, :n], data[3, :n]
+
+
 cdef inline uint32_t get_alignment_length(bam1_t * src):
     cdef int k = 0
     cdef uint32_t l = 0
@@ -1718,6 +2349,268 @@ def bam2stats_window_count(AlignmentFile samfile,
     return window_df
 
 
+cdef inline int64_t find_exons(int64_t * starts,
+                               int64_t * ends,
+                               int64_t * maxends,
+                               int64_t n,
+                               int64_t start,
+                               int64_t end,
+                               int64_t * exon_start,
+                               int64_t * exon_end) nogil:
+    '''count exons overlapping *start*, *end* in sorted arrays and
+    set the smallest start and largest end of overlapping exons.'''
+    cdef int64_t lower = 0, upper = n, mid, i
+    cdef int64_t count = 0
+    # first exon with a running maximum of ends after start
+    while lower < upper:
+        mid = (lower + upper) // 2
+        if maxends[mid] > start:
+            upper = mid
+        else:
+            lower = mid + 1
+    i = lower
+    while i < n and starts[i] < end:
+        if ends[i] > start:
+            if count == 0:
+                exon_start[0] = starts[i]
+                exon_end[0] = ends[i]
+            elif ends[i] > exon_end[0]:
+                exon_end[0] = ends[i]
+            count += 1
+        i += 1
+    return count
+
+
+cdef inline int64_t splice_overrun(int64_t start,
+                                   int64_t end,
+                                   int64_t exon_start,
+                                   int64_t exon_end) nogil:
+    '''return splice site overrun (positive) or underrun (negative).'''
+    if start <= exon_start and end > exon_start:
+        return exon_start - start
+    elif start < exon_end and end >= exon_end:
+        return end - exon_end
+    elif start - exon_start < exon_end - end:
+        return -(start - exon_start)
+    else:
+        return -(exon_end - end)
+
+
+cdef inline void count_exon_overlap(bam1_t * b,
+                                    int64_t * starts,
+                                    int64_t * ends,
+                                    int64_t * maxends,
+                                    int64_t * offsets,
+                                    int nreferences,
+                                    int64_t offset,
+                                    int64_t * counts,
+                                    int64_t * unspliced_overrun,
+                                    int64_t * spliced_overrun) nogil:
+    '''count exon overlap of a single read, see
+    :func:`bam_vs_gtf_count`.'''
+    cdef uint32_t * cigar = bam_get_cigar(b)
+    cdef uint32_t ncigar = b.core.n_cigar
+    cdef uint32_t k
+    cdef bint is_spliced = False
+    cdef int64_t first = 0, n = 0
+    cdef int64_t start, end, block_start, block_end
+    cdef int64_t exon_start = 0, exon_end = 0
+    cdef int64_t o, overrun, nblocks
+
+    # indices into counts, see BAM_VS_GTF_COUNTS
+    counts[0] += 1
+    if b.core.flag & BAM_FUNMAP:
+        counts[1] += 1
+        return
+
+    for k in range(ncigar):
+        if cigar[k] & BAM_CIGAR_MASK == BAM_CREF_SKIP:
+            is_spliced = True
+            break
+
+    if 0 <= b.core.tid < nreferences:
+        first = offsets[b.core.tid]
+        n = offsets[b.core.tid + 1] - first
+    start = b.core.pos
+    end = bam_endpos(b)
+
+    if is_spliced:
+        counts[2] += 1
+        if ncigar != 3:
+            counts[3] += 1
+            return
+
+        nblocks = 0
+        for k in range(2):
+            if k == 0:
+                # 5' block
+                block_start = start
+                block_end = start + (cigar[0] >> BAM_CIGAR_SHIFT)
+            else:
+                # 3' block
+                block_start = end - (cigar[2] >> BAM_CIGAR_SHIFT)
+                block_end = end
+            if find_exons(starts + first, ends + first, maxends + first, n,
+                          block_start, block_end,
+                          &exon_start, &exon_end) == 0:
+                continue
+            nblocks += 1
+            o = splice_overrun(block_start, block_end, exon_start, exon_end)
+            if o == 0:
+                counts[7] += 1
+            else:
+                counts[8] += 1
+            spliced_overrun[max(0, min(2 * offset - 1, offset + o))] += 1
+        counts[4 + nblocks] += 1
+    else:
+        counts[9] += 1
+        if find_exons(starts + first, ends + first, maxends + first, n,
+                      start, end, &exon_start, &exon_end) == 0:
+            counts[10] += 1
+        else:
+            counts[11] += 1
+            overrun = max(0, exon_start - start) + max(0, end - exon_end)
+            unspliced_overrun[min(offset - 1, overrun)] += 1
+
+
+BAM_VS_GTF_COUNTS = ("input",
+                     "unmapped",
+                     "spliced",
+                     "spliced_ignored",
+                     "spliced_nooverlap",
+                     "spliced_halfoverlap",
+                     "spliced_bothoverlap",
+                     "spliced_exact",
+                     "spliced_inexact",
+                     "unspliced",
+                     "unspliced_nooverlap",
+                     "unspliced_overlap")
+
+
+def bam_vs_gtf_count(AlignmentFile samfile,
+                     exons,
+                     int read_length=200,
+                     contigs=None):
+    '''count overlap of reads in *samfile* with *exons*, an
+    :class:`IndexedGenome.SortedArray`.
+
+    Reads are read from the current position of *samfile* to the
+    end. If *contigs* is given, only reads on these contigs are
+    counted using the index of *samfile*. The contig ``*`` denotes
+    reads without coordinates.
+
+    Spliced reads are examined if they consist of exactly two blocks
+    separated by an intron. The overrun of each block is the distance
+    of its inner boundary to the closest boundary of the exons it
+    overlaps.
+
+    Returns a tuple ``(counter, unspliced_overrun, spliced_overrun)``.
+    The counter contains the counts listed in ``BAM_VS_GTF_COUNTS``.
+    *unspliced_overrun* is a histogram of the number of bases of
+    unspliced reads outside exons with ``read_length + 10`` bins.
+    *spliced_overrun* is a histogram of splice site over- and
+    underruns with ``2 * (read_length + 10)`` bins, where bin
+    ``read_length + 10`` is an exact match. Larger values are
+    counted in the last or first bin, respectively.
+    '''
+
+    cdef sam_hdr_t * header = samfile.header.ptr
+    cdef int nreferences = sam_hdr_nref(header)
+    cdef int64_t offset = read_length + 10
+
+    # concatenate exon arrays of all contigs in the order of the
+    # bam file. A dummy element avoids empty arrays.
+    offsets = numpy.zeros(nreferences + 2, dtype=numpy.int64)
+    starts, ends, maxends = [], [], []
+    for idx, reference in enumerate(samfile.references):
+        if reference in exons.mIndex:
+            arrays, data = exons.mIndex[reference].getArrays()
+            starts.append(arrays[0])
+            ends.append(arrays[1])
+            maxends.append(arrays[2])
+            offsets[idx + 1] = len(arrays[0])
+    starts.append(numpy.zeros(1, dtype=numpy.int64))
+    ends.append(numpy.zeros(1, dtype=numpy.int64))
+    maxends.append(numpy.zeros(1, dtype=numpy.int64))
+    offsets = numpy.cumsum(offsets)
+
+    cdef int64_t [::1] c_offsets = offsets
+    cdef int64_t [::1] c_starts = numpy.ascontiguousarray(
+        numpy.concatenate(starts), dtype=numpy.int64)
+    cdef int64_t [::1] c_ends = numpy.ascontiguousarray(
+        numpy.concatenate(ends), dtype=numpy.int64)
+    cdef int64_t [::1] c_maxends = numpy.ascontiguousarray(
+        numpy.concatenate(maxends), dtype=numpy.int64)
+
+    unspliced_overrun = numpy.zeros(offset, dtype=numpy.int64)
+    spliced_overrun = numpy.zeros(2 * offset, dtype=numpy.int64)
+    cdef int64_t [::1] c_unspliced_overrun = unspliced_overrun
+    cdef int64_t [::1] c_spliced_overrun = spliced_overrun
+    counts = numpy.zeros(len(BAM_VS_GTF_COUNTS), dtype=numpy.int64)
+    cdef int64_t [::1] c_counts = counts
+
+    cdef htsFile * hts = samfile.htsfile
+    cdef hts_itr_t * itr = NULL
+    cdef bam1_t * b = bam_init1()
+    cdef int ret, tid
+
+    if contigs is None:
+        regions = [None]
+    else:
+        samfile.check_index()
+        tids = dict((y, x) for x, y in enumerate(samfile.references))
+        regions = []
+        for contig in contigs:
+            if contig == "*":
+                regions.append(HTS_IDX_NOCOOR)
+            elif contig in tids:
+                regions.append(tids[contig])
+            else:
+                raise KeyError("contig %s not in bam file" % contig)
+
+    try:
+        for region in regions:
+            if region is not None:
+                tid = region
+                itr = sam_itr_queryi(samfile.index, tid, 0, HTS_POS_MAX)
+                if itr == NULL:
+                    raise ValueError("could not create iterator for %s" %
+                                     samfile.get_reference_name(tid))
+            while True:
+                with nogil:
+                    if itr == NULL:
+                        ret = sam_read1(hts, header, b)
+                    else:
+                        ret = sam_itr_next(hts, itr, b)
+                if ret < -1:
+                    raise IOError("error while reading from %s" %
+                                  samfile.filename)
+                if ret < 0:
+                    break
+                count_exon_overlap(b,
+                                   &c_starts[0],
+                                   &c_ends[0],
+                                   &c_maxends[0],
+                                   &c_offsets[0],
+                                   nreferences,
+                                   offset,
+                                   &c_counts[0],
+                                   &c_unspliced_overrun[0],
+                                   &c_spliced_overrun[0])
+            if itr != NULL:
+                sam_itr_destroy(itr)
+                itr = NULL
+    finally:
+        if itr != NULL:
+            sam_itr_destroy(itr)
+        bam_destroy1(b)
+
+    c = E.Counter()
+    for key, value in zip(BAM_VS_GTF_COUNTS, counts):
+        c[key] = int(value)
+    return c, unspliced_overrun, spliced_overrun
+
+
 def is_paired(bamfile, alignments=1000):
     '''check if a `bamfile` contains paired end data
 
@@ -1,10 +1,10 @@
 #cimport csamtools
 
+from pysam.libchtslib cimport *
 from pysam.libcalignmentfile cimport *
 import collections
 import cgatcore.experiment as E
 import numpy
-import cgat.Stats as Stats
 
 PeakShapeResult = collections.namedtuple(
     "PeakShapeResult",
@@ -12,27 +12,43 @@ PeakShapeResult = collections.namedtuple(
     "peak_center peak_width peak_height peak_relative_pos "
     "nreads "
     "median closest_half_height furthest_halfheight "
-    "bins counts" )
+    "bins counts",
+    module=__name__)
 
 PeakShapeCounts = collections.namedtuple(
     "PeakShapeCounts",
-    "nreads median counts" )
+    "nreads median counts",
+    module=__name__)
 
 cdef class Counter:
-    '''base class for counters computing densities 
+    '''base class for counters computing densities
     from genomic data.
 
     *smooth_method* is a function that will be applied
     before sampling the bins.
+
+    Densities for several intervals on a contig can be computed
+    in one batch (:meth:`countInIntervals` and
+    :meth:`countAroundPositions`). The histograms of a batch are
+    the rows of a matrix with one row per interval.
     '''
     cdef smooth_method
-    
+
     def __init__(self, smooth_method=None):
         self.smooth_method = smooth_method
 
-    def countAroundPos(self, 
+    def coverageInIntervals(self, infile, contig, starts, ends):
+        '''return list of tuples (nreads, counts) for windows on
+        *contig* bounded by *starts* and *ends*.
+
+        See :meth:`coverageInInterval`.
+        '''
+        return [self.coverageInInterval(infile, contig, start, end)
+                for start, end in zip(starts, ends)]
+
+    def countAroundPos(self,
                        infile,
-                       contig, 
+                       contig,
                        int pos,
                        bins,
                        **kwargs):
@@ -42,40 +58,41 @@ cdef class Counter:
 
         return a PeakShapeCounts tuple.
         '''
-        cdef int xstart, xend, rstart, rend, i, offset
+        return self.countAroundPositions(infile, contig, [pos], bins)[0]
 
-        nreads, counts = self.coverageInInterval(infile, 
-                                                 contig, 
-                                                 max(0, pos + bins[0]),
-                                                 pos + bins[-1],
-                                                 **kwargs )
+    def countAroundPositions(self,
+                             infile,
+                             contig,
+                             positions,
+                             bins):
+        '''count and bin in bins around each position in *positions*.
 
+        return a list of PeakShapeCounts tuples.
+        '''
         nbins = len(bins) - 1
-        hist = numpy.zeros(nbins, dtype=numpy.int)
-        cdef int lcounts = len(counts)
-
-        if self.smooth_method is not None:
-            smoothed_counts = self.smooth_method(counts)
-
-        offset = -bins[0]
-        xstart = offset + bins[0] 
-        for i from 0 <= i < nbins:
-            xend = offset + bins[i+1]
-            # only take complete bins
-            if xstart >= 0 and xend < lcounts:
-                hist[i] = sum(counts[xstart:xend]) 
-            xstart = xend
-
-        result = PeakShapeCounts._make((nreads, 
-                                        numpy.median(counts),
-                                        hist))
-
+        hists = numpy.zeros((len(positions), nbins), dtype=numpy.int64)
+
+        coverages = self.coverageInIntervals(
+            infile,
+            contig,
+            [max(0, pos + bins[0]) for pos in positions],
+            [pos + bins[-1] for pos in positions])
+
+        result = []
+        for hist, (nreads, counts) in zip(hists, coverages):
+            if self.smooth_method is not None:
+                smoothed_counts = self.smooth_method(counts)
+
+            fillHistogram(hist, counts, -bins[0], bins)
+            result.append(PeakShapeCounts._make((nreads,
+                                                 numpy.median(counts),
+                                                 hist)))
         return result
 
     def countInInterval(self,
                         infile,
-                        contig, 
-                        int start, 
+                        contig,
+                        int start,
                         int end,
                         bins,
                         int window_size = 0,
@@ -83,7 +100,7 @@ cdef class Counter:
                         use_interval=False,
                         smooth_method=None,
                         centring_method = "reads" ):
-        '''count density in window and compute peak-shape 
+        '''count density in window and compute peak-shape
         summary parameters inside window.
 
         If *use_interval* is True, only counts within the
@@ -92,165 +109,372 @@ cdef class Counter:
         will be located first and a window centered on the
         peak of size *window_size* will be used.
 
-        Smoothes by summing counts in bins.        
+        Smoothes by summing counts in bins.
 
         return a result object.
         '''
+        return self.countInIntervals(infile,
+                                     contig,
+                                     [start],
+                                     [end],
+                                     bins,
+                                     window_size=window_size,
+                                     peak_ratio=peak_ratio,
+                                     use_interval=use_interval,
+                                     centring_method=centring_method)[0]
+
+    def countInIntervals(self,
+                         infile,
+                         contig,
+                         starts,
+                         ends,
+                         bins,
+                         int window_size = 0,
+                         float peak_ratio = 0.90,
+                         use_interval=False,
+                         centring_method = "reads"):
+        '''count densities and compute peak-shape summary parameters
+        for each interval bounded by *starts* and *ends* on *contig*.
+
+        See :meth:`countInInterval`.
+
+        return a list of result objects. The result is None for
+        empty intervals.
+        '''
+        for start in starts:
+            assert start >= 0, "start < 0"
+
+        # maximum extend of window = interval +- window_size
+        maxwindow_starts = [max(0, start - window_size) for start in starts]
+        maxwindow_ends = [end + window_size for end in ends]
 
-        cdef int peak_nreads = 0
-        cdef int npeaks = 0
-        cdef int peak_center = 0
-        cdef int i, x
-        cdef int xstart, xend, rstart, rend
+        # get counts in windows
+        coverages = self.coverageInIntervals(infile,
+                                             contig,
+                                             maxwindow_starts,
+                                             maxwindow_ends)
 
-        assert start >= 0, "start < 0"
+        nbins = len(bins) - 1
+        hists = numpy.zeros((len(starts), nbins), dtype=numpy.int64)
+
+        result = []
+        for start, end, maxwindow_start, maxwindow_end, hist, \
+                (nreads, counts_in_window) in zip(starts,
+                                                  ends,
+                                                  maxwindow_starts,
+                                                  maxwindow_ends,
+                                                  hists,
+                                                  coverages):
+            result.append(buildPeakShape(contig,
+                                         start,
+                                         end,
+                                         maxwindow_start,
+                                         maxwindow_end,
+                                         nreads,
+                                         counts_in_window,
+                                         bins,
+                                         hist,
+                                         peak_ratio,
+                                         use_interval,
+                                         centring_method))
+        return result
 
-        # maximum extend of window = interval +- window_size
-        cdef int maxwindow_start = max(0, start - window_size)
-        cdef int maxwindow_end = end + window_size
 
-        # bases added at right/left of interval
-        cdef int offset_right = maxwindow_end - end
-        cdef int offset_left = start - maxwindow_start
+def fillHistogram(hist, counts, int offset, bins):
+    '''fill *hist* with sums of *counts* in *bins* relative to
+    *offset*. Only complete bins are counted.
+    '''
+    counts = numpy.asarray(counts)
+    cumulative = numpy.zeros(len(counts) + 1,
+                             dtype=numpy.result_type(counts, numpy.int64))
+    numpy.cumsum(counts, out=cumulative[1:])
+    xstart = offset + bins[:-1]
+    xend = offset + bins[1:]
+    take = (xstart >= 0) & (xend < len(counts))
+    hist[take] = cumulative[xend[take]] - cumulative[xstart[take]]
+
+
+def buildPeakShape(contig,
+                   int start,
+                   int end,
+                   int maxwindow_start,
+                   int maxwindow_end,
+                   nreads,
+                   counts_in_window,
+                   bins,
+                   hist,
+                   float peak_ratio,
+                   use_interval,
+                   centring_method):
+    '''compute peak-shape summary parameters from the counts in a
+    window around an interval and fill *hist*.
+
+    return a result object or None if the interval is empty.
+    '''
+    cdef int peak_nreads = 0
+    cdef int npeaks = 0
+    cdef int peak_center = 0
 
-        cdef int interval_width = end - start
+    # bases added at right/left of interval
+    cdef int offset_right = maxwindow_end - end
+    cdef int offset_left = start - maxwindow_start
 
-        # get counts in window
-        nreads, counts_in_window = self.coverageInInterval(infile, 
-                                                           contig, 
-                                                           maxwindow_start, 
-                                                           maxwindow_end)
-
-        # counts only in interval - used to define peak center
-        counts_in_interval = counts_in_window[offset_left:-offset_right]
-
-        if len(counts_in_interval) == 0:
-            E.warn("empty interval: %i - %i for %s:%i-%i" %
-                   (offset_left, -offset_right, contig, start, end) )
-            return None
-
-        #################################################
-        # compute peak shape parameters
-        peak_nreads = max(counts_in_interval)
-        peaks = numpy.array(range(0,interval_width) )[counts_in_interval >= peak_nreads]
-        if centring_method == "reads":
-            peak_center = peaks[len(peaks) // 2] 
-        elif centring_method == "middle":
-            peak_center = interval_width // 2
-        else:
-            raise ValueError("unknown centring method '%s'" % centring_method)
-
-        # define peak height
-        cdef int peak_height = numpy.ceil(peak_ratio * peak_nreads)
-
-        peaks = numpy.array(range(0,interval_width))[counts_in_interval >= peak_height]
-        npeaks = len(peaks)
-        peak_start = peaks[0]
-        peak_end = peaks[-1]
-        cdef int peak_width = peak_end - peak_start
-
-        # find size of peak
-        # cdef int peak_start, peak_end
-        # peak_start, peak_end = peak_center, peak_center
-
-        # for peak_center >= i >= 0:
-        #     if counts_in_interval[i] < peak_height:
-        #         peak_start = i
-        #         break
-
-        # for peak_center <= i < interval_width:
-        #     if counts_in_interval[i] < peak_height:
-        #         peak_end = i
-        #         break
-
-        # closest and furthest distance of peak to half-height
-        cdef int half_height = peak_height // 2
-        cdef int left_first, left_last, right_first, right_last 
-        left_first, left_last, right_first, right_last = peak_center, 0, interval_width, peak_center
-
-        for i from 0 <= i < peak_center:
-            if counts_in_interval[i] >= half_height: 
-                left_first = i
-                break
+    cdef int interval_width = end - start
 
-        for i from peak_center > i >= 0:
-            if counts_in_interval[i] <= half_height: 
-                left_last = i
-                break
+    # counts only in interval - used to define peak center
+    counts_in_interval = counts_in_window[offset_left:-offset_right]
 
-        for i from peak_center < i < interval_width:
-            if counts_in_interval[i] <= half_height: 
-                right_first = i
-                break
+    if len(counts_in_interval) == 0:
+        E.warn("empty interval: %i - %i for %s:%i-%i" %
+               (offset_left, -offset_right, contig, start, end) )
+        return None
 
-        for i from interval_width > i >= peak_center:
-            if counts_in_interval[i] >= half_height: 
-                right_last = i
+    #################################################
+    # compute peak shape parameters
+    peak_nreads = counts_in_interval.max()
+    peaks = numpy.flatnonzero(counts_in_interval >= peak_nreads)
+    if centring_method == "reads":
+        peak_center = peaks[len(peaks) // 2]
+    elif centring_method == "middle":
+        peak_center = interval_width // 2
+    else:
+        raise ValueError("unknown centring method '%s'" % centring_method)
+
+    # define peak height
+    cdef int peak_height = numpy.ceil(peak_ratio * peak_nreads)
+
+    peaks = numpy.flatnonzero(counts_in_interval >= peak_height)
+    npeaks = len(peaks)
+    cdef int peak_width = peaks[-1] - peaks[0]
+
+    # closest and furthest distance of peak to half-height
+    cdef int half_height = peak_height // 2
+    cdef int left_first, left_last, right_first, right_last
+    left_first, left_last, right_first, right_last = peak_center, 0, interval_width, peak_center
+
+    above = counts_in_interval >= half_height
+    below = counts_in_interval <= half_height
+
+    x = numpy.flatnonzero(above[:peak_center])
+    if len(x):
+        left_first = x[0]
+    x = numpy.flatnonzero(below[:peak_center])
+    if len(x):
+        left_last = x[-1]
+    x = numpy.flatnonzero(below[peak_center + 1:interval_width])
+    if len(x):
+        right_first = peak_center + 1 + x[0]
+    x = numpy.flatnonzero(above[peak_center:interval_width])
+    if len(x):
+        right_last = peak_center + x[-1]
+
+    cdef int furthest_dist = max(peak_center - left_first,
+                                 right_last - peak_center)
+    cdef int closest_dist = min(peak_center - left_last,
+                                right_first - peak_center)
+
+    #################################################
+    # compute histogram
+    # decide in which region to count - interval or window
+    if use_interval:
+        counts = counts_in_interval
+        # offset = peak
+        offset = peak_center
+    else:
+        counts = counts_in_window
+        # offset = peak to its corresponding location in
+        # counts_in_window
+        offset = peak_center + offset_left
+
+    fillHistogram(hist, counts, offset, bins)
+
+    return PeakShapeResult._make((interval_width, npeaks,
+                                  start + peak_center,
+                                  peak_width, peak_nreads,
+                                  abs((interval_width // 2) - peak_center),
+                                  nreads,
+                                  numpy.median(counts),
+                                  closest_dist, furthest_dist,
+                                  bins,
+                                  hist))
+
+
+cdef fetchReads(AlignmentFile samfile, int tid, int64_t start, int64_t end):
+    '''return arrays with start, end and flags of reads overlapping
+    *start*:*end* on *tid*.
+
+    Bit 1 of flags is set for reads on the reverse strand and bit 2
+    for reads with a CIGAR string.
+    '''
+    cdef htsFile * hts = samfile.htsfile
+    cdef hts_itr_t * itr = sam_itr_queryi(samfile.index, tid, start, end)
+    if itr == NULL:
+        raise ValueError("could not create iterator for %s:%i-%i" %
+                         (samfile.references[tid], start, end))
+
+    cdef int64_t capacity = 1024
+    cdef int64_t n = 0
+    cdef int ret
+    cdef bam1_t * b = bam_init1()
+    positions = numpy.zeros((2, capacity), dtype=numpy.int64)
+    flags = numpy.zeros(capacity, dtype=numpy.uint8)
+    cdef int64_t [:, ::1] c_positions = positions
+    cdef uint8_t [::1] c_flags = flags
+
+    try:
+        while True:
+            with nogil:
+                ret = sam_itr_next(hts, itr, b)
+            if ret < -1:
+                raise IOError("error while reading from %s" %
+                              samfile.filename)
+            if ret < 0:
                 break
+            if n == capacity:
+                capacity *= 2
+                positions = numpy.concatenate(
+                    (positions, numpy.zeros_like(positions)), axis=1)
+                flags = numpy.concatenate((flags, numpy.zeros_like(flags)))
+                c_positions = positions
+                c_flags = flags
+            c_positions[0, n] = b.core.pos
+            c_positions[1, n] = bam_endpos(b)
+            c_flags[n] = 0
+            if b.core.flag & BAM_FREVERSE:
+                c_flags[n] |= 1
+            if b.core.n_cigar > 0:
+                c_flags[n] |= 2
+            n += 1
+    finally:
+        sam_itr_destroy(itr)
+        bam_destroy1(b)
+
+    return positions[0, :n], positions[1, :n], flags[:n]
+
+
+cdef inline int64_t lowerBound(int64_t [::1] values, int64_t value) nogil:
+    '''return index of first element in sorted *values* >= *value*.'''
+    cdef int64_t lo = 0
+    cdef int64_t hi = values.shape[0]
+    cdef int64_t mid
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if values[mid] < value:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+cdef inline void addRead(int64_t * diff,
+                         int64_t rstart,
+                         int64_t rend,
+                         int64_t width) nogil:
+    '''add a read covering *rstart*:*rend* to the difference
+    array *diff* truncating it to 0:*width*.'''
+    if rstart < 0:
+        rstart = 0
+    if rend > width:
+        rend = width
+    if rstart < rend:
+        diff[rstart] += 1
+        diff[rend] -= 1
+
+
+def countReads(int64_t [::1] read_starts,
+               int64_t [::1] read_ends,
+               uint8_t [::1] read_flags,
+               int64_t max_span,
+               int64_t start,
+               int64_t end,
+               int offset):
+    '''return tuple (nreads, counts) with the coverage of reads in
+    window *start*:*end*.
+
+    Reads are sorted by start and selected as in
+    :meth:`pysam.AlignmentFile.fetch`. If *offset* is not 0, reads
+    on the + strand are extended from their start by 2 * *offset*
+    and reads on the - strand from their end. + strand reads are
+    collected in the window shifted upstream by *offset*, - strand
+    reads in the window shifted downstream.
+    '''
+    cdef int64_t interval_width = end - start
+    cdef int64_t nreads = 0
+    cdef int64_t xstart, xend, k
+    cdef int64_t nreads_total = read_starts.shape[0]
 
-        cdef int furthest_dist = max(peak_center - left_first,
-                                     right_last - peak_center)
-        cdef int closest_dist = min(peak_center - left_last,
-                                    right_first - peak_center)
+    diff = numpy.zeros(interval_width + 1, dtype=numpy.int64)
+    cdef int64_t [::1] c_diff = diff
 
-        #################################################
-        # compute histogram
-        nbins = len(bins) - 1
-        hist = numpy.zeros(nbins, dtype = numpy.int)
+    with nogil:
+        if offset:
+            xstart, xend = max(0, start - offset), max(0, end - offset)
+            k = lowerBound(read_starts, xstart - max_span)
+            while k < nreads_total and read_starts[k] < xend:
+                if read_ends[k] > xstart and not read_flags[k] & 1:
+                    nreads += 1
+                    # extend reads from upstream pos
+                    addRead(&c_diff[0],
+                            read_starts[k] - xstart,
+                            read_starts[k] + 2 * offset - xstart,
+                            interval_width)
+                k += 1
 
-        # decide in which region to count - interval or window
-        if use_interval:
-            counts = counts_in_interval
-            # offset = peak
-            offset = peak_center
+            # on the - strand, shift tags downstream
+            xstart, xend = start + offset, end + offset
+            k = lowerBound(read_starts, xstart - max_span)
+            while k < nreads_total and read_starts[k] < xend:
+                if read_ends[k] > xstart and read_flags[k] & 1:
+                    nreads += 1
+                    # reads without CIGAR string are unmapped but
+                    # have still a coordinate assigned.
+                    if read_flags[k] & 2:
+                        # shift and extend reads from downstream pos
+                        addRead(&c_diff[0],
+                                read_ends[k] - 2 * offset - xstart,
+                                read_ends[k] - xstart,
+                                interval_width)
+                k += 1
         else:
-            counts = counts_in_window
-            # offset = peak to its corresponding location in
-            # counts_in_window
-            offset = peak_center + offset_left
-
-        cdef int lcounts = len(counts)
-
-        # count averages
-        xstart = offset + bins[0] 
-        for i from 0 <= i < nbins:
-            xend = offset + bins[i+1]
-            # only take complete bins
-            if xstart >= 0 and xend < lcounts:
-                hist[i] = sum(counts[xstart:xend]) 
-            xstart = xend
-
-        result = PeakShapeResult._make((interval_width, npeaks,
-                                        start + peak_center, 
-                                        peak_width, peak_nreads, 
-                                        abs((interval_width // 2) - peak_center), 
-                                        nreads,
-                                        numpy.median(counts),
-                                        closest_dist, furthest_dist,
-                                        bins,
-                                        hist))
+            k = lowerBound(read_starts, start - max_span)
+            while k < nreads_total and read_starts[k] < end:
+                if read_ends[k] > start:
+                    nreads += 1
+                    if read_flags[k] & 2:
+                        addRead(&c_diff[0],
+                                read_starts[k] - start,
+                                read_ends[k] - start,
+                                interval_width)
+                k += 1
 
-
-        return result
+    return nreads, numpy.cumsum(diff[:interval_width])
 
 
 cdef class CounterBam(Counter):
-    '''compute densities in intervals from bam files.'''
+    '''compute densities in intervals from bam files.
+
+    Coverage for a batch of intervals is computed in a sorted sweep
+    along the contig. Reads are read once for each block of
+    overlapping windows. Blocks are at most *max_block_size* bases
+    apart.
+    '''
 
     cdef int shift
+    cdef int max_block_size
 
-    def __init__(self, shift = 0, *args, **kwargs):
+    def __init__(self, shift = 0, max_block_size = 1000000, *args, **kwargs):
 
         Counter.__init__(self, *args, **kwargs)
 
         self.shift = shift
+        self.max_block_size = max_block_size
 
     #################################################
     # bigwig versions
     def coverageInInterval(self,
                            AlignmentFile samfile,
                            contig,
-                           int start, 
+                           int start,
                            int end):
         '''return coverage in window on *contig* bounded by *start* and *end*.
 
@@ -261,88 +485,85 @@ cdef class CounterBam(Counter):
            nreads = number of reads/tags counted
            counts = numpy array with reads per base
         '''
+        return self.coverageInIntervals(samfile, contig, [start], [end])[0]
+
+    def coverageInIntervals(self,
+                            AlignmentFile samfile,
+                            contig,
+                            starts,
+                            ends):
+        '''return list of tuples (nreads, counts) for windows on
+        *contig* bounded by *starts* and *ends*.
+
+        See :meth:`coverageInInterval`.
+        '''
         cdef int shift = self.shift
 
         # for peak counting follow the MACS protocol:
         # see the function def __tags_call_peak in PeakDetect.py
         #
         # In words
-        # Only take the start of reads (taking into account the strand)        # add d/2=shift to each side of peak and start accumulate counts.
+        # Only take the start of reads (taking into account the strand)
+        # add d/2=shift to each side of peak and start accumulate counts.
         # for counting, extend reads by 2 * shift
         # on + strand shift tags upstream
         # i.e. look at the downstream window
         # note: filtering?
         # note: does this work with paired-end data?
         cdef int offset = shift // 2
-        cdef int nreads = 0
 
-        # collect pileup profile in region bounded by maxwindow_start and maxwindow_end.
-        cdef int interval_width = end - start
-        cdef int * ccounts = <int*>calloc( interval_width, sizeof(int))
+        starts = numpy.asarray(starts, dtype=numpy.int64)
+        ends = numpy.asarray(ends, dtype=numpy.int64)
+        result = [(0, numpy.zeros(0))] * len(starts)
 
-        if interval_width <= 0: 
-            return 0, numpy.zeros(0)
-            
-        if contig not in samfile.references:
-            return 0, numpy.zeros(0)
+        tids = dict((y, x) for x, y in enumerate(samfile.references))
+        if contig not in tids:
+            return result
+        samfile.check_index()
 
+        # region containing the reads of each window. Reads on the
+        # + strand are collected upstream, on the - strand downstream.
         if shift:
-            xstart, xend = max(0, start - offset), max(0, end - offset)
-
-            for read in samfile.fetch(contig, xstart, xend):
-                if read.is_reverse: continue
-                nreads += 1
-                # extend reads from upstream pos
-                rstart = read.pos
-                rend = rstart + 2 * offset 
-                # truncate to interval
-                rstart = max( 0, rstart - xstart )
-                rend = min( interval_width, rend - xstart )
-                for i from rstart <= i < rend: ccounts[i] += 1
-
-            # on the - strand, shift tags downstream
-            xstart, xend = start + offset, end + offset
-
-            for read in samfile.fetch( contig, xstart, xend ):
-                if not read.is_reverse: continue
-                nreads += 1
-                rend = read.aend
-                # shift and extend reads from downstream pos
-                try:
-                    rstart = rend - 2 * offset
-                except TypeError:
-                    # read.aend can be None if CIGAR string is missing
-                    # read is unmapped but has still a coordinate
-                    # assigned.
-                    continue
-                # truncate to interval
-                rstart = max( 0, rstart - xstart )
-                rend = min( interval_width, rend - xstart )
-
-                for i from rstart <= i < rend: ccounts[i] += 1
-
+            span_starts = numpy.maximum(0, starts - offset)
+            span_ends = ends + offset
         else:
-            for read in samfile.fetch(contig, start, end):
-                nreads += 1
-                # truncate to interval
-                rstart = max(0, read.pos - start)
-                try:
-                    rend = min(interval_width, read.aend - start)
-                except TypeError:
-                    # aend can be None if CIGAR string is missing
-                    # read is unmapped but has still a coordinate
-                    # assigned.
-                    continue
-
-                for i from rstart <= i < rend: ccounts[i] += 1
-
-        # transfer to numpy count object
-        counts = numpy.zeros( interval_width, dtype = numpy.int )
-        for i from 0 <= i < interval_width: counts[i] = ccounts[i]
-
-        free( ccounts )
+            span_starts, span_ends = starts, ends
+
+        todo = numpy.flatnonzero(ends - starts > 0)
+        todo = todo[numpy.argsort(span_starts[todo], kind="stable")]
+
+        # group windows into blocks of overlapping windows
+        cdef int64_t block_start, block_end
+        idx = 0
+        while idx < len(todo):
+            block = [todo[idx]]
+            block_start = span_starts[todo[idx]]
+            block_end = span_ends[todo[idx]]
+            idx += 1
+            while idx < len(todo) and \
+                  span_starts[todo[idx]] < block_end and \
+                  span_starts[todo[idx]] < block_start + self.max_block_size:
+                block.append(todo[idx])
+                block_end = max(block_end, span_ends[todo[idx]])
+                idx += 1
+
+            read_starts, read_ends, read_flags = fetchReads(
+                samfile, tids[contig], block_start, block_end)
+            if len(read_starts):
+                max_span = (read_ends - read_starts).max()
+            else:
+                max_span = 0
+
+            for x in block:
+                result[x] = countReads(read_starts,
+                                       read_ends,
+                                       read_flags,
+                                       max_span,
+                                       starts[x],
+                                       ends[x],
+                                       offset)
+        return result
 
-        return nreads, counts
 
 cdef class CounterBigwig(Counter):
     '''compute densities in intervals from bigwig files.'''
@@ -9,13 +9,23 @@ single entry and a series of iterators to iterate of :term:`PSL`
 formatted files (:func:`iterator`, :func:`iterator_target_overlap`,
 ...).
 
+For large files, :func:`iterator_records` returns light-weight
+:class:`MatchRecord` objects with block coordinates in numpy arrays
+and :func:`iterator_columns` returns whole chunks of a file as numpy
+arrays per column.
+
 Reference
 ---------
 
 '''
 import copy
+import csv
+import io
 import string
 import collections
+import heapq
+
+import numpy
 
 try:
     import alignlib_lite
@@ -23,8 +33,11 @@ except ImportError:
     pass
 
 from cgat import Components as Components
+import cgat.LazyImport as LazyImport
 from cgatcore import experiment as E
 
+pandas = LazyImport.LazyModule("pandas")
+
 
 class Error(Exception):
     """Base class for exceptions in this module."""
@@ -571,6 +584,185 @@ class MatchPSLX(Match):
                 sbjct_sequence[start_sbjct - offset_sbjct:start_sbjct - offset_sbjct + size])
 
 
+class MatchRecord(object):
+
+    """a :term:`psl` formatted alignment with block coordinates
+    in numpy arrays.
+
+    This is a light-weight alternative to :class:`Match` returned
+    by :func:`iterator_records`. Attributes have the same names as
+    in :class:`Match`, but the block sizes and starts are numpy
+    integer arrays. The blocks are parsed, and the alignment maps
+    ``mMapQuery2Target`` and ``mMapTarget2Query`` are built, when
+    first accessed. Coverage and percent identity are computed on
+    access.
+    """
+
+    __slots__ = ("mNMatches", "mNMismatches", "mNRepMatches", "mNns",
+                 "mQueryNGapsCounts", "mQueryNGapsBases",
+                 "mSbjctNGapsCounts", "mSbjctNGapsBases",
+                 "strand",
+                 "mQueryId", "mQueryLength", "mQueryFrom", "mQueryTo",
+                 "mSbjctId", "mSbjctLength", "mSbjctFrom", "mSbjctTo",
+                 "mNBlocks", "_block_fields", "_blocks",
+                 "_map_query2target", "_map_target2query")
+
+    def __init__(self):
+        self._block_fields = None
+        self._blocks = None
+        self._map_query2target = None
+        self._map_target2query = None
+
+    def fromTable(self, data):
+
+        if len(data) < 21:
+            raise ParsingError("parsing error: %i fields" %
+                               len(data), "\t".join(data))
+
+        (self.mNMatches, self.mNMismatches, self.mNRepMatches, self.mNns,
+         self.mQueryNGapsCounts, self.mQueryNGapsBases,
+         self.mSbjctNGapsCounts, self.mSbjctNGapsBases) = \
+            list(map(int, data[:8]))
+        self.strand = data[8]
+        self.mQueryId = data[9]
+        (self.mQueryLength, self.mQueryFrom, self.mQueryTo) = \
+            int(data[10]), int(data[11]), int(data[12])
+        self.mSbjctId = data[13]
+        (self.mSbjctLength, self.mSbjctFrom, self.mSbjctTo,
+         self.mNBlocks) = \
+            int(data[14]), int(data[15]), int(data[16]), int(data[17])
+        # blocks are parsed on first access
+        self._block_fields = data[18:21]
+        self._blocks = None
+        self._map_query2target = None
+        self._map_target2query = None
+        return self
+
+    def _get_blocks(self):
+        if self._blocks is None:
+            blocks = numpy.fromstring("".join(self._block_fields),
+                                      sep=",", dtype=numpy.int64)
+            if len(blocks) != 3 * self.mNBlocks:
+                raise ParsingError(
+                    "parsing error: expected %i blocks" % self.mNBlocks,
+                    "\t".join(self._block_fields))
+            self._blocks = list(blocks.reshape(3, self.mNBlocks))
+        return self._blocks
+
+    def _set_block_row(self, row, values):
+        self._get_blocks()[row] = numpy.asarray(values, dtype=numpy.int64)
+
+    mBlockSizes = property(
+        lambda self: self._get_blocks()[0],
+        lambda self, values: self._set_block_row(0, values))
+    mQueryBlockStarts = property(
+        lambda self: self._get_blocks()[1],
+        lambda self, values: self._set_block_row(1, values))
+    mSbjctBlockStarts = property(
+        lambda self: self._get_blocks()[2],
+        lambda self, values: self._set_block_row(2, values))
+
+    @property
+    def mQueryCoverage(self):
+        if self.mQueryLength == 0:
+            return 0
+        return 100.0 * \
+            (self.mNMismatches + self.mNMatches) / self.mQueryLength
+
+    @property
+    def mSbjctCoverage(self):
+        if self.mSbjctLength == 0:
+            return 0
+        return 100.0 * \
+            (self.mNMismatches + self.mNMatches) / self.mSbjctLength
+
+    @property
+    def mPid(self):
+        if self.mNMatches + self.mNMismatches == 0:
+            return 100.0
+        return 100.0 * float(self.mNMatches) / \
+            (self.mNMatches + self.mNMismatches)
+
+    def _get_map_query2target(self):
+        if self._map_query2target is None:
+            self._map_query2target = self.getMapQuery2Target()
+        return self._map_query2target
+
+    def _set_map_query2target(self, value):
+        self._map_query2target = value
+    mMapQuery2Target = property(_get_map_query2target,
+                                _set_map_query2target)
+
+    def _get_map_target2query(self):
+        if self._map_target2query is None:
+            self._map_target2query = self.getMapTarget2Query()
+        return self._map_target2query
+
+    def _set_map_target2query(self, value):
+        self._map_target2query = value
+    mMapTarget2Query = property(_get_map_target2query,
+                                _set_map_target2query)
+
+    def hasMap(self, by_query=False):
+        """return True if the alignment map has been built."""
+        if by_query:
+            return self._map_query2target is not None
+        return self._map_target2query is not None
+
+    def getMapQuery2Target(self):
+        """return a map between query to target."""
+        return Match.getMapQuery2Target(self)
+
+    def getMapTarget2Query(self):
+        """return a map between target to query."""
+        return Match.getMapTarget2Query(self)
+
+    def getBlocks(self):
+        """return a list of aligned blocks."""
+        return list(zip(self.mQueryBlockStarts.tolist(),
+                        self.mSbjctBlockStarts.tolist(),
+                        self.mBlockSizes.tolist()))
+
+    def toMatch(self):
+        """return a :class:`Match` object with the same alignment."""
+        match = Match()
+        for key in self.__slots__:
+            if not key.startswith("_"):
+                setattr(match, key, getattr(self, key))
+        match.mBlockSizes = self.mBlockSizes.tolist()
+        match.mQueryBlockStarts = self.mQueryBlockStarts.tolist()
+        match.mSbjctBlockStarts = self.mSbjctBlockStarts.tolist()
+        match.mQueryCoverage = self.mQueryCoverage
+        match.mSbjctCoverage = self.mSbjctCoverage
+        match.mPid = self.mPid
+        return match
+
+    def copy(self):
+        other = MatchRecord()
+        for key in self.__slots__:
+            if not key.startswith("_"):
+                setattr(other, key, getattr(self, key))
+        other._blocks = [x.copy() for x in self._get_blocks()]
+        return other
+
+    def __str__(self):
+        return Match.__str__(self)
+
+
+def _iterate_lines(infile):
+    """iterate over data lines in psl output skipping headers."""
+    for line in infile:
+        if line[0] == "#":
+            continue
+        if line.startswith("match"):
+            continue
+        if line.startswith("psLayout version 3"):
+            for x in range(4):
+                next(infile, None)
+            continue
+        yield line
+
+
 def _iterate(infile):
     """iterator over psl output.
 
@@ -680,87 +872,145 @@ def iterator_pslx(infile):
         yield match
 
 
-def iterator_target_overlap(infile, merge_distance):
-    '''iterate over psl formatted infile and return
-    blocks of target overlapping alignments.'''
-
-    last_sbjct_id = None
-    start = None
-    end = None
-    matches = []
+def iterator_records(infile):
+    """iterate over the contents of a psl file returning
+    :class:`MatchRecord` objects.
+    """
+    for line in _iterate_lines(infile):
+        yield MatchRecord().fromTable(line[:-1].split("\t"))
+
+
+def _parseColumns(lines):
+    """parse *lines* of psl output into columns, see
+    :func:`iterator_columns`."""
+
+    dtype = dict([(x, numpy.int64) for x in FIELDS])
+    for field in ("strand", "qName", "tName",
+                  "blockSizes", "qStarts", "tStarts"):
+        dtype[field] = object
+
+    try:
+        table = pandas.read_csv(io.StringIO("".join(lines)),
+                                sep="\t",
+                                header=None,
+                                names=FIELDS,
+                                usecols=list(range(len(FIELDS))),
+                                dtype=dtype,
+                                na_filter=False,
+                                quoting=csv.QUOTE_NONE)
+    except ValueError as msg:
+        raise ParsingError("parsing error: %s" % msg)
+
+    result = {}
+    for field in FIELDS:
+        if field in ("blockSizes", "qStarts", "tStarts"):
+            result[field] = numpy.fromstring(
+                "".join(table[field].values), sep=",", dtype=numpy.int64)
+        else:
+            result[field] = table[field].values
+
+    nblocks = result["blockCount"].sum()
+    for field in ("blockSizes", "qStarts", "tStarts"):
+        if len(result[field]) != nblocks:
+            raise ParsingError(
+                "parsing error: expected %i values in column %s, got %i" %
+                (nblocks, field, len(result[field])))
+
+    offsets = numpy.zeros(len(table) + 1, dtype=numpy.int64)
+    numpy.cumsum(result["blockCount"], out=offsets[1:])
+    result["blockOffsets"] = offsets
+    return result
+
+
+def iterator_columns(infile, chunk_size=100000):
+    """iterate over the contents of a psl file in chunks of
+    *chunk_size* alignments.
+
+    Each chunk is a dictionary of numpy arrays with one array per
+    column in :data:`FIELDS`. The blocks of all alignments in a chunk
+    are concatenated in the columns ``blockSizes``, ``qStarts`` and
+    ``tStarts``. The blocks of the i-th alignment are at positions
+    ``blockOffsets[i]`` to ``blockOffsets[i+1]``.
+    """
+    lines = []
+    for line in _iterate_lines(infile):
+        lines.append(line)
+        if len(lines) >= chunk_size:
+            yield _parseColumns(lines)
+            lines = []
+    if lines:
+        yield _parseColumns(lines)
+
+
+def _iterate_chunks(matches, get_contig, get_start, get_end,
+                    merge_distance, label):
+    '''group matches sorted by (contig, start) into chunks of matches
+    whose extents are less than *merge_distance* residues apart.
+
+    *get_contig*, *get_start* and *get_end* return the contig and
+    extent of a match. Raises a ValueError if the matches are not
+    sorted.
+    '''
+
+    last_contig = None
+    start, end = None, None
+    chunk = []
     processed_contigs = set()
 
-    while 1:
-
-        match = next(infile)
-
-        if match is None:
-            break
-
-        if match.mSbjctId != last_sbjct_id or match.mSbjctFrom >= (end + merge_distance):
-            if last_sbjct_id:
-                yield matches
-            matches = []
-            if last_sbjct_id != match.mSbjctId and match.mSbjctId in processed_contigs:
-                raise ValueError("input not sorted by target (contig,start): already encountered %s\n%s" %
-                                 (match.mSbjctId, str(match)))
+    for match in matches:
+        contig = get_contig(match)
+        match_start = get_start(match)
 
-            processed_contigs.add(last_sbjct_id)
+        if not chunk or contig != last_contig or \
+           match_start >= end + merge_distance:
+            if chunk:
+                yield chunk
+            chunk = []
+            if contig != last_contig and contig in processed_contigs:
+                raise ValueError(
+                    "input not sorted by %s (contig,start): "
+                    "already encountered %s\n%s" %
+                    (label, contig, str(match)))
 
-            last_sbjct_id = match.mSbjctId
-            start = match.mSbjctFrom
-            end = match.mSbjctTo
+            processed_contigs.add(last_contig)
+            last_contig = contig
+            start, end = match_start, get_end(match)
 
-        if match.mSbjctFrom < start:
-            raise ValueError("input not sorted by target (contig,start): %i < %i\n%s" %
-                             (match.mSbjctFrom, start, str(match)))
+        if match_start < start:
+            raise ValueError(
+                "input not sorted by %s (contig,start): %i < %i\n%s" %
+                (label, match_start, start, str(match)))
 
-        end = max(match.mSbjctTo, end)
-        matches.append(match)
+        end = max(get_end(match), end)
+        chunk.append(match)
 
-    if last_sbjct_id:
-        yield matches
+    if chunk:
+        yield chunk
 
 
-def iterator_query_overlap(infile, merge_distance):
+def iterator_target_overlap(infile, merge_distance):
     '''iterate over psl formatted infile and return
     blocks of target overlapping alignments.'''
 
-    last_query_id = None
-    start, end = None, None
-    matches = []
-    processed_contigs = set()
-
-    while 1:
-
-        match = next(infile)
-
-        if match is None:
-            break
-
-        if match.mQueryId != last_query_id or match.mQueryFrom >= (end + merge_distance):
-            if last_query_id:
-                yield matches
-            matches = []
-
-            if last_query_id != match.mQueryId and match.mQueryId in processed_contigs:
-                raise ValueError("input not sorted by query (contig,start): already encountered %s\n%s" %
-                                 (match.mQueryId, str(match)))
-
-            processed_contigs.add(last_query_id)
+    # BlatIterator returns None at the end of the input
+    return _iterate_chunks(iter(lambda: next(infile), None),
+                           lambda x: x.mSbjctId,
+                           lambda x: x.mSbjctFrom,
+                           lambda x: x.mSbjctTo,
+                           merge_distance,
+                           "target")
 
-            last_query_id = match.mQueryId
-            start, end = match.mQueryFrom, match.mQueryTo
 
-        if match.mQueryFrom < start:
-            raise ValueError("input not sorted by query (contig,start): %i < %i\n%s" %
-                             (match.mQueryFrom, start, str(match)))
-
-        end = max(match.mQueryTo, end)
-        matches.append(match)
+def iterator_query_overlap(infile, merge_distance):
+    '''iterate over psl formatted infile and return
+    blocks of query overlapping alignments.'''
 
-    if last_query_id:
-        yield matches
+    return _iterate_chunks(iter(lambda: next(infile), None),
+                           lambda x: x.mQueryId,
+                           lambda x: x.mQueryFrom,
+                           lambda x: x.mQueryTo,
+                           merge_distance,
+                           "query")
 
 
 def iterator_test(infile, report_step=100000):
@@ -831,6 +1081,18 @@ FIELDS = ("matches",
           "tStarts")
 
 
+def _hasMap(match, by_query):
+    """return True if an alignment map has been added to *match*.
+
+    Maps of :class:`MatchRecord` objects are not built by the check.
+    """
+    if isinstance(match, MatchRecord):
+        return match.hasMap(by_query)
+    if by_query:
+        return hasattr(match, "mMapQuery2Target")
+    return hasattr(match, "mMapTarget2Query")
+
+
 def addAlignments(matches, shift=0, by_query=False):
     """building a genome to query alignment for all matches
 
@@ -839,20 +1101,73 @@ def addAlignments(matches, shift=0, by_query=False):
 
     if by_query:
         for match in matches:
-            if not hasattr(match, "mMapQuery2Target"):
+            if not _hasMap(match, by_query):
                 map_query2target = match.getMapQuery2Target()
                 if shift:
                     map_query2target.moveAlignment(shift, 0)
                 match.mMapQuery2Target = map_query2target
     else:
         for match in matches:
-            if not hasattr(match, "mMapTarget2Query"):
+            if not _hasMap(match, by_query):
                 map_target2query = match.getMapTarget2Query()
                 if shift:
                     map_target2query.moveAlignment(shift, 0)
                 match.mMapTarget2Query = map_target2query
 
 
+def getRowBlocks(match, by_query=False):
+    """return the aligned blocks of *match* on the target as a list
+    of (start, end) tuples.
+
+    If *by_query* is set, the blocks are on the query. Query
+    coordinates are on the negative strand if the strand is "-".
+    """
+    if by_query:
+        starts = match.mQueryBlockStarts
+    else:
+        starts = match.mSbjctBlockStarts
+    return [(x, x + y) for x, y in zip(starts, match.mBlockSizes)]
+
+
+def getBlockOverlap(blocks1, blocks2):
+    """return the number of residues covered by both lists of
+    sorted, non-overlapping blocks."""
+    i, j, overlap = 0, 0, 0
+    while i < len(blocks1) and j < len(blocks2):
+        start1, end1 = blocks1[i]
+        start2, end2 = blocks2[j]
+        overlap += max(0, min(end1, end2) - max(start1, start2))
+        if end1 < end2:
+            i += 1
+        else:
+            j += 1
+    return overlap
+
+
+def getBlockDistance(blocks1, blocks2):
+    """return the shortest distance between residues in two lists of
+    sorted, non-overlapping blocks.
+
+    Adjacent blocks are 1 residue apart, overlapping blocks are
+    0 residues apart. Returns None if either list is empty.
+    """
+    i, j, distance = 0, 0, None
+    while i < len(blocks1) and j < len(blocks2):
+        start1, end1 = blocks1[i]
+        start2, end2 = blocks2[j]
+        if end1 <= start2:
+            d = start2 - end1 + 1
+            i += 1
+        elif end2 <= start1:
+            d = start1 - end2 + 1
+            j += 1
+        else:
+            return 0
+        if distance is None or d < distance:
+            distance = d
+    return distance
+
+
 def getComponents(matches, max_distance=0, min_overlap=0, by_query=False):
     """return overlapping matches.
 
@@ -863,45 +1178,57 @@ def getComponents(matches, max_distance=0, min_overlap=0, by_query=False):
     min_overlap
        require at least # residues to be overlapping
 
+    Distances and overlaps are computed between the aligned blocks
+    on the target or, if *by_query* is set, on the query. Matches are
+    sorted by position and only pairs of matches whose extents are
+    within *max_distance* or overlap by at least *min_overlap*
+    residues are compared.
+
+    Returns a list of lists of indices into *matches*.
     """
 
-    addAlignments(matches, by_query=by_query)
+    if min_overlap > 0 and max_distance > 0:
+        raise ValueError(
+            "both min_overlap (%i) and max_distance (%i) > 0" % (min_overlap, max_distance))
 
     components = Components.IComponents()
 
     for x in range(0, len(matches)):
         components.add(x, x)
 
-    if min_overlap > 0 and max_distance > 0:
-        raise ValueError(
-            "both min_overlap (%i) and max_distance (%i) > 0" % (min_overlap, max_distance))
+    blocks = [getRowBlocks(match, by_query) for match in matches]
+    extents = sorted([(x[0][0], x[-1][1], idx)
+                      for idx, x in enumerate(blocks) if x])
 
-    if by_query:
-        if min_overlap > 0:
-            f = lambda x, y: alignlib_lite.py_getAlignmentOverlap(
-                matches[x].mMapQuery2Target,
-                matches[y].mMapQuery2Target,
-                alignlib_lite.py_RR) >= min_overlap
-        else:
-            f = lambda x, y: alignlib_lite.py_getAlignmentShortestDistance(
-                matches[x].mMapQuery2Target,
-                matches[y].mMapQuery2Target,
-                alignlib_lite.py_RR) <= max_distance
+    if min_overlap > 0:
+        # matches ending before start + min_overlap can not
+        # overlap the current or any later match sufficiently
+        retire = min_overlap
+        f = lambda x, y: getBlockOverlap(blocks[x], blocks[y]) >= min_overlap
     else:
-        if min_overlap > 0:
-            f = lambda x, y: alignlib_lite.py_getAlignmentOverlap(
-                matches[x].mMapTarget2Query,
-                matches[y].mMapTarget2Query,
-                alignlib_lite.py_RR) >= min_overlap
-        else:
-            f = lambda x, y: alignlib_lite.py_getAlignmentShortestDistance(
-                matches[x].mMapTarget2Query,
-                matches[y].mMapTarget2Query,
-                alignlib_lite.py_RR) <= max_distance
-
-    for x in range(len(matches)):
-        for y in range(0, x):
-            if f(x, y):
-                components.add(x, y)
+        # matches ending before start - max_distance + 1 are more
+        # than max_distance residues away
+        retire = -max_distance + 1
+        f = lambda x, y: getBlockDistance(blocks[x], blocks[y]) <= max_distance
+
+    # chunks of matches whose extents are connected can be
+    # processed independently
+    for chunk in _iterate_chunks(extents,
+                                 lambda x: None,
+                                 lambda x: x[0],
+                                 lambda x: x[1],
+                                 max(max_distance, 0),
+                                 "position"):
+        # active matches ordered by end
+        active = []
+        for start, end, x in chunk:
+            while active and active[0][0] < start + retire:
+                heapq.heappop(active)
+            component = components.get(x)
+            for a, y in active:
+                if components.get(y) != component and f(x, y):
+                    components.add(x, y)
+                    component = components.get(x)
+            heapq.heappush(active, (end, x))
 
     return components.getComponents()
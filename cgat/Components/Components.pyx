@@ -21,8 +21,20 @@ USAGE:
 # retrieve components
 >>> print x.getComponents()
 
+Large graphs can be loaded in bulk from arrays of edges and the
+component of each node returned as an array of labels:
+
+>>> x = IComponents()
+>>> x.addEdges(numpy.array([1, 1, 4]), numpy.array([2, 3, 5]))
+>>> x.getTokens()
+array([1, 2, 3, 4, 5])
+>>> x.getLabels()
+array([0, 0, 0, 1, 1])
+
 This is a cython extension class."""
 
+import numpy
+
 cdef extern from "connected_components.h":
 
     ctypedef struct cSComponents "CharComponents":
@@ -32,6 +44,7 @@ cdef extern from "connected_components.h":
         int getIndex(char *)
         char * getToken(int)
         int getNumNodes()
+        int getLabels(int *)
         void reset()
 
     cSComponents *new_SComponents "new CharComponents" ()
@@ -43,12 +56,23 @@ cdef extern from "connected_components.h":
         int getComponent(int)
         int getIndex(int)
         int getToken(int)
+        int addEdges(int *, int *, int)
         int getNumNodes()
+        int getLabels(int *)
         void reset()
 
     cIComponents *new_IComponents "new IntComponents" ()
     void del_IComponents "delete" (cIComponents * c)
 
+def _groupTokens(tokens, labels):
+    """group tokens by label into a list of lists."""
+    if len(labels) == 0:
+        return []
+    components = [[] for x in range(labels.max() + 1)]
+    for token, label in zip(tokens, labels.tolist()):
+        components[label].append(token)
+    return components
+
 cdef class SComponents:
     """Components for a graph with string indices."""
     cdef cSComponents *thisptr      # hold a C++ instance which we're wrapping
@@ -84,17 +108,37 @@ cdef class SComponents:
         """
         return self.thisptr.get(v)
 
+    def addEdges(self, a, b):
+        """add edges between nodes in *a* and *b*.
+        return the number of edges that joined two previously
+        disconnected components.
+        """
+        if len(a) != len(b):
+            raise ValueError("number of nodes differ: %i != %i" %
+                             (len(a), len(b)))
+        cdef int njoined = 0
+        for x, y in zip(a, b):
+            njoined += self.thisptr.add(x, y) > 0
+        return njoined
+
+    def getTokens(self):
+        """return all tokens in the order of submission."""
+        return [self.thisptr.getToken(x)
+                for x in range(1, self.thisptr.getNumNodes() + 1)]
+
+    def getLabels(self):
+        """return the component label of each token as a numpy array.
+        Labels are numbered from 0 in the order of :meth:`getTokens`.
+        """
+        labels = numpy.zeros(self.thisptr.getNumNodes(), dtype=numpy.intc)
+        cdef int[::1] view = labels
+        if len(labels) > 0:
+            self.thisptr.getLabels(&view[0])
+        return labels
+
     def getComponents(self):
         """return all connected components as a list of lists."""
-        components = {}
-        
-        for x in range(1, self.thisptr.getNumNodes() + 1):
-            c = self.thisptr.getComponent(x)
-            if c not in components:
-                components[c] = []
-            components[c].append(self.thisptr.getToken(x))
-        
-        return components.values()
+        return _groupTokens(self.getTokens(), self.getLabels())
 
     def reset(self):
         """clear graph.
@@ -136,16 +180,43 @@ cdef class IComponents:
         """
         return self.thisptr.get(v)
 
+    def addEdges(self, a, b):
+        """add edges between nodes in the integer arrays *a* and *b*.
+        return the number of edges that joined two previously
+        disconnected components.
+        """
+        cdef int[::1] aa = numpy.ascontiguousarray(a, dtype=numpy.intc)
+        cdef int[::1] bb = numpy.ascontiguousarray(b, dtype=numpy.intc)
+        if aa.shape[0] != bb.shape[0]:
+            raise ValueError("number of nodes differ: %i != %i" %
+                             (aa.shape[0], bb.shape[0]))
+        if aa.shape[0] == 0:
+            return 0
+        return self.thisptr.addEdges(&aa[0], &bb[0], aa.shape[0])
+
+    def getTokens(self):
+        """return all tokens as a numpy array in the order of submission."""
+        cdef int n = self.thisptr.getNumNodes()
+        tokens = numpy.zeros(n, dtype=numpy.intc)
+        cdef int[::1] view = tokens
+        cdef int x
+        for x in range(n):
+            view[x] = self.thisptr.getToken(x + 1)
+        return tokens
+
+    def getLabels(self):
+        """return the component label of each token as a numpy array.
+        Labels are numbered from 0 in the order of :meth:`getTokens`.
+        """
+        labels = numpy.zeros(self.thisptr.getNumNodes(), dtype=numpy.intc)
+        cdef int[::1] view = labels
+        if len(labels) > 0:
+            self.thisptr.getLabels(&view[0])
+        return labels
+
     def getComponents(self):
         """return all connected components as a list of lists."""
-        components = {}
-        
-        for x in range(1, self.thisptr.getNumNodes() + 1):
-            c = self.thisptr.getComponent(x)
-            if c not in components: components[c] = []
-            components[ c  ].append( self.thisptr.getToken( x ) )
-        
-        return components.values()
+        return _groupTokens(self.getTokens().tolist(), self.getLabels())
 
     def reset(self):
         """clear graph.
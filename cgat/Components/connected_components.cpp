@@ -1,7 +1,7 @@
 #include "connected_components.h"
 #include <cassert>
 #include <vector>
-#include <map>
+#include <unordered_map>
 #include <iostream>
 
 template<class T>
@@ -116,6 +116,16 @@ bool Components<T>::add( const T & a, const T & b )
   return retval;
 }
 
+//------------------------------------------------------------------------
+template<class T>
+int Components<T>::addEdges( const T * a, const T * b, int n )
+{
+  int njoined = 0;
+  for (int x = 0; x < n; ++x)
+    if (add( a[x], b[x] )) ++njoined;
+  return njoined;
+}
+
 //------------------------------------------------------------------------
 template<class T>
 int Components<T>::get( const T & v) 
@@ -171,6 +181,24 @@ const T & Components<T>::getToken(Index i)
 }
 
 
+//------------------------------------------------------------------------
+template<class T>
+int Components<T>::getLabels( int * labels )
+{
+  Index nnodes = mMapVertex2Token.size();
+  std::vector< int > root2label( mDad.size(), -1 );
+  int nlabels = 0;
+
+  for (Index i = 1; i <= nnodes; ++i)
+    {
+      Index root = getComponent( i );
+      if (root2label[root] < 0)
+	root2label[root] = nlabels++;
+      labels[i - 1] = root2label[root];
+    }
+  return nlabels;
+}
+
 //------------------------------------------------------------------------
 template<class T>
 void Components<T>::reset()
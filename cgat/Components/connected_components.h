@@ -5,7 +5,7 @@
 #define _connected_components_h
 
 #include <vector>
-#include <map>
+#include <unordered_map>
 #include <string>
 
 template<class T>
@@ -28,6 +28,14 @@ class Components
   */
   virtual bool add( const T & a, const T & b);
 
+  /** @brief add links between tokens in two arrays
+      @param a array of first tokens
+      @param b array of second tokens
+      @param n number of links
+      @return number of links that joined two disconnected components
+  */
+  virtual int addEdges( const T * a, const T * b, int n);
+
   // start from new
   virtual void reset();
   
@@ -60,10 +68,18 @@ class Components
   */
   virtual int getNumNodes();
 
+  /** @brief label components
+      @param labels array of size getNumNodes() to store the
+      component label of each node in order of submission. Components
+      are numbered consecutively from 0 in order of their first node.
+      @return number of components
+  */
+  virtual int getLabels( int * labels );
+
  protected:
 
-  typedef typename std::map< T, Index > MapToken2Vertex;
-  typedef typename std::map< T, Index >::iterator MapToken2VertexIterator;
+  typedef typename std::unordered_map< T, Index > MapToken2Vertex;
+  typedef typename std::unordered_map< T, Index >::iterator MapToken2VertexIterator;
   
   std::vector< Index > mDad;
 
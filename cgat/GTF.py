@@ -30,12 +30,20 @@ Apart from basic iteration, this module provides the following utilities:
 * Read GTF formatted files and optionally index them: :func:`readFromFile`,
   :func:`readAsIntervals`, :func:`readAndIndex`
 
+* Random access to tabix indexed files by region and identifier:
+  :class:`IndexedGTF`, :func:`buildIndexedGTF`
+
 * Manipulate lists of GTF records: :func:`asRanges`, :func:`CombineOverlaps`,
   :func:`SortPerContig`, :func:`toIntronIntervals`, :func:`toSequence`
 
 """
 
 import collections
+import heapq
+import itertools
+import os
+import pickle
+import tempfile
 from cgat import Intervals as Intervals
 from cgat import Genomics as Genomics
 from cgat import IndexedGenome as IndexedGenome
@@ -331,33 +339,137 @@ def iterator_min_feature_length(gff_iterator, min_length, feature="exon"):
             yield gffs
 
 
-def iterator_sorted(gff_iterator, sort_order="gene"):
-    '''sort input and yield sorted output.'''
-    entries = list(gff_iterator)
-    if sort_order == "gene":
-        entries.sort(key=lambda x: (x.gene_id, x.contig, x.start))
+def getSortKey(sort_order):
+    """return a function computing the key of an entry for sorting
+    in *sort_order*, see :func:`iterator_sorted`.
+
+    For ``position+gene``, the key is the one used for sorting entries
+    before genes are sorted by position. Returns None if the sort
+    order is unknown.
+    """
+    if sort_order in ("gene", "gene+position"):
+        return lambda x: (x.gene_id, x.contig, x.start)
     elif sort_order == "gene+transcript":
-        entries.sort(
-            key=lambda x: (x.gene_id, x.transcript_id, x.contig, x.start))
+        return lambda x: (x.gene_id, x.transcript_id, x.contig, x.start)
     elif sort_order == "contig+gene":
-        entries.sort(
-            key=lambda x: (x.contig, x.gene_id, x.transcript_id, x.start))
+        return lambda x: (x.contig, x.gene_id, x.transcript_id, x.start)
     elif sort_order == "transcript":
-        entries.sort(key=lambda x: (x.transcript_id, x.contig, x.start))
+        return lambda x: (x.transcript_id, x.contig, x.start)
     elif sort_order == "position":
-        entries.sort(key=lambda x: (x.contig, x.start))
+        return lambda x: (x.contig, x.start)
     elif sort_order == "position+gene":
-        entries.sort(key=lambda x: (x.gene_id, x.start))
+        return lambda x: (x.gene_id, x.start)
+    elif sort_order == "gene+exon":
+        return lambda x: (x.gene_id, x.exon_number)
+    return None
+
+
+def iterator_sorted(gff_iterator, sort_order="gene"):
+    '''sort input and yield sorted output.'''
+    entries = list(gff_iterator)
+    key = getSortKey(sort_order)
+    if key is not None:
+        entries.sort(key=key)
+    if sort_order == "position+gene":
         genes = list(flat_gene_iterator(entries))
         genes.sort(key=lambda x: (x[0].contig, x[0].start))
         entries = iotools.flatten(genes)
-    elif sort_order == "gene+exon":
-        entries.sort(key=lambda x: (x.gene_id, x.exon_number))
 
     for entry in entries:
         yield entry
 
 
+def _iterator_sorted_runs(records, max_records, tmpdir=None):
+    """sort tuples of ``(key, line)`` in *records* and yield the lines
+    in sorted order.
+
+    At most *max_records* records are kept in memory. Larger inputs
+    are sorted in runs that are written to temporary files in
+    *tmpdir* and merged. Records with the same key are output in
+    input order.
+    """
+    runs = []
+    chunk = []
+
+    def _spill():
+        chunk.sort(key=lambda x: x[0])
+        outf = tempfile.TemporaryFile(dir=tmpdir)
+        for record in chunk:
+            pickle.dump(record, outf, pickle.HIGHEST_PROTOCOL)
+        outf.seek(0)
+        runs.append(outf)
+        del chunk[:]
+
+    def _read(inf):
+        while True:
+            try:
+                yield pickle.load(inf)
+            except EOFError:
+                break
+
+    try:
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= max_records:
+                _spill()
+
+        if not runs:
+            chunk.sort(key=lambda x: x[0])
+            for key, line in chunk:
+                yield line
+            return
+
+        if chunk:
+            _spill()
+        for key, line in heapq.merge(*[_read(x) for x in runs],
+                                     key=lambda x: x[0]):
+            yield line
+    finally:
+        for run in runs:
+            run.close()
+
+
+def iterator_sorted_external(gff_iterator, sort_order="gene",
+                             max_entries=1000000, tmpdir=None):
+    """sort input with bounded memory and yield sorted output.
+
+    The output order is the same as for :func:`iterator_sorted`.
+    At most *max_entries* entries are kept in memory as tuples of
+    sort key and formatted entry. Larger inputs are sorted in runs
+    that are written to temporary files in *tmpdir* and merged.
+
+    The entries are returned as :class:`pysam.GTFProxy` objects.
+    """
+    key = getSortKey(sort_order)
+    if key is None:
+        raise ValueError("unknown sort order %s" % sort_order)
+
+    lines = _iterator_sorted_runs(
+        ((key(x), str(x)) for x in gff_iterator), max_entries, tmpdir)
+
+    if sort_order == "position+gene":
+        # sort genes by position of their first entry, entries
+        # within a gene remain in order
+        def _genes(lines):
+            for idx, gene in enumerate(flat_gene_iterator(
+                    _iterator_parsed(lines))):
+                for x in gene:
+                    yield (gene[0].contig, gene[0].start, idx), str(x)
+
+        lines = _iterator_sorted_runs(_genes(lines), max_entries, tmpdir)
+
+    for entry in _iterator_parsed(lines):
+        yield entry
+
+
+def _iterator_parsed(lines):
+    """parse formatted entries in *lines*."""
+    parser = pysam.asGTF()
+    for line in lines:
+        line = line.encode("utf-8")
+        yield parser(line, len(line))
+
+
 def iterator_overlapping_genes(gtf_iterator, min_overlap=0):
     """return overlapping genes."""
 
@@ -714,6 +826,212 @@ def readAndIndex(iterator, with_value=True):
     return index
 
 
+def isIndexed(filename):
+    """return True if *filename* is a compressed file indexed with tabix.
+    """
+    return isinstance(filename, str) and os.path.exists(filename + ".tbi")
+
+
+def buildIndexedGTF(gff_iterator, filename, max_entries=1000000,
+                    tmpdir=None):
+    """sort entries in *gff_iterator* by position and save them in
+    *filename*.
+
+    The file is compressed with bgzip and indexed with tabix. The
+    locations of genes and transcripts are saved in a side index,
+    see :class:`IndexedGTF`. The entries are sorted with bounded
+    memory using :func:`iterator_sorted_external`.
+
+    Returns an :class:`IndexedGTF`.
+    """
+    extents = {}
+    with tempfile.NamedTemporaryFile(mode="w", dir=tmpdir,
+                                     delete=False) as outf:
+        for gff in iterator_sorted_external(gff_iterator,
+                                            sort_order="position",
+                                            max_entries=max_entries,
+                                            tmpdir=tmpdir):
+            _addExtent(extents, gff)
+            outf.write("%s\n" % str(gff))
+
+    try:
+        pysam.tabix_compress(outf.name, filename, force=True)
+    finally:
+        os.unlink(outf.name)
+    pysam.tabix_index(filename, preset="gff", force=True)
+    _writeExtents(filename + ".ids.gz", extents)
+    return IndexedGTF(filename)
+
+
+def _addExtent(extents, gff):
+    """update gene and transcript locations in *extents* with *gff*."""
+    for key in (("gene", gff.gene_id, gff.contig),
+                ("transcript", gff.transcript_id, gff.contig)):
+        if key in extents:
+            extent = extents[key]
+            extent[0] = min(extent[0], gff.start)
+            extent[1] = max(extent[1], gff.end)
+        else:
+            extents[key] = [gff.start, gff.end]
+
+
+def _writeExtents(filename, extents):
+    with iotools.open_file(filename, "w") as outf:
+        outf.write("type\tid\tcontig\tstart\tend\n")
+        for (id_type, id, contig), (start, end) in sorted(extents.items()):
+            outf.write("%s\t%s\t%s\t%i\t%i\n" %
+                       (id_type, id, contig, start, end))
+
+
+class IndexedGTF(object):
+    """random access to entries in a :term:`gtf` formatted file by
+    region and by gene or transcript identifier.
+
+    *filename* needs to be sorted by position, compressed with bgzip
+    and indexed with tabix, see :func:`buildIndexedGTF`. Entries are
+    returned as :class:`pysam.GTFProxy` objects.
+
+    The locations of genes and transcripts on each contig are kept in
+    a side index ``filename.ids.gz``. Entries for an identifier are
+    fetched from these locations. The side index is built by reading
+    the file once if it does not exist.
+    """
+
+    def __init__(self, filename):
+        if not isIndexed(filename):
+            raise ValueError("%s is not indexed with tabix" % filename)
+        self.mFilename = filename
+        self.mFile = pysam.TabixFile(filename, parser=pysam.asGTF())
+        self.mContigs = set(self.mFile.contigs)
+        self.mExtents = None
+
+    def _loadExtents(self):
+        if self.mExtents is not None:
+            return
+        filename = self.mFilename + ".ids.gz"
+        if not os.path.exists(filename):
+            extents = {}
+            for gff in self.fetch():
+                _addExtent(extents, gff)
+            _writeExtents(filename, extents)
+
+        self.mExtents = {"gene": collections.defaultdict(list),
+                         "transcript": collections.defaultdict(list)}
+        with iotools.open_file(filename) as inf:
+            for line in inf:
+                if line.startswith("type\t"):
+                    continue
+                id_type, id, contig, start, end = line[:-1].split("\t")
+                self.mExtents[id_type][id].append(
+                    (contig, int(start), int(end)))
+
+    def getContigs(self):
+        """return contigs in the file."""
+        return self.mFile.contigs
+
+    def fetch(self, contig=None, start=None, end=None):
+        """iterate over entries overlapping a region.
+
+        Iterate over all entries if *contig* is None.
+        """
+        if contig is None:
+            return itertools.chain.from_iterable(
+                self.mFile.fetch(x) for x in self.getContigs())
+        if contig not in self.mContigs:
+            return iter([])
+        return self.mFile.fetch(contig, start, end)
+
+    def getExtents(self, id, by="gene"):
+        """return list of tuples (contig, start, end) with the location
+        of gene or transcript *id* on each contig.
+
+        *by* is ``gene`` or ``transcript``.
+        """
+        self._loadExtents()
+        if id not in self.mExtents[by]:
+            raise KeyError("%s %s not in index" % (by, id))
+        return self.mExtents[by][id]
+
+    def hasId(self, id, by="gene"):
+        """return True if gene or transcript *id* is in the file."""
+        self._loadExtents()
+        return id in self.mExtents[by]
+
+    def iterator_ids(self, ids, by="gene"):
+        """iterate over entries of genes or transcripts in *ids* in the
+        order of the file.
+
+        Identifiers not in the file are ignored.
+        """
+        self._loadExtents()
+        ids = set(ids)
+        if by == "gene":
+            keyf = lambda x: x.gene_id
+        else:
+            keyf = lambda x: x.transcript_id
+
+        regions = collections.defaultdict(list)
+        for id in ids:
+            for contig, start, end in self.mExtents[by].get(id, []):
+                regions[contig].append((start, end))
+
+        # entries of an identifier are contained in its extent, so
+        # merged extents yield each entry once.
+        for contig in self.getContigs():
+            if contig not in regions:
+                continue
+            for start, end in Intervals.combine(regions[contig]):
+                for gff in self.fetch(contig, start, end):
+                    if keyf(gff) in ids:
+                        yield gff
+
+    def getGene(self, gene_id):
+        """return list of entries of gene *gene_id*."""
+        return list(self.iterator_ids([gene_id], by="gene"))
+
+    def getTranscript(self, transcript_id):
+        """return list of entries of transcript *transcript_id*."""
+        return list(self.iterator_ids([transcript_id], by="transcript"))
+
+    def getGenes(self, gene_ids):
+        """iterate over lists of entries for each gene in *gene_ids*.
+
+        Raises a KeyError for unknown genes.
+        """
+        for gene_id in gene_ids:
+            self.getExtents(gene_id, by="gene")
+            yield self.getGene(gene_id)
+
+    def getTranscripts(self, transcript_ids):
+        """iterate over lists of entries for each transcript in
+        *transcript_ids*.
+
+        Raises a KeyError for unknown transcripts.
+        """
+        for transcript_id in transcript_ids:
+            self.getExtents(transcript_id, by="transcript")
+            yield self.getTranscript(transcript_id)
+
+    def fetchGenes(self, contig, start=None, end=None):
+        """iterate over lists of entries for each gene overlapping a
+        region.
+
+        All entries of a gene are returned, including those outside
+        the region. Genes are sorted by their first entry.
+        """
+        gene_ids = []
+        found = set()
+        for gff in self.fetch(contig, start, end):
+            if gff.gene_id not in found:
+                found.add(gff.gene_id)
+                gene_ids.append(gff.gene_id)
+        for gene_id in gene_ids:
+            yield self.getGene(gene_id)
+
+    def close(self):
+        self.mFile.close()
+
+
 class Error(Exception):
     """Base class for exceptions in this module."""
 
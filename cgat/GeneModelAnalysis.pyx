@@ -15,7 +15,6 @@ import time
 import tempfile
 import subprocess
 import types
-import bisect
 import array
 import collections
 import itertools
@@ -41,6 +40,21 @@ except ImportError:
     pass
 
 
+def guessFormat(filename):
+    """return format of *filename* from its extension.
+
+    Returns one of ``gtf``, ``gff`` or ``bed`` or None if the
+    format can not be determined.
+    """
+    if filename.endswith(".gtf") or filename.endswith(".gtf.gz"):
+        return "gtf"
+    elif filename.endswith(".gff") or filename.endswith(".gff.gz"):
+        return "gff"
+    elif filename.endswith(".bed") or filename.endswith(".bed.gz"):
+        return "bed"
+    return None
+
+
 def readIntervalsFromGFF(filename_gff, source, feature,
                          with_values=False, with_records=False, fasta=None,
                          merge_genes=False, format="gtf", use_strand=False):
@@ -54,13 +68,7 @@ def readIntervalsFromGFF(filename_gff, source, feature,
 
     if format is None:
         if isinstance(filename_gff, str):
-            fn = filename_gff
-            if fn.endswith(".gtf") or fn.endswith(".gtf.gz"):
-                format = "gtf"
-            elif fn.endswith(".gff") or fn.endswith(".gff.gz"):
-                format = "gff"
-            elif fn.endswith(".bed") or fn.endswith(".bed.gz"):
-                format = "bed"
+            format = guessFormat(filename_gff)
         else:
             format = "gff"
 
@@ -150,6 +158,59 @@ def readIntervalsFromGFF(filename_gff, source, feature,
     return e
 
 
+def buildSortedArray(intervals, copy_records=False):
+    """build :class:`IndexedGenome.SortedArray` from a dictionary of
+    interval lists as returned by :func:`readIntervalsFromGFF`.
+
+    If *copy_records* is set, pysam GTF records are copied to
+    :class:`GTF.Entry` objects so that the index can be saved.
+    """
+    index = IndexedGenome.SortedArray()
+    for contig, values in intervals.items():
+        for start, end, value in values:
+            if copy_records and isinstance(value, pysam.GTFProxy):
+                value = GTF.Entry().copy(value)
+            index.add(contig, start, end, value)
+    return index
+
+
+class IndexedIntersectors(object):
+    """dictionary of intersectors for a :term:`gtf` file indexed
+    with tabix, see :class:`GTF.IndexedGTF`.
+
+    Intersectors are built by *counter* when a contig is first
+    accessed. Only the intersectors for the most recent contig are
+    kept, so input sorted by contig reads the file once.
+    """
+
+    def __init__(self, counter, filename_gff, source, feature):
+        self.mCounter = counter
+        self.mIndex = GTF.IndexedGTF(filename_gff)
+        self.mSource = source
+        self.mFeature = feature
+        self.mContig = None
+        self.mIntersectors = {}
+
+    def _load(self, key):
+        if isinstance(key, tuple):
+            contig = key[0]
+        else:
+            contig = key
+        if contig != self.mContig:
+            self.mContig = contig
+            self.mIntersectors = self.mCounter.buildIntersectors(
+                self.mCounter.readIntervals(
+                    list(self.mIndex.fetch(contig)),
+                    self.mSource, self.mFeature))
+        return self.mIntersectors
+
+    def __contains__(self, key):
+        return key in self._load(key)
+
+    def __getitem__(self, key):
+        return self._load(key)[key]
+
+
 class Counter:
     """
     This class does not remove small exons/introns,
@@ -194,6 +255,47 @@ class Counter:
         self.contig = self.getContig()
         self.strand = self.getStrand()
 
+    def loadIndex(self, filename_gff, source, feature, reader):
+        """return :class:`IndexedGenome.SortedArray` with intervals
+        from *filename_gff*.
+
+        If an index cache directory is given in the options, the index
+        is loaded from the cache. Otherwise, or if it is not in the
+        cache, the index is built from the intervals returned by
+        *reader*.
+        """
+        cache_dir = getattr(self.options, "index_cache_dir", None)
+        if not cache_dir or not isinstance(filename_gff, str):
+            return buildSortedArray(reader())
+
+        max_size = getattr(self.options, "index_cache_size", None)
+        if max_size is not None:
+            max_size = int(max_size * 1024 * 1024)
+        cache = IndexedGenome.IndexCache(cache_dir, max_size=max_size)
+
+        # contig names are translated if a genome is given
+        if self.fasta:
+            genome = getattr(self.options, "genome_file", None)
+        else:
+            genome = None
+        key = cache.getKey(filename_gff,
+                           self.__class__.__name__,
+                           source,
+                           feature,
+                           self.options.filename_format,
+                           genome)
+
+        index = cache.get(key)
+        if index is None:
+            index = buildSortedArray(reader(), copy_records=True)
+            cache.put(key, index)
+            E.info("added index for %s to cache %s" %
+                   (filename_gff, cache_dir))
+        else:
+            E.info("loaded index for %s from cache %s" %
+                   (filename_gff, cache_dir))
+        return index
+
     def getContig(self):
         contig = self.mGFFs[0].contig
         if self.fasta: contig = self.fasta.getToken( contig)
@@ -1978,6 +2080,34 @@ class CounterCompositionCpG(Counter):
 # ------------------------------------------------------------------------
 
 
+class CounterMotif(Counter):
+
+    '''count occurrences of nucleotide motifs.
+
+    Motifs are counted in the sequence of the transcript/gene with
+    the :class:`Motifs.MotifScanner` *scanner*.
+    '''
+
+    def __init__(self, scanner, *args, **kwargs):
+        self.scanner = scanner
+        if len(scanner.motifs) == 1:
+            self.header = ("motif_counts",)
+        else:
+            self.header = tuple(["motif_counts_%s" % x
+                                 for x in scanner.motifs])
+        Counter.__init__(self, *args, **kwargs)
+
+    def count(self):
+        ee = self.getSegments()
+        s = self.getSequence(ee)
+        self.result = self.scanner.count(s)
+
+    def __str__(self):
+        return "\t".join(map(str, self.result))
+
+# ------------------------------------------------------------------------
+
+
 class CounterOverlap(Counter):
 
     """count overlap with segments in another file.
@@ -2013,16 +2143,40 @@ class CounterOverlap(Counter):
         if len(filename_gff) != 1:
             raise ValueError("expected one gff file")
 
-        e = readIntervalsFromGFF(filename_gff[0],
-                                 source,
-                                 feature,
-                                 self.mWithValues,
-                                 self.mWithRecords,
-                                 self.fasta,
-                                 format=self.options.filename_format,
-                                 use_strand=self.mUseStrand)
+        self.mIntersectors = self.loadIntersectors(
+            filename_gff[0], source, feature)
 
-        # convert intervals to intersectors
+        E.info("loading data finished")
+
+    def readIntervals(self, filename_gff, source, feature):
+
+        return readIntervalsFromGFF(filename_gff,
+                                    source,
+                                    feature,
+                                    self.mWithValues,
+                                    self.mWithRecords,
+                                    self.fasta,
+                                    format=self.options.filename_format,
+                                    use_strand=self.mUseStrand)
+
+    def loadIntersectors(self, filename_gff, source, feature):
+        """return dictionary of intersectors for each contig.
+
+        If *filename_gff* is a :term:`gtf` or :term:`gff` file
+        indexed with tabix, intersectors are built on demand for one
+        contig at a time, see :class:`IndexedIntersectors`.
+        """
+        format = self.options.filename_format or guessFormat(filename_gff)
+        if format in ("gtf", "gff") and self.fasta is None and \
+           GTF.isIndexed(filename_gff):
+            E.info("loading data from %s on demand" % filename_gff)
+            return IndexedIntersectors(self, filename_gff, source, feature)
+
+        return self.buildIntersectors(
+            self.readIntervals(filename_gff, source, feature))
+
+    def buildIntersectors(self, e):
+        """convert dictionary of intervals to intersectors."""
         for key in list(e.keys()):
             intersector = quicksect.IntervalTree()
             if self.mWithValues or self.mWithRecords:
@@ -2034,9 +2188,7 @@ class CounterOverlap(Counter):
 
             e[key] = intersector
 
-        self.mIntersectors = e
-
-        E.info("loading data finished")
+        return e
 
     def count(self):
 
@@ -2630,7 +2782,7 @@ class ClassifierRNASeq(Counter):
 
         map_transcript2gene = {}
         transcripts = {}
-        transcript_intervals = IndexedGenome.Quicksect()
+        transcript_intervals = IndexedGenome.SortedArray()
 
         f = iotools.open_file(filename_gff[0])
 
@@ -3049,7 +3201,7 @@ class ClassifierRNASeqSplicing(Counter):
 
         map_transcript2gene = {}
         transcripts = {}
-        transcript_intervals = IndexedGenome.Quicksect()
+        transcript_intervals = IndexedGenome.SortedArray()
 
         f = iotools.open_file(filename_gff[0])
 
@@ -3957,23 +4109,11 @@ class CounterDistance(Counter):
         if len(filename_gff) != 1:
             raise ValueError("expected only one gff file")
 
-        e = self.readIntervals(filename_gff[0], source, feature)
-
-        # collect start and end points and points of intersection
-        self.startPoints, self.startValues = {}, {}
-        self.endPoints, self.endValues = {}, {}
-        self.mIntervals = IndexedGenome.IndexedGenome()
-
-        for contig, values in list(e.items()):
-            for start, end, value in values:
-                self.mIntervals.add(contig, start, end, value)
-
-            values.sort(key=lambda x: x[0])
-            self.startPoints[contig] = [x[0] for x in values]
-            self.startValues[contig] = [x[2] for x in values]
-            values.sort(key=lambda x: x[1])
-            self.endPoints[contig] = [x[1] for x in values]
-            self.endValues[contig] = [x[2] for x in values]
+        # sorted arrays permit finding overlapping and closest
+        # intervals with the same index
+        self.mIntervals = self.loadIndex(
+            filename_gff[0], source, feature,
+            lambda: self.readIntervals(filename_gff[0], source, feature))
 
         E.info("loading data finished")
 
@@ -4020,23 +4160,21 @@ class CounterDistance(Counter):
             self.mDistance = 0
             self.mData = [x[2] for x in self.mOverlaps]
         else:
-            if contig in self.startValues:
-                entry_before = bisect.bisect(self.endPoints[contig], start) - 1
-                entry_after = bisect.bisect(self.startPoints[contig], end)
-
-                if entry_before >= 0:
-                    e = self.endValues[contig][entry_before]
-                    self.mDistance5 = start - e.end
-                    self.strand5 = e.strand
-                    self.mData5 = e
-                    has5 = True
-
-                if entry_after < len(self.startPoints[contig]):
-                    e = self.startValues[contig][entry_after]
-                    self.mDistance3 = e.start - end
-                    self.strand3 = e.strand
-                    self.mData3 = e
-                    has3 = True
+            before, after = self.mIntervals.closest(contig, start, end)
+
+            if before is not None:
+                e = before[2]
+                self.mDistance5 = start - e.end
+                self.strand5 = e.strand
+                self.mData5 = e
+                has5 = True
+
+            if after is not None:
+                e = after[2]
+                self.mDistance3 = e.start - end
+                self.strand3 = e.strand
+                self.mData3 = e
+                has3 = True
 
             if has5 and has3:
                 if self.mDistance5 < self.mDistance3:
@@ -4432,6 +4570,16 @@ class CounterProximity(CounterOverlap):
 
         self.mProximalDistance = self.options.proximal_distance
 
+    def loadIntersectors(self, filename_gff, source, feature):
+        """return sorted array index for each contig.
+
+        Segments are tuples of (start, end, value).
+        """
+        index = self.loadIndex(
+            filename_gff, source, feature,
+            lambda: self.readIntervals(filename_gff, source, feature))
+        return index.mIndex
+
     def count(self):
 
         # collect overlapping segments
@@ -4448,16 +4596,15 @@ class CounterProximity(CounterOverlap):
         end += self.mProximalDistance
 
         if contig in self.mIntersectors:
-            self.mSegments = self.mIntersectors[contig].find(quicksect.Interval(start, end))
+            self.mSegments = self.mIntersectors[contig].find(start, end)
         else:
             self.mSegments = []
 
     def __str__(self):
-        s = Stats.Summary([x.value for x in self.mSegments])
-        values = ";".join(["%s-%s:%s" % (x.start, x.end, x.value)
-                           for x in self.mSegments])
-        length = sum([x.end - x.start for x in self.mSegments])
-        lengths = ";".join([str(x.end - x.start) for x in self.mSegments])
+        s = Stats.Summary([x[2] for x in self.mSegments])
+        values = ";".join(["%s-%s:%s" % x for x in self.mSegments])
+        length = sum([x[1] - x[0] for x in self.mSegments])
+        lengths = ";".join([str(x[1] - x[0]) for x in self.mSegments])
         return "\t".join((str(s), str(length), lengths, values))
 
 # ------------------------------------------------------------------------
@@ -4491,7 +4638,7 @@ class CounterProximityExclusive(CounterProximity):
         new = []
         for ss in self.mSegments:
             for s, e in segments:
-                if min(ss.end, e) - max(ss.start, s) > 0:
+                if min(ss[1], e) - max(ss[0], s) > 0:
                     break
             else:
                 new.append(ss)
@@ -4536,11 +4683,11 @@ class CounterProximityLengthMatched(CounterProximity):
             math.ceil((1.0 + self.mSizeDifference) * total_length))
         new = []
         for ss in self.mSegments:
-            l = ss.end - ss.start
+            l = ss[1] - ss[0]
             if l < min_length or l > max_length:
                 continue
             for s, e in segments:
-                if min(ss.end, e) - max(ss.start, s) > 0:
+                if min(ss[1], e) - max(ss[0], s) > 0:
                     break
             else:
                 new.append(ss)
@@ -4584,22 +4731,22 @@ class CounterNeighbours(CounterProximity):
 
         self.mDistances = []
 
-        for seg in self.mSegments:
-            if end < seg.start:
-                d = end - seg.start
-            elif seg.end < start:
-                d = start - seg.end
+        for seg_start, seg_end, value in self.mSegments:
+            if end < seg_start:
+                d = end - seg_start
+            elif seg_end < start:
+                d = start - seg_end
             else:
                 d = 0
 
-            if Genomics.IsNegativeStrand(seg.value.strand):
+            if Genomics.IsNegativeStrand(value.strand):
                 d = -d
 
             self.mDistances.append(d)
 
     def __str__(self):
 
-        ids = ";".join([x.value.gene_id for x in self.mSegments])
+        ids = ";".join([x[2].gene_id for x in self.mSegments])
         dists = ";".join(map(str, self.mDistances))
         return "\t".join((ids, dists))
 
@@ -1097,6 +1097,74 @@ def Alignment2PeptideAlignment(alignment,
     return map_query2sbjct, "".join(sbjct_residues)
 
 
+# symbols used for table-driven translation: nucleotides, N, gap
+# characters and all other characters. Codons are translated by
+# looking up the codon index 49 * x + 7 * y + z in a table.
+CODON_SYMBOLS = "ACGTN-X"
+NA2SYMBOL = numpy.full(256, CODON_SYMBOLS.index("X"), dtype=numpy.uint8)
+for x, c in enumerate(CODON_SYMBOLS[:5]):
+    NA2SYMBOL[ord(c)] = x
+    NA2SYMBOL[ord(c.lower())] = x
+NA2SYMBOL[ord("-")] = NA2SYMBOL[ord(".")] = CODON_SYMBOLS.index("-")
+
+# characters rendering a codon as lower case
+IS_LOWER_NA = numpy.zeros(256, dtype=bool)
+IS_LOWER_NA[numpy.frombuffer(b"acgtnx", dtype=numpy.uint8)] = True
+
+# map of bytes to lower case
+LOWER_CASE = numpy.frombuffer(
+    bytes(range(256)).lower(), dtype=numpy.uint8)
+
+_translation_tables = {}
+
+
+def getTranslationTable(is_seleno=False, ignore_n=False):
+    """return array with the amino acid (as byte) for each codon index.
+
+    The table is built from :func:`MapCodon2AA`.
+    """
+    key = (is_seleno, ignore_n)
+    if key not in _translation_tables:
+        size = len(CODON_SYMBOLS)
+        table = numpy.zeros(size ** 3, dtype=numpy.uint8)
+        for x, a in enumerate(CODON_SYMBOLS):
+            for y, b in enumerate(CODON_SYMBOLS):
+                for z, c in enumerate(CODON_SYMBOLS):
+                    table[x * size * size + y * size + z] = ord(MapCodon2AA(
+                        a + b + c, is_seleno=is_seleno, ignore_n=ignore_n))
+        _translation_tables[key] = table
+    return _translation_tables[key]
+
+
+def _translateArray(data, is_seleno, prefer_lowercase, ignore_n):
+    """translate byte array *data* of complete codons."""
+    codons = data.reshape(-1, 3)
+    symbols = NA2SYMBOL[codons].astype(numpy.int32)
+    size = len(CODON_SYMBOLS)
+    index = symbols[:, 0] * size * size + symbols[:, 1] * size + symbols[:, 2]
+    residues = getTranslationTable(is_seleno, ignore_n)[index]
+    lower = IS_LOWER_NA[codons]
+    if prefer_lowercase:
+        is_lower = lower.any(axis=1)
+    else:
+        is_lower = lower.all(axis=1)
+    return numpy.where(is_lower, LOWER_CASE[residues], residues)
+
+
+def _translateCodon(codon, is_seleno, prefer_lowercase, ignore_n):
+    """translate a single, possibly incomplete codon."""
+    if prefer_lowercase:
+        is_lower = any([c in "acgtnx" for c in codon])
+    else:
+        is_lower = all([c in "acgtnx" for c in codon])
+
+    aa = MapCodon2AA(codon.upper(), is_seleno=is_seleno, ignore_n=ignore_n)
+    if is_lower:
+        return aa.lower()
+    else:
+        return aa.upper()
+
+
 def translate(sequence,
               is_seleno=False,
               prefer_lowercase=True,
@@ -1110,29 +1178,85 @@ def translate(sequence,
     If ``ignore_n`` is set, codons with ``n`` are returned
     as ``?`` in order to distinguish them from stop codons.
 
+    A codon is translated into a lower case amino acid if any
+    (``prefer_lowercase`` is set) or all of its characters are
+    lower case nucleotides.
+
+    An incomplete codon at the end of the sequence is translated
+    if it can be mapped unambiguously.
     '''
-    residues = []
+    return translateBatch([sequence],
+                          is_seleno=is_seleno,
+                          prefer_lowercase=prefer_lowercase,
+                          ignore_n=ignore_n)[0]
 
-    for x in range(0, len(sequence), 3):
-        if prefer_lowercase:
-            is_lower = False
-            for c in sequence[x:x + 3]:
-                is_lower = is_lower or c in "acgtnx"
-        else:
-            is_lower = True
-            for c in sequence[x:x + 3]:
-                is_lower = is_lower and c in "acgtnx"
-
-        if is_lower:
-            residues.append(MapCodon2AA(sequence[x:x + 3].upper(),
-                                        is_seleno=is_seleno,
-                                        ignore_n=ignore_n).lower())
-        else:
-            residues.append(MapCodon2AA(sequence[x:x + 3].upper(),
-                                        is_seleno=is_seleno,
-                                        ignore_n=ignore_n).upper())
 
-    return "".join(residues)
+def translateBatch(sequences,
+                   is_seleno=False,
+                   prefer_lowercase=True,
+                   ignore_n=False):
+    '''translate a list of DNA sequences into peptide sequences.
+
+    The codons of all sequences are translated together, which is
+    faster than translating many short sequences one by one. See
+    :func:`translate` for the options.
+
+    Returns
+    -------
+    list
+       list of peptide sequences
+    '''
+    sizes = [len(x) for x in sequences]
+    data = numpy.frombuffer(
+        "".join(sequences).encode("ascii", "replace"), dtype=numpy.uint8)
+
+    # collect complete codons of all sequences
+    full = [x - x % 3 for x in sizes]
+    if sum(full) == len(data):
+        codons = data
+    else:
+        starts = numpy.cumsum([0] + sizes[:-1])
+        codons = numpy.concatenate(
+            [data[start:start + size] for start, size in zip(starts, full)])
+
+    residues = _translateArray(
+        codons, is_seleno, prefer_lowercase, ignore_n).tobytes().decode(
+            "ascii")
+
+    result = []
+    offset = 0
+    for sequence, size in zip(sequences, full):
+        peptide = residues[offset:offset + size // 3]
+        if size < len(sequence):
+            peptide += _translateCodon(sequence[size:], is_seleno,
+                                       prefer_lowercase, ignore_n)
+        result.append(peptide)
+        offset += size // 3
+
+    return result
+
+
+def translateSixFrames(sequence, **kwargs):
+    '''translate a DNA sequence in all six frames.
+
+    Only complete codons are translated. See :func:`translate` for
+    the options.
+
+    Returns
+    -------
+    list
+       list of six peptide sequences. The first three are the
+       forward frames starting at positions 0, 1 and 2 of the
+       sequence, the last three the frames starting at positions
+       0, 1 and 2 of the reverse complement.
+    '''
+    reverse = reverse_complement(sequence)
+    frames = []
+    for s in (sequence, reverse):
+        for frame in range(3):
+            end = len(s) - (len(s) - frame) % 3
+            frames.append(s[frame:max(frame, end)])
+    return translateBatch(frames, **kwargs)
 
 
 def TranslateDNA2Protein(*args, **kwargs):
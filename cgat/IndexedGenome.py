@@ -17,11 +17,19 @@ quicksect
    to be installed. The benefit of quicksect is that it allows also
    quick retrieval of intervals that are closest before or after an query.
 
+sorted arrays
+   Intervals are stored per contig in numpy arrays sorted by start and
+   end coordinate together with a running maximum of end
+   coordinates. Overlap and nearest-neighbour queries are binary
+   searches with :func:`numpy.searchsorted` and can be issued for
+   many query intervals at once.
+
 The principal clas is :class:`IndexedGenome` which uses NCL and stores
 a value associated with each interval. :class:`Quicksect` is equivalent
 to :class:`IndexedGenome` but uses quicksect. The :class:`Simple` is a
 light-weight version of :class:`IndexedGenome` that does not store a
-value and thus preserves space.
+value and thus preserves space. :class:`SortedArray` provides the
+same queries as :class:`Quicksect` and adds batch and distance queries.
 
 The basic usage is::
 
@@ -33,12 +41,21 @@ The basic usage is::
    print index.contains("chr1", 1000, 2000)
    print index.get("chr1", 10000, 20000)
 
-The index is built in memory.
+The index is built in memory. :class:`SortedArray` indices can be
+saved to disk and memory-mapped. :class:`IndexCache` keeps such
+indices in a directory so that they need not be rebuilt by
+subsequent runs.
 
 Reference
 ---------
 
 '''
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy
 from cgat import NCL as ncl
 import quicksect
 
@@ -143,3 +160,444 @@ class Quicksect(IndexedGenome):
                         quicksect.Interval(start, end),
                         num_intervals,
                         max_dist)]
+
+
+class SortedArrayIndex(object):
+
+    '''interval container for a single contig based on sorted arrays.
+
+    Intervals are collected with :meth:`add` and the arrays are built
+    on the first query. Adding further intervals causes the arrays to
+    be rebuilt on the next query.
+
+    Coordinates are 0-based, half-open. An interval ending at the start
+    of a query is thus before the query and does not overlap it.
+
+    An index with pre-built arrays, for example memory-mapped from
+    disk, is created with :meth:`setArrays` and is read-only.
+    '''
+
+    def __init__(self):
+        self.mIntervals = []
+        self.mIsBuilt = False
+
+    def add(self, start, end, value=None):
+        if self.mIntervals is None:
+            raise ValueError("can not add to a pre-built index")
+        self.mIntervals.append((start, end, value))
+        self.mIsBuilt = False
+
+    def __len__(self):
+        if self.mIntervals is None:
+            return len(self.mStarts)
+        return len(self.mIntervals)
+
+    def build(self):
+        '''build arrays. Ties are kept in input order.'''
+        if self.mIsBuilt:
+            return
+        starts = numpy.array([x[0] for x in self.mIntervals],
+                             dtype=numpy.int64)
+        ends = numpy.array([x[1] for x in self.mIntervals],
+                           dtype=numpy.int64)
+
+        order = numpy.argsort(starts, kind="stable")
+        self.mStarts = starts[order]
+        self.mEnds = ends[order]
+        self.mData = [self.mIntervals[x][2] for x in order]
+        # the running maximum is sorted and permits skipping all
+        # intervals ending before a query
+        if len(order):
+            self.mMaxEnds = numpy.maximum.accumulate(self.mEnds)
+        else:
+            self.mMaxEnds = self.mEnds
+
+        self.mEndOrder = numpy.argsort(self.mEnds, kind="stable")
+        self.mSortedEnds = self.mEnds[self.mEndOrder]
+        self.mIsBuilt = True
+
+    def getArrays(self):
+        '''return tuple of arrays ``(starts, ends, maxends, endorder,
+        sortedends)`` and the sequence of values in the order of
+        *starts*.'''
+        self.build()
+        return ((self.mStarts, self.mEnds, self.mMaxEnds,
+                 self.mEndOrder, self.mSortedEnds), self.mData)
+
+    def setArrays(self, arrays, data):
+        '''set arrays as returned by :meth:`getArrays`.'''
+        (self.mStarts, self.mEnds, self.mMaxEnds,
+         self.mEndOrder, self.mSortedEnds) = arrays
+        self.mData = data
+        self.mIntervals = None
+        self.mIsBuilt = True
+
+    def find(self, start, end):
+        '''return list of intervals overlapping *start*, *end* as tuples
+        ``(start, end, value)`` sorted by start.'''
+        self.build()
+        lower = numpy.searchsorted(self.mMaxEnds, start, "right")
+        upper = numpy.searchsorted(self.mStarts, end, "left")
+        return [self.getValue(x) for x in range(lower, upper)
+                if self.mEnds[x] > start]
+
+    def before(self, start, num_intervals=1, max_dist=None):
+        '''return list of up to *num_intervals* intervals ending
+        before *start*, closest first.
+
+        As in :class:`Quicksect`, intervals ending at *start* are not
+        returned. Intervals with the same end as the last one returned
+        are included as well and are ordered by decreasing start.'''
+        self.build()
+        upper = numpy.searchsorted(self.mSortedEnds, start, "left")
+        lower = max(0, upper - num_intervals)
+        if max_dist is not None:
+            lower = max(lower, numpy.searchsorted(
+                self.mSortedEnds, start - max_dist, "left"))
+        if lower >= upper:
+            return []
+        lower = numpy.searchsorted(
+            self.mSortedEnds, self.mSortedEnds[lower], "left")
+        indices = sorted(self.mEndOrder[lower:upper],
+                         key=lambda x: (-self.mEnds[x], -self.mStarts[x], x))
+        return [self.getValue(x) for x in indices]
+
+    def after(self, end, num_intervals=1, max_dist=None):
+        '''return list of up to *num_intervals* intervals starting at or
+        after *end*, closest first.
+
+        Intervals with the same start as the last one returned are
+        included as well. As in :class:`Quicksect`, intervals with
+        the same start are returned in reverse order of addition.'''
+        self.build()
+        lower = numpy.searchsorted(self.mStarts, end, "left")
+        upper = min(len(self.mStarts), lower + num_intervals)
+        if max_dist is not None:
+            upper = min(upper, numpy.searchsorted(
+                self.mStarts, end + max_dist, "right"))
+        if lower >= upper:
+            return []
+        upper = numpy.searchsorted(
+            self.mStarts, self.mStarts[upper - 1], "right")
+        indices = sorted(range(lower, upper),
+                         key=lambda x: (self.mStarts[x], -x))
+        return [self.getValue(x) for x in indices]
+
+    def find_batch(self, starts, ends):
+        '''find intervals overlapping each of the query intervals in the
+        arrays *starts* and *ends*.
+
+        returns a tuple of numpy arrays ``(offsets, indices)``. The
+        indices of the intervals overlapping query ``i`` are
+        ``indices[offsets[i]:offsets[i+1]]``. Use :meth:`getValue` to
+        obtain the interval for an index.
+        '''
+        self.build()
+        starts = numpy.asarray(starts, dtype=numpy.int64)
+        ends = numpy.asarray(ends, dtype=numpy.int64)
+        lower = numpy.searchsorted(self.mMaxEnds, starts, "right")
+        upper = numpy.searchsorted(self.mStarts, ends, "left")
+        upper = numpy.maximum(lower, upper)
+
+        # expand candidate ranges and filter by end coordinate
+        sizes = upper - lower
+        query = numpy.repeat(numpy.arange(len(starts)), sizes)
+        first = numpy.repeat(lower - numpy.cumsum(sizes) + sizes, sizes)
+        candidates = numpy.arange(len(query)) + first
+        keep = self.mEnds[candidates] > starts[query]
+        indices = candidates[keep]
+        offsets = numpy.zeros(len(starts) + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(query[keep], minlength=len(starts)),
+                     out=offsets[1:])
+        return offsets, indices
+
+    def count_batch(self, starts, ends):
+        '''return numpy array with the number of intervals overlapping
+        each of the query intervals in *starts* and *ends*.
+
+        Intervals starting before the end of a query either overlap
+        it or end before its start.
+        '''
+        self.build()
+        return (numpy.searchsorted(self.mStarts, ends, "left") -
+                numpy.searchsorted(self.mSortedEnds, starts, "right"))
+
+    def distance_batch(self, starts, ends):
+        '''return the distances to the closest interval before and after
+        each of the query intervals in *starts* and *ends*.
+
+        returns a tuple of numpy arrays ``(distance, before, after)``.
+        *distance* is 0 for queries overlapping an interval and
+        otherwise the smaller of the distance to the closest interval
+        ending before and starting after the query. *before* and
+        *after* are the indices of these intervals, or -1 if there is
+        none. *distance* is -1 if the contig has no intervals.
+        '''
+        self.build()
+        starts = numpy.asarray(starts, dtype=numpy.int64)
+        ends = numpy.asarray(ends, dtype=numpy.int64)
+        nintervals = len(self.mStarts)
+
+        upper = numpy.searchsorted(self.mSortedEnds, starts, "right")
+        lower = numpy.searchsorted(self.mStarts, ends, "left")
+        overlap = lower - upper > 0
+
+        before = numpy.full(len(starts), -1, dtype=numpy.int64)
+        has_before = upper > 0
+        before[has_before] = self.mEndOrder[upper[has_before] - 1]
+        after = numpy.where(lower < nintervals, lower, -1)
+
+        infinity = numpy.iinfo(numpy.int64).max
+        d5 = numpy.full(len(starts), infinity, dtype=numpy.int64)
+        d5[has_before] = starts[has_before] - \
+            self.mEnds[before[has_before]]
+        d3 = numpy.full(len(starts), infinity, dtype=numpy.int64)
+        d3[after >= 0] = self.mStarts[after[after >= 0]] - ends[after >= 0]
+
+        distance = numpy.minimum(d5, d3)
+        distance[overlap] = 0
+        distance[distance == infinity] = -1
+        return distance, before, after
+
+    def getValue(self, index):
+        '''return interval ``(start, end, value)`` at *index*.'''
+        self.build()
+        return (int(self.mStarts[index]),
+                int(self.mEnds[index]),
+                self.mData[index])
+
+
+class SortedArray(IndexedGenome):
+
+    '''index intervals using sorted arrays.
+
+    Permits finding closest intervals in case there is no overlap
+    and querying many intervals at once.
+    '''
+    index_factory = SortedArrayIndex
+
+    def __init__(self, *args, **kwargs):
+        IndexedGenome.__init__(self, *args, **kwargs)
+
+    def add(self, contig, start, end, value=None):
+
+        if contig not in self.mIndex:
+            self.mIndex[contig] = self.index_factory()
+        self.mIndex[contig].add(start, end, value)
+
+    def _getIndex(self, contig):
+        if contig not in self.mIndex:
+            raise KeyError("contig %s not in index" % contig)
+        return self.mIndex[contig]
+
+    def get(self, contig, start, end):
+        '''return intervals overlapping with key.'''
+        return self._getIndex(contig).find(start, end)
+
+    def before(self, contig, start, end, num_intervals=1, max_dist=2500):
+        '''get closest intervals ending before *start*.
+
+        Set *max_dist* to None for no distance limit.
+        '''
+        return self._getIndex(contig).before(start, num_intervals, max_dist)
+
+    def after(self, contig, start, end, num_intervals=1, max_dist=2500):
+        '''get closest intervals starting after *end*.
+
+        Set *max_dist* to None for no distance limit.
+        '''
+        return self._getIndex(contig).after(end, num_intervals, max_dist)
+
+    def get_batch(self, contig, starts, ends):
+        '''return list of lists of intervals overlapping each query
+        interval in *starts* and *ends*.'''
+        index = self._getIndex(contig)
+        offsets, indices = index.find_batch(starts, ends)
+        return [[index.getValue(x)
+                 for x in indices[offsets[i]:offsets[i + 1]]]
+                for i in range(len(offsets) - 1)]
+
+    def count_batch(self, contig, starts, ends):
+        '''return number of intervals overlapping each query interval
+        in *starts* and *ends*.'''
+        return self._getIndex(contig).count_batch(starts, ends)
+
+    def closest(self, contig, start, end):
+        '''return tuple ``(before, after)`` with the closest interval
+        ending before *start* and starting after *end*. Either is None
+        if there is no such interval.'''
+        index = self._getIndex(contig)
+        distance, before, after = index.distance_batch([start], [end])
+        return (index.getValue(before[0]) if before[0] >= 0 else None,
+                index.getValue(after[0]) if after[0] >= 0 else None)
+
+    def distance_batch(self, contig, starts, ends):
+        '''return distance of each query interval in *starts* and *ends*
+        to the closest interval, see
+        :meth:`SortedArrayIndex.distance_batch`.'''
+        return self._getIndex(contig).distance_batch(starts, ends)
+
+    def save(self, filestem):
+        '''save index to files starting with *filestem*.
+
+        The arrays of all contigs are concatenated into
+        ``filestem.arrays.npy``, the values are written to a
+        :class:`NCL.ValueStore` and the contigs with their offsets
+        to a second store ``filestem.contigs``.
+        '''
+        contigs, arrays, offset = [], [], 0
+        values = []
+        for contig, index in self.mIndex.items():
+            a, data = index.getArrays()
+            contigs.append((contig, offset, len(a[0])))
+            arrays.append(numpy.vstack(a))
+            values.extend(data)
+            offset += len(a[0])
+
+        if arrays:
+            arrays = numpy.hstack(arrays)
+        else:
+            arrays = numpy.zeros((5, 0), dtype=numpy.int64)
+        numpy.save(filestem + ".arrays.npy", arrays)
+        ncl.writeValueStore(filestem, values)
+        ncl.writeValueStore(filestem + ".contigs", contigs)
+
+    def load(self, filestem):
+        '''load index saved with :meth:`save`.
+
+        The arrays and values are memory-mapped and the index is
+        read-only.
+        '''
+        arrays = numpy.load(filestem + ".arrays.npy", mmap_mode="r")
+        values = ncl.ValueStore(filestem)
+        contigs = ncl.ValueStore(filestem + ".contigs")
+        self.mIndex = {}
+        for x in range(len(contigs)):
+            contig, offset, size = contigs[x]
+            index = self.index_factory()
+            index.setArrays(
+                [arrays[y, offset:offset + size] for y in range(5)],
+                ValueSlice(values, offset, size))
+            self.mIndex[contig] = index
+
+
+class ValueSlice(object):
+
+    '''a view of *size* elements starting at *offset* in *values*.'''
+
+    def __init__(self, values, offset, size):
+        self.mValues = values
+        self.mOffset = offset
+        self.mSize = size
+
+    def __len__(self):
+        return self.mSize
+
+    def __getitem__(self, key):
+        if key < 0 or key >= self.mSize:
+            raise IndexError("index %i out of range" % key)
+        return self.mValues[self.mOffset + key]
+
+
+class IndexCache(object):
+
+    '''a cache of :class:`SortedArray` indices on disk.
+
+    Indices are stored in *directory* under a key that is computed
+    with :meth:`getKey` from the content of the file the index has
+    been built from and the parameters used to build it. An index is
+    thus never stale. Cached indices are memory-mapped when loaded.
+
+    If the total size of the cache exceeds *max_size* bytes, the least
+    recently used indices are removed after an index has been added.
+    '''
+
+    def __init__(self, directory, max_size=None):
+        self.mDirectory = directory
+        self.mMaxSize = max_size
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def getChecksum(self, filename, blocksize=1 << 20):
+        '''return checksum of the content of *filename*.'''
+        checksum = hashlib.sha1()
+        with open(filename, "rb") as inf:
+            while True:
+                block = inf.read(blocksize)
+                if not block:
+                    break
+                checksum.update(block)
+        return checksum.hexdigest()
+
+    def getKey(self, filename, *params):
+        '''return key for an index built from *filename* with
+        *params*.'''
+        key = hashlib.sha1(self.getChecksum(filename).encode("ascii"))
+        key.update(repr(params).encode("utf-8"))
+        return key.hexdigest()
+
+    def _getPath(self, key):
+        return os.path.join(self.mDirectory, key)
+
+    def __contains__(self, key):
+        return os.path.exists(
+            os.path.join(self._getPath(key), "index.arrays.npy"))
+
+    def get(self, key):
+        '''return index for *key* or None if not in cache.'''
+        if key not in self:
+            return None
+        path = self._getPath(key)
+        # the modification time records the last use for eviction
+        os.utime(path, None)
+        index = SortedArray()
+        index.load(os.path.join(path, "index"))
+        return index
+
+    def put(self, key, index):
+        '''add *index* to the cache under *key*.
+
+        The index is written to a temporary directory first so that
+        concurrent processes never see a partial index.
+        '''
+        if key in self:
+            return
+        tmpdir = tempfile.mkdtemp(dir=self.mDirectory, prefix=".tmp")
+        try:
+            index.save(os.path.join(tmpdir, "index"))
+            os.rename(tmpdir, self._getPath(key))
+        except OSError:
+            # another process has added the same index
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            if key not in self:
+                raise
+        self.evict(keep=key)
+
+    def getEntries(self):
+        '''return list of tuples ``(last_used, size, key)`` of
+        indices in the cache.'''
+        entries = []
+        for key in os.listdir(self.mDirectory):
+            path = self._getPath(key)
+            if key.startswith(".") or not os.path.isdir(path):
+                continue
+            size = sum([os.path.getsize(os.path.join(path, x))
+                        for x in os.listdir(path)])
+            entries.append((os.path.getmtime(path), size, key))
+        return entries
+
+    def evict(self, keep=None):
+        '''remove least recently used indices until the cache is
+        smaller than the maximum size. The index *keep* is not
+        removed.'''
+        if self.mMaxSize is None:
+            return
+        entries = sorted(self.getEntries())
+        total = sum([x[1] for x in entries])
+        for last_used, size, key in entries:
+            if total <= self.mMaxSize:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._getPath(key), ignore_errors=True)
+            total -= size
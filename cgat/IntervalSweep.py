@@ -0,0 +1,298 @@
+'''IntervalSweep.py - sweep-line algorithms on sorted interval streams
+===================================================================
+
+This module implements merge-join algorithms over streams of
+intervals that are sorted by position. Each stream is traversed once
+and only those intervals that can still overlap the current position
+are kept in memory. Memory usage thus depends on the local depth of
+the intervals, not on the size of the input.
+
+An interval is any object with the attributes ``contig``, ``start``
+and ``end`` in 0-based, half-open coordinates such as
+:class:`Bed.Bed` or :class:`GTF.Entry`. :class:`Interval` is a
+light-weight container for intervals built from other data.
+
+Streams need to be sorted by contig and then by start coordinate.
+Contigs are compared as strings, which is the order produced by
+``sort -k1,1 -k2,2n``. A :class:`ValueError` is raised if a stream is
+not sorted.
+
+The principal functions are:
+
+:func:`iterate_overlaps`
+   for each interval in a query stream, output the overlapping
+   intervals in one or more reference streams.
+
+:func:`iterate_nearest`
+   for each interval in a query stream, output the closest
+   non-overlapping intervals upstream and downstream in a reference
+   stream.
+
+:func:`iterate_chunks`
+   group overlapping intervals in a single stream.
+
+:func:`merge_streams`
+   combine several sorted streams into a single sorted stream.
+
+The basic usage is::
+
+   import cgat.IntervalSweep as IntervalSweep
+   for query, hits in IntervalSweep.iterate_overlaps(
+           Bed.iterator(infile1), Bed.iterator(infile2)):
+       print(query, IntervalSweep.covered_bases(
+           query.start, query.end, hits[0]))
+
+Reference
+---------
+
+'''
+
+import collections
+import heapq
+
+Interval = collections.namedtuple("Interval", "contig start end value")
+
+
+def check_sorted(iterator):
+    """yield intervals from *iterator* and raise a ValueError if the
+    intervals are not sorted by contig and start.
+    """
+    last = None
+    for interval in iterator:
+        if last is not None:
+            if interval.contig == last.contig:
+                if interval.start < last.start:
+                    raise ValueError(
+                        "intervals not sorted by position: %s:%i after %s:%i" %
+                        (interval.contig, interval.start,
+                         last.contig, last.start))
+            elif interval.contig < last.contig:
+                raise ValueError(
+                    "intervals not sorted by contig: %s after %s" %
+                    (interval.contig, last.contig))
+        last = interval
+        yield interval
+
+
+def merge_streams(*iterators):
+    """merge several sorted streams of intervals into a single sorted
+    stream.
+
+    The merge is lazy and keeps only one interval per stream in
+    memory.
+    """
+    return heapq.merge(*iterators, key=lambda x: (x.contig, x.start))
+
+
+def covered_bases(start, end, intervals):
+    """return number of bases in *start*, *end* that are covered by
+    at least one of *intervals*.
+
+    >>> covered_bases(0, 100, [Interval("chr1", 10, 20, None),
+    ...                        Interval("chr1", 15, 30, None),
+    ...                        Interval("chr1", 90, 120, None)])
+    30
+    """
+    covered, last = 0, start
+    for interval in sorted(intervals, key=lambda x: x.start):
+        left = max(interval.start, last)
+        right = min(interval.end, end)
+        if right > left:
+            covered += right - left
+            last = right
+    return covered
+
+
+class SweepCursor(object):
+    '''a cursor on a sorted stream of intervals.
+
+    Queries to the cursor need to be issued in sorted order. The
+    cursor keeps a buffer of intervals from the stream that start
+    before the end of the current query and that might overlap
+    the current or subsequent queries.
+
+    Zero-length intervals in the stream are ignored.
+    '''
+
+    def __init__(self, iterator):
+        self.iterator = check_sorted(iterator)
+        self.contig = None
+        self.buffer = []
+        # closest interval ending before the current query
+        self.upstream = None
+        self.next = next(self.iterator, None)
+
+    def _advance(self, contig, end):
+        """read intervals from the stream that start on *contig*
+        before *end*."""
+        interval = self.next
+        while interval is not None:
+            if interval.contig == contig:
+                if interval.start >= end:
+                    break
+                if interval.end > interval.start:
+                    self.buffer.append(interval)
+            elif interval.contig > contig:
+                break
+            interval = next(self.iterator, None)
+        self.next = interval
+
+    def fetch(self, contig, start, end):
+        """return list of intervals overlapping *start*, *end* on *contig*.
+
+        The intervals are returned sorted by start coordinate.
+        """
+        if contig != self.contig:
+            if self.contig is not None and contig < self.contig:
+                raise ValueError(
+                    "queries not sorted by contig: %s after %s" %
+                    (contig, self.contig))
+            self.contig = contig
+            self.buffer = []
+            self.upstream = None
+
+        self._advance(contig, end)
+
+        keep = []
+        for interval in self.buffer:
+            if interval.end > start:
+                keep.append(interval)
+            elif self.upstream is None or \
+                    interval.end >= self.upstream.end:
+                self.upstream = interval
+        self.buffer = keep
+        return [x for x in keep if x.start < end]
+
+    def nearest(self, contig, start, end):
+        """return a tuple (upstream, overlapping, downstream).
+
+        *upstream* is the interval with the largest end coordinate
+        ending at or before *start* and *downstream* is the interval
+        with the smallest start coordinate starting at or after
+        *end*. Either is None if there is no such interval on
+        *contig*. *overlapping* is the list of overlapping intervals.
+        """
+        overlapping = self.fetch(contig, start, end)
+        downstream = None
+        for interval in self.buffer:
+            if interval.start >= end:
+                downstream = interval
+                break
+        if downstream is None and self.next is not None and \
+                self.next.contig == contig:
+            downstream = self.next
+        return self.upstream, overlapping, downstream
+
+
+def iterate_overlaps(query, *references):
+    """iterate over intervals in *query* and return overlapping
+    intervals in each of the streams *references*.
+
+    Yields
+    ------
+    tuple
+       a tuple (interval, hits). *hits* is a list with the intervals
+       overlapping *interval* for each reference stream.
+    """
+    cursors = [SweepCursor(x) for x in references]
+    for interval in check_sorted(query):
+        yield interval, [cursor.fetch(interval.contig,
+                                      interval.start,
+                                      interval.end)
+                         for cursor in cursors]
+
+
+def iterate_nearest(query, reference):
+    """iterate over intervals in *query* and return closest intervals
+    in *reference*.
+
+    Yields
+    ------
+    tuple
+       a tuple (interval, upstream, overlapping, downstream), see
+       :meth:`SweepCursor.nearest`.
+    """
+    cursor = SweepCursor(reference)
+    for interval in check_sorted(query):
+        upstream, overlapping, downstream = cursor.nearest(
+            interval.contig, interval.start, interval.end)
+        yield interval, upstream, overlapping, downstream
+
+
+def is_contained_in_all(contig, start, end, cursors):
+    """return True if *start*, *end* overlaps with an interval in
+    each of *cursors*."""
+    for cursor in cursors:
+        if not cursor.fetch(contig, start, end):
+            return False
+    return True
+
+
+def is_contained_in_one(contig, start, end, cursors):
+    """return True if *start*, *end* overlaps with an interval in
+    any of *cursors*."""
+    for cursor in cursors:
+        if cursor.fetch(contig, start, end):
+            return True
+    return False
+
+
+def iterate_chunks(iterator, max_distance=0, partition=None, split=None):
+    """group intervals in a sorted stream into chunks of overlapping
+    intervals.
+
+    An interval is added to a chunk if it starts at most *max_distance*
+    bases after the end of the chunk. Intervals need to be sorted by
+    start within each contig, but contigs may appear in any order.
+
+    If *partition* is given, it is called with each interval and
+    intervals are grouped separately for each value returned, for
+    example per strand.
+
+    If *split* is given, it is called with the last interval added to
+    a chunk and the current interval. A new chunk is started if it
+    returns True.
+
+    Chunks are yielded as lists of intervals. At the end of a contig,
+    chunks that are still open are yielded in the order of their
+    partition.
+    """
+    chunks = collections.OrderedDict()
+    max_end = {}
+    last = None
+
+    for interval in iterator:
+        if partition is None:
+            key = None
+        else:
+            key = partition(interval)
+
+        if last is not None and interval.contig == last.contig:
+            if interval.start < last.start:
+                raise ValueError(
+                    "intervals not sorted by position: %s:%i after %s:%i" %
+                    (interval.contig, interval.start,
+                     last.contig, last.start))
+        elif last is not None:
+            for k in sorted(chunks, key=str):
+                yield chunks[k]
+            chunks.clear()
+            max_end.clear()
+
+        chunk = chunks.get(key, None)
+        if chunk is not None and (
+                interval.start - max_end[key] > max_distance or
+                (split is not None and split(chunk[-1], interval))):
+            yield chunk
+            chunk = None
+
+        if chunk is None:
+            chunk = chunks[key] = []
+
+        chunk.append(interval)
+        # the extent is kept across chunks started by *split*
+        max_end[key] = max(max_end.get(key, interval.end), interval.end)
+        last = interval
+
+    for k in sorted(chunks, key=str):
+        yield chunks[k]
@@ -14,11 +14,20 @@ An interval list is simply a list of such intervals.
 The majority of the functions in this module take one or more lists of
 intervals and return one or more new lists of intervals.
 
+Functions with the suffix ``Array`` such as :func:`combineArray`
+implement the same operations on numpy arrays of shape (N, 2). They
+are vectorized and suited for large interval sets such as all exons in
+a genome that are kept as arrays. For short lists such as the exons of
+a single gene, the list functions are faster as they avoid the
+conversion to and from arrays.
+
 Reference
 ---------
 
 '''
 
+import numpy
+
 
 def getLength(intervals):
     """return sum of intervals lengths.
@@ -479,3 +488,179 @@ def ShortenIntervalsOverlap(intervals, to_remove):
             new_intervals.append((this_from, this_to))
 
     return new_intervals
+
+
+def toList(a):
+    """convert an array of intervals to a list of tuples."""
+    return [tuple(x) for x in a.tolist()]
+
+
+def asIntervalArray(intervals):
+    """return intervals as integer array of shape (N, 2).
+
+    >>> asIntervalArray([(10, 20), (30, 40)]).tolist()
+    [[10, 20], [30, 40]]
+    """
+    a = numpy.asarray(intervals, dtype=numpy.int64)
+    if a.size == 0:
+        return numpy.zeros((0, 2), dtype=numpy.int64)
+    if a.ndim != 2 or a.shape[1] != 2:
+        raise ValueError("expected array of shape (N, 2), got %s" %
+                         str(a.shape))
+    return a
+
+
+def _sortArray(a):
+    """return intervals sorted by start and then end."""
+    return a[numpy.lexsort((a[:, 1], a[:, 0]))]
+
+
+def _mergeBlocks(starts, ends, new):
+    """merge consecutive intervals into blocks.
+
+    *new* is a boolean array flagging intervals 1 to N-1 that start a
+    new block. The end of a block is the end of its last interval.
+    """
+    breaks = numpy.flatnonzero(new) + 1
+    first = numpy.concatenate(([0], breaks))
+    last = numpy.concatenate((breaks - 1, [len(starts) - 1]))
+    return numpy.column_stack((starts[first], ends[last]))
+
+
+def combineArray(intervals):
+    """combine overlapping and adjacent intervals.
+
+    >>> combineArray(numpy.array([(10, 20), (15, 40), (40, 50)])).tolist()
+    [[10, 50]]
+    """
+    a = _sortArray(asIntervalArray(intervals))
+    if len(a) == 0:
+        return a
+    ends = numpy.maximum.accumulate(a[:, 1])
+    return _mergeBlocks(a[:, 0], ends, a[1:, 0] > ends[:-1])
+
+
+def complementArray(intervals, first=None, last=None):
+    """complement an array of intervals with intervals not in array.
+
+    See :func:`complement` for the meaning of *first* and *last*.
+
+    >>> complementArray(numpy.array([(10, 20), (30, 40)]), first=5).tolist()
+    [[5, 10], [20, 30]]
+    """
+    a = combineArray(intervals)
+    if len(a) == 0:
+        if first is not None and last is not None:
+            return numpy.array([(first, last)], dtype=numpy.int64)
+        return a
+
+    gaps = [numpy.column_stack((a[:-1, 1], a[1:, 0]))]
+    if first is not None and first < a[0, 0]:
+        gaps.insert(0, numpy.array([(first, a[0, 0])], dtype=numpy.int64))
+    if last and last > a[-1, 1]:
+        gaps.append(numpy.array([(a[-1, 1], last)], dtype=numpy.int64))
+    return numpy.concatenate(gaps)
+
+
+def combineAtDistanceArray(intervals, min_distance):
+    """combine intervals and merge those that are less than
+    *min_distance* apart.
+
+    >>> combineAtDistanceArray(numpy.array([(0, 10), (15, 20)]), 10).tolist()
+    [[0, 20]]
+    """
+    a = combineArray(intervals)
+    if len(a) == 0:
+        return a
+    return _mergeBlocks(a[:, 0], a[:, 1],
+                        a[1:, 0] - a[:-1, 1] >= min_distance)
+
+
+def _overlapPairs(a, b):
+    """return indices of overlapping pairs between the arrays *a* and
+    *b* of sorted, non-overlapping intervals.
+
+    returns a tuple ``(index_a, index_b, upper)``. Pairs are sorted by
+    position and *upper* is one past the last interval in *b* that
+    overlaps each interval in *a*.
+    """
+    lower = numpy.searchsorted(b[:, 1], a[:, 0], "right")
+    upper = numpy.maximum(numpy.searchsorted(b[:, 0], a[:, 1], "left"),
+                          lower)
+    sizes = upper - lower
+    index_a = numpy.repeat(numpy.arange(len(a)), sizes)
+    index_b = numpy.arange(len(index_a)) + \
+        numpy.repeat(lower - numpy.cumsum(sizes) + sizes, sizes)
+    return index_a, index_b, upper
+
+
+def intersectArray(intervals1, intervals2):
+    """intersect two interval sets.
+
+    Returns the regions that are covered by intervals in both sets.
+    Intervals within a set must not overlap, use :func:`combineArray`
+    otherwise.
+
+    >>> intersectArray(numpy.array([(0, 5), (10, 15)]),
+    ...                numpy.array([(3, 12)])).tolist()
+    [[3, 5], [10, 12]]
+    """
+    a = _sortArray(asIntervalArray(intervals1))
+    b = _sortArray(asIntervalArray(intervals2))
+    index_a, index_b, upper = _overlapPairs(a, b)
+    result = numpy.column_stack(
+        (numpy.maximum(a[index_a, 0], b[index_b, 0]),
+         numpy.minimum(a[index_a, 1], b[index_b, 1])))
+    return result[result[:, 1] > result[:, 0]]
+
+
+def calculateOverlapArray(intervals1, intervals2):
+    """return number of bases covered by both interval sets.
+
+    Intervals within a set must not overlap.
+
+    >>> calculateOverlapArray(numpy.array([(0, 5), (10, 15)]),
+    ...                       numpy.array([(3, 12)]))
+    4
+    """
+    result = intersectArray(intervals1, intervals2)
+    return int(numpy.sum(result[:, 1] - result[:, 0]))
+
+
+def truncateArray(intervals1, intervals2):
+    """remove regions covered by *intervals2* from *intervals1*.
+
+    Intervals in *intervals1* must not overlap. Intervals in
+    *intervals2* may overlap.
+
+    >>> truncateArray(numpy.array([(0, 10), (20, 30)]),
+    ...               numpy.array([(5, 25)])).tolist()
+    [[0, 5], [25, 30]]
+    """
+    a = _sortArray(asIntervalArray(intervals1))
+    b = combineArray(intervals2)
+    b = b[b[:, 1] > b[:, 0]]
+    if len(b) == 0:
+        return a[a[:, 1] > a[:, 0]]
+
+    index_a, index_b, upper = _overlapPairs(a, b)
+    sizes = numpy.bincount(index_a, minlength=len(a))
+    # position of a masking interval within the masks of an interval
+    rank = numpy.arange(len(index_a)) - \
+        numpy.repeat(numpy.cumsum(sizes) - sizes, sizes)
+
+    # segments preceding each masking interval
+    left = numpy.where(rank == 0, a[index_a, 0], b[index_b - 1, 1])
+    right = b[index_b, 0]
+
+    # segment following the last masking interval
+    final_left = numpy.where(sizes > 0, b[upper - 1, 1], a[:, 0])
+
+    segments = numpy.concatenate((
+        numpy.column_stack((left, right)),
+        numpy.column_stack((final_left, a[:, 1]))))
+    order = numpy.lexsort((
+        numpy.concatenate((rank, sizes)),
+        numpy.concatenate((index_a, numpy.arange(len(a))))))
+    segments = segments[order]
+    return segments[segments[:, 1] > segments[:, 0]]
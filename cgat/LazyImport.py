@@ -0,0 +1,164 @@
+'''LazyImport.py - deferred imports of optional dependencies
+==========================================================
+
+Many tools import modules such as :mod:`pandas` or :mod:`pyBigWig`
+that are only required for some of their options. Importing these
+at module level slows down the start of the tool and makes it fail
+if the module is not installed, even if the options requiring the
+module are not used.
+
+:class:`LazyModule` is a placeholder for a module that is imported
+when one of its attributes is first accessed::
+
+   import cgat.LazyImport as LazyImport
+   pyBigWig = LazyImport.LazyModule("pyBigWig")
+
+   ...
+   # pyBigWig is imported here
+   bigwig_file = pyBigWig.open(filename)
+
+If the module can not be imported, an :class:`ImportError` is raised
+at the point of use. Submodules of a package such as
+:mod:`scipy.stats` are imported on first access as well.
+
+:func:`profileImports` reports the time spent importing each module
+when importing a tool and is used by ``cgat --profile-startup``.
+
+Reference
+---------
+
+'''
+
+import importlib
+import importlib.util
+import os
+import re
+import subprocess
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    '''placeholder for module *name* that imports the module on
+    first attribute access.
+
+    After the import, the attributes of the module are copied into
+    the placeholder so that subsequent lookups do not incur any
+    overhead.
+    '''
+
+    def __init__(self, name):
+        types.ModuleType.__init__(self, name)
+        self.__dict__["_lazy_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            try:
+                module = importlib.import_module(self.__name__)
+            except ImportError as ex:
+                raise ImportError(
+                    "module '%s' is required for this functionality, "
+                    "but could not be imported: %s" % (self.__name__, ex))
+            self.__dict__.update(module.__dict__)
+            self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, key):
+        module = self._load()
+        try:
+            return getattr(module, key)
+        except AttributeError:
+            # submodules such as scipy.stats need to be imported
+            # explicitly in some packages
+            if key.startswith("_"):
+                raise
+            try:
+                submodule = importlib.import_module(
+                    "%s.%s" % (self.__name__, key))
+            except ImportError:
+                raise AttributeError(
+                    "module '%s' has no attribute '%s'" %
+                    (self.__name__, key))
+            self.__dict__[key] = submodule
+            return submodule
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        if self.__dict__["_lazy_module"] is None:
+            return "<lazy module '%s' (not loaded)>" % self.__name__
+        return repr(self.__dict__["_lazy_module"])
+
+
+def isLoaded(module):
+    '''return True if *module* is not a placeholder or has been
+    imported.'''
+    if isinstance(module, LazyModule):
+        return module.__dict__["_lazy_module"] is not None
+    return True
+
+
+def isAvailable(name):
+    '''return True if module *name* can be imported.
+
+    The module is located, but not imported.
+    '''
+    if name in sys.modules:
+        return True
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def parseImportTime(lines):
+    '''parse output of ``python -X importtime``.
+
+    returns a list of tuples (module, depth, self, cumulative) in
+    the order of the output. Times are in microseconds and depth is
+    the nesting level of the import, starting at 0 for modules
+    imported at top level.
+    '''
+    rx = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+    result = []
+    for line in lines:
+        x = rx.match(line)
+        if not x:
+            continue
+        result.append((x.group(4),
+                       (len(x.group(3)) - 1) // 2,
+                       int(x.group(1)),
+                       int(x.group(2))))
+    return result
+
+
+def profileImports(module, python=None, environ=None):
+    '''import *module* in a new interpreter and return the import
+    times of all modules imported, see :func:`parseImportTime`.
+
+    Raises an :class:`ImportError` if *module* can not be imported.
+    '''
+    if python is None:
+        python = sys.executable
+    if environ is None:
+        environ = os.environ.copy()
+
+    proc = subprocess.Popen(
+        [python, "-X", "importtime", "-c", "import %s" % module],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=environ,
+        universal_newlines=True)
+    stdout, stderr = proc.communicate()
+    if proc.returncode != 0:
+        # report the exception, which might span several lines
+        lines = stderr.strip().split("\n")
+        message = lines[-1]
+        for line in reversed(lines):
+            if re.match(r"^[\w.]+(Error|Exception)\b", line):
+                message = line
+                break
+        raise ImportError("could not import %s: %s" % (module, message))
+    return parseImportTime(stderr.split("\n"))
@@ -4,11 +4,19 @@ Motifs.py -
 
 :Tags: Python
 
+Nucleotide motifs in IUPAC notation can be counted with
+:class:`MotifScanner`. The scanner searches several motifs on both
+strands and counts motifs in genomic intervals in sorted batches::
+
+   scanner = Motifs.MotifScanner(["TATAWA", "CACGTG"])
+   counts = scanner.countIntervals(fasta, [("chr1", 1000, 2000)])
+
 Code
 ----
 
 '''
 import collections
+import numpy
 from cgat import Genomics as Genomics
 from cgat import FastaIterator as FastaIterator
 
@@ -104,3 +112,193 @@ def regex2iupac(pattern):
     for x in _split(pattern):
         a.append(regexdict[x])
     return "".join(a)
+
+
+# bits of nucleotides in the encoding used by MotifScanner. Lower
+# case nucleotides are stored in the upper four bits if case is
+# significant.
+NA_BITS = {'A': 1, 'C': 2, 'G': 4, 'T': 8, 'U': 8}
+
+
+def _complementMask(mask):
+    '''return complement of an encoded nucleotide *mask*.'''
+    result = 0
+    for shift in (0, 4):
+        nibble = (mask >> shift) & 15
+        # A <-> T, C <-> G
+        result |= ((nibble & 1) << 3 | (nibble & 2) << 1 |
+                   (nibble & 4) >> 1 | (nibble & 8) >> 3) << shift
+    return result
+
+
+def isIUPAC(pattern):
+    '''return True if *pattern* is a nucleotide motif in IUPAC notation.'''
+    return len(pattern) > 0 and all(x.upper() in iupacdict for x in pattern)
+
+
+class MotifScanner(object):
+    '''find occurrences of nucleotide motifs given in IUPAC notation.
+
+    Sequences are encoded as bit masks and all positions are tested
+    simultaneously with numpy. A position matches a motif if the
+    bits of each base are contained in the mask of the corresponding
+    motif character. Ambiguous characters in a sequence such as
+    ``N`` do not match any motif character.
+
+    If *both_strands* is set, the reverse complement of each motif
+    is searched as well. Palindromic matches are counted once for
+    each strand. Overlapping matches are counted separately.
+
+    If *ignore_case* is False, upper case motif characters only
+    match upper case bases and lower case characters only lower case
+    bases.
+    '''
+
+    def __init__(self, motifs, both_strands=True, ignore_case=True):
+
+        self.motifs = list(motifs)
+        self.both_strands = both_strands
+        self.ignore_case = ignore_case
+
+        for motif in self.motifs:
+            if not isIUPAC(motif):
+                raise ValueError("motif '%s' is not in IUPAC notation" %
+                                 motif)
+
+        self.codes = numpy.zeros(256, dtype=numpy.uint8)
+        for c, bit in NA_BITS.items():
+            self.codes[ord(c)] = bit
+            if ignore_case:
+                self.codes[ord(c.lower())] = bit
+            else:
+                self.codes[ord(c.lower())] = bit << 4
+
+        # list of (index of motif, strand, masks)
+        self.patterns = []
+        for idx, motif in enumerate(self.motifs):
+            masks = numpy.array([self._encodeCharacter(x) for x in motif],
+                                dtype=numpy.uint8)
+            self.patterns.append((idx, "+", masks))
+            if both_strands:
+                reverse = numpy.array(
+                    [_complementMask(x) for x in masks[::-1]],
+                    dtype=numpy.uint8)
+                self.patterns.append((idx, "-", reverse))
+
+    def _encodeCharacter(self, c):
+        mask = 0
+        for x in iupacdict[c.upper()]:
+            mask |= NA_BITS[x]
+        if not self.ignore_case and c.islower():
+            mask <<= 4
+        return mask
+
+    def encode(self, sequence):
+        '''return *sequence* as array of bit masks.
+
+        *sequence* can be a string, bytes or an array of bytes.
+        '''
+        if isinstance(sequence, numpy.ndarray):
+            return self.codes[sequence]
+        if not isinstance(sequence, bytes):
+            sequence = sequence.encode("ascii")
+        return self.codes[numpy.frombuffer(sequence, dtype=numpy.uint8)]
+
+    def _match(self, encoded, masks):
+        '''return start positions of *masks* in *encoded*.'''
+        npositions = len(encoded) - len(masks) + 1
+        if npositions <= 0:
+            return numpy.zeros(0, dtype=numpy.int64)
+        hits = (encoded[:npositions] & masks[0]) != 0
+        for x in range(1, len(masks)):
+            hits &= (encoded[x:x + npositions] & masks[x]) != 0
+        return numpy.flatnonzero(hits)
+
+    def findPositions(self, sequence):
+        '''return a list with a sorted array of start positions of
+        matches in *sequence* for each motif. Matches on both
+        strands are combined.
+        '''
+        encoded = self.encode(sequence)
+        positions = [[] for x in self.motifs]
+        for idx, strand, masks in self.patterns:
+            positions[idx].append(self._match(encoded, masks))
+        return [numpy.sort(numpy.concatenate(x)) for x in positions]
+
+    def scan(self, sequence):
+        '''return list of matches in *sequence*.
+
+        Each match is a tuple of (motif, strand, start, end). Matches
+        are sorted by position.
+        '''
+        encoded = self.encode(sequence)
+        result = []
+        for idx, strand, masks in self.patterns:
+            motif = self.motifs[idx]
+            for start in self._match(encoded, masks):
+                result.append((motif, strand, start, start + len(masks)))
+        result.sort(key=lambda x: (x[2], x[3]))
+        return result
+
+    def count(self, sequence):
+        '''return array with the number of matches of each motif
+        in *sequence*.'''
+        encoded = self.encode(sequence)
+        counts = numpy.zeros(len(self.motifs), dtype=numpy.int64)
+        for idx, strand, masks in self.patterns:
+            counts[idx] += len(self._match(encoded, masks))
+        return counts
+
+    def countIntervals(self, fasta, intervals, max_block_size=1000000):
+        '''count motifs in genomic intervals.
+
+        *intervals* is a list of tuples (contig, start, end). Only
+        matches completely within an interval are counted. Intervals
+        are processed sorted by position. Sequence is retrieved from
+        the :class:`IndexedFasta.IndexedFasta` *fasta* once for each
+        block of overlapping intervals, but blocks are at most
+        *max_block_size* bases apart.
+
+        Returns a matrix of counts with a row for each interval and
+        a column for each motif.
+        '''
+        result = numpy.zeros((len(intervals), len(self.motifs)),
+                             dtype=numpy.int64)
+        lengths = numpy.array([len(x) for x in self.motifs],
+                              dtype=numpy.int64)
+
+        # empty intervals have no matches
+        order = sorted([x for x in range(len(intervals))
+                        if intervals[x][2] > intervals[x][1]],
+                       key=lambda x: (intervals[x][0], intervals[x][1]))
+
+        def _countBlock(contig, block_start, block_end, block):
+            positions = self.findPositions(
+                fasta.getSequence(contig, "+", block_start, block_end))
+            starts = numpy.array([intervals[x][1] for x in block],
+                                 dtype=numpy.int64) - block_start
+            ends = numpy.array([intervals[x][2] for x in block],
+                               dtype=numpy.int64) - block_start
+            for idx, (p, l) in enumerate(zip(positions, lengths)):
+                result[block, idx] = numpy.maximum(
+                    0,
+                    numpy.searchsorted(p, ends - l, side="right") -
+                    numpy.searchsorted(p, starts, side="left"))
+
+        block = []
+        for x in order:
+            contig, start, end = intervals[x]
+            if block and (contig != block_contig or
+                          start >= block_end or
+                          start >= block_start + max_block_size):
+                _countBlock(block_contig, block_start, block_end, block)
+                block = []
+            if not block:
+                block_contig, block_start, block_end = contig, start, end
+            block.append(x)
+            block_end = max(block_end, end)
+
+        if block:
+            _countBlock(block_contig, block_start, block_end, block)
+
+        return result
@@ -3,6 +3,9 @@ from . import cnestedlist
 import sqlite3
 import os
 import sys
+import mmap
+import struct
+import numpy
 
 if sys.version_info.major >= 3:
     import pickle as pickle
@@ -12,6 +15,85 @@ else:
 sqlite3.register_converter("pickle", pickle.loads)
 
 
+def encodeValue(value):
+    """encode *value* for storage in a :class:`ValueStore`.
+
+    Strings and integers are stored directly, all other
+    objects are pickled.
+    """
+    if isinstance(value, str):
+        return b"s" + value.encode("utf-8")
+    elif isinstance(value, int) and not isinstance(value, bool) and \
+            -2 ** 63 <= value < 2 ** 63:
+        return b"i" + struct.pack("<q", value)
+    elif isinstance(value, bytes):
+        return b"b" + value
+    else:
+        return b"p" + pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def decodeValue(data):
+    """decode a value encoded with :func:`encodeValue`."""
+    tag, data = data[:1], data[1:]
+    if tag == b"s":
+        return data.decode("utf-8")
+    elif tag == b"i":
+        return struct.unpack("<q", data)[0]
+    elif tag == b"b":
+        return bytes(data)
+    elif tag == b"p":
+        return pickle.loads(data)
+    else:
+        raise ValueError("unknown value type %s" % tag)
+
+
+def writeValueStore(filestem, values):
+    """write *values* to a memory-mappable value store.
+
+    The store consists of two files: ``filestem.voffsets`` contains
+    the start of each value and the end of the last value as a
+    fixed-width array of 64-bit integers, and ``filestem.vheap``
+    contains the encoded values.
+    """
+    offsets = numpy.zeros(len(values) + 1, dtype=numpy.int64)
+    with open(filestem + ".vheap", "wb") as outf:
+        offset = 0
+        for x, value in enumerate(values):
+            data = encodeValue(value)
+            outf.write(data)
+            offset += len(data)
+            offsets[x + 1] = offset
+    offsets.tofile(filestem + ".voffsets")
+
+
+class ValueStore(object):
+    """read-only access to values written with :func:`writeValueStore`.
+
+    Both files are memory-mapped, opening a store thus does not read
+    the values and each lookup decodes a single value.
+    """
+
+    def __init__(self, filestem):
+        self.mOffsets = numpy.memmap(filestem + ".voffsets",
+                                     dtype=numpy.int64,
+                                     mode="r")
+        with open(filestem + ".vheap", "rb") as inf:
+            if os.fstat(inf.fileno()).st_size > 0:
+                self.mHeap = mmap.mmap(inf.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+            else:
+                self.mHeap = b""
+
+    def __len__(self):
+        return len(self.mOffsets) - 1
+
+    def __getitem__(self, key):
+        if key < 0 or key >= len(self):
+            raise IndexError("value index %i out of range" % key)
+        return decodeValue(
+            self.mHeap[self.mOffsets[key]:self.mOffsets[key + 1]])
+
+
 class NCLSimple(object):
     """a nested contained list in memory storing
     no additional data.
@@ -69,6 +151,31 @@ class NCLSimple(object):
         self._commit()
         return self.mDatabase.find_overlap(start, end)
 
+    def find_batch(self, starts, ends):
+        """find intervals in database overlapping with each of the
+        query intervals in the arrays *starts* and *ends*.
+
+        returns a tuple of numpy arrays ``(offsets, indices,
+        hit_starts, hit_ends)``, see
+        :meth:`cnestedlist.IntervalDB.find_overlaps_batch`.
+        """
+        return self._getBatchDatabase().find_overlaps_batch(starts, ends)
+
+    def count_batch(self, starts, ends):
+        """return numpy array with the number of intervals overlapping
+        each of the query intervals in *starts* and *ends*."""
+        return self._getBatchDatabase().count_overlaps_batch(starts, ends)
+
+    def bases_overlapped_batch(self, starts, ends):
+        """return numpy array with the number of bases in each query
+        interval in *starts* and *ends* covered by the database."""
+        return self._getBatchDatabase().bases_overlapped_batch(starts, ends)
+
+    def _getBatchDatabase(self):
+        """return committed database for batch queries."""
+        self._commit()
+        return self.mDatabase
+
     def _commit(self):
         """commit database if changed."""
         if self.mIsDirty:
@@ -95,10 +202,16 @@ class NCL(NCLSimple):
     def __init__(self, *args, **kwargs):
         NCLSimple.__init__(self, *args, **kwargs)
         self.mValues = []
+        self.mValueStore = None
+        self.mDBHandle = None
         # route calls to __getitem__ directly to list if in memory
         if self.mFromDisk:
-            fn = self.mFilestem + ".vals" 
-            self.mDBHandle = sqlite3.connect(fn)
+            if os.path.exists(self.mFilestem + ".voffsets"):
+                self.mValueStore = ValueStore(self.mFilestem)
+            else:
+                # databases written by previous versions
+                fn = self.mFilestem + ".vals"
+                self.mDBHandle = sqlite3.connect(fn)
 
     def add(self, start, end, value):
         """add segment *start*,*end* with value to database.
@@ -115,6 +228,8 @@ class NCL(NCLSimple):
     def __getitem__(self, key):
         """get a value from the database
         """
+        if self.mValueStore is not None:
+            return self.mValueStore[key]
         cc = self.mDBHandle.cursor()
         val = cc.execute(
             "SELECT value FROM data WHERE id = '%i'" % key).fetchone()[0]
@@ -141,20 +256,7 @@ class NCL(NCLSimple):
 
     def _flushValues(self):
         """flush values to disk."""
-
-        fn = self.mFilestem + ".vals"
-        if os.path.exists(fn):
-            os.remove(fn)
-        dbhandle = sqlite3.connect(fn)
-
-        cc = dbhandle.cursor()
-        cc.execute("""create table data( id INTEGER, value BLOB);""")
-        cc.executemany(
-            """INSERT INTO data VALUES (?,?)""",
-            list(enumerate(map(lambda x: sqlite3.Binary(pickle.dumps(x)),
-                               self.mValues))))
-        dbhandle.commit()
-        cc.close()
+        writeValueStore(self.mFilestem, self.mValues)
 
     def __del__(self):
         """flush database to disk."""
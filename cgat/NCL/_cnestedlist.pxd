@@ -79,6 +79,9 @@ cdef extern from "intervaldb.h":
   int free_interval_iterator(IntervalIterator *it)
   IntervalIterator *reset_interval_iterator(IntervalIterator *it)
   int find_intervals(IntervalIterator *it0,int start,int end,IntervalMap im[],int n,SublistHeader subheader[],int nlists,IntervalMap buf[],int nbuf,int *p_nreturn,IntervalIterator **it_return) except -1
+  int find_intervals_batch(int starts[],int ends[],int nquery,IntervalMap im[],int n,SublistHeader subheader[],int nlists,int offsets[],IntervalMap **p_hits,int *p_nhits) except -1
+  int count_intervals_batch(int starts[],int ends[],int nquery,IntervalMap im[],int n,SublistHeader subheader[],int nlists,int counts[]) except -1
+  int cover_intervals_batch(int starts[],int ends[],int nquery,IntervalMap im[],int n,SublistHeader subheader[],int nlists,int bases[]) except -1
   char *write_binary_files(IntervalMap im[],int n,int ntop,int div,SublistHeader *subheader,int nlists,char filestem[])
   IntervalDBFile *read_binary_files(char filestem[],char err_msg[],int subheader_nblock) except NULL
   int free_interval_dbfile(IntervalDBFile *db_file)
@@ -1,5 +1,6 @@
 #cython: embedsignature=True
 cimport cython
+import numpy
 
 ###############################
 # Could not make .pxd file to be found in gpipe/setup.py, so including it here:
@@ -86,6 +87,9 @@ cdef extern from "intervaldb.h":
   int free_interval_iterator(IntervalIterator *it)
   IntervalIterator *reset_interval_iterator(IntervalIterator *it)
   int find_intervals(IntervalIterator *it0,int start,int end,IntervalMap im[],int n,SublistHeader subheader[],int nlists,IntervalMap buf[],int nbuf,int *p_nreturn,IntervalIterator **it_return) except -1
+  int find_intervals_batch(int starts[],int ends[],int nquery,IntervalMap im[],int n,SublistHeader subheader[],int nlists,int offsets[],IntervalMap **p_hits,int *p_nhits) except -1
+  int count_intervals_batch(int starts[],int ends[],int nquery,IntervalMap im[],int n,SublistHeader subheader[],int nlists,int counts[]) except -1
+  int cover_intervals_batch(int starts[],int ends[],int nquery,IntervalMap im[],int n,SublistHeader subheader[],int nlists,int bases[]) except -1
   char *write_binary_files(IntervalMap im[],int n,int ntop,int div,SublistHeader *subheader,int nlists,char filestem[])
   IntervalDBFile *read_binary_files(char filestem[],char err_msg[],int subheader_nblock) except NULL
   int free_interval_dbfile(IntervalDBFile *db_file)
@@ -100,6 +104,45 @@ cdef extern from "intervaldb.h":
 ### .pxd end
 ###############################
 
+def _as_query_arrays(starts, ends):
+  """return *starts* and *ends* as contiguous int32 arrays.
+
+  Raises IndexError if any of the query intervals is empty.
+  """
+  qstarts = numpy.ascontiguousarray(starts, dtype=numpy.int32)
+  qends = numpy.ascontiguousarray(ends, dtype=numpy.int32)
+  if qstarts.ndim != 1 or qstarts.shape != qends.shape:
+    raise ValueError("starts and ends must be 1-dimensional arrays of equal length")
+  invalid = numpy.nonzero(qstarts >= qends)[0]
+  if len(invalid) > 0:
+    raise IndexError("invalid interval (%i,%i)" %
+                     (qstarts[invalid[0]], qends[invalid[0]]))
+  return qstarts, qends
+
+def _bases_overlapped(qstarts, qends, offsets, hit_starts, hit_ends):
+  """return int32 array with the number of bases in each query interval
+  covered by its hits given in compressed sparse row layout.
+  """
+  cdef int i, j, left, right, last
+  cdef int nquery = len(qstarts)
+  query = numpy.repeat(numpy.arange(nquery), numpy.diff(offsets))
+  # HITS ARE IN NESTED LIST ORDER, SORT BY START WITHIN EACH QUERY
+  order = numpy.lexsort((hit_starts, query))
+  cdef int[::1] qs = qstarts, qe = qends, offs = offsets
+  cdef int[::1] hs = numpy.ascontiguousarray(hit_starts[order])
+  cdef int[::1] he = numpy.ascontiguousarray(hit_ends[order])
+  bases = numpy.zeros(nquery, dtype=numpy.int32)
+  cdef int[::1] bases_view = bases
+  for i from 0 <= i < nquery:
+    last = qs[i] # RIGHT EDGE OF THE UNION SO FAR
+    for j from offs[i] <= j < offs[i + 1]:
+      left = hs[j] if hs[j] > last else last
+      right = he[j] if he[j] < qe[i] else qe[i]
+      if right > left:
+        bases_view[i] += right - left
+        last = right
+  return bases
+
 cdef class IntervalDBIterator:
   """Iterator over intervals from an NCL."""
 
@@ -276,6 +319,79 @@ cdef class IntervalDB:
         l.append((im_buf[i].start,im_buf[i].end,im_buf[i].target_id))
     free_interval_iterator(it_alloc)
     return l
+
+  def find_overlaps_batch(self, starts, ends):
+    """find intervals in database overlapping with each of the
+    query intervals given by the arrays *starts* and *ends*.
+
+    Results are returned in compressed sparse row layout as a tuple
+    of numpy arrays ``(offsets, indices, hit_starts, hit_ends)``.
+    The hits for query ``i`` are at positions
+    ``offsets[i]:offsets[i+1]`` in *indices*, *hit_starts* and
+    *hit_ends*. Within a query, hits are in nested list order.
+    """
+    cdef int i, nquery, nhits = 0
+    cdef int[::1] qstarts, qends, offsets_view, idx_view, start_view, end_view
+    cdef IntervalMap *hits = NULL
+    self.check_nonempty() # RAISE EXCEPTION IF NO DATA
+    qs, qe = _as_query_arrays(starts, ends)
+    nquery = len(qs)
+    offsets = numpy.zeros(nquery + 1, dtype=numpy.int32)
+    if nquery == 0:
+      empty = numpy.zeros(0, dtype=numpy.int32)
+      return offsets, empty, empty.copy(), empty.copy()
+    qstarts, qends, offsets_view = qs, qe, offsets
+    find_intervals_batch(&qstarts[0], &qends[0], nquery,
+                         self.im, self.ntop, self.subheader, self.nlists,
+                         &offsets_view[0], &hits, &nhits)
+    indices = numpy.empty(nhits, dtype=numpy.int32)
+    hit_starts = numpy.empty(nhits, dtype=numpy.int32)
+    hit_ends = numpy.empty(nhits, dtype=numpy.int32)
+    idx_view, start_view, end_view = indices, hit_starts, hit_ends
+    for i from 0 <= i < nhits:
+      idx_view[i] = hits[i].target_id
+      start_view[i] = hits[i].start
+      end_view[i] = hits[i].end
+    if hits:
+      free(hits)
+    return offsets, indices, hit_starts, hit_ends
+
+  def count_overlaps_batch(self, starts, ends):
+    """return a numpy array with the number of intervals in the database
+    overlapping each of the query intervals *starts* and *ends*.
+    """
+    cdef int nquery
+    cdef int[::1] qstarts, qends, counts_view
+    self.check_nonempty() # RAISE EXCEPTION IF NO DATA
+    qs, qe = _as_query_arrays(starts, ends)
+    nquery = len(qs)
+    counts = numpy.zeros(nquery, dtype=numpy.int32)
+    if nquery == 0:
+      return counts
+    qstarts, qends, counts_view = qs, qe, counts
+    count_intervals_batch(&qstarts[0], &qends[0], nquery,
+                          self.im, self.ntop, self.subheader, self.nlists,
+                          &counts_view[0])
+    return counts
+
+  def bases_overlapped_batch(self, starts, ends):
+    """return a numpy array with the number of bases in each of the query
+    intervals *starts* and *ends* that are covered by at least one
+    interval in the database.
+    """
+    cdef int nquery
+    cdef int[::1] qstarts, qends, bases_view
+    self.check_nonempty() # RAISE EXCEPTION IF NO DATA
+    qs, qe = _as_query_arrays(starts, ends)
+    nquery = len(qs)
+    bases = numpy.zeros(nquery, dtype=numpy.int32)
+    if nquery == 0:
+      return bases
+    qstarts, qends, bases_view = qs, qe, bases
+    cover_intervals_batch(&qstarts[0], &qends[0], nquery,
+                          self.im, self.ntop, self.subheader, self.nlists,
+                          &bases_view[0])
+    return bases
         
   def check_nonempty(self):
     """return True if the database is empty."""
@@ -368,6 +484,66 @@ cdef class IntervalFileDB:
     free_interval_iterator(it_alloc)
     return l
 
+  def find_overlaps_batch(self, starts, ends):
+    """find intervals in database overlapping with each of the
+    query intervals given by the arrays *starts* and *ends*.
+
+    returns a tuple of numpy arrays ``(offsets, indices, hit_starts,
+    hit_ends)``, see :meth:`IntervalDB.find_overlaps_batch`.
+    """
+    cdef int i, j, nquery, nhit
+    cdef int[::1] qstarts, qends, offsets_view
+    cdef IntervalIterator *it,*it_alloc
+    cdef IntervalMap im_buf[1024]
+    self.check_nonempty() # RAISE EXCEPTION IF NO DATA
+    qs, qe = _as_query_arrays(starts, ends)
+    nquery = len(qs)
+    offsets = numpy.zeros(nquery + 1, dtype=numpy.int32)
+    indices, hit_starts, hit_ends = [], [], []
+    if nquery == 0:
+      empty = numpy.zeros(0, dtype=numpy.int32)
+      return offsets, empty, empty.copy(), empty.copy()
+    qstarts, qends, offsets_view = qs, qe, offsets
+    it_alloc=interval_iterator_alloc()
+    try:
+      for i from 0 <= i < nquery:
+        it=reset_interval_iterator(it_alloc) # REUSE ITERATOR FROM LAST QUERY
+        while it:
+          find_file_intervals(it,qstarts[i],qends[i],
+                              self.db[0].ii,self.db[0].nii,
+                              self.db[0].subheader,self.db[0].nlists,
+                              &(self.db[0].subheader_file),
+                              self.db[0].ntop,self.db[0].div,
+                              self.db[0].ifile_idb,im_buf,1024,
+                              &(nhit),&(it)) # GET NEXT BUFFER CHUNK
+          for j from 0 <= j < nhit:
+            indices.append(im_buf[j].target_id)
+            hit_starts.append(im_buf[j].start)
+            hit_ends.append(im_buf[j].end)
+        offsets_view[i + 1] = len(indices)
+    finally:
+      free_interval_iterator(it_alloc)
+    return (offsets,
+            numpy.array(indices, dtype=numpy.int32),
+            numpy.array(hit_starts, dtype=numpy.int32),
+            numpy.array(hit_ends, dtype=numpy.int32))
+
+  def count_overlaps_batch(self, starts, ends):
+    """return a numpy array with the number of intervals in the database
+    overlapping each of the query intervals *starts* and *ends*.
+    """
+    offsets = self.find_overlaps_batch(starts, ends)[0]
+    return numpy.diff(offsets).astype(numpy.int32)
+
+  def bases_overlapped_batch(self, starts, ends):
+    """return a numpy array with the number of bases in each of the query
+    intervals *starts* and *ends* that are covered by at least one
+    interval in the database.
+    """
+    qs, qe = _as_query_arrays(starts, ends)
+    offsets, indices, hit_starts, hit_ends = self.find_overlaps_batch(qs, qe)
+    return _bases_overlapped(qs, qe, offsets, hit_starts, hit_ends)
+
   def check_nonempty(self):
     if self.db==NULL:
       raise IndexError('empty IntervalFileDB, not searchable!')
@@ -465,6 +465,152 @@ int find_intervals(IntervalIterator *it0,int start,int end,
 
 
 
+/****************************************************************
+ *
+ *   BATCH SEARCH FUNCTIONS
+ *
+ *   Run many queries against an in-memory database in a single
+ *   call. Hits are returned in compressed sparse row layout: the
+ *   hits for query i are stored in hits[offsets[i]:offsets[i+1]].
+ */
+
+#define BATCH_BUFFER_CHUNK 1024
+
+/* RETURN -1, MAKING SURE THAT A PYTHON EXCEPTION IS SET */
+#ifdef BUILD_C_LIBRARY
+#define BATCH_FAILURE_RETURN return -1
+#else
+#define BATCH_FAILURE_RETURN \
+  if (!PyErr_Occurred()) \
+    PyErr_NoMemory(); \
+  return -1
+#endif
+
+/* APPEND ALL HITS FOR ONE QUERY TO A GROWABLE BUFFER */
+static int find_all_intervals(IntervalIterator *it0,int start,int end,
+			      IntervalMap im[],int n,
+			      SublistHeader subheader[],int nlists,
+			      IntervalMap **p_buf,int *p_nbuf,int *p_nhits)
+{
+  IntervalIterator *it=NULL;
+  int nreturn=0;
+  it=reset_interval_iterator(it0); /* REUSE ITERATOR STACK FROM LAST QUERY */
+  do {
+    if (*p_nbuf - *p_nhits < BATCH_BUFFER_CHUNK) { /* MAKE ROOM FOR ONE CHUNK */
+      if (*p_nbuf > (INT_MAX-BATCH_BUFFER_CHUNK)/2) /* BUFFER SIZE WOULD OVERFLOW */
+	goto handle_malloc_failure;
+      REALLOC(*p_buf,2*(*p_nbuf)+BATCH_BUFFER_CHUNK,IntervalMap);
+      *p_nbuf=2*(*p_nbuf)+BATCH_BUFFER_CHUNK;
+    }
+    if (find_intervals(it,start,end,im,n,subheader,nlists,
+		       *p_buf + *p_nhits,*p_nbuf - *p_nhits,
+		       &nreturn,&it))
+      goto handle_malloc_failure;
+    *p_nhits += nreturn;
+  } while (it);
+  return 0;
+ handle_malloc_failure:
+  BATCH_FAILURE_RETURN;
+}
+
+
+int find_intervals_batch(int starts[],int ends[],int nquery,
+			 IntervalMap im[],int n,
+			 SublistHeader subheader[],int nlists,
+			 int offsets[],IntervalMap **p_hits,int *p_nhits)
+{
+  IntervalIterator *it=NULL;
+  IntervalMap *hits=NULL;
+  int i,nbuf=0,nhits=0;
+
+  CALLOC(it,1,IntervalIterator);
+  offsets[0]=0;
+  for (i=0;i<nquery;i++) {
+    if (find_all_intervals(it,starts[i],ends[i],im,n,subheader,nlists,
+			   &hits,&nbuf,&nhits))
+      goto handle_malloc_failure;
+    offsets[i+1]=nhits;
+  }
+  free_interval_iterator(it);
+  *p_hits=hits; /* CALLER MUST FREE THE HITS */
+  *p_nhits=nhits;
+  return 0;
+ handle_malloc_failure:
+  FREE(hits);
+  free_interval_iterator(it);
+  BATCH_FAILURE_RETURN;
+}
+
+
+int count_intervals_batch(int starts[],int ends[],int nquery,
+			  IntervalMap im[],int n,
+			  SublistHeader subheader[],int nlists,
+			  int counts[])
+{
+  IntervalIterator *it=NULL,*it_alloc=NULL;
+  IntervalMap buf[BATCH_BUFFER_CHUNK];
+  int i,nreturn;
+
+  CALLOC(it_alloc,1,IntervalIterator);
+  for (i=0;i<nquery;i++) {
+    counts[i]=0;
+    it=reset_interval_iterator(it_alloc);
+    do {
+      if (find_intervals(it,starts[i],ends[i],im,n,subheader,nlists,
+			 buf,BATCH_BUFFER_CHUNK,&nreturn,&it))
+	goto handle_malloc_failure;
+      counts[i]+=nreturn;
+    } while (it);
+  }
+  free_interval_iterator(it_alloc);
+  return 0;
+ handle_malloc_failure:
+  free_interval_iterator(it_alloc);
+  BATCH_FAILURE_RETURN;
+}
+
+
+int cover_intervals_batch(int starts[],int ends[],int nquery,
+			  IntervalMap im[],int n,
+			  SublistHeader subheader[],int nlists,
+			  int bases[])
+{ /* COUNT BASES OF EACH QUERY COVERED BY AT LEAST ONE INTERVAL */
+  IntervalIterator *it=NULL;
+  IntervalMap *hits=NULL;
+  int i,j,nbuf=0,nhits,left,right,last;
+
+  CALLOC(it,1,IntervalIterator);
+  for (i=0;i<nquery;i++) {
+    nhits=0;
+    if (find_all_intervals(it,starts[i],ends[i],im,n,subheader,nlists,
+			   &hits,&nbuf,&nhits))
+      goto handle_malloc_failure;
+    /* NESTED LIST ORDER IS NOT START ORDER, SO SORT BEFORE SWEEPING */
+    qsort(hits,nhits,sizeof(IntervalMap),imstart_qsort_cmp);
+    bases[i]=0;
+    last=starts[i]; /* RIGHT EDGE OF THE UNION SO FAR */
+    for (j=0;j<nhits;j++) {
+      left= hits[j].start>last ? hits[j].start : last;
+      right= hits[j].end<ends[i] ? hits[j].end : ends[i];
+      if (right>left) {
+	bases[i]+=right-left;
+	last=right;
+      }
+    }
+  }
+  FREE(hits);
+  free_interval_iterator(it);
+  return 0;
+ handle_malloc_failure:
+  FREE(hits);
+  free_interval_iterator(it);
+  BATCH_FAILURE_RETURN;
+}
+
+
+
+
+
 /****************************************************************
  *
  *   FILE-BASED SEARCH FUNCTIONS
@@ -84,6 +84,18 @@ extern IntervalIterator *interval_iterator_alloc(void);
 extern int free_interval_iterator(IntervalIterator *it);
 extern IntervalIterator *reset_interval_iterator(IntervalIterator *it);
 extern int find_intervals(IntervalIterator *it0,int start,int end,IntervalMap im[],int n,SublistHeader subheader[],int nlists,IntervalMap buf[],int nbuf,int *p_nreturn,IntervalIterator **it_return);
+extern int find_intervals_batch(int starts[],int ends[],int nquery,
+				IntervalMap im[],int n,
+				SublistHeader subheader[],int nlists,
+				int offsets[],IntervalMap **p_hits,int *p_nhits);
+extern int count_intervals_batch(int starts[],int ends[],int nquery,
+				 IntervalMap im[],int n,
+				 SublistHeader subheader[],int nlists,
+				 int counts[]);
+extern int cover_intervals_batch(int starts[],int ends[],int nquery,
+				 IntervalMap im[],int n,
+				 SublistHeader subheader[],int nlists,
+				 int bases[]);
 extern int read_imdiv(FILE *ifile,IntervalMap imdiv[],int div,int i_div,int ntop);
 extern IntervalMap *read_sublist(FILE *ifile,SublistHeader *subheader,IntervalMap *im);
 extern int find_file_intervals(IntervalIterator *it0,int start,int end,
@@ -32,6 +32,12 @@ only once over an input file and output a single, multi-column table.
     While useful and in working order, the design of the classes is
     cumbersome.
 
+The counts are computed by :class:`SequenceComposition`, which
+converts a sequence into an array of bytes and counts characters,
+dinucleotides and codons with :func:`numpy.bincount`. The composition
+of the sequence loaded last is kept, so that several counters loaded
+with the same sequence object compute each count only once.
+
 Reference
 ---------
 
@@ -43,10 +49,175 @@ import hashlib
 import base64
 import itertools
 import six
+import numpy
 
 from cgat import Genomics as Genomics
 
-import Bio.Alphabet.IUPAC
+# letters of the IUPAC alphabets, in the order of Bio.Alphabet.IUPAC
+DNA_LETTERS = "GATC"
+EXTENDED_DNA_LETTERS = "GATCBDSW"
+EXTENDED_PROTEIN_LETTERS = "ACDEFGHIKLMNPQRSTVWYBXZJUO"
+
+# two-bit code of upper-case nucleotides, 4 for other characters
+NA_CODE = numpy.full(256, 4, dtype=numpy.uint8)
+for x, c in enumerate("ACGT"):
+    NA_CODE[ord(c)] = x
+
+# codons in the order of their two-bit code
+CODONS = ["".join(x) for x in itertools.product("ACGT", repeat=3)]
+
+# map of bytes to upper case
+UPPER_CASE = numpy.arange(256, dtype=numpy.uint8)
+UPPER_CASE[ord("a"):ord("z") + 1] -= ord("a") - ord("A")
+
+
+class SequenceComposition(object):
+    """character, dinucleotide and codon counts of a sequence.
+
+    The sequence is converted into an array of bytes. Counts are
+    computed on first request and cached. Characters that are not
+    ASCII are counted as ``?``.
+    """
+
+    def __init__(self, sequence):
+        self.mSequence = sequence
+        self.mBytes = numpy.frombuffer(
+            sequence.encode("ascii", "replace"), dtype=numpy.uint8)
+        self.mCache = {}
+
+    def _cached(self, key, f):
+        try:
+            return self.mCache[key]
+        except KeyError:
+            result = self.mCache[key] = f()
+            return result
+
+    def getCleanSequence(self):
+        """return upper-case sequence without gap characters."""
+        return self._cached(
+            "clean",
+            lambda: re.sub("[ -.]", "", self.mSequence).upper())
+
+    def getBytes(self, upper=False):
+        """return sequence as array of bytes."""
+        if upper:
+            return self._cached("upper", lambda: UPPER_CASE[self.mBytes])
+        return self.mBytes
+
+    def getCounts(self, upper=False):
+        """return array with counts for each of the 256 byte values."""
+        return self._cached(
+            ("counts", upper),
+            lambda: numpy.bincount(self.getBytes(upper), minlength=256))
+
+    def countCharacters(self, alphabet, upper=False):
+        """return a dictionary with counts of each character in
+        *alphabet* and the number of other characters."""
+        counts = self.getCounts(upper)
+        result = {}
+        for x in alphabet:
+            if len(x) == 1 and ord(x) < 128:
+                result[x] = int(counts[ord(x)])
+            else:
+                result[x] = 0
+        return result, len(self.mBytes) - sum(result.values())
+
+    def getDinucleotideCounts(self):
+        """return 4x4 array of counts of overlapping dinucleotides
+        (in ``ACGT`` order) and the number of dinucleotides containing
+        other characters. The sequence is not converted to upper case.
+        """
+        def _count():
+            code = NA_CODE[self.mBytes]
+            if len(code) < 2:
+                return numpy.zeros((4, 4), dtype=numpy.int64), 0
+            valid = (code[:-1] < 4) & (code[1:] < 4)
+            index = code[:-1][valid].astype(numpy.int64) * 4 + \
+                code[1:][valid]
+            counts = numpy.bincount(index, minlength=16).reshape(4, 4)
+            return counts, len(code) - 1 - int(counts.sum())
+        return self._cached("dinucleotides", _count)
+
+    def getCodonCounts(self, upper=False):
+        """return a dictionary with counts of each codon.
+
+        Codons containing characters other than ``ACGT`` are counted
+        as well. An incomplete codon at the end of the sequence is
+        counted as a codon of length 1 or 2.
+        """
+        def _count():
+            data = self.getBytes(upper)
+            n = len(data) - len(data) % 3
+            codons = data[:n].reshape(-1, 3)
+            code = NA_CODE[codons]
+            valid = (code < 4).all(axis=1)
+            index = (code[valid].astype(numpy.int64) *
+                     numpy.array((16, 4, 1))).sum(axis=1)
+            counts = numpy.bincount(index, minlength=64)
+            result = dict([(CODONS[x], int(counts[x]))
+                           for x in numpy.flatnonzero(counts)])
+
+            invalid = codons[~valid].astype(numpy.int64)
+            if len(invalid):
+                keys, key_counts = numpy.unique(
+                    (invalid[:, 0] << 16) | (invalid[:, 1] << 8) |
+                    invalid[:, 2], return_counts=True)
+                for key, count in zip(keys, key_counts):
+                    codon = bytes((key >> 16, (key >> 8) & 255,
+                                   key & 255)).decode("ascii")
+                    result[codon] = result.get(codon, 0) + int(count)
+
+            if n < len(data):
+                codon = data[n:].tobytes().decode("ascii")
+                result[codon] = result.get(codon, 0) + 1
+            return result
+        return self._cached(("codons", upper), _count)
+
+    def getCodonPositionCounts(self, upper=False):
+        """return 3x256 array with counts of byte values at each
+        codon position."""
+        def _count():
+            data = self.getBytes(upper)
+            codons = data[:len(data) - len(data) % 3].reshape(-1, 3)
+            return numpy.array([numpy.bincount(codons[:, x], minlength=256)
+                                for x in range(3)])
+        return self._cached(("positions", upper), _count)
+
+    def getRegions(self, chars):
+        """return a tuple with the number of characters in *chars*,
+        the number of regions consisting of *chars* and the number
+        of regions consisting of other characters."""
+        def _count():
+            lookup = numpy.zeros(256, dtype=bool)
+            for c in chars:
+                if ord(c) < 128:
+                    lookup[ord(c)] = True
+            is_char = lookup[self.mBytes]
+            if len(is_char) == 0:
+                return 0, 0, 0
+            starts = numpy.concatenate(
+                ([True], is_char[1:] != is_char[:-1]))
+            nregions = int(is_char[starts].sum())
+            return (int(is_char.sum()),
+                    nregions,
+                    int(starts.sum()) - nregions)
+        return self._cached(("regions", chars), _count)
+
+
+_last_composition = None
+
+
+def getComposition(sequence):
+    """return :class:`SequenceComposition` of *sequence*.
+
+    The composition is re-used if *sequence* is the same object as
+    in the previous call.
+    """
+    global _last_composition
+    if _last_composition is None or \
+       _last_composition.mSequence is not sequence:
+        _last_composition = SequenceComposition(sequence)
+    return _last_composition
 
 
 class SequenceProperties(object):
@@ -73,7 +244,7 @@ class SequenceProperties(object):
         """load sequence properties from a sequence."""
 
         self.mSeqType = seqtype
-        self.mSequence = re.sub("[ -.]", "", sequence).upper()
+        self.mSequence = getComposition(sequence).getCleanSequence()
         self.mLength = len(self.mSequence)
 
     def __str__(self):
@@ -143,7 +314,7 @@ class SequencePropertiesHid(SequenceProperties):
         # map to printable letters: hid has length 22, so the padded '=' are
         # truncated. You have to add them, if you ever want to decode,
         # but who would do such a thing :=)
-        r = base64.encodestring(h)[0:22].decode("ascii")
+        r = base64.encodebytes(h)[0:22].decode("ascii")
 
         # finally substitute some characters:
         # '/' for '_', so we have legal file names
@@ -223,7 +394,7 @@ class SequencePropertiesNA(SequenceProperties):
         self.mCountsOthers = 0
         # counts of nucleotides
         self.mCountsNA = {}
-        self.mAlphabet = Bio.Alphabet.IUPAC.unambiguous_dna.letters + "N"
+        self.mAlphabet = DNA_LETTERS + "N"
         for x in self.mAlphabet:
             self.mCountsNA[x] = 0
 
@@ -239,19 +410,10 @@ class SequencePropertiesNA(SequenceProperties):
         """load sequence properties from a sequence."""
         SequenceProperties.loadSequence(self, sequence, seqtype)
         # counts of nucleotides
-        self.mCountsNA = {}
-        for x in self.mAlphabet:
-            self.mCountsNA[x] = 0
-
-        for na in sequence.upper():
-            if na in ('G', 'C'):
-                self.mCountsGC += 1
-            elif na in ('A', 'T'):
-                self.mCountsAT += 1
-            try:
-                self.mCountsNA[na] += 1
-            except KeyError:
-                self.mCountsOthers += 1
+        self.mCountsNA, self.mCountsOthers = getComposition(
+            sequence).countCharacters(self.mAlphabet, upper=True)
+        self.mCountsGC = self.mCountsNA["G"] + self.mCountsNA["C"]
+        self.mCountsAT = self.mCountsNA["A"] + self.mCountsNA["T"]
 
     def getFields(self):
         fields = SequenceProperties.getFields(self)
@@ -313,7 +475,7 @@ class SequencePropertiesDN(SequenceProperties):
         SequenceProperties.__init__(self)
         self.mCountsDinuc = {}
         self.mCountsOthers = 0
-        self.mAlphabet = Bio.Alphabet.IUPAC.unambiguous_dna.letters
+        self.mAlphabet = DNA_LETTERS
         for dinucleotide in itertools.product(self.mAlphabet, repeat=2):
             self.mCountsDinuc["".join(dinucleotide)] = 0
 
@@ -327,14 +489,11 @@ class SequencePropertiesDN(SequenceProperties):
         """load sequence properties from a sequence."""
         SequenceProperties.loadSequence(self, sequence, seqtype)
 
-        # IMS: generator rather than list
-        # to save memory for might be a neater way of doing this.
-        for dinuc in (sequence[x - 2:x]
-                      for x in range(2, len(sequence) + 1, 1)):
-            try:
-                self.mCountsDinuc[dinuc] += 1
-            except KeyError:
-                self.mCountsOthers += 1
+        counts, self.mCountsOthers = getComposition(
+            sequence).getDinucleotideCounts()
+        for x, first in enumerate("ACGT"):
+            for y, second in enumerate("ACGT"):
+                self.mCountsDinuc[first + second] = int(counts[x, y])
 
     def getFields(self):
 
@@ -451,36 +610,54 @@ class SequencePropertiesGaps(SequenceProperties):
         """load sequence properties from a sequence."""
         SequenceProperties.loadSequence(self, sequence, seqtype)
 
-        gap_chars = self.gap_chars
-        ngaps = 0
-        was_gap = not (sequence[0] in gap_chars)
+        self.ngaps, self.ngap_regions, self.nseq_regions = getComposition(
+            sequence).getRegions(self.gap_chars)
 
-        ngap_regions = 0
-        nseq_regions = 0
+    def addProperties(self, other):
+        SequenceProperties.addProperties(self, other)
 
-        x = 0
-        for x, c in enumerate(sequence):
+        self.ngaps += other.ngaps
+        self.nseq_regions += other.nseq_regions
+        self.ngap_regions += other.ngap_regions
 
-            is_gap = c in gap_chars
-            if is_gap:
-                ngaps += 1
-                if not was_gap:
-                    ngap_regions += 1
-            else:
-                if was_gap:
-                    nseq_regions += 1
-            was_gap = is_gap
 
-        self.ngaps = ngaps
-        self.ngap_regions = ngap_regions
-        self.nseq_regions = nseq_regions
+class SequencePropertiesMotifs(SequenceProperties):
+    """Add Properties : number of occurrences of nucleotide motifs
+
+    motif_counts
+        Number of matches of the motif. If there are several motifs,
+        there is a column ``motif_counts_<motif>`` for each motif.
+
+    Arguments
+    ---------
+    scanner : :class:`Motifs.MotifScanner`
+        Scanner with the motifs to count.
+
+    """
+
+    def __init__(self, scanner, *args, **kwargs):
+        SequenceProperties.__init__(self, *args, **kwargs)
+        self.scanner = scanner
+        self.mCounts = numpy.zeros(len(scanner.motifs), dtype=numpy.int64)
+
+    def loadSequence(self, sequence, seqtype="na"):
+        """load sequence properties from a sequence."""
+        SequenceProperties.loadSequence(self, sequence, seqtype)
+        self.mCounts = self.scanner.count(getComposition(sequence).getBytes())
 
     def addProperties(self, other):
         SequenceProperties.addProperties(self, other)
+        self.mCounts = self.mCounts + other.mCounts
 
-        self.ngaps += other.ngaps
-        self.nseq_regions += other.nseq_regions
-        self.ngap_regions += other.ngap_regions
+    def getFields(self):
+        fields = SequenceProperties.getFields(self)
+        return fields + ["%i" % x for x in self.mCounts]
+
+    def getHeaders(self):
+        headers = SequenceProperties.getHeaders(self)
+        if len(self.scanner.motifs) == 1:
+            return headers + ["motif_counts"]
+        return headers + ["motif_counts_%s" % x for x in self.scanner.motifs]
 
 
 class SequencePropertiesDegeneracy (SequencePropertiesLength):
@@ -555,7 +732,7 @@ class SequencePropertiesDegeneracy (SequencePropertiesLength):
             xx = []
             for y in range(5):
                 yy = {}
-                for z in Bio.Alphabet.IUPAC.extended_dna.letters:
+                for z in EXTENDED_DNA_LETTERS:
                     yy[z] = 0
                 xx.append(yy)
             self.mCountsDegeneracy.append(xx)
@@ -567,7 +744,7 @@ class SequencePropertiesDegeneracy (SequencePropertiesLength):
 
         for x in (0, 1, 2):
             for y in range(5):
-                for z in Bio.Alphabet.IUPAC.extended_dna.letters:
+                for z in EXTENDED_DNA_LETTERS:
                     self.mCountsDegeneracy[x][y][
                         z] += other.mCountsDegeneracy[x][y][z]
 
@@ -584,17 +761,23 @@ class SequencePropertiesDegeneracy (SequencePropertiesLength):
                 '''sequence length is not a multiple of 3 (length=%i)''' %
                 (len(sequence)))
 
-        # uppercase all letters
-        sequence = sequence.upper()
+        composition = getComposition(sequence)
 
         self.mNStopCodons = 0
 
         # setup counting arrays
         # nucleotide counts for each position (is not a sum of the counts
         # per degenerate site, as the codon might be intelligible, e.g. GNN).
-        self.mCounts = [{'A': 0, 'C': 0, 'G': 0, 'T': 0, 'X': 0, 'N': 0},
-                        {'A': 0, 'C': 0, 'G': 0, 'T': 0, 'X': 0, 'N': 0},
-                        {'A': 0, 'C': 0, 'G': 0, 'T': 0, 'X': 0, 'N': 0}]
+        position_counts = composition.getCodonPositionCounts(upper=True)
+        self.mCounts = []
+        for x in (0, 1, 2):
+            counts = dict([(c, int(position_counts[x][ord(c)]))
+                           for c in "ACGTXN"])
+            if sum(counts.values()) != len(sequence) // 3:
+                other = [chr(y) for y in numpy.flatnonzero(position_counts[x])
+                         if chr(y) not in counts]
+                raise KeyError(other[0])
+            self.mCounts.append(counts)
 
         # nucleotide counts for each position per degeneracy
         self.mCountsDegeneracy = []
@@ -603,26 +786,22 @@ class SequencePropertiesDegeneracy (SequencePropertiesLength):
             xx = []
             for y in range(5):
                 yy = {}
-                for z in Bio.Alphabet.IUPAC.extended_dna.letters:
+                for z in EXTENDED_DNA_LETTERS:
                     yy[z] = 0
                 xx.append(yy)
             self.mCountsDegeneracy.append(xx)
 
-        # use generator rather than list to save memory
-        for codon in (sequence[x:x + 3] for x in range(0, len(sequence), 3)):
-
-            for x in (0, 1, 2):
-                self.mCounts[x][codon[x]] += 1
+        for codon, count in composition.getCodonCounts(upper=True).items():
 
             if Genomics.IsStopCodon(codon):
-                self.mNStopCodons += 1
+                self.mNStopCodons += count
                 continue
 
             try:
                 aa, deg1, deg2, deg3 = Genomics.GetDegeneracy(codon)
                 degrees = (deg1, deg2, deg3)
                 for x in range(len(degrees)):
-                    self.mCountsDegeneracy[x][degrees[x]][codon[x]] += 1
+                    self.mCountsDegeneracy[x][degrees[x]][codon[x]] += count
 
             except KeyError:
                 pass
@@ -759,7 +938,7 @@ class SequencePropertiesAA(SequenceProperties):
 
         # counts of amino acids
         self.mCountsAA = {}
-        for x in Bio.Alphabet.IUPAC.extended_protein.letters:
+        for x in EXTENDED_PROTEIN_LETTERS:
             self.mCountsAA[x] = 0
 
     def addProperties(self, other):
@@ -781,30 +960,31 @@ class SequencePropertiesAA(SequenceProperties):
         # counts of amino acids
         self.mCountsAA = {}
 
-        for x in Bio.Alphabet.IUPAC.extended_protein.letters:
+        for x in EXTENDED_PROTEIN_LETTERS:
             self.mCountsAA[x] = 0
 
-        for codon in (sequence[x:x + 3] for x in range(0, len(sequence), 3)):
+        for codon, count in getComposition(
+                sequence).getCodonCounts().items():
             aa = Genomics.MapCodon2AA(codon)
-            self.mCountsAA[aa] += 1
+            self.mCountsAA[aa] += count
 
     def getFields(self):
 
         fields = SequenceProperties.getFields(self)
         t = 0
-        for x in Bio.Alphabet.IUPAC.extended_protein.letters:
+        for x in EXTENDED_PROTEIN_LETTERS:
             fields.append("%i" % self.mCountsAA[x])
             t += self.mCountsAA[x]
-        for x in Bio.Alphabet.IUPAC.extended_protein.letters:
+        for x in EXTENDED_PROTEIN_LETTERS:
             fields.append("%f" % (float(self.mCountsAA[x]) / t))
         return fields
 
     def getHeaders(self):
         '''Return list of data headers'''
         headers = SequenceProperties.getHeaders(self)
-        for x in Bio.Alphabet.IUPAC.extended_protein.letters:
+        for x in EXTENDED_PROTEIN_LETTERS:
             headers.append("n%s" % x)
-        for x in Bio.Alphabet.IUPAC.extended_protein.letters:
+        for x in EXTENDED_PROTEIN_LETTERS:
             headers.append("p%s" % x)
         return headers
 
@@ -824,7 +1004,7 @@ class SequencePropertiesAminoAcids(SequenceProperties):
 
         # counts of amino acids
         self.mCountsAA = {}
-        for x in Bio.Alphabet.IUPAC.extended_protein.letters:
+        for x in EXTENDED_PROTEIN_LETTERS:
             self.mCountsAA[x] = 0
         self.mOtherCounts = 0
 
@@ -839,18 +1019,11 @@ class SequencePropertiesAminoAcids(SequenceProperties):
 
         SequenceProperties.loadSequence(self, sequence, seqtype)
 
-        # set to zero
-        for x in Bio.Alphabet.IUPAC.extended_protein.letters:
-            self.mCountsAA[x] = 0
-        self.mOtherCounts = 0
-
-        for aa in sequence:
-            if aa == "-":
-                continue
-            try:
-                self.mCountsAA[aa] += 1
-            except KeyError:
-                self.mOtherCounts += 1
+        composition = getComposition(sequence)
+        self.mCountsAA, self.mOtherCounts = composition.countCharacters(
+            EXTENDED_PROTEIN_LETTERS)
+        # gaps are not counted
+        self.mOtherCounts -= int(composition.getCounts()[ord("-")])
 
     def getFields(self):
 
@@ -858,15 +1031,15 @@ class SequencePropertiesAminoAcids(SequenceProperties):
 
         t = 0
 
-        for x in Bio.Alphabet.IUPAC.extended_protein.letters:
+        for x in EXTENDED_PROTEIN_LETTERS:
             fields.append("%i" % self.mCountsAA[x])
             t += self.mCountsAA[x]
 
         if t > 0:
-            for x in Bio.Alphabet.IUPAC.extended_protein.letters:
+            for x in EXTENDED_PROTEIN_LETTERS:
                 fields.append("%f" % (float(self.mCountsAA[x]) / t))
         else:
-            for x in Bio.Alphabet.IUPAC.extended_protein.letters:
+            for x in EXTENDED_PROTEIN_LETTERS:
                 fields.append("0")
 
         return fields
@@ -874,9 +1047,9 @@ class SequencePropertiesAminoAcids(SequenceProperties):
     def getHeaders(self):
 
         fields = SequenceProperties.getHeaders(self)
-        for x in Bio.Alphabet.IUPAC.extended_protein.letters:
+        for x in EXTENDED_PROTEIN_LETTERS:
             fields.append("n%s" % x)
-        for x in Bio.Alphabet.IUPAC.extended_protein.letters:
+        for x in EXTENDED_PROTEIN_LETTERS:
             fields.append("p%s" % x)
 
         return fields
@@ -921,8 +1094,12 @@ class SequencePropertiesCodons(SequencePropertiesLength):
 
         SequencePropertiesLength.loadSequence(self, sequence, seqtype)
 
-        # uppercase all letters and count codons
-        self.mCodonCounts = Genomics.CountCodons(sequence.upper())
+        # uppercase all letters and count codons, skipping stop codons
+        self.mCodonCounts = dict([(c, 0) for c in Genomics.GeneticCodeAA])
+        for codon, count in getComposition(
+                sequence).getCodonCounts(upper=True).items():
+            if codon in self.mCodonCounts:
+                self.mCodonCounts[codon] += count
 
     def getFields(self):
 
@@ -1207,24 +1384,15 @@ class SequencePropertiesCounts(SequenceProperties):
         SequenceProperties.addProperties(self, other)
         for na, count in list(other.mCounts.items()):
             self.mCounts[na] += count
-        self.mCountsOthers += self.mCountsOthers
+        self.mCountsOthers += other.mCountsOthers
 
     def loadSequence(self, sequence, seqtype="na"):
         """load sequence properties from a sequence."""
 
         SequenceProperties.loadSequence(self, sequence, seqtype)
 
-        # counts of amino acids
-        self.mCounts = {}
-        for x in self.mAlphabet:
-            self.mCounts[x] = 0
-        self.mCountsOthers = 0
-
-        for na in sequence.upper():
-            try:
-                self.mCounts[na] += 1
-            except KeyError:
-                self.mCountsOthers += 1
+        self.mCounts, self.mCountsOthers = getComposition(
+            sequence).countCharacters(self.mAlphabet, upper=True)
 
     def getFields(self):
         fields = SequenceProperties.getFields(self)
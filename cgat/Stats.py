@@ -10,11 +10,12 @@ Code
 '''
 import math
 import numpy
-import scipy
-import scipy.stats
-import scipy.interpolate
 import collections
 from functools import reduce
+import cgat.LazyImport as LazyImport
+
+# scipy.stats and scipy.interpolate are imported on first use
+scipy = LazyImport.LazyModule("scipy")
 
 
 def getSignificance(pvalue, thresholds=[0.05, 0.01, 0.001]):
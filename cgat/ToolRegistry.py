@@ -0,0 +1,123 @@
+'''ToolRegistry.py - index of cgat tools and their keywords
+========================================================
+
+``cgat --help`` lists the tools grouped by the keywords given in the
+``:Tags:`` field of each tool's documentation. Collecting the keywords
+requires opening and reading every file in the tools directory.
+
+This module maintains a registry with the keywords of each tool. The
+registry is written to the file :file:`registry.json` in the tools
+directory when the package is built (see :file:`setup.py`). At run
+time, only tools whose modification time or size differ from the
+registry are read again, so that the registry can not go stale in a
+development checkout.
+
+This module must not import any other cgat module as it is used
+by :file:`setup.py` before the package is built.
+
+Reference
+---------
+
+'''
+
+import collections
+import glob
+import json
+import os
+
+# name of the registry file in the tools directory
+REGISTRY_FILENAME = "registry.json"
+
+# increment if the format of the registry changes
+REGISTRY_VERSION = 1
+
+
+def readTags(filename, size=10000):
+    '''return list of keywords in the ``:Tags:`` field of a tool.
+
+    Only the first *size* bytes of the file are searched.
+    '''
+    with open(filename, encoding="utf-8", errors="replace") as inf:
+        for line in inf.readlines(size):
+            if line.startswith(":Tags:"):
+                return [x for x in line[6:].strip().split(" ") if x]
+    return []
+
+
+def _getStamp(filename):
+    s = os.stat(filename)
+    return [s.st_mtime_ns, s.st_size]
+
+
+def listTools(path):
+    '''return sorted list of tool names in *path*.'''
+    return sorted([os.path.basename(x)[:-3]
+                   for x in glob.glob(os.path.join(path, "*.py"))
+                   if not os.path.basename(x).startswith("_")])
+
+
+def buildRegistry(path, registry=None):
+    '''build registry for tools in directory *path*.
+
+    If a previous *registry* is given, its entries are re-used for
+    tools that have not changed.
+    '''
+    previous = {}
+    if registry is not None:
+        previous = registry["tools"]
+
+    tools = {}
+    for tool in listTools(path):
+        filename = os.path.join(path, tool + ".py")
+        stamp = _getStamp(filename)
+        entry = previous.get(tool, None)
+        if entry is None or entry["stamp"] != stamp:
+            entry = {"stamp": stamp, "tags": readTags(filename)}
+        tools[tool] = entry
+
+    return {"version": REGISTRY_VERSION, "tools": tools}
+
+
+def readRegistry(filename):
+    '''read registry from *filename*.
+
+    returns None if the file does not exist or is not a registry of
+    the current version.
+    '''
+    try:
+        with open(filename) as inf:
+            registry = json.load(inf)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(registry, dict) or \
+       registry.get("version", None) != REGISTRY_VERSION:
+        return None
+    return registry
+
+
+def writeRegistry(path, filename=None):
+    '''build registry for tools in *path* and save to *filename*.
+
+    The registry is saved in *path* if *filename* is not given.
+    '''
+    if filename is None:
+        filename = os.path.join(path, REGISTRY_FILENAME)
+    registry = buildRegistry(path)
+    with open(filename, "w") as outf:
+        json.dump(registry, outf, sort_keys=True, indent=1)
+    return registry
+
+
+def getRegistry(path):
+    '''return an up-to-date registry for tools in *path*.'''
+    return buildRegistry(
+        path, readRegistry(os.path.join(path, REGISTRY_FILENAME)))
+
+
+def mapKeyword2Tool(registry):
+    '''return a dictionary mapping keywords to lists of tools.'''
+    map_keyword2tool = collections.defaultdict(list)
+    for tool, entry in sorted(registry["tools"].items()):
+        for keyword in entry["tags"]:
+            map_keyword2tool[keyword].append(tool)
+    return map_keyword2tool
@@ -0,0 +1,281 @@
+'''ToolServer.py - run cgat tools in pre-started processes
+=========================================================
+
+Starting a cgat tool requires starting an interpreter and importing
+numpy, pysam, cgatcore and other modules, which can take longer than
+running the tool on a small input. Pipelines calling tools many times
+on small chunks of data thus spend most of their time starting up.
+
+:func:`serve` starts a server that imports these modules once and
+keeps a pool of worker processes waiting for requests on a UNIX
+socket. Workers are forked from the server and share the imported
+modules. A worker handles a single request and exits, upon which the
+server forks a replacement. Each tool thus runs in a fresh process
+without state left over from previous runs.
+
+:func:`run` is the client. It sends the command line arguments, the
+working directory and the environment to a worker together with its
+standard input, output and error file descriptors and waits for the
+exit code. As the file descriptors themselves are passed, the tool
+reads from and writes to the client's files and pipes directly.
+
+The server is started with::
+
+   cgat --serve --socket=/tmp/cgat.sock --workers=4 &
+
+Tools are run through the server if the environment variable
+``CGAT_SERVER`` is set to the socket::
+
+   export CGAT_SERVER=/tmp/cgat.sock
+   cgat bed2bed --method=merge < in.bed > out.bed
+
+If no server is listening on the socket, the tool is run locally.
+Note that interrupting the client does not stop the tool in the
+worker.
+
+Reference
+---------
+
+'''
+
+import array
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import traceback
+
+# modules imported by the server before forking workers
+DEFAULT_PRELOAD = ("numpy",
+                   "pysam",
+                   "pandas",
+                   "cgatcore.experiment",
+                   "cgatcore.iotools")
+
+# file descriptors passed from the client to a worker
+STD_FDS = (0, 1, 2)
+
+
+def _receiveAll(connection, size):
+    '''receive exactly *size* bytes or return None if the connection
+    has been closed.'''
+    data = []
+    while size > 0:
+        chunk = connection.recv(size)
+        if not chunk:
+            return None
+        data.append(chunk)
+        size -= len(chunk)
+    return b"".join(data)
+
+
+def _getExitCode(code):
+    '''convert argument to sys.exit into an exit status the way the
+    interpreter does.'''
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    sys.stderr.write("%s\n" % str(code))
+    return 1
+
+
+def isListening(socket_path):
+    '''return True if a server is listening on *socket_path*.'''
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path)
+        return True
+    except (OSError, IOError):
+        return False
+    finally:
+        connection.close()
+
+
+def run(socket_path, argv):
+    '''run command line *argv* in a worker of the server listening
+    on *socket_path*.
+
+    returns the exit status of the tool or None if no server is
+    listening.
+    '''
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path)
+    except (OSError, IOError):
+        connection.close()
+        return None
+
+    header = json.dumps({"argv": list(argv),
+                         "cwd": os.getcwd(),
+                         "environ": dict(os.environ)}).encode("utf-8")
+
+    try:
+        connection.sendmsg(
+            [b"\0"],
+            [(socket.SOL_SOCKET, socket.SCM_RIGHTS,
+              array.array("i", STD_FDS))])
+        connection.sendall(struct.pack("!I", len(header)) + header)
+        data = _receiveAll(connection, 4)
+    finally:
+        connection.close()
+
+    if data is None:
+        sys.stderr.write("cgat: server worker died without exit status\n")
+        return 1
+    return struct.unpack("!i", data)[0]
+
+
+def _receiveRequest(connection):
+    '''receive file descriptors and request header from a client.'''
+    fds = array.array("i")
+    msg, ancdata, flags, address = connection.recvmsg(
+        1, socket.CMSG_LEN(len(STD_FDS) * fds.itemsize))
+    for level, type, data in ancdata:
+        if level == socket.SOL_SOCKET and type == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+
+    size = _receiveAll(connection, 4)
+    if size is None or len(fds) != len(STD_FDS):
+        raise ValueError("incomplete request")
+    header = _receiveAll(connection, struct.unpack("!I", size)[0])
+    if header is None:
+        raise ValueError("incomplete request")
+    return list(fds), json.loads(header.decode("utf-8"))
+
+
+def _setupProcess(fds, header):
+    '''redirect standard streams to the client's file descriptors and
+    set up working directory and environment.'''
+    for stream in (sys.stdout, sys.stderr):
+        stream.flush()
+
+    for target, fd in zip(STD_FDS, fds):
+        os.dup2(fd, target)
+        os.close(fd)
+
+    sys.stdin = sys.__stdin__ = os.fdopen(0, "r", closefd=False)
+    sys.stdout = sys.__stdout__ = os.fdopen(1, "w", closefd=False)
+    sys.stderr = sys.__stderr__ = os.fdopen(2, "w", buffering=1,
+                                            closefd=False)
+
+    os.chdir(header["cwd"])
+    os.environ.clear()
+    os.environ.update(header["environ"])
+
+
+def _work(listener, runner):
+    '''accept a single request on *listener*, run it with *runner*
+    and exit.'''
+    connection, address = listener.accept()
+    listener.close()
+
+    code = 1
+    try:
+        fds, header = _receiveRequest(connection)
+        _setupProcess(fds, header)
+        try:
+            runner(header["argv"])
+            code = 0
+        except SystemExit as ex:
+            code = _getExitCode(ex.code)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except (OSError, IOError, ValueError):
+                pass
+        connection.sendall(struct.pack("!i", code))
+    finally:
+        connection.close()
+        os._exit(0)
+
+
+def _spawn(listener, runner, children):
+    '''fork a worker and add its process id to *children*.
+
+    Signals are blocked until the worker has been recorded so that
+    a server stopped during the fork does not leave workers behind.
+    '''
+    signals = set((signal.SIGTERM, signal.SIGINT))
+    mask = signal.pthread_sigmask(signal.SIG_BLOCK, signals)
+    try:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                for signum in signals:
+                    signal.signal(signum, signal.SIG_DFL)
+                signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+                _work(listener, runner)
+            finally:
+                os._exit(1)
+        children.add(pid)
+    finally:
+        signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+
+
+def preload(modules):
+    '''import *modules* and return list of modules that could not be
+    imported.'''
+    failed = []
+    for module in modules:
+        try:
+            __import__(module)
+        except ImportError:
+            failed.append(module)
+    return failed
+
+
+def serve(socket_path, runner, workers=4, modules=DEFAULT_PRELOAD):
+    '''serve requests on *socket_path* with a pool of *workers*.
+
+    *runner* is called in a worker with the command line of a request.
+    *modules* are imported before the workers are started.
+
+    The server runs until it receives SIGTERM or SIGINT.
+    '''
+    failed = preload(modules)
+    if failed:
+        sys.stderr.write("cgat: could not preload %s\n" % ",".join(failed))
+
+    if os.path.exists(socket_path):
+        # remove stale socket, but do not replace a running server
+        if isListening(socket_path):
+            raise OSError("server already running on %s" % socket_path)
+        os.unlink(socket_path)
+
+    def _stop(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    children = set()
+    bound = False
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        listener.bind(socket_path)
+        bound = True
+        listener.listen(max(16, workers * 4))
+
+        for x in range(workers):
+            _spawn(listener, runner, children)
+
+        while True:
+            pid, status = os.wait()
+            if pid in children:
+                children.remove(pid)
+                _spawn(listener, runner, children)
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        listener.close()
+        if bound and os.path.exists(socket_path):
+            os.unlink(socket_path)
@@ -17,7 +17,6 @@ import hashlib
 import itertools
 import math
 import numpy
-import pandas
 import re
 import string
 import sys
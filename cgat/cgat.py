@@ -26,34 +26,38 @@ for a list of all available tools.
 To get help for a specific tool, type::
 
     cgat <tool> --help
+
+To avoid the start-up cost of each tool when calling many tools in
+succession, start a server with pre-imported worker processes::
+
+    cgat --serve --socket=<socket> [--workers=<n>] &
+
+and set the environment variable ``CGAT_SERVER`` to <socket>. For
+details type::
+
+    cgat --serve --help
+
+To see which modules contribute to the start-up time of a tool, type::
+
+    cgat --profile-startup <tool>
 '''
 
 import os
 import sys
 import re
-import glob
 import imp
 import collections
-import cgatcore.iotools as iotools
 import cgat
 
 
 def mapKeyword2Script(path):
-    '''collect keywords from scripts.'''
+    '''collect keywords from scripts.
 
-    map_keyword2script = collections.defaultdict(list)
-
-    for script in glob.glob(os.path.join(path, "*.py")):
-        s = os.path.basename(script)[:-3]
-        with iotools.open_file(script, 'r') as inf:
-            data = [x for x in inf.readlines(10000) if x.startswith(':Tags:')]
-            if data:
-                keywords = [x.strip() for x in data[0][6:].split(' ')]
-                for x in keywords:
-                    if x:
-                        map_keyword2script[x].append(s)
-
-    return map_keyword2script
+    Keywords are taken from the tool registry, which is updated for
+    tools that have changed since the package has been built.
+    '''
+    import cgat.ToolRegistry as ToolRegistry
+    return ToolRegistry.mapKeyword2Tool(ToolRegistry.getRegistry(path))
 
 
 def printListInColumns(l, ncolumns):
@@ -90,10 +94,10 @@ def main(argv=None):
 
     argv = sys.argv
 
-    path = os.path.join(os.path.abspath(os.path.dirname(cgat.__file__)),
-                        "tools")
+    path = getToolsPath()
 
     if len(argv) == 1 or argv[1] == "--help" or argv[1] == "-h":
+        import cgat.ToolRegistry as ToolRegistry
         print((globals()["__doc__"]))
 
         map_keyword2script = mapKeyword2Script(path)
@@ -108,8 +112,7 @@ def main(argv=None):
         if 'all' in argv[2:]:
             print("The list of all available commands is:\n")
             print(("%s\n" % printListInColumns(
-                sorted([os.path.basename(x)[:-3]
-                        for x in glob.glob(os.path.join(path, "*.py"))]),
+                ToolRegistry.listTools(path),
                 3)))
 
         else:
@@ -121,15 +124,144 @@ def main(argv=None):
                         3)))
         return
 
+    if argv[1] == "--serve":
+        return serve(argv[2:])
+
+    if argv[1] == "--profile-startup":
+        return profileStartup(argv[2:])
+
+    socket_path = os.environ.get("CGAT_SERVER", None)
+    if socket_path:
+        import cgat.ToolServer as ToolServer
+        code = ToolServer.run(socket_path, argv)
+        if code is not None:
+            return code
+
+    runTool(argv)
+
+
+def getToolsPath():
+    '''return directory with cgat tools.'''
+    return os.path.join(os.path.abspath(os.path.dirname(cgat.__file__)),
+                        "tools")
+
+
+def runTool(argv):
+    '''run tool with command line *argv* such as ``["cgat", "bed2bed",
+    "--help"]``.'''
+
     command = argv[1]
 
     command = re.sub("-", "_", command)
-    
-    (file, pathname, description) = imp.find_module(command, [path, ])
+
+    (file, pathname, description) = imp.find_module(
+        command, [getToolsPath(), ])
     module = imp.load_module(command, file, pathname, description)
     # remove 'cgat' from sys.argv
-    del sys.argv[0]
+    sys.argv = list(argv[1:])
     module.main(sys.argv)
 
+
+def serve(argv):
+    '''start server with pre-imported worker processes.'''
+    import argparse
+    import cgat.ToolServer as ToolServer
+
+    parser = argparse.ArgumentParser(
+        prog="cgat --serve",
+        description="run cgat tools in pre-started worker processes "
+        "listening on a UNIX socket. Clients use the server if the "
+        "environment variable CGAT_SERVER is set to the socket.")
+
+    parser.add_argument("--socket", dest="socket_path", type=str,
+                        default=os.environ.get("CGAT_SERVER", None),
+                        help="path of the UNIX socket "
+                        "[default=$CGAT_SERVER]")
+
+    parser.add_argument("--workers", dest="workers", type=int, default=4,
+                        help="number of worker processes [%(default)s]")
+
+    parser.add_argument("--preload", dest="preload", type=str,
+                        action="append", default=[],
+                        help="additional module to import before starting "
+                        "the workers, for example cgat.tools.gtf2table. "
+                        "Can be given multiple times")
+
+    args = parser.parse_args(argv)
+    if not args.socket_path:
+        parser.error("no socket given, use --socket or set CGAT_SERVER")
+
+    ToolServer.serve(args.socket_path,
+                     runTool,
+                     workers=args.workers,
+                     modules=ToolServer.DEFAULT_PRELOAD + tuple(args.preload))
+
+
+def profileStartup(argv):
+    '''output time spent importing modules when starting a tool.'''
+    import argparse
+    import cgat.LazyImport as LazyImport
+
+    parser = argparse.ArgumentParser(
+        prog="cgat --profile-startup",
+        description="import a tool in a new interpreter and report "
+        "the time spent importing each module. The output lists the "
+        "total import time of the tool, the time for each module "
+        "imported directly by the tool and the modules with the "
+        "largest import times.")
+
+    parser.add_argument("tool", type=str,
+                        help="name of the tool")
+
+    parser.add_argument("--top", dest="top", type=int, default=20,
+                        help="number of modules with the largest import "
+                        "time to report [%(default)s]")
+
+    args = parser.parse_args(argv)
+
+    tool = re.sub("-", "_", args.tool)
+    if not os.path.exists(os.path.join(getToolsPath(), tool + ".py")):
+        parser.error("unknown tool '%s'" % args.tool)
+
+    # make sure the new interpreter imports this copy of cgat
+    environ = os.environ.copy()
+    environ["PYTHONPATH"] = os.pathsep.join(
+        [os.path.dirname(os.path.dirname(os.path.abspath(cgat.__file__)))] +
+        [x for x in environ.get("PYTHONPATH", "").split(os.pathsep) if x])
+
+    module = "cgat.tools." + tool
+    try:
+        imports = LazyImport.profileImports(module, environ=environ)
+    except ImportError as ex:
+        sys.stderr.write("cgat: %s\n" % str(ex))
+        return 1
+
+    # imports are output in the order they complete, thus the direct
+    # imports of the tool are the top-level imports since the previous
+    # module at top level.
+    index = [x[0] for x in imports].index(module)
+    first = index
+    while first > 0 and imports[first - 1][1] > 0:
+        first -= 1
+    # parent packages are imported within the import of the tool
+    direct = [x for x in imports[first:index]
+              if x[1] == 1 and not module.startswith(x[0] + ".")]
+
+    def _write(section, name, self_time, cumulative_time):
+        sys.stdout.write("%s\t%s\t%.1f\t%.1f\n" % (
+            section, name, self_time / 1000.0, cumulative_time / 1000.0))
+
+    sys.stdout.write("section\tmodule\tself_ms\tcumulative_ms\n")
+    total = sum([x[2] for x in imports])
+    _write("total", "all", total, total)
+    _write("tool", module, imports[index][2], imports[index][3])
+    for name, depth, self_time, cumulative_time in sorted(
+            direct, key=lambda x: -x[3]):
+        _write("direct", name, self_time, cumulative_time)
+    for name, depth, self_time, cumulative_time in sorted(
+            imports, key=lambda x: -x[2])[:args.top]:
+        _write("top", name, self_time, cumulative_time)
+
+
 if __name__ == "__main__":
     sys.exit(main())
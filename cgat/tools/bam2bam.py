@@ -114,6 +114,12 @@ The script implements the following methods:
    computed via the NM flag will be unaffected. The error rate is set
    by --error-rate.
 
+If only the methods ``unset-unmapped-mapq``, ``set-sequence``,
+``strip-sequence``, ``strip-quality`` and ``keep-first-base`` are
+given, reads are modified in compiled code without creating python
+objects. Use ``--threads`` to compress and
+decompress :term:`bam` files with multiple threads.
+
 By default, the script works from stdin and outputs to stdout.
 
 Usage
@@ -152,7 +158,15 @@ import cgatcore.iotools as iotools
 import itertools
 import math
 
-from cgat.BamTools.bamtools import bam2bam_filter_bam, SetNH
+from cgat.BamTools.bamtools import bam2bam_filter_bam, SetNH, \
+    bam2bam_transform_reads
+
+# methods that are applied by bam2bam_transform_reads
+NATIVE_METHODS = set(("unset-unmapped-mapq",
+                      "set-sequence",
+                      "strip-sequence",
+                      "strip-quality",
+                      "keep-first-base"))
 
 
 class SubsetBam(object):
@@ -319,6 +333,8 @@ def process_bam(infile, outfile, options):
                 minimum_average_base_quality=options.minimum_average_base_quality)
 
             options.stdlog.write("category\tcounts\n%s\n" % c.asTable())
+    elif set(options.methods).issubset(NATIVE_METHODS):
+        transform_reads(infile, outfile, options)
     else:
 
         # set up the modifying iterators
@@ -437,17 +453,28 @@ def process_bam(infile, outfile, options):
 
         # keep first base of reads by changing the cigarstring to
         # '1M' and, in reads mapping to the reverse strand,
-        # changes the pos to aend - 1
+        # changes the pos to aend - 1. Sequence and qualities
+        # are reduced to the kept base.
         # Needs to be refactored to make it more general
         # (last base, midpoint, ..)
-        if "keep_first_base" in options.methods:
+        if "keep-first-base" in options.methods:
             def keep_first_base(i):
                 for read in i:
+                    if read.is_unmapped:
+                        yield read
+                        continue
+                    pairs = read.get_aligned_pairs(matches_only=True)
                     if read.is_reverse:
+                        qpos = pairs[-1][0]
                         read.pos = read.aend - 1
-                        read.cigarstring = '1M'
-                    elif not read.is_unmapped:
-                        read.cigarstring = '1M'
+                    else:
+                        qpos = pairs[0][0]
+                    seq, qual = read.seq, read.qual
+                    read.cigarstring = '1M'
+                    if seq:
+                        read.seq = seq[qpos]
+                        if qual:
+                            read.qual = qual[qpos]
                     yield read
             it = keep_first_base(it)
 
@@ -523,6 +550,48 @@ def process_bam(infile, outfile, options):
             outfile.write(read)
 
 
+def transform_reads(infile, outfile, options):
+    """apply methods that modify reads independently of each other
+    with :func:`bam2bam_transform_reads`.
+    """
+    strip_sequence, strip_quality, strip_match = False, False, False
+    if "strip-sequence" in options.methods or \
+       "strip-quality" in options.methods:
+        if options.strip_method == "all":
+            if "strip-sequence" in options.methods:
+                strip_sequence = True
+                msg = 'no sequence present'
+            else:
+                strip_quality = True
+                msg = 'no quality information present'
+
+            # check first read if processing should start,
+            # only possible when not working from stdin
+            if not infile.is_stream:
+                first_reads = list(infile.head(1))
+                if first_reads and \
+                        ((strip_sequence and first_reads[0].seq is None) or
+                         (strip_quality and first_reads[0].qual is None)):
+                    if options.force:
+                        E.warn('proccessing continues, though: %s' % msg)
+                    else:
+                        E.warn('processing not started: %s' % msg)
+                        return
+        elif options.strip_method == "match":
+            strip_match = True
+
+    c = bam2bam_transform_reads(
+        infile, outfile,
+        unset_unmapped_mapq="unset-unmapped-mapq" in options.methods,
+        set_sequence="set-sequence" in options.methods,
+        strip_sequence=strip_sequence,
+        strip_quality=strip_quality,
+        strip_match=strip_match,
+        keep_first_base="keep-first-base" in options.methods)
+
+    E.info("category\tcounts\n%s\n" % c.asTable())
+
+
 def main(argv=None):
     """script main.
 
@@ -624,6 +693,12 @@ def main(argv=None):
         type=float,
         help="minimum average base quality when filtering ")
 
+    parser.add_argument(
+        "--threads", dest="threads",
+        type=int,
+        help="number of threads to use for compressing and "
+        "decompressing bam files ")
+
     parser.set_defaults(
         methods=[],
         output_sam=False,
@@ -639,6 +714,7 @@ def main(argv=None):
         error_rate=None,
         minimum_read_length=0,
         minimum_average_base_quality=0,
+        threads=1,
     )
 
     # add common options (-h/--help, ...) and parse command line
@@ -686,9 +762,11 @@ def main(argv=None):
         output_mode = "wb"
 
     # reading bam from stdin does not work with only the "r" tag
-    with pysam.AlignmentFile(bamfile, "rb") as pysam_in:
+    with pysam.AlignmentFile(bamfile, "rb",
+                             threads=args.threads) as pysam_in:
         with pysam.AlignmentFile(output_bamfile, output_mode,
-                                 template=pysam_in) as pysam_out:
+                                 template=pysam_in,
+                                 threads=args.threads) as pysam_out:
             process_bam(pysam_in, pysam_out, args)
 
     # write footer and output benchmark information.
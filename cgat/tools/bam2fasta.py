@@ -35,10 +35,12 @@ import sys
 import collections
 import pysam
 import numpy
-import pandas
+import cgat.LazyImport as LazyImport
 import cgatcore.experiment as E
 import cgatcore.iotools as iotools
 
+pandas = LazyImport.LazyModule("pandas")
+
 
 # adapted from here: https://bitbucket.org/brentp/biostuff/src/282b504ac9020fe1449e23f800b20b5bd7d12061/nwalign/pairwise.py?at=default&fileviewer=file-view-default
 # replace with alignlib version
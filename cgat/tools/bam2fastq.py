@@ -28,6 +28,19 @@ below will create the same two output files::
 
    cat in.bam cgat bam2fastq --output-filename-pattern=out.%s.fastq.gz
 
+By default, reads are collected in temporary files that are then
+sorted by read name with the external ``sort`` command. With
+``--pairing-method=buffer``, reads are paired in a single pass within
+the process. A read is kept in memory until its mate is found and the
+pair is written to both output files. Pairs are thus output in the
+order in which they are completed, which for name-grouped or
+coordinate-sorted :term:`bam` files requires only a small buffer. If
+more than ``--max-buffer-size`` reads are waiting for their mate, the
+waiting reads are written to a sorted temporary file. Reads without
+mate are output at the end in the order of their name. Secondary and
+supplementary alignments are ignored in this mode and the output
+files are compressed in separate threads.
+
 Type::
 
    python bam2fastq.py --help
@@ -39,9 +52,14 @@ Command line options
 
 '''
 
+import gzip
+import heapq
+import itertools
 import os
+import queue
 import sys
 import tempfile
+import threading
 import shutil
 import cgatcore.experiment as E
 import cgatcore.iotools as iotools
@@ -49,6 +67,214 @@ import cgatcore.iotools as iotools
 import pysam
 
 
+class ThreadedGzipWriter(object):
+    """write text to a gzip compressed file.
+
+    Text is collected in chunks of *chunk_size* characters that are
+    compressed and written in a separate thread.
+    """
+
+    def __init__(self, filename, chunk_size=1 << 20, compresslevel=6):
+        self.outfile = gzip.open(filename, "wb", compresslevel)
+        self.chunk_size = chunk_size
+        self.queue = queue.Queue(maxsize=4)
+        self.chunk = []
+        self.size = 0
+        self.error = None
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            data = self.queue.get()
+            if data is None:
+                break
+            if self.error is not None:
+                continue
+            try:
+                self.outfile.write(data)
+            except Exception as ex:
+                self.error = ex
+
+    def write(self, text):
+        self.chunk.append(text)
+        self.size += len(text)
+        if self.size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.error is not None:
+            raise self.error
+        if self.chunk:
+            self.queue.put("".join(self.chunk).encode("ascii"))
+            self.chunk = []
+            self.size = 0
+
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        self.outfile.close()
+        if self.error is not None:
+            raise self.error
+
+
+class MateBuffer(object):
+    """pair reads by name.
+
+    Reads are kept in memory until their mate is added. If more than
+    *max_size* reads are waiting, all waiting reads are written to a
+    temporary file in *tmpdir* sorted by name. Reads that have not
+    been paired are returned by :meth:`iterate_unpaired`.
+    """
+
+    def __init__(self, max_size, tmpdir):
+        self.max_size = max_size
+        self.tmpdir = tmpdir
+        self.reads = {}
+        self.filenames = []
+
+    def add(self, qname, is_read1, seq, qual):
+        """add a read.
+
+        Returns a tuple of (read1, read2) if the read completes a
+        pair, otherwise None. Each read is a tuple of
+        (name, sequence, quality).
+        """
+        mate = self.reads.pop(qname, None)
+        if mate is not None:
+            if mate[0] != is_read1:
+                if is_read1:
+                    return (qname, seq, qual), (qname, mate[1], mate[2])
+                else:
+                    return (qname, mate[1], mate[2]), (qname, seq, qual)
+            # keep the first occurrence of duplicate reads
+            self.reads[qname] = mate
+            return None
+
+        self.reads[qname] = (is_read1, seq, qual)
+        if len(self.reads) > self.max_size:
+            self.spill()
+        return None
+
+    def spill(self):
+        """write all waiting reads to a temporary file."""
+        filename = os.path.join(self.tmpdir,
+                                "spill%i.tsv" % len(self.filenames))
+        with open(filename, "w") as outf:
+            for qname, (is_read1, seq, qual) in sorted(self.reads.items()):
+                outf.write("%s\t%i\t%s\t%s\n" %
+                           (qname, is_read1, seq, qual))
+        E.debug("wrote %i unpaired reads to %s" % (len(self.reads), filename))
+        self.filenames.append(filename)
+        self.reads = {}
+
+    def _iterate_file(self, filename):
+        with open(filename) as inf:
+            for line in inf:
+                qname, is_read1, seq, qual = line[:-1].split("\t")
+                yield qname, is_read1 == "1", seq, qual
+
+    def iterate_unpaired(self):
+        """iterate over reads waiting for their mate in the order of
+        their name.
+
+        Mates that were written to different temporary files are
+        paired. Yields tuples of (read1, read2). One of read1 or
+        read2 is None if a mate is missing.
+        """
+        runs = [self._iterate_file(x) for x in self.filenames]
+        runs.append((qname, is_read1, seq, qual) for
+                    qname, (is_read1, seq, qual) in
+                    sorted(self.reads.items()))
+
+        for qname, reads in itertools.groupby(heapq.merge(*runs),
+                                              key=lambda x: x[0]):
+            read1, read2 = None, None
+            for qname, is_read1, seq, qual in reads:
+                if is_read1:
+                    if read1 is None:
+                        read1 = (qname, seq, qual)
+                elif read2 is None:
+                    read2 = (qname, seq, qual)
+            yield read1, read2
+
+
+def write_pairs_buffered(samfile, fastqfile1, fastqfile2,
+                         max_buffer_size, tmpdir):
+    """write reads in *samfile* to *fastqfile1* and *fastqfile2*
+    pairing reads with a :class:`MateBuffer`.
+
+    Returns a counter.
+    """
+    c = E.Counter()
+    outfile1 = ThreadedGzipWriter(fastqfile1)
+    outfile2 = ThreadedGzipWriter(fastqfile2)
+    mates = MateBuffer(max_buffer_size, tmpdir)
+    read1_qlen, read2_qlen = 0, 0
+
+    def write(outfile, read):
+        outfile.write("@%s\n%s\n+\n%s\n" % read)
+
+    for read in samfile.fetch(until_eof=True):
+        c.input += 1
+        if read.is_secondary or read.is_supplementary:
+            c.skipped += 1
+            continue
+
+        if not read.is_paired:
+            if not read1_qlen:
+                read1_qlen = read.qlen
+            write(outfile1, (read.qname, read.seq, read.qual))
+            # keep the second file synchronized in case the input
+            # contains paired reads
+            write(outfile2, (read.qname,
+                             "N" * (read2_qlen or read.qlen),
+                             "B" * (read2_qlen or read.qlen)))
+            c.unpaired += 1
+            continue
+
+        if read.is_read1:
+            if not read1_qlen:
+                read1_qlen = read.qlen
+        elif not read2_qlen:
+            read2_qlen = read.qlen
+
+        pair = mates.add(read.qname, read.is_read1, read.seq, read.qual)
+        if pair is not None:
+            write(outfile1, pair[0])
+            write(outfile2, pair[1])
+            c.output1 += 1
+            c.output2 += 1
+
+    c.spilled = len(mates.filenames)
+
+    for read1, read2 in mates.iterate_unpaired():
+        if read1 is None:
+            read1 = (read2[0], "N" * read1_qlen, "B" * read1_qlen)
+            c.extra1 += 1
+            c.output2 += 1
+        elif read2 is None:
+            read2 = (read1[0], "N" * read2_qlen, "B" * read2_qlen)
+            c.extra2 += 1
+            c.output1 += 1
+        else:
+            c.output1 += 1
+            c.output2 += 1
+        write(outfile1, read1)
+        write(outfile2, read2)
+
+    outfile1.close()
+    outfile2.close()
+
+    if c.output1 == 0 and c.output2 == 0:
+        # single end data
+        os.unlink(fastqfile2)
+
+    return c
+
+
 def main(argv=None):
     """script main.
 
@@ -63,7 +289,21 @@ def main(argv=None):
 
     parser.add_argument("--version", action='version', version="1.0")
 
+    parser.add_argument("--pairing-method", dest="pairing_method", type=str,
+                        choices=("sort", "buffer"),
+                        help="method to pair reads. ``sort`` sorts reads "
+                        "by name with the external sort command, "
+                        "``buffer`` pairs reads in a single pass ")
+
+    parser.add_argument("--max-buffer-size", dest="max_buffer_size",
+                        type=int,
+                        help="maximum number of reads waiting for their "
+                        "mate to keep in memory with "
+                        "``--pairing-method=buffer`` ")
+
     parser.set_defaults(
+        pairing_method="sort",
+        max_buffer_size=1000000,
     )
 
     # add common options (-h/--help, ...) and parse command line
@@ -92,6 +332,16 @@ def main(argv=None):
 
     tmpdir = tempfile.mkdtemp()
 
+    if args.pairing_method == "buffer":
+        c = write_pairs_buffered(samfile, fastqfile1, fastqfile2,
+                                 args.max_buffer_size, tmpdir)
+        shutil.rmtree(tmpdir)
+        if c.unpaired == 0 and c.output1 == 0 and c.output2 == 0:
+            E.warn("no reads were found")
+        E.info("%s" % str(c))
+        E.stop()
+        return
+
     outtemp1 = os.path.join(tmpdir, "pair1.gz")
     outtemp2 = os.path.join(tmpdir, "pair2.gz")
 
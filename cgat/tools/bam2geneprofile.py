@@ -97,6 +97,12 @@ counts are aggregated over all transcripts in the :term:`gtf` file.
 
 :term:`Bam` files need to be sorted by coordinate and indexed.
 
+The profile can be restricted to a subset of genes or transcripts
+listed in a file with ``--id-tsv-file``. If the :term:`gtf` file is
+compressed with bgzip and indexed with tabix (see
+:func:`GTF.buildIndexedGTF`), only the entries of the selected genes
+or transcripts are read from it.
+
 A meta-gene structure has two components - regions of variable size,
 such as exons, introns, etc, which nevertheless have a fixed start and
 end coordinate in a transcript. The other component are regions of
@@ -302,11 +308,13 @@ import cgatcore.iotools as iotools
 import pysam
 import cgat.GTF as GTF
 import numpy
-import pandas
-import pyBigWig
+import cgat.LazyImport as LazyImport
 
 from cgat.BamTools import geneprofile
 
+pandas = LazyImport.LazyModule("pandas")
+pyBigWig = LazyImport.LazyModule("pyBigWig")
+
 
 def main(argv=None):
     """script main.
@@ -354,6 +362,11 @@ def main(argv=None):
                         metavar="GTF",
                         help="GTF file to use. ")
 
+    parser.add_argument("--id-tsv-file", dest="filename_ids", type=str,
+                        metavar="tsv",
+                        help="restrict profile to genes or transcripts "
+                        "(see --reporter) in this file. ")
+
     parser.add_argument(
         "--normalize-transcript",
         dest="transcript_normalization",
@@ -575,6 +588,7 @@ def main(argv=None):
         infiles=[],
         controlfiles=[],
         gtffile=None,
+        filename_ids=None,
         profile_normalizations=[],
         transcript_normalization=None,
         scale_flanks=0,
@@ -603,8 +617,11 @@ def main(argv=None):
     if not args.gtffile:
         raise ValueError("no GTF file specified")
 
+    index = None
     if args.gtffile == "-":
         args.gtffile = args.stdin
+    elif args.filename_ids and GTF.isIndexed(args.gtffile):
+        index = GTF.IndexedGTF(args.gtffile)
     else:
         args.gtffile = iotools.open_file(args.gtffile)
 
@@ -622,10 +639,32 @@ def main(argv=None):
         if methodsRequiresBaseAccuracy in args.methods:
             args.base_accuracy = True
 
-    if args.reporter == "gene":
-        gtf_iterator = GTF.flat_gene_iterator(GTF.iterator(args.gtffile))
-    elif args.reporter == "transcript":
-        gtf_iterator = GTF.transcript_iterator(GTF.iterator(args.gtffile))
+    ids = None
+    if args.filename_ids:
+        ids = iotools.read_list(iotools.open_file(args.filename_ids))
+        E.info("read %i ids" % len(ids))
+
+    if index is not None:
+        ids = [x for x in ids if index.hasId(x, by=args.reporter)]
+        if args.reporter == "gene":
+            gtf_iterator = index.getGenes(ids)
+        else:
+            gtf_iterator = index.getTranscripts(ids)
+    else:
+        if args.reporter == "gene":
+            gtf_iterator = GTF.flat_gene_iterator(
+                GTF.iterator(args.gtffile))
+        elif args.reporter == "transcript":
+            gtf_iterator = GTF.transcript_iterator(
+                GTF.iterator(args.gtffile))
+        if ids is not None:
+            ids = set(ids)
+            if args.reporter == "gene":
+                gtf_iterator = (x for x in gtf_iterator
+                                if x[0].gene_id in ids)
+            else:
+                gtf_iterator = (x for x in gtf_iterator
+                                if x[0].transcript_id in ids)
 
     # Select rangecounter based on file type
     if len(args.infiles) > 0:
@@ -145,6 +145,13 @@ exactly 1000000.
 The detail normalization algorithm as follows: norm = sum(all counts
 in all features)/1000000.0 normalized count = normalized count / norm
 
+Option: Number of jobs
+++++++++++++++++++++++
+
+Densities are computed for all intervals on a contig in a single
+pass over the contig. With ``--num-jobs``, contigs are processed in
+parallel. The output does not depend on the number of jobs.
+
 .. todo::
 
    paired-endedness is not fully implemented.
@@ -157,16 +164,20 @@ Command line options
 import sys
 import os
 import re
+import random
 import cgatcore.experiment as E
 import cgatcore.iotools as iotools
 import pysam
 import cgat.Bed as Bed
 import numpy
 import collections
-import pyBigWig
+import multiprocessing
+import cgat.LazyImport as LazyImport
 
 import cgat.BamTools.peakshape as bam2peakshape
 
+pyBigWig = LazyImport.LazyModule("pyBigWig")
+
 
 def buildArgumentParser(argv):
 
@@ -265,6 +276,11 @@ def buildArgumentParser(argv):
         "reads will be shifted upstream/downstream by this amount. "
         )
 
+    parser.add_argument(
+        "-p", "--num-jobs", dest="num_jobs", type=int,
+        help="number of processes computing densities in parallel. "
+        "Intervals are distributed to processes by contig. ")
+
     parser.set_defaults(
         bin_size=10,
         shift=0,
@@ -278,6 +294,7 @@ def buildArgumentParser(argv):
         report_step=100,
         use_interval=False,
         smooth_method=None,
+        num_jobs=1,
     )
 
     return parser
@@ -316,11 +333,42 @@ def outputFeatureTable(outfile, features_per_interval, bins):
         outfile.write("\n")
 
 
-def writeMatricesForSortOrder(features_per_interval,
+def buildMatrices(features_per_interval, ncontrols, shifted):
+    '''collect densities of all intervals into matrices.
+
+    Returns a tuple of matrices (foreground, controls, shifted)
+    with one row per interval. Rows are in the order of
+    *features_per_interval*. shifted is None if *shifted* is
+    False.
+    '''
+    nrows = len(features_per_interval)
+    ncols = len(features_per_interval[0].foreground.counts)
+
+    foreground_matrix = numpy.zeros((nrows, ncols), dtype=numpy.int64)
+    control_matrices = [numpy.zeros((nrows, ncols), dtype=numpy.int64)
+                        for x in range(ncontrols)]
+    if shifted:
+        shifted_matrix = numpy.zeros((nrows, ncols), dtype=numpy.int64)
+    else:
+        shifted_matrix = None
+
+    for row, data in enumerate(features_per_interval):
+        foreground_matrix[row] = data.foreground.counts
+        for matrix, control in zip(control_matrices, data.controls or []):
+            matrix[row] = control.counts
+        if shifted:
+            shifted_matrix[row] = data.shifted.counts
+
+    return foreground_matrix, control_matrices, shifted_matrix
+
+
+def writeMatricesForSortOrder(names,
                               bins,
                               foreground_track,
+                              foreground_matrix,
                               control_tracks,
-                              shifted,
+                              control_matrices,
+                              shifted_matrix,
                               sort_order):
     '''output one or more matrices for each sort sorder.
 
@@ -332,64 +380,50 @@ def writeMatricesForSortOrder(features_per_interval,
     matrix_<track>_<sortorder>
 
     '''
-    if "name" in features_per_interval[0].interval:
-        names = [x.interval.name for x in features_per_interval]
-    else:
-        names = list(map(str, list(range(1, len(features_per_interval) + 1))))
-
     bins = ["%i" % x for x in bins]
     sort_order = re.sub("-", "_", sort_order)
 
     # write foreground
     iotools.write_matrix(
         E.open_output_file("matrix_%s_%s.gz" % (foreground_track, sort_order)),
-        [x.foreground.counts for x in features_per_interval],
+        foreground_matrix,
         row_headers=names,
         col_headers=bins,
         row_header="name")
 
     # write controls
-    for idx, track in enumerate(control_tracks):
+    for track, matrix in zip(control_tracks, control_matrices):
         iotools.write_matrix(
             E.open_output_file("matrix_%s_%s.gz" % (track, sort_order)),
-            [x.controls[idx].counts for x in features_per_interval],
+            matrix,
             row_headers=names,
             col_headers=bins,
             row_header="name")
 
     # write shifted matrix
-    if shifted:
+    if shifted_matrix is not None:
         iotools.write_matrix(
             E.open_output_file("matrix_shift_%s.gz" % (sort_order)),
-            [x.shifted.counts for x in features_per_interval],
+            shifted_matrix,
             row_headers=names,
             col_headers=bins,
             row_header="name")
 
     # output a combined matrix
-    if len(control_tracks) > 0 or shifted:
-        rows = []
-        for row in features_per_interval:
-            l = [row.foreground.counts]
-            l.extend([row.controls[x].counts for x in
-                      range(len(control_tracks))])
-            if shifted:
-                l.append(row.shifted.counts)
-            rows.append(numpy.concatenate(l))
-
-        n = 1 + len(control_tracks)
-        if shifted:
-            n += 1
+    if len(control_tracks) > 0 or shifted_matrix is not None:
+        matrices = [foreground_matrix] + list(control_matrices)
+        if shifted_matrix is not None:
+            matrices.append(shifted_matrix)
 
         # make column names unique and make sure they can be sorted
         # lexicographically
         all_bins = []
-        for x in range(n):
+        for x in range(len(matrices)):
             all_bins.extend(["%i:%s" % (x, b) for b in bins])
 
         iotools.write_matrix(
             E.open_output_file("matrix_sidebyside_%s.gz" % (sort_order)),
-            rows,
+            numpy.hstack(matrices),
             row_headers=names,
             col_headers=all_bins,
             row_header="name")
@@ -398,53 +432,188 @@ def writeMatricesForSortOrder(features_per_interval,
 def outputMatrices(features_per_interval,
                    bins,
                    foreground_track,
+                   foreground_matrix,
                    control_tracks=None,
-                   shifted=False,
+                   control_matrices=None,
+                   shifted_matrix=None,
                    sort_orders=None):
     '''ouput matrices from density profiles
     in one or more sort_orders.
+
+    Sort orders are applied in turn, each sort is stable with respect
+    to the previous one. The rows of the matrices are re-ordered by
+    indexing, the matrices themselves are not modified.
     '''
+    if "name" in features_per_interval[0].interval:
+        names = numpy.array([x.interval.name for x in features_per_interval],
+                            dtype=object)
+    else:
+        names = numpy.array(
+            list(map(str, list(range(1, len(features_per_interval) + 1)))),
+            dtype=object)
 
-    # output sorted matrices
-    if not sort_orders:
-        writeMatricesForSortOrder(features_per_interval,
+    control_tracks = control_tracks or []
+    control_matrices = control_matrices or []
+
+    def _write(order, sort_order):
+        if shifted_matrix is not None:
+            shifted = shifted_matrix[order]
+        else:
+            shifted = None
+        writeMatricesForSortOrder(names[order],
                                   bins,
                                   foreground_track,
+                                  foreground_matrix[order],
                                   control_tracks,
+                                  [x[order] for x in control_matrices],
                                   shifted,
-                                  "unsorted")
+                                  sort_order)
+
+    order = numpy.arange(len(features_per_interval))
+
+    # output sorted matrices
+    if not sort_orders:
+        _write(order, "unsorted")
 
     for sort_order in sort_orders:
 
         if sort_order == "peak-height":
-            features_per_interval.sort(
-                key=lambda x: x.foreground.peak_height)
+            keys = numpy.array([x.foreground.peak_height
+                                for x in features_per_interval])
 
         elif sort_order == "peak-width":
-            features_per_interval.sort(
-                key=lambda x: x.foreground.peak_width)
+            keys = numpy.array([x.foreground.peak_width
+                                for x in features_per_interval])
 
         elif sort_order == "interval-width":
-            features_per_interval.sort(
-                key=lambda x: x.interval.end - x.interval.start)
+            keys = numpy.array([x.interval.end - x.interval.start
+                                for x in features_per_interval])
 
         elif sort_order == "interval-score":
             try:
-                features_per_interval.sort(
-                    key=lambda x: float(x.interval.score))
+                keys = numpy.array([float(x.interval.score)
+                                    for x in features_per_interval])
             except IndexError:
                 E.warn("score field not present - no output")
                 continue
-            except TypeError:
+            except (TypeError, ValueError):
                 E.warn("score field not a valid number - no output")
                 continue
 
-        writeMatricesForSortOrder(features_per_interval,
-                                  bins,
-                                  foreground_track,
-                                  control_tracks,
-                                  shifted,
-                                  sort_order)
+        else:
+            keys = None
+
+        if keys is not None:
+            order = order[numpy.argsort(keys[order], kind="stable")]
+
+        _write(order, sort_order)
+
+
+def countIntervals(counter,
+                   fg_file,
+                   control_files,
+                   contig,
+                   intervals,
+                   bins,
+                   directions=None,
+                   window_size=1000,
+                   use_interval=False,
+                   centring_method="reads"):
+    '''compute densities and peakshape parameters for
+    *intervals* on *contig*.
+
+    *intervals* is a list of tuples (start, end). If *directions*
+    is given, densities are computed in a window shifted upstream
+    (direction=1) or downstream (direction=0) of each peak as well.
+
+    Returns a list with a tuple (foreground, controls, shifted) for
+    each interval. The tuple is None for empty intervals.
+    '''
+    features = counter.countInIntervals(
+        fg_file,
+        contig,
+        [x[0] for x in intervals],
+        [x[1] for x in intervals],
+        bins=bins,
+        window_size=window_size,
+        use_interval=use_interval,
+        centring_method=centring_method)
+
+    valid = [x for x, f in enumerate(features) if f is not None]
+    peak_centers = [features[x].peak_center for x in valid]
+
+    controls = [counter.countAroundPositions(control_file,
+                                             contig,
+                                             peak_centers,
+                                             bins=bins)
+                for control_file in control_files]
+
+    if directions is not None:
+        positions = []
+        for x, peak_center in zip(valid, peak_centers):
+            if directions[x]:
+                positions.append(peak_center + 2 * bins[0])
+            else:
+                positions.append(peak_center + 2 * bins[-1])
+        shifted = counter.countAroundPositions(fg_file,
+                                               contig,
+                                               positions,
+                                               bins=bins)
+    else:
+        shifted = None
+
+    result = [None] * len(intervals)
+    for idx, x in enumerate(valid):
+        if control_files:
+            control = [c[idx] for c in controls]
+        else:
+            control = None
+        if shifted is not None:
+            result[x] = (features[x], control, shifted[idx])
+        else:
+            result[x] = (features[x], control, None)
+
+    return result
+
+
+def openFiles(infile, control_files, format):
+    '''open *infile* and *control_files* in *format*.'''
+    if format == "bigwig":
+        return (pyBigWig.open(infile),
+                [pyBigWig.open(x) for x in control_files])
+    elif format == "bam":
+        return (pysam.AlignmentFile(infile, "rb"),
+                [pysam.AlignmentFile(x, "rb") for x in control_files])
+
+
+def buildCounter(format, shift=0, smooth_method=None):
+    '''return a counter for files in *format*.'''
+    if format == "bigwig":
+        return bam2peakshape.CounterBigwig(smooth_method=smooth_method)
+    elif format == "bam":
+        return bam2peakshape.CounterBam(shift=shift,
+                                        smooth_method=smooth_method)
+
+
+_worker = {}
+
+
+def _init_worker(infile, control_files, format, shift, smooth_method):
+    _worker["files"] = openFiles(infile, control_files, format)
+    _worker["counter"] = buildCounter(format, shift, smooth_method)
+
+
+def _count_contig(args):
+    contig, intervals, bins, directions, kwargs = args
+    fg_file, control_files = _worker["files"]
+    return countIntervals(_worker["counter"],
+                          fg_file,
+                          control_files,
+                          contig,
+                          intervals,
+                          bins,
+                          directions,
+                          **kwargs)
 
 
 def buildDensityMatrices(bedfile,
@@ -458,13 +627,18 @@ def buildDensityMatrices(bedfile,
                          use_interval=False,
                          random_shift=False,
                          smooth_method="none",
-                         report_step=1000):
+                         report_step=1000,
+                         pool=None):
     '''compute densities and peakshape parameters
     in intervals given by *bedfile* using reads in *fg_file*.
 
     If *control_files* are given, densities are produced for
     these as well.
 
+    Intervals are processed in batches of one contig. If *pool*
+    is given, contigs are processed in parallel. The pool workers
+    need to be initialized with :func:`_init_worker`.
+
     Returns a list of results for each interval in *bedfile* of
     type IntervalData and an array of bin-values.
     '''
@@ -475,64 +649,76 @@ def buildDensityMatrices(bedfile,
                             +window_size,
                             bin_size)
 
-    result = []
     c = E.Counter()
     c.input = 0
 
-    for bed in bedfile:
-        c.input += 1
+    beds = list(bedfile)
+    c.input = len(beds)
 
-        # if bed.contig not in contigs:
-        #    c.skipped += 1
-        #    continue
+    # group intervals by contig keeping the input order
+    contigs = collections.OrderedDict()
+    for idx, bed in enumerate(beds):
+        contigs.setdefault(bed.contig, []).append(idx)
 
-        if c.input % report_step == 0:
-            E.info("iteration: %i" % c.input)
+    # draw directions in input order, so that results are reproducible
+    # with --random-seed independent of the number of processes.
+    if random_shift:
+        directions = numpy.array([random.randint(0, 1) for x in beds])
 
-        features = counter.countInInterval(
-            fg_file,
-            bed.contig, bed.start, bed.end,
-            window_size=window_size,
-            bins=bins,
-            use_interval=use_interval,
-            centring_method=centring_method)
+    kwargs = {"window_size": window_size,
+              "use_interval": use_interval,
+              "centring_method": centring_method}
 
-        if features is None:
+    tasks = []
+    for contig, indices in contigs.items():
+        if random_shift:
+            contig_directions = directions[indices]
+        else:
+            contig_directions = None
+        tasks.append((contig,
+                      [(beds[x].start, beds[x].end) for x in indices],
+                      bins,
+                      contig_directions,
+                      kwargs))
+
+    if pool:
+        iterator = pool.imap(_count_contig, tasks)
+    else:
+        iterator = (countIntervals(counter,
+                                   fg_file,
+                                   control_files,
+                                   contig,
+                                   intervals,
+                                   bins,
+                                   contig_directions,
+                                   **kwargs)
+                    for contig, intervals, bins, contig_directions, kwargs
+                    in tasks)
+
+    data = [None] * len(beds)
+    ndone = 0
+    for indices, results in zip(contigs.values(), iterator):
+        for idx, result in zip(indices, results):
+            data[idx] = result
+        if (ndone + len(indices)) // report_step > ndone // report_step:
+            E.info("iteration: %i" % (ndone + len(indices)))
+        ndone += len(indices)
+
+    result = []
+    for bed, values in zip(beds, data):
+        if values is None:
             c.skipped += 1
             continue
 
-        if control_files:
-            control = []
-            for control_file in control_files:
-                control.append(counter.countAroundPos(
-                    control_file,
-                    bed.contig,
-                    features.peak_center,
-                    bins=features.bins))
-
-        else:
-            control = None
-
-        if random_shift:
-            direction = numpy.random.randint(0, 2)
-            if direction:
-                pos = features.peak_center + 2 * bins[0]
-            else:
-                pos = features.peak_center + 2 * bins[-1]
-            shifted = counter.countAroundPos(fg_file,
-                                             bed.contig,
-                                             pos,
-                                             bins=features.bins)
-        else:
-            shifted = None
+        features, control, shifted = values
 
         if strand_specific and bed.strand == "-":
-            features._replace(hist=features.hist[::-1])
+            features = features._replace(counts=features.counts[::-1])
             if control:
-                for c in control:
-                    c._replace(hist=c.hist[::-1])
+                control = [x._replace(counts=x.counts[::-1])
+                           for x in control]
             if shifted:
-                shifted._replace(hist=shifted.hist[::-1])
+                shifted = shifted._replace(counts=shifted.counts[::-1])
 
         result.append(IntervalData._make((features, bed, control, shifted)))
         c.added += 1
@@ -561,22 +747,25 @@ def main(argv=None):
         E.info("using control files: %s" % ",".join(args.control_files))
 
     infile, bedfile = unknown
-    control_files = []
-
-    if args.format == "bigwig":
-        fg_file = pyBigWig.open(infile)
-        for control_file in args.control_files:
-            control_files.append(pyBigWig.open(control_file))
-        counter = bam2peakshape.CounterBigwig(
-            smooth_method=args.smooth_method)
-
-    elif args.format == "bam":
-        fg_file = pysam.AlignmentFile(infile, "rb")
-        for control_file in args.control_files:
-            control_files.append(pysam.AlignmentFile(control_file, "rb"))
-        counter = bam2peakshape.CounterBam(
-            shift=args.shift,
-            smooth_method=args.smooth_method)
+
+    fg_file, control_files = openFiles(
+        infile, args.control_files, args.format)
+    counter = buildCounter(args.format,
+                           shift=args.shift,
+                           smooth_method=args.smooth_method)
+
+    if args.num_jobs > 1:
+        E.info("computing densities with %i processes" % args.num_jobs)
+        pool = multiprocessing.Pool(
+            args.num_jobs,
+            initializer=_init_worker,
+            initargs=(infile,
+                      args.control_files,
+                      args.format,
+                      args.shift,
+                      args.smooth_method))
+    else:
+        pool = None
 
     features_per_interval, bins = buildDensityMatrices(
         Bed.iterator(iotools.open_file(bedfile)),
@@ -590,7 +779,12 @@ def main(argv=None):
         use_interval=args.use_interval,
         random_shift=args.random_shift,
         smooth_method=args.smooth_method,
-        report_step=args.report_step)
+        report_step=args.report_step,
+        pool=pool)
+
+    if pool:
+        pool.close()
+        pool.join()
 
     if len(features_per_interval) == 0:
         E.warn("no data - no output")
@@ -599,6 +793,11 @@ def main(argv=None):
 
     outputFeatureTable(args.stdout, features_per_interval, bins)
 
+    foreground_matrix, control_matrices, shifted_matrix = buildMatrices(
+        features_per_interval,
+        len(args.control_files),
+        args.random_shift)
+
     # apply normalization
     # Note: does not normalize control?
     # Needs reworking, currently it does not normalize across
@@ -607,32 +806,16 @@ def main(argv=None):
     if args.normalization == "sum":
         E.info("starting sum normalization")
         # get total counts across all intervals
-        norm = 0.0
-        for foreground, bed, controls, shifted in features_per_interval:
-            norm += sum(foreground.counts)
+        norm = float(foreground_matrix.sum())
         # per million
         norm /= float(1000000)
         E.info("sum/million normalization with %f" % norm)
 
         # normalise
-        new_data = []
-        for foreground, bed, controls, shifted in features_per_interval:
-            foreground = foreground._replace(
-                counts=numpy.array(foreground.counts,
-                                   dtype=numpy.float) / norm)
-            new_controls = []
-            for control in controls:
-                new_controls.append(
-                    control._replace(
-                        counts=numpy.array(control.counts,
-                                           dtype=numpy.float) / norm))
-            if shifted:
-                shifted = shifted._replace(
-                    counts=numpy.array(shifted.counts,
-                                       dtype=numpy.float) / norm)
-            new_data.append(IntervalData._make((
-                foreground, bed, new_controls, shifted)))
-        features_per_interval = new_data
+        foreground_matrix = foreground_matrix / norm
+        control_matrices = [x / norm for x in control_matrices]
+        if shifted_matrix is not None:
+            shifted_matrix = shifted_matrix / norm
     else:
         E.info("no normalization performed")
 
@@ -645,9 +828,11 @@ def main(argv=None):
 
     outputMatrices(features_per_interval,
                    out_bins,
-                   foreground_track=_toTrack(infile),
+                   _toTrack(infile),
+                   foreground_matrix,
                    control_tracks=[_toTrack(x) for x in args.control_files],
-                   shifted=args.random_shift,
+                   control_matrices=control_matrices,
+                   shifted_matrix=shifted_matrix,
                    sort_orders=args.sort_orders)
 
     # write footer and output benchmark information.
@@ -125,6 +125,15 @@ Note that for paired-end data, any ``\1`` or ``/2`` suffixes will be
 removed from the read name in the assumption that these have been removed
 in the bam file as well.
 
+Parallel counting
++++++++++++++++++
+
+With ``--num-jobs``, an indexed :term:`bam` file is split into regions
+with about equal numbers of alignments using the index. The regions and
+the alignments without coordinates are counted in separate processes
+and the counts are combined. The output is the same as when counting
+in a single process.
+
 Usage
 -----
 
@@ -307,13 +316,15 @@ import sys
 import cgatcore.experiment as E
 import cgatcore.iotools as iotools
 import numpy
-import pandas
+import cgat.LazyImport as LazyImport
 import pysam
 import collections
 
 import cgat.GTF as GTF
 from cgat.BamTools.bamtools import bam2stats_count
 
+pandas = LazyImport.LazyModule("pandas")
+
 FLAGS = {
     1: 'paired',
     2: 'proper_pair',
@@ -432,6 +443,11 @@ def main(argv=None):
         "This is more memory efficient and faster stats computation, "
         "but only a summary counts table is output ")
 
+    parser.add_argument(
+        "-p", "--num-jobs", dest="num_jobs", type=int,
+        help="number of processes counting regions of the bam file in "
+        "parallel. Requires an indexed bam file. ")
+
     parser.set_defaults(
         filename_bed=None,
         ignore_masked_reads=False,
@@ -442,6 +458,7 @@ def main(argv=None):
         output_details=False,
         output_readmap=False,
         add_alignment_details=False,
+        num_jobs=1,
     )
 
     # add common options (-h/--help, ...) and parse command line
@@ -491,7 +508,8 @@ def main(argv=None):
                         outfile_details=outfile_details,
                         add_alignment_details=args.add_alignment_details,
                         outfile_readmap=outfile_readmap,
-                        detailed_count=args.detailed_count)
+                        detailed_count=args.detailed_count,
+                        num_jobs=args.num_jobs)
 
     if max_hi > 0 and max_hi != max(nh_all.keys()):
         E.warn("max_hi(%i) is inconsistent with max_nh (%i) "
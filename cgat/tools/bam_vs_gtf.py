@@ -22,6 +22,16 @@ Please note:
    * The script requires a list of non-overlapping exons as input.
    * For read counts to be correct the NH (number of hits) flag needs to be set correctly.
 
+Reads are counted by a compiled routine that walks the alignment
+blocks of each read and looks up exons in sorted arrays. The BAM file
+is read from stdin. Alternatively, an indexed BAM file can be given
+with ``--bam-file``. Contigs are then counted in parallel with
+``--num-jobs`` processes and the counts are combined. The output is
+the same irrespective of the number of processes.
+
+Overruns that exceed the size of the histogram are counted in the
+last bin.
+
 Usage
 -----
 
@@ -85,11 +95,33 @@ reference genome annotation database (Ensembl, UCSC etc.).
 
 '''
 
+import multiprocessing
 import sys
 import cgatcore.experiment as E
 import cgatcore.iotools as iotools
 import pysam
 import cgat.GTF as GTF
+import cgat.IndexedGenome as IndexedGenome
+from cgat.BamTools.bamtools import bam_vs_gtf_count
+
+# per-process state of workers counting contigs in parallel
+_worker = {}
+
+
+def _init_worker(filename, exons, read_length):
+    _worker["samfile"] = pysam.AlignmentFile(filename, "rb")
+    _worker["exons"] = exons
+    _worker["read_length"] = read_length
+
+
+def _count_contig(contig):
+    counts, unspliced_overrun, spliced_overrun = bam_vs_gtf_count(
+        _worker["samfile"],
+        _worker["exons"],
+        read_length=_worker["read_length"],
+        contigs=[contig])
+    # counters can not be pickled
+    return dict(counts.items()), unspliced_overrun, spliced_overrun
 
 
 def main(argv=None):
@@ -112,138 +144,63 @@ def main(argv=None):
         help="gtf formatted file with non-overlapping exon "
         "locations (required). ")
 
+    parser.add_argument(
+        "-b", "--bam-file", dest="filename_bam", type=str,
+        help="indexed bam file to read from instead of stdin. ")
+
+    parser.add_argument(
+        "-p", "--num-jobs", dest="num_jobs", type=int,
+        help="number of processes counting contigs in parallel. "
+        "Requires an indexed bam file. ")
+
     parser.set_defaults(
         filename_exons=None,
+        filename_bam=None,
+        num_jobs=1,
         read_length=200,
     )
 
     # add common options (-h/--help, ...) and parse command line
     (args, unknown) = E.start(parser, argv=argv, add_output_options=True, unknowns=True)
 
-    exons = GTF.readAndIndex(
-        GTF.iterator(iotools.open_file(args.filename_exons)))
-
-    pysam_in = pysam.AlignmentFile("-", "rb")
-
-    nspliced = 0
-    nspliced_ignored = 0
-    nspliced_nooverlap = 0
-    nspliced_halfoverlap = 0
-    nspliced_bothoverlap = 0
-    nspliced_overrun = [0] * 2 * (args.read_length + 10)
-    nspliced_exact = 0
-    nspliced_inexact = 0
-    nunspliced = 0
-    nunspliced_overlap = 0
-    nunspliced_ignored = 0
-    nunspliced_nooverlap = 0
-    nunspliced_overrun = [0] * (args.read_length + 10)
+    exons = IndexedGenome.SortedArray()
+    for gtf in GTF.iterator(iotools.open_file(args.filename_exons)):
+        exons.add(gtf.contig, gtf.start, gtf.end)
+
     overrun_offset = args.read_length + 10
-    ninput = 0
-    nunmapped = 0
-
-    c = E.Counter()
-
-    def _splice_overrun(start, end, overlap):
-        '''return splicesite over/underrun.
-
-        positive values: overrun
-        negative values: underrun
-        0: no over/underrun
-        '''
-
-        exon_start = min([x[0] for x in overlap])
-        exon_end = max([x[1] for x in overlap])
-
-        if start <= exon_start and end > exon_start:
-            # overrun at start or match
-            r = exon_start - start
-        elif start < exon_end and end >= exon_end:
-            # overrun at end or match
-            r = end - exon_end
-        else:
-            # underrun - distance to closest exon boundary
-            r = -min(start - exon_start, exon_end - end)
-
-        return r
-
-    for read in pysam_in:
-        ninput += 1
-        if read.is_unmapped:
-            nunmapped += 1
-            continue
-
-        # check for BAM_CREF_SKIP code in cigar string
-        cigar = read.cigar
-        is_spliced = 3 in [x[0] for x in cigar]
-
-        contig = pysam_in.getrname(read.tid)
-        start = read.pos
-        end = read.aend
-        if is_spliced:
-            # count both ends
-            nspliced += 1
-
-            if len(cigar) != 3:
-                nspliced_ignored += 1
-                continue
-
-            start5, end5 = start, start + cigar[0][1]
-            start3, end3 = end - cigar[2][1], end
-            try:
-                overlap3 = list(exons.get(contig, start3, end3))
-                overlap5 = list(exons.get(contig, start5, end5))
-            except KeyError:
-                overlap3 = overlap5 = []
-
-            ovl3 = len(overlap3)
-            ovl5 = len(overlap5)
-            o3 = o5 = None
-            if not ovl3 and not ovl5:
-                nspliced_nooverlap += 1
-            elif ovl3 and not ovl5:
-                nspliced_halfoverlap += 1
-                o3 = _splice_overrun(start3, end3, overlap3)
-            elif ovl5 and not ovl3:
-                nspliced_halfoverlap += 1
-                o5 = _splice_overrun(start5, end5, overlap5)
-            else:
-                # both overlap
-                nspliced_bothoverlap += 1
-                o3 = _splice_overrun(start3, end3, overlap3)
-                o5 = _splice_overrun(start5, end5, overlap5)
-
-            if o3 is not None:
-                if o3 == 0:
-                    nspliced_exact += 1
-                else:
-                    nspliced_inexact += 1
-                nspliced_overrun[max(0, overrun_offset + o3)] += 1
-            if o5 is not None:
-                if o5 == 0:
-                    nspliced_exact += 1
-                else:
-                    nspliced_inexact += 1
-                nspliced_overrun[max(0, overrun_offset + o5)] += 1
-        else:
-            nunspliced += 1
-            try:
-                overlap = list(exons.get(contig, start, end))
-            except KeyError:
-                overlap = []
-
-            if len(overlap) == 0:
-                nunspliced_nooverlap += 1
-            elif len(overlap) >= 1:
-                nunspliced_overlap += 1
-                # multiple overlap - merge exons (usually: small introns)
-                exon_start = min([x[0] for x in overlap])
-                exon_end = max([x[1] for x in overlap])
-                ostart = max(0, exon_start - start)
-                oend = max(0, end - exon_end)
-                o = min(end, exon_end) - max(start, exon_start)
-                overrun = ostart + oend
-                nunspliced_overrun[overrun] += 1
+
+    if args.num_jobs > 1:
+        if args.filename_bam is None:
+            raise ValueError(
+                "counting in parallel requires an indexed bam file")
+        with pysam.AlignmentFile(args.filename_bam, "rb") as pysam_in:
+            # reads without coordinates are counted as a separate batch
+            contigs = list(pysam_in.references) + ["*"]
+        E.info("counting %i contigs with %i processes" %
+               (len(contigs), args.num_jobs))
+        pool = multiprocessing.Pool(
+            args.num_jobs,
+            initializer=_init_worker,
+            initargs=(args.filename_bam, exons, args.read_length))
+        try:
+            results = pool.map(_count_contig, contigs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        counts = E.Counter()
+        for c, unspliced_overrun, spliced_overrun in results:
+            for key, value in c.items():
+                counts[key] += value
+        nunspliced_overrun = sum(x[1] for x in results)
+        nspliced_overrun = sum(x[2] for x in results)
+    else:
+        pysam_in = pysam.AlignmentFile(args.filename_bam or "-", "rb")
+        counts, nunspliced_overrun, nspliced_overrun = bam_vs_gtf_count(
+            pysam_in, exons, read_length=args.read_length)
+        pysam_in.close()
+
+    nunspliced_overrun = nunspliced_overrun.tolist()
+    nspliced_overrun = nspliced_overrun.tolist()
 
     # output histograms
     outfile = E.open_output_file("overrun")
@@ -257,24 +214,10 @@ def main(argv=None):
     outfile.close()
 
     # output summary
-    # convert to counter
-    c.input = ninput
-    c.unmapped = nunmapped
-    c.mapped = ninput - nunmapped
-
-    c.unspliced = nunspliced
-    c.unspliced_nooverlap = nunspliced_nooverlap
+    c = counts
+    c.mapped = c.input - c.unmapped
     c.unspliced_nooverrun = nunspliced_overrun[0]
-    c.unspliced_overlap = nunspliced_overlap
     c.unspliced_overrun = sum(nunspliced_overrun[1:])
-
-    c.spliced = nspliced
-    c.spliced_nooverlap = nspliced_nooverlap
-    c.spliced_halfoverlap = nspliced_halfoverlap
-    c.spliced_bothoverlap = nspliced_bothoverlap
-    c.spliced_exact = nspliced_exact
-    c.spliced_inexact = nspliced_inexact
-    c.spliced_ignored = nspliced_ignored
     c.spliced_underrun = sum(_nspliced_underrun[1:])
     c.spliced_overrun = sum(_nspliced_overrun[1:])
 
@@ -166,7 +166,7 @@ import cgatcore.experiment as E
 import cgat.IndexedFasta as IndexedFasta
 import cgat.Bed as Bed
 import cgat.Intervals as Intervals
-from collections import defaultdict as defaultdict
+import cgat.IntervalSweep as IntervalSweep
 import pysam
 import csv
 
@@ -203,66 +203,22 @@ def merge(iterator,
         assert ValueError(
             "using both remove_inconsistent and by_name makes no sense")
 
-    def iterate_chunks(iterator):
-        max_end = defaultdict(int)
-        to_join = defaultdict(list)
-        last_name = defaultdict(str)
+    if stranded:
+        partition = lambda bed: bed.strand
+    else:
+        partition = None
 
-        last = next(iterator)
-
-        if not stranded:
-            strand = "."
-        else:
-            strand = last.strand
-
-        max_end[strand] = last.end
-        to_join[strand] = [last]
-
-        for bed in iterator:
-
-            if not stranded:
-                strand = "."
-            else:
-                strand = bed.strand
-
-            d = bed.start - max_end[strand]
-
-            if bed.contig == last.contig:
-                assert bed.start >= last.start, \
-                    "input file should be sorted by contig and position: d=%i:\n%s\n%s\n" \
-                    % (d, last, bed)
-
-            if bed.contig != last.contig:
-
-                for s in to_join:
-                    if to_join[s]:
-                        yield to_join[s]
-                    to_join[s] = []
-                    max_end[s] = 0
-
-            elif (d > max_distance or
-                  (by_name and last_name[strand] and last_name[strand] != bed.name)):
-
-                if to_join[strand]:
-                    yield to_join[strand]
-
-                to_join[strand] = list()
-
-            last = bed
-            last_name[strand] = last.name
-            max_end[strand] = max(bed.end, max_end[strand])
-            to_join[strand].append(bed)
-
-        for strand in sorted(to_join):
-                if to_join[strand]:
-                    try:
-                        yield to_join[strand]
-                    except:
-                        return
+    if by_name:
+        split = lambda last, bed: last.name and last.name != bed.name
+    else:
+        split = None
 
     c = E.Counter()
 
-    for to_join in iterate_chunks(iterator):
+    for to_join in IntervalSweep.iterate_chunks(iterator,
+                                                max_distance,
+                                                partition=partition,
+                                                split=split):
 
         c.input += 1
 
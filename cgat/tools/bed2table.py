@@ -19,6 +19,7 @@ peaks
     compute peak location in intervals. Requires one or more
     bam-files. This counter can also count within an secondary set of
     bam-files (--control-bam-file) and add this to the output.
+    Intervals can be processed in parallel with ``--num-jobs``.
 
 composition-na
 
@@ -36,6 +37,11 @@ classifier-chipseq
 motif
 
    Search for a specified motif e.g. using --motif-sequence=TTTT.
+   Several motifs can be counted at the same time. By default,
+   motifs are case-sensitive regular expressions searched on the
+   forward strand. With ``--motif-format=iupac`` motifs are given in
+   IUPAC notation (e.g. ``TATAWA``). Use ``--motif-both-strands``
+   to count matches on both strands.
 
 
 Usage
@@ -92,6 +98,8 @@ Command line options
 import re
 import sys
 import collections
+import itertools
+import multiprocessing
 import cgat.GTF as GTF
 import cgat.Bed as Bed
 import cgatcore.iotools as iotools
@@ -99,10 +107,13 @@ import cgatcore.experiment as E
 import cgat.IndexedFasta as IndexedFasta
 import cgat.SequenceProperties as SequenceProperties
 import cgat.Intervals as Intervals
+import cgat.Motifs as Motifs
+import cgat.Genomics as Genomics
 import numpy
 import pysam
 
 import cgat.GeneModelAnalysis as GeneModelAnalysis
+from cgat.BamTools.bamtools import bam_fetch_positions
 
 
 class Counter(object):
@@ -187,6 +198,26 @@ class CounterOverlap(Counter):
         return "\t".join(r)
 
 
+def accumulateCounts(start, end, rstarts, rends):
+    '''return array with the number of reads covering each position
+    in the interval *start*:*end*.
+
+    *rstarts* and *rends* are lists of arrays with the coordinates of
+    reads. Reads are clipped to the interval.
+    '''
+    length = end - start
+    if rstarts:
+        rstarts = numpy.clip(numpy.concatenate(rstarts) - start, 0, length)
+        rends = numpy.clip(numpy.concatenate(rends) - start, 0, length)
+        take = rends > rstarts
+        # difference array: +1 at read start, -1 at read end
+        diff = numpy.bincount(rstarts[take], minlength=length + 1) - \
+            numpy.bincount(rends[take], minlength=length + 1)
+    else:
+        diff = numpy.zeros(length + 1, dtype=numpy.int64)
+    return numpy.cumsum(diff[:length]).astype(numpy.float64)
+
+
 CounterPeaksResult = collections.namedtuple(
     "CounterPeaksResult", ("length nreads avgval peakval npeaks peakcenter"))
 
@@ -222,19 +253,16 @@ class CounterPeaks(Counter):
             self.headers.extend(
                 ["control_%s" % x for x in CounterPeaksResult._fields])
 
-    def _count(self, bed, bamfiles, offsets):
-        '''count reads in bed interval.'''
-
-        contig, start, end = bed.contig, bed.start, bed.end
+    def _count(self, contig, start, end, bamfiles, offsets):
+        '''count reads in interval.'''
 
         length = end - start
-        try:
-            counts = numpy.zeros(length)
-        except ValueError as msg:
+        if length < 0:
             raise ValueError("Error negative length obtained: "
-                             " message=%s contig=%s, start=%s, end=%s" %
-                             (msg, contig, start, end))
+                             "contig=%s, start=%s, end=%s" %
+                             (contig, start, end))
         nreads = 0
+        rstarts, rends = [], []
 
         if offsets:
             # if offsets are given, shift tags.
@@ -251,49 +279,34 @@ class CounterPeaks(Counter):
                 # on + strand shift tags upstream
                 # i.e. look at the downstream window
                 xstart, xend = max(0, start - shift), max(0, end + shift)
-
-                for read in samfile.fetch(contig, xstart, xend):
-                    nreads += 1
-                    # some reads are assigned to a contig and position, but
-                    # are flagged as unmapped - these might not have an alen
-                    # attribute.
-                    if read.is_unmapped:
-                        continue
-
-                    if read.is_reverse:
-                        # rstart = read.pos + read.alen - offset
-                        # offset = 2 * shift
-                        try:
-                            rstart = read.pos + read.alen - offset
-                        except TypeError as msg:
-                            raise TypeError("Error message =", msg,
-                                            "read.pos =", read.pos,
-                                            "read.alen =", read.alen,
-                                            "offset =", offset,
-                                            "query name =", read.qname,
-                                            "length of read =", read.rlen)
-                    else:
-                        rstart = read.pos + shift
-
-                    rend = rstart + shift
-                    rstart = max(0, rstart - start)
-                    rend = min(length, rend - start)
-                    counts[rstart:rend] += 1
-
+                pos, aend, rlen, flag = bam_fetch_positions(
+                    samfile, contig, xstart, xend)
+                nreads += len(pos)
+
+                # some reads are assigned to a contig and position, but
+                # are flagged as unmapped - these are ignored.
+                mapped = (flag & 4) == 0
+                pos, aend, flag = pos[mapped], aend[mapped], flag[mapped]
+                rstart = numpy.where((flag & 16) != 0,
+                                     aend - offset,
+                                     pos + shift)
+                rstarts.append(rstart)
+                rends.append(rstart + shift)
         else:
             for samfile in bamfiles:
-                for read in samfile.fetch(contig, start, end):
-                    nreads += 1
-                    rstart = max(0, read.pos - start)
-                    rend = min(length, read.pos - start + read.rlen)
-                    counts[rstart:rend] += 1
+                pos, aend, rlen, flag = bam_fetch_positions(
+                    samfile, contig, start, end)
+                nreads += len(pos)
+                rstarts.append(pos)
+                rends.append(pos + rlen)
+
+        counts = accumulateCounts(start, end, rstarts, rends)
 
-        length = end - start
         avgval = numpy.mean(counts)
-        peakval = max(counts)
+        peakval = counts.max()
 
         # set other peak parameters
-        peaks = numpy.array(list(range(0, length)))[counts >= peakval]
+        peaks = numpy.flatnonzero(counts >= peakval)
         npeaks = len(peaks)
         # peakcenter is median coordinate between peaks
         # such that it is a valid peak in the middle
@@ -302,17 +315,33 @@ class CounterPeaks(Counter):
         return CounterPeaksResult(length, nreads, avgval,
                                   peakval, npeaks, peakcenter)
 
+    def countInterval(self, contig, start, end):
+        '''return tuple of peak statistics for reads and control reads
+        in an interval.
+
+        The control statistics are None if there are no control files.
+        '''
+        result = self._count(contig, start, end,
+                             self.bamfiles, self.offsets)
+        if self.control_bamfiles:
+            control = self._count(contig, start, end,
+                                  self.control_bamfiles,
+                                  self.control_offsets)
+        else:
+            control = None
+        return result, control
+
     def count(self, bed):
         '''count reads per position.
 
         If offsets are given, shift tags by offset / 2 and extend
         by offset / 2.
         '''
+        self.setResult(self.countInterval(bed.contig, bed.start, bed.end))
 
-        self.result = self._count(bed, self.bamfiles, self.offsets)
-        if self.control_bamfiles:
-            self.control = self._count(
-                bed, self.control_bamfiles, self.control_offsets)
+    def setResult(self, result):
+        '''set result computed by :meth:`countInterval`.'''
+        self.result, self.control = result
 
     def __str__(self):
         if self.control_bamfiles:
@@ -321,6 +350,46 @@ class CounterPeaks(Counter):
             return "\t".join(map(str, self.result))
 
 
+# state of worker processes computing peak statistics
+_worker = {}
+
+
+def _init_worker(bam_files, offsets, control_bam_files, control_offsets):
+    _worker["counter"] = CounterPeaks(
+        [pysam.AlignmentFile(x, "rb") for x in bam_files],
+        offsets,
+        [pysam.AlignmentFile(x, "rb") for x in control_bam_files],
+        control_offsets)
+
+
+def _count_peaks(intervals):
+    counter = _worker["counter"]
+    return [counter.countInterval(contig, start, end)
+            for contig, start, end in intervals]
+
+
+def iterator_peaks(pool, iterator, batch_size, nbatches):
+    '''iterate over tuples of (bed, peak statistics) for intervals in
+    *iterator*.
+
+    Peak statistics are computed in batches of *batch_size* intervals
+    by the worker processes in *pool*, see
+    :meth:`CounterPeaks.countInterval`. *nbatches* batches are read
+    from *iterator* at a time.
+    '''
+    while True:
+        beds = list(itertools.islice(iterator, batch_size * nbatches))
+        if not beds:
+            break
+        intervals = [(x.contig, x.start, x.end) for x in beds]
+        batches = [intervals[x:x + batch_size]
+                   for x in range(0, len(intervals), batch_size)]
+        results = itertools.chain.from_iterable(
+            pool.map(_count_peaks, batches, chunksize=1))
+        for bed, result in zip(beds, results):
+            yield bed, result
+
+
 class CounterCompositionNucleotides(Counter):
 
     headers = SequenceProperties.SequencePropertiesNA().getHeaders()
@@ -340,20 +409,94 @@ class CounterCompositionNucleotides(Counter):
 
 
 class CounterMotif(Counter):
+    """count occurrences of one or more motifs in intervals.
 
-    headers = ['motif_counts']
+    If *motif_format* is ``iupac``, motifs are given in IUPAC
+    notation and counted with :class:`Motifs.MotifScanner`. Intervals
+    are counted in batches (see :meth:`countBatch`).
 
-    def __init__(self, motif, *args, **kwargs):
+    If *motif_format* is ``regex``, motifs are regular expressions
+    and matching is case-sensitive. Expressions consisting only of
+    nucleotides and character classes of nucleotides are counted with
+    the motif scanner as well.
+    """
+
+    def __init__(self, motifs, motif_format="regex", both_strands=False,
+                 *args, **kwargs):
         Counter.__init__(self, *args, **kwargs)
-        self.motif = motif
+        self.motifs = motifs
+        self.both_strands = both_strands
+
+        if len(motifs) == 1:
+            self.headers = ['motif_counts']
+        else:
+            self.headers = ['motif_counts_%s' % x for x in motifs]
+
+        self.scanner = None
+        if motif_format == "iupac":
+            self.scanner = Motifs.MotifScanner(motifs,
+                                               both_strands=both_strands)
+        else:
+            try:
+                self.scanner = Motifs.MotifScanner(
+                    [Motifs.regex2iupac(x) for x in motifs],
+                    both_strands=both_strands,
+                    ignore_case=False)
+            except (KeyError, ValueError):
+                self.patterns = [re.compile(r'(?=(%s))' % x) for x in motifs]
+
+        # counts of intervals processed in batch
+        self.results = collections.deque()
+
+    def countBatch(self, beds):
+        """count motifs in a batch of intervals.
+
+        The results are used by subsequent calls to :meth:`count`
+        in the same order as *beds*.
+        """
+        if self.scanner is None:
+            return
+        self.results.extend(self.scanner.countIntervals(
+            self.fasta,
+            [(x.contig, x.start, x.end) for x in beds]))
 
     def count(self, bed):
+        if self.results:
+            self.result = self.results.popleft()
+            return
+
         s = self.fasta.getSequence(bed.contig, "+", bed.start, bed.end)
-        self.result = len([x for x in
-                           re.finditer(r'(?=(%s))' % self.motif, s)])
+        if self.scanner is not None:
+            self.result = self.scanner.count(s)
+            return
+
+        sequences = [s]
+        if self.both_strands:
+            sequences.append(Genomics.reverse_complement(s))
+        self.result = [sum([len([x for x in pattern.finditer(y)])
+                            for y in sequences])
+                       for pattern in self.patterns]
 
     def __str__(self):
-        return str(self.result)
+        return "\t".join(map(str, self.result))
+
+
+def iterator_batches(iterator, counters, batch_size):
+    """iterate over tuples of (bed, peak statistics) in *iterator*.
+
+    Tuples are read in batches of *batch_size* intervals and
+    *counters* count each batch before it is returned (see
+    :meth:`CounterMotif.countBatch`).
+    """
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            break
+        beds = [x[0] for x in batch]
+        for counter in counters:
+            counter.countBatch(beds)
+        for x in batch:
+            yield x
 
 
 class CounterCompositionCpG(CounterCompositionNucleotides):
@@ -550,7 +693,20 @@ def main(argv=None):
 
     parser.add_argument(
         "--motif-sequence", dest="motif_sequence", type=str,
-        help="specify a sequence to search for")
+        action="append",
+        help="specify a sequence to search for. The option can be "
+        "given multiple times to count several motifs.")
+
+    parser.add_argument(
+        "--motif-format", dest="motif_format", type=str,
+        choices=("regex", "iupac"),
+        help="format of motifs: regex=case-sensitive regular "
+        "expression, iupac=nucleotides in IUPAC notation.")
+
+    parser.add_argument(
+        "--motif-both-strands", dest="motif_both_strands",
+        action="store_true",
+        help="count motifs on both strands. ")
 
     parser.add_argument(
         "-o", "--offset", dest="offsets", type=int, action="append",
@@ -563,6 +719,17 @@ def main(argv=None):
         help="control tag offsets for tag counting - supply as many as "
         "there are bam-files.")
 
+    parser.add_argument(
+        "-p", "--num-jobs", dest="num_jobs", type=int,
+        help="number of processes computing peak statistics "
+        "(--counter=peaks) in parallel.")
+
+    parser.add_argument(
+        "--batch-size", dest="batch_size", type=int,
+        help="number of intervals sent to a process at a time "
+        "if --num-jobs is set and number of intervals searched "
+        "for motifs at a time.")
+
     parser.add_argument(
         "-a", "--output-all-fields", dest="all_fields", action="store_true",
         help="output all fields in original bed file, by default only "
@@ -594,7 +761,11 @@ def main(argv=None):
         bed_headers=None,
         filename_gff=[],
         has_header=False,
-        motif_sequence=None
+        motif_sequence=[],
+        motif_format="regex",
+        motif_both_strands=False,
+        num_jobs=1,
+        batch_size=100,
     )
 
     (args) = E.start(parser)
@@ -673,12 +844,43 @@ def main(argv=None):
             del args.filename_gff[0]
 
         elif c == "motif":
-            counters.append(CounterMotif(fasta=fasta,
-                                         motif=args.motif_sequence))
+            counters.append(CounterMotif(
+                fasta=fasta,
+                motifs=args.motif_sequence,
+                motif_format=args.motif_format,
+                both_strands=args.motif_both_strands))
 
     extra_fields = None
 
-    for bed in Bed.iterator(args.stdin):
+    pool = None
+    if args.num_jobs > 1 and "peaks" in args.counters:
+        if args.control_bam_files:
+            control_filenames = args.control_bam_files.split(",")
+        else:
+            control_filenames = []
+        E.info("computing peak statistics with %i processes" %
+               args.num_jobs)
+        pool = multiprocessing.Pool(
+            args.num_jobs,
+            initializer=_init_worker,
+            initargs=(args.bam_files.split(","),
+                      args.offsets,
+                      control_filenames,
+                      args.control_offsets))
+        iterator = iterator_peaks(pool,
+                                  Bed.iterator(args.stdin),
+                                  args.batch_size,
+                                  4 * args.num_jobs)
+    else:
+        iterator = ((bed, None) for bed in Bed.iterator(args.stdin))
+
+    batch_counters = [x for x in counters if isinstance(x, CounterMotif)]
+    if batch_counters:
+        iterator = iterator_batches(iterator,
+                                    batch_counters,
+                                    args.batch_size)
+
+    for bed, peaks in iterator:
 
         if extra_fields is None:
 
@@ -699,7 +901,11 @@ def main(argv=None):
             extra_fields = list(range(len(bed_headers) - 3))
 
         for counter in counters:
-            counter.update(bed)
+            if peaks is not None and isinstance(counter, CounterPeaks):
+                counter.bed = bed
+                counter.setResult(peaks)
+            else:
+                counter.update(bed)
 
         if args.all_fields:
             args.stdout.write(str(bed))
@@ -714,6 +920,10 @@ def main(argv=None):
 
         args.stdout.write("\n")
 
+    if pool is not None:
+        pool.close()
+        pool.join()
+
     E.stop()
 
 
@@ -30,7 +30,8 @@ If the ``--exclusive-overlap`` option is set, report exclusive
 overlap. Only intervals will be reported that overlap in a pairwise
 comparison but do not overlap with intervals in any of the other sets.
 
-This script requires bed files indexed by tabix_.
+This script requires bed files indexed by tabix_. The files are
+processed contig by contig in a single sorted pass.
 
 Usage
 -----
@@ -93,72 +94,70 @@ import collections
 import cgatcore.experiment as E
 import cgatcore.iotools as iotools
 import pysam
-import cgat.Intervals as Intervals
+import cgat.IntervalSweep as IntervalSweep
 
 
-def isContainedInAll(contig, start, end, bedfiles):
-
-    for bedfile in bedfiles:
-        try:
-            if len(list(bedfile.fetch(contig, start, end))) == 0:
-                return False
-        except KeyError:
-            return False
-        except ValueError:
-            return False
-
-    return True
-
-
-def isContainedInOne(contig, start, end, bedfiles):
+def fetchContig(bedfile, contig, track=None):
+    """return iterator over intervals on *contig* in *bedfile*.
 
+    Returns an empty iterator if *contig* is not present. If *track*
+    is given, intervals are returned as :class:`IntervalSweep.Interval`
+    with *track* as value.
+    """
+    try:
+        iterator = bedfile.fetch(contig, parser=pysam.asBed())
+    except (KeyError, ValueError):
+        return iter(())
+    if track is None:
+        return iterator
+    return (IntervalSweep.Interval(bed.contig, bed.start, bed.end, track)
+            for bed in iterator)
+
+
+def getContigs(bedfiles):
+    """return sorted list of contigs in any of *bedfiles*."""
+    contigs = set()
     for bedfile in bedfiles:
-        try:
-            if len(list(bedfile.fetch(contig, start, end))) > 0:
-                return True
-        except KeyError:
-            pass
-        except ValueError:
-            pass
-
-    return False
+        contigs.update(bedfile.contigs)
+    return sorted(contigs)
 
 
-def combineMergedIntervals(bedfiles):
+def combineMergedIntervals(bedfiles, others=()):
     '''combine intervals in a collection of bed files.
 
     Overlapping intervals between tracks are merged.
 
     Algorithm:
 
-    1. collect all intervals in all tracks into a single track
-    2. merge overlapping intervals
-    3. report all intervals that overlap with an interval in each track.
+    1. merge the sorted intervals of all tracks per contig into a
+       single stream
+    2. group overlapping intervals in the stream
+    3. report all groups that contain an interval from each track.
 
+    Yields tuples of (contig, start, end, overlaps_other) where
+    *overlaps_other* is True if the merged interval overlaps with an
+    interval in any of the files in *others*.
     '''
 
-    # get all intervals
-    data_per_contig = collections.defaultdict(list)
-
-    for bedfile in bedfiles:
-        for contig in bedfile.contigs:
-            i = []
-            for bed in bedfile.fetch(contig, parser=pysam.asBed()):
-                i.append((bed.start, bed.end))
-            data_per_contig[contig].extend(i)
-
-    # merge intervals
-    for contig in list(data_per_contig.keys()):
-        data_per_contig[contig] = Intervals.combine(data_per_contig[contig])
-
-    # filter intervals - take only those present in all bedfiles
-    for contig, data in sorted(data_per_contig.items()):
-        for start, end in data:
-            if isContainedInAll(contig, start, end, bedfiles):
-                yield contig, start, end
-
-
-def combineUnmergedIntervals(foreground, background):
+    for contig in getContigs(bedfiles):
+        streams = [fetchContig(bedfile, contig, track=x)
+                   for x, bedfile in enumerate(bedfiles)]
+        cursors = [IntervalSweep.SweepCursor(fetchContig(bedfile, contig))
+                   for bedfile in others]
+
+        for chunk in IntervalSweep.iterate_chunks(
+                IntervalSweep.merge_streams(*streams)):
+            # filter intervals - take only those present in all bedfiles
+            if len(set([x.value for x in chunk])) < len(bedfiles):
+                continue
+            start = chunk[0].start
+            end = max([x.end for x in chunk])
+            yield (contig, start, end,
+                   IntervalSweep.is_contained_in_one(
+                       contig, start, end, cursors))
+
+
+def combineUnmergedIntervals(foreground, background, others=()):
     '''combine intervals in a collection of bed files.
 
     Only intervals in the first track are reported.
@@ -168,13 +167,24 @@ def combineUnmergedIntervals(foreground, background):
     1. report all intervals in the first track that overlap with an
     interval in every other track.
 
+    Yields tuples of (bed, overlaps_other) where *overlaps_other* is
+    True if the interval overlaps with an interval in any of the
+    files in *others*.
     '''
 
-    c = 0
-    for bed in foreground.fetch(parser=pysam.asBed()):
-        c += 1
-        if isContainedInAll(bed.contig, bed.start, bed.end, background):
-            yield bed
+    for contig in foreground.contigs:
+        background_cursors = [
+            IntervalSweep.SweepCursor(fetchContig(bedfile, contig))
+            for bedfile in background]
+        other_cursors = [
+            IntervalSweep.SweepCursor(fetchContig(bedfile, contig))
+            for bedfile in others]
+
+        for bed in fetchContig(foreground, contig):
+            if IntervalSweep.is_contained_in_all(
+                    contig, bed.start, bed.end, background_cursors):
+                yield bed, IntervalSweep.is_contained_in_one(
+                    contig, bed.start, bed.end, other_cursors)
 
 
 def main(argv=None):
@@ -252,13 +262,12 @@ def main(argv=None):
                 outf = iotools.open_file(
                     E.get_output_file(tag), "w", create_dir=True)
                 c = E.Counter()
-                for contig, start, end in combineMergedIntervals(
-                        [bedfiles[x] for x in combination]):
+                for contig, start, end, overlaps_other in \
+                        combineMergedIntervals(
+                            [bedfiles[x] for x in combination],
+                            other_bed):
                     c.found += 1
-                    if is_exclusive and isContainedInOne(contig,
-                                                         start,
-                                                         end,
-                                                         other_bed):
+                    if is_exclusive and overlaps_other:
                         c.removed += 1
                         continue
                     c.output += 1
@@ -297,14 +306,12 @@ def main(argv=None):
                     outf = iotools.open_file(
                         E.get_output_file(tag), "w", create_dir=True)
                     c = E.Counter()
-                    for bed in combineUnmergedIntervals(
+                    for bed, overlaps_other in combineUnmergedIntervals(
                             bedfiles[foreground],
-                            combination_bed):
+                            combination_bed,
+                            other_bed):
                         c.found += 1
-                        if is_exclusive and isContainedInOne(bed.contig,
-                                                             bed.start,
-                                                             bed.end,
-                                                             other_bed):
+                        if is_exclusive and overlaps_other:
                             c.removed += 1
                             continue
                         c.output += 1
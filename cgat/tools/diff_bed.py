@@ -61,7 +61,7 @@ import re
 import cgatcore.experiment as E
 import cgatcore.iotools as iotools
 import cgat.Bed as Bed
-import numpy
+import cgat.IntervalSweep as IntervalSweep
 
 
 class Counter:
@@ -85,45 +85,38 @@ class Counter:
         return "\t".join(h)
 
     @E.cached_method
-    def buildIndex(self, filename):
-        return Bed.readAndIndex(iotools.open_file(filename, "r"))
-
-    def _count(self, filename, idx):
-        '''count filename against idx.'''
+    def readIntervals(self, filename):
+        """read intervals from *filename* sorted by position."""
+        infile = iotools.open_file(filename, "r")
+        intervals = sorted(
+            [IntervalSweep.Interval(bed.contig, bed.start, bed.end, None)
+             for bed in Bed.iterator(infile)],
+            key=lambda x: (x.contig, x.start))
+        infile.close()
+        return intervals
 
-        overlapping_genes = set()
-        genes = set()
+    def _count(self, intervals, other):
+        '''count *intervals* against *other*.
 
-        # iterate over exons
-        infile = iotools.open_file(filename, "r")
-        it = Bed.bed_iterator(infile)
+        Both lists need to be sorted by position.
+        '''
 
         nexons, nexons_overlapping = 0, 0
         nbases, nbases_overlapping = 0, 0
-        for this in it:
+
+        cursor = IntervalSweep.SweepCursor(other)
+        for this in intervals:
             nexons += 1
             nbases += this.end - this.start
 
-            try:
-                intervals = list(
-                    idx[this.contig].find(max(0, this.start), this.end))
-            except KeyError:
-                continue
-            except Exception as msg:
-                raise Exception(
-                    "error while processing %s, msg=%s" % (filename, msg))
-            if len(intervals) == 0:
+            overlapping = cursor.fetch(
+                this.contig, max(0, this.start), this.end)
+            if len(overlapping) == 0:
                 continue
 
             nexons_overlapping += 1
-            start, end = this.start, this.end
-            counts = numpy.zeros(end - start, numpy.int)
-            for other_start, other_end, other_value in intervals:
-                for x in range(max(start, other_start) - start, min(end, other_end) - start):
-                    counts[x] += 1
-            nbases_overlapping += sum([1 for x in counts if x > 0])
-
-        infile.close()
+            nbases_overlapping += IntervalSweep.covered_bases(
+                this.start, this.end, overlapping)
 
         return nexons, nexons_overlapping, nbases, nbases_overlapping
 
@@ -132,18 +125,19 @@ class Counter:
 
         E.info("counting started for %s versus %s" % (filename1, filename2))
 
-        idx2 = self.buildIndex(filename2)
+        intervals1 = self.readIntervals(filename1)
+        intervals2 = self.readIntervals(filename2)
 
         (self.mExons1, self.mExonsOverlapping1,
-         self.mBases1, self.mBasesOverlapping1) = self._count(filename1, idx2)
+         self.mBases1, self.mBasesOverlapping1) = self._count(
+             intervals1, intervals2)
 
         self.mExonsUnique1 = self.mExons1 - self.mExonsOverlapping1
         self.mBasesUnique1 = self.mBases1 - self.mBasesOverlapping1
 
-        idx1 = self.buildIndex(filename1)
-
         (self.mExons2, self.mExonsOverlapping2,
-         self.mBases2, self.mBasesOverlapping2) = self._count(filename2, idx1)
+         self.mBases2, self.mBasesOverlapping2) = self._count(
+             intervals2, intervals1)
 
         self.mExonsUnique2 = self.mExons2 - self.mExonsOverlapping2
         self.mBasesUnique2 = self.mBases2 - self.mBasesOverlapping2
@@ -171,62 +165,41 @@ class Counter:
 class CounterTracks(Counter):
 
     def __init__(self, filename):
-        self.mIndices = Bed.readAndIndex(iotools.open_file(filename, "r"),
-                                         per_track=True)
+        self.mIntervals = {}
+        infile = iotools.open_file(filename, "r")
+        for track, beds in Bed.grouped_iterator(Bed.iterator(infile)):
+            if track is None:
+                name = None
+            else:
+                name = track["name"]
+            self.mIntervals[name] = sorted(
+                [IntervalSweep.Interval(bed.contig, bed.start, bed.end, None)
+                 for bed in beds],
+                key=lambda x: (x.contig, x.start))
+        infile.close()
 
     def getTracks(self):
-        return sorted(self.mIndices.keys())
-
-    def _countIndices(self, idx_in, idx):
-        '''count filename against idx.'''
-
-        overlapping_genes = set()
-        genes = set()
-
-        # iterate over exons
-
-        nexons, nexons_overlapping = 0, 0
-        nbases, nbases_overlapping = 0, 0
-        for contig, ix in idx_in.items():
-
-            # note: add a findall function to ncl
-            for start, end, value in ix.find(0, 1000000000):
-                nexons += 1
-                nbases += end - start
-
-                try:
-                    intervals = list(idx[contig].find(start, end))
-                except KeyError:
-                    continue
-
-                if len(intervals) == 0:
-                    continue
-
-                nexons_overlapping += 1
-                counts = numpy.zeros(end - start, numpy.int)
-                for other_start, other_end, other_value in intervals:
-                    for x in range(max(start, other_start) - start, min(end, other_end) - start):
-                        counts[x] += 1
-                nbases_overlapping += sum([1 for x in counts if x > 0])
-
-        return nexons, nexons_overlapping, nbases, nbases_overlapping
+        return sorted(self.mIntervals.keys())
 
     def count(self, filename, track):
         """count overlap between two gtf files."""
 
         E.info("counting started for %s versus %s" % (filename, track))
 
+        intervals = self.readIntervals(filename)
+        track_intervals = self.mIntervals[track]
+
         (self.mExons1, self.mExonsOverlapping1,
-         self.mBases1, self.mBasesOverlapping1) = self._count(filename, self.mIndices[track])
+         self.mBases1, self.mBasesOverlapping1) = self._count(
+             intervals, track_intervals)
 
         self.mExonsUnique1 = self.mExons1 - self.mExonsOverlapping1
         self.mBasesUnique1 = self.mBases1 - self.mBasesOverlapping1
 
-        idx = self.buildIndex(filename)
-
-        # count index against index
+        # count track against file
         (self.mExons2, self.mExonsOverlapping2,
-         self.mBases2, self.mBasesOverlapping2) = self._countIndices(self.mIndices[track], idx)
+         self.mBases2, self.mBasesOverlapping2) = self._count(
+             track_intervals, intervals)
 
         self.mExonsUnique2 = self.mExons2 - self.mExonsOverlapping2
         self.mBasesUnique2 = self.mBases2 - self.mBasesOverlapping2
@@ -302,9 +275,9 @@ def main(argv=None):
     ncomputed, nupdated = 0, 0
 
     if args.tracks:
-        counter = CounterTracks(args[0])
+        counter = CounterTracks(unknown[0])
         args.stdout.write("set1\tset2\t%s\n" % counter.getHeader())
-        for filename in args[1:]:
+        for filename in unknown[1:]:
             title1 = getTitle(filename)
             for title2 in counter.getTracks():
 
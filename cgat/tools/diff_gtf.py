@@ -127,12 +127,11 @@ Command line options
 
 import sys
 import re
-import numpy
 
 import cgatcore.experiment as E
 import cgat.GTF as GTF
 import cgatcore.iotools as iotools
-import cgat.NCL as NCL
+import cgat.IntervalSweep as IntervalSweep
 
 
 class Counter:
@@ -156,51 +155,45 @@ class Counter:
         return "\t".join(h)
 
     @E.cached_method
-    def buildIndex(self, filename):
-        """read and index."""
+    def readIntervals(self, filename):
+        """read exons from *filename* sorted by position.
 
-        idx = {}
+        The gene_id is stored as value of each interval.
+        """
         infile = iotools.open_file(filename, "r")
-        for e in GTF.readFromFile(infile):
-            if e.contig not in idx:
-                idx[e.contig] = NCL.NCLSimple()
-            idx[e.contig].add(e.start, e.end)
+        intervals = sorted(
+            [IntervalSweep.Interval(e.contig, e.start, e.end, e.gene_id)
+             for e in GTF.iterator(infile)],
+            key=lambda x: (x.contig, x.start))
         infile.close()
-        return idx
+        return intervals
 
-    def _count(self, filename, idx):
+    def _count(self, intervals, other):
+        '''count *intervals* against *other*.
+
+        Both lists need to be sorted by position.
+        '''
 
         overlapping_genes = set()
         genes = set()
-        # iterate over exons
-        infile = iotools.open_file(filename, "r")
-        it = GTF.iterator(infile)
 
         nexons, nexons_overlapping = 0, 0
         nbases, nbases_overlapping = 0, 0
-        for this in it:
+
+        cursor = IntervalSweep.SweepCursor(other)
+        for this in intervals:
             nexons += 1
             nbases += this.end - this.start
-            genes.add(this.gene_id)
-
-            try:
-                intervals = list(idx[this.contig].find(this.start, this.end))
-            except KeyError:
-                continue
+            genes.add(this.value)
 
-            if len(intervals) == 0:
+            overlapping = cursor.fetch(this.contig, this.start, this.end)
+            if len(overlapping) == 0:
                 continue
 
-            overlapping_genes.add(this.gene_id)
+            overlapping_genes.add(this.value)
             nexons_overlapping += 1
-            start, end = this.start, this.end
-            counts = numpy.zeros(end - start, numpy.int)
-            for other_start, other_end, other_value in intervals:
-                for x in range(max(start, other_start) - start, min(end, other_end) - start):
-                    counts[x] += 1
-            nbases_overlapping += sum([1 for x in counts if x > 0])
-
-        infile.close()
+            nbases_overlapping += IntervalSweep.covered_bases(
+                this.start, this.end, overlapping)
 
         return len(genes), len(overlapping_genes), nexons, nexons_overlapping, nbases, nbases_overlapping
 
@@ -209,21 +202,22 @@ class Counter:
 
         E.info("counting started for %s versus %s" % (filename1, filename2))
 
-        idx2 = self.buildIndex(filename2)
+        intervals1 = self.readIntervals(filename1)
+        intervals2 = self.readIntervals(filename2)
 
         (self.mGenes1, self.mGenesOverlapping1,
          self.mExons1, self.mExonsOverlapping1,
-         self.mBases1, self.mBasesOverlapping1) = self._count(filename1, idx2)
+         self.mBases1, self.mBasesOverlapping1) = self._count(
+             intervals1, intervals2)
 
         self.mGenesUnique1 = self.mGenes1 - self.mGenesOverlapping1
         self.mExonsUnique1 = self.mExons1 - self.mExonsOverlapping1
         self.mBasesUnique1 = self.mBases1 - self.mBasesOverlapping1
 
-        idx1 = self.buildIndex(filename1)
-
         (self.mGenes2, self.mGenesOverlapping2,
          self.mExons2, self.mExonsOverlapping2,
-         self.mBases2, self.mBasesOverlapping2) = self._count(filename2, idx1)
+         self.mBases2, self.mBasesOverlapping2) = self._count(
+             intervals2, intervals1)
 
         self.mGenesUnique2 = self.mGenes2 - self.mGenesOverlapping2
         self.mExonsUnique2 = self.mExons2 - self.mExonsOverlapping2
@@ -270,28 +264,16 @@ class CounterGenes(Counter):
              "nuniq2", "ovl1", "ovl2", "uniq1", "uniq2"]
         return "\t".join(h)
 
-    def _count(self, filename, idx):
+    def _count(self, intervals, other):
 
         overlapping_genes = set()
         genes = set()
-        # iterate over exons
-        infile = iotools.open_file(filename, "r")
-        it = GTF.iterator(infile)
 
-        for this in it:
-            genes.add(this.gene_id)
-
-            try:
-                intervals = idx[this.contig].find(this.start, this.end)
-            except KeyError:
-                continue
-
-            if len(intervals) == 0:
-                continue
-
-            overlapping_genes.add(this.gene_id)
-
-        infile.close()
+        cursor = IntervalSweep.SweepCursor(other)
+        for this in intervals:
+            genes.add(this.value)
+            if cursor.fetch(this.contig, this.start, this.end):
+                overlapping_genes.add(this.value)
 
         return genes, overlapping_genes
 
@@ -300,12 +282,13 @@ class CounterGenes(Counter):
 
         E.info("counting started for %s versus %s" % (filename1, filename2))
 
-        idx2 = self.buildIndex(filename2)
-
-        (self.mGenes1, self.mGenesOverlapping1) = self._count(filename1, idx2)
+        intervals1 = self.readIntervals(filename1)
+        intervals2 = self.readIntervals(filename2)
 
-        idx1 = self.buildIndex(filename1)
-        (self.mGenes2, self.mGenesOverlapping2) = self._count(filename2, idx1)
+        (self.mGenes1, self.mGenesOverlapping1) = self._count(
+            intervals1, intervals2)
+        (self.mGenes2, self.mGenesOverlapping2) = self._count(
+            intervals2, intervals1)
 
     def __str__(self):
 
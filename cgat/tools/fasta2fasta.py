@@ -369,8 +369,6 @@ def main(argv=None):
 
             if method == "translate":
                 # translate such that gaps are preserved
-                seq = []
-
                 ls = len(re.sub('[%s]' % args.gap_chars, sequence, ""))
 
                 if ls % 3 != 0:
@@ -383,11 +381,7 @@ def main(argv=None):
                     else:
                         raise ValueError(msg)
 
-                for codon in [sequence[x:x + 3] for x in range(0, l, 3)]:
-                    aa = Genomics.MapCodon2AA(codon)
-                    seq.append(aa)
-
-                sequence = "".join(seq)
+                sequence = Genomics.translate(sequence, ignore_n=True).upper()
 
             elif method == "back-translate":
                 # translate from an amino acid alignment to codon alignment
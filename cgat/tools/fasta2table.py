@@ -58,6 +58,11 @@ codon-translator
     translate codons for each sequence to their frequency (nucleotide
     sequence only, sequence must have length divisible by 3)
 
+motif
+    number of occurrences of one or more nucleotide motifs in IUPAC
+    notation (see options ``--motif-sequence`` and
+    ``--motif-both-strands``).
+
 Multiple counters can be calculated at the same by specifying
 --section multiple times.
 
@@ -117,6 +122,7 @@ import cgat.Genomics as Genomics
 import cgatcore.iotools as iotools
 import cgat.SequenceProperties as SequenceProperties
 import cgat.FastaIterator as FastaIterator
+import cgat.Motifs as Motifs
 
 
 def main(argv=None):
@@ -135,7 +141,8 @@ def main(argv=None):
         "-s", "--section", dest="sections", nargs="*", type=str,
         choices=("length", "sequence", "hid", "na", "aa", "cpg", "dn",
                  "degeneracy", "gaps",
-                 "codons", "codon-usage", "codon-translator", "codon-bias"),
+                 "codons", "codon-usage", "codon-translator", "codon-bias",
+                 "motif"),
         help="which sections to output ")
 
     parser.add_argument(
@@ -154,6 +161,17 @@ def main(argv=None):
         help="split fasta description line (starting >) and use "
         "only text before first space")
 
+    parser.add_argument(
+        "--motif-sequence", dest="motif_sequences", type=str,
+        action="append",
+        help="nucleotide motif in IUPAC notation to count (for section "
+        "motif). The option can be given multiple times.")
+
+    parser.add_argument(
+        "--motif-both-strands", dest="motif_both_strands",
+        action="store_true",
+        help="count motifs on both strands (for section motif).")
+
     parser.add_argument(
         "--add-total", dest="add_total", action="store_true",
         help="add a row with column totals at the end of the table"
@@ -168,6 +186,8 @@ def main(argv=None):
         gap_chars='xXnN',
         split_id=False,
         add_total=False,
+        motif_sequences=[],
+        motif_both_strands=False,
     )
 
     (args) = E.start(parser, argv=argv)
@@ -207,6 +227,12 @@ def main(argv=None):
                                    args.filename_weights[y],
                                    d))
 
+    if "motif" in args.sections:
+        if not args.motif_sequences:
+            raise ValueError("section motif requires a motif sequence")
+        scanner = Motifs.MotifScanner(args.motif_sequences,
+                                      both_strands=args.motif_both_strands)
+
     iterator = FastaIterator.FastaIterator(args.stdin)
 
     def getCounter(section):
@@ -240,6 +266,8 @@ def main(argv=None):
                 s = SequenceProperties.SequencePropertiesCodonUsage()
             elif section == "codon-translator":
                 s = SequenceProperties.SequencePropertiesCodonTranslator()
+            elif section == "motif":
+                s = SequenceProperties.SequencePropertiesMotifs(scanner)
             else:
                 raise ValueError("unknown section %s" % section)
         elif args.seqtype == "aa":
@@ -78,18 +78,25 @@ def main(argv=None):
                 "length of sequence '%s' is not a multiple of 3" % entry.title
 
             sequence = Genomics.translate(cds_sequence)
+            codons = [cds_sequence[x:x + 3]
+                      for x in range(0, len(cds_sequence), 3)]
+
+            # translate all single nucleotide variants in one batch
+            variants = []
+            for codon in codons:
+                for x in range(0, 3):
+                    for na in "ACGT":
+                        if na != codon[x]:
+                            variants.append(codon[:x] + na + codon[x + 1:])
+            translations = iter(Genomics.translateBatch(variants))
+
             weights = []
-            for pos, cds_pos in enumerate(range(0, len(cds_sequence), 3)):
-                codon = cds_sequence[cds_pos:cds_pos + 3]
+            for codon in codons:
                 counts = collections.defaultdict(int)
                 for x in range(0, 3):
-                    rna = codon[x]
                     for na in "ACGT":
-                        if na == rna:
-                            continue
-                        taa = Genomics.translate(
-                            codon[:x] + na + codon[x + 1:])
-                        counts[taa] += 1
+                        if na != codon[x]:
+                            counts[next(translations)] += 1
                 weights.append(counts)
 
         else:
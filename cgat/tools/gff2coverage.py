@@ -94,6 +94,10 @@ Please note the following:
 option) to compute the genomic coverage of that feature. You can also use\
 a comma-separated list of feature names.
 
+- the histogram method requires that features on the same strand do\
+not overlap. Bases in overlapping features on different strands are\
+counted once for each feature.
+
 - the output of the histogram method goes to a file (in the current working\
 directory) which is named as the contig name by default. To change this\
 behaviour, please use the ``--output-filename-pattern`` option where \
@@ -107,6 +111,8 @@ import sys
 import math
 import collections
 
+import numpy
+
 import cgatcore.experiment as E
 import cgat.IndexedFasta as IndexedFasta
 import cgat.GTF as GTF
@@ -143,6 +149,50 @@ def printValues(contig, max_size, window_size, values, options):
     outfile.close()
 
 
+def checkOverlaps(chunk):
+    """raise ValueError if features on the same strand in *chunk*
+    overlap.
+
+    Features are sorted by start and each feature is compared to the
+    preceding feature with the largest end coordinate.
+    """
+    for strand in set([x.strand for x in chunk]):
+        entries = sorted([x for x in chunk
+                          if x.strand == strand and x.end > x.start],
+                         key=lambda x: x.start)
+        if len(entries) < 2:
+            continue
+        starts = numpy.array([x.start for x in entries], dtype=numpy.int64)
+        ends = numpy.array([x.end for x in entries], dtype=numpy.int64)
+        max_ends = numpy.maximum.accumulate(ends)
+        overlapping = numpy.nonzero(starts[1:] < max_ends[:-1])[0]
+        if len(overlapping):
+            other = overlapping[0] + 1
+            feature = numpy.argmax(ends[:other])
+            raise ValueError(" Histogram could not be created"
+                             " since the file contains overlapping "
+                             "features! \n%s\n%s  "
+                             % (entries[feature], entries[other]))
+
+
+def getCumulativeCoverage(starts, ends, positions):
+    """return the number of bases covered by intervals given by
+    *starts* and *ends* before each of *positions*.
+
+    The coverage of all positions is computed at once from the
+    sorted start and end coordinates.
+    """
+    starts = numpy.sort(numpy.asarray(starts, dtype=numpy.int64))
+    ends = numpy.sort(numpy.asarray(ends, dtype=numpy.int64))
+    sum_starts = numpy.concatenate(([0], numpy.cumsum(starts)))
+    sum_ends = numpy.concatenate(([0], numpy.cumsum(ends)))
+    # intervals starting and ending before each position
+    nstarts = numpy.searchsorted(starts, positions, "left")
+    nends = numpy.searchsorted(ends, positions, "left")
+    return (nstarts - nends) * positions - \
+        (sum_starts[nstarts] - sum_ends[nends])
+
+
 def processChunk(contig, chunk, options, fasta=None):
     """
     This function requires segments to be non-overlapping.
@@ -152,18 +202,7 @@ def processChunk(contig, chunk, options, fasta=None):
         return
 
     # check whether there are overlapping features or not
-    checked = []
-    for feature in chunk:
-        checked.append(feature)
-        others = [x for x in chunk if x not in checked]
-        for otherFeature in others:
-            if GTF.Overlap(feature, otherFeature):
-                raise ValueError(" Histogram could not be created"
-                                 " since the file contains overlapping "
-                                 "features! \n%s\n%s  "
-                                 % (feature, otherFeature))
-    # clear auxiliary list
-    del checked[:]
+    checkOverlaps(chunk)
 
     # compute max_coordinate for the histogram
     max_coordinate = max([x.end for x in chunk])
@@ -186,38 +225,16 @@ def processChunk(contig, chunk, options, fasta=None):
         raise ValueError("please specify a window size of provide "
                          "genomic sequence with number of bins.")
 
-    values = [[] for x in range(num_bins)]
-
-    # do several parses for each feature, slow, but easier to code
-    # alternatively: sort by feature and location.
-    for feature in options.features:
-        total = 0
-        bin = 0
-        end = window_size
-        for entry in chunk:
-            if entry.feature != feature:
-                continue
-
-            while end < entry.start:
-                values[bin].append(total)
-                bin += 1
-                end += window_size
-
-            while entry.end > end:
-                seg_start = max(entry.start, end - window_size)
-                seg_end = min(entry.end, end)
-                total += seg_end - seg_start
-                values[bin].append(total)
-                end += window_size
-                bin += 1
-            else:
-                seg_start = max(entry.start, end - window_size)
-                seg_end = min(entry.end, end)
-                total += seg_end - seg_start
-
-        while bin < num_bins:
-            values[bin].append(total)
-            bin += 1
+    # cumulative coverage at the end of each bin
+    bin_ends = numpy.arange(1, num_bins + 1, dtype=numpy.int64) * window_size
+    values = numpy.zeros((num_bins, len(options.features)), dtype=numpy.int64)
+    for column, feature in enumerate(options.features):
+        entries = [x for x in chunk if x.feature == feature]
+        values[:, column] = getCumulativeCoverage(
+            [x.start for x in entries],
+            [x.end for x in entries],
+            bin_ends)
+    values = values.tolist()
 
     printValues(contig, max_coordinate, window_size, values, options)
 
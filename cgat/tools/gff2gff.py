@@ -138,7 +138,7 @@ import re
 import collections
 import numpy
 import quicksect
-import pandas as pd
+import cgat.LazyImport as LazyImport
 import cgatcore.experiment as E
 import cgatcore.iotools as iotools
 import cgat.GTF as GTF
@@ -148,6 +148,8 @@ import cgat.IndexedFasta as IndexedFasta
 import cgat.Intervals as Intervals
 import csv
 
+pd = LazyImport.LazyModule("pandas")
+
 
 def combineGFF(gffs,
                min_distance,
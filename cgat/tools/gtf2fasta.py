@@ -137,11 +137,21 @@ Command line options
     intronic bases in introns less than specified length
     will be marked "unknown"
 
+``--memory-map``
+    The annotation is kept in memory with one byte per base. With
+    this option, the annotation is stored in memory-mapped temporary
+    files instead and only the contig that is currently annotated
+    needs to be kept in memory. This works best if the input is
+    sorted by contig.
+
 """
 
+import os
+import shutil
 import sys
-import collections
-import array
+import tempfile
+
+import numpy
 
 import cgatcore.experiment as E
 import cgat.GTF as GTF
@@ -173,8 +183,8 @@ INTRON_CODES = "iI"
 UTR_CODES = "uvUV"
 
 
-def setCode(annotation, pos, code):
-    """set *pos* to *code* in annotation.
+def resolveCode(c, code):
+    """return code of a base with code *c* after setting it to *code*.
 
     This method performs conflict resolution in the following cases:
 
@@ -188,29 +198,70 @@ def setCode(annotation, pos, code):
 
     All other conflicts are marked as ambiguous bases.
     """
-    c = annotation[pos]
     if c == DEFAULT_CODE or c in NONCODING_CODES:
-        annotation[pos] = code
+        return code
     elif c == AMBIGUOUS_CODE:
-        return
+        return c
     elif code in NONCODING_CODES:
         # only set introns/UTR if no other code is present
-        return
+        return c
     elif c == code:
-        return
+        return c
     elif code in CODING_CODES and c in CODING_CODES:
         # ambiguous frame/strand in coding sequence
-        annotation[pos] = CODING_CODE
-    elif code in NONCODING_CODES and c in CODING_CODES:
-        # permit alternative transcripts
-        return
-    elif c not in CODING_CODES and code not in CODING_CODES and c.upper() == code.upper():
+        return CODING_CODE
+    elif c not in CODING_CODES and code not in CODING_CODES and \
+            c.upper() == code.upper():
         # permit features of the same type on different strands to overlap (for
         # example, tRNAs)
-        return
+        return c
     else:
-        annotation[pos] = AMBIGUOUS_CODE
-        E.warn("ambiguous position %i: %s - %s" % (pos, c, code))
+        return AMBIGUOUS_CODE
+
+
+def buildResolutionTable():
+    """return a lookup table with the results of :func:`resolveCode`
+    for all pairs of codes.
+
+    The table is indexed by the byte values of the current and the new
+    code.
+    """
+    table = numpy.zeros((256, 256), dtype=numpy.uint8)
+    for c in ALL_CODES:
+        for code in ALL_CODES:
+            table[ord(c), ord(code)] = ord(resolveCode(c, code))
+    return table
+
+
+RESOLUTION_TABLE = buildResolutionTable()
+
+
+def setCodes(annotation, start, end, codes):
+    """set bases from *start* to *end* in annotation to *codes*.
+
+    *codes* is a single code or an array of codes for each base.
+    Conflicts are resolved for all bases at once, see
+    :func:`resolveCode`.
+    """
+    if start >= end:
+        return
+    segment = annotation[start:end]
+    if isinstance(codes, str):
+        codes = ord(codes)
+    result = RESOLUTION_TABLE[segment, codes]
+    nambiguous = numpy.count_nonzero(
+        (result == ord(AMBIGUOUS_CODE)) & (segment != ord(AMBIGUOUS_CODE)))
+    if nambiguous:
+        E.warn("%i ambiguous positions in %i-%i" % (nambiguous, start, end))
+    annotation[start:end] = result
+
+
+def setCode(annotation, pos, code):
+    """set *pos* to *code* in annotation.
+
+    See :func:`resolveCode` for conflict resolution.
+    """
+    setCodes(annotation, pos, pos + 1, code)
 
 
 def addSegments(annotation, intervals, is_positive, code):
@@ -221,8 +272,7 @@ def addSegments(annotation, intervals, is_positive, code):
         code = code.upper()
 
     for start, end in intervals:
-        for x in range(start, end):
-            setCode(annotation, x, code)
+        setCodes(annotation, start, end, code)
 
 
 def addIntrons(annotation, intervals, is_positive, max_frameshift_length):
@@ -248,15 +298,12 @@ def addIntrons(annotation, intervals, is_positive, max_frameshift_length):
         else:
             code = code_i
             # add splice sites
-            setCode(annotation, last, code_s)
-            setCode(annotation, last + 1, code_s)
-            setCode(annotation, start - 2, code_s)
-            setCode(annotation, start - 1, code_s)
+            setCodes(annotation, last, last + 2, code_s)
+            setCodes(annotation, start - 2, start, code_s)
             last += 2
             start -= 2
 
-        for x in range(last, start):
-            setCode(annotation, x, code)
+        setCodes(annotation, last, start, code)
 
         last = end
 
@@ -274,48 +321,124 @@ def addCDS(annotation, gtfs, is_positive):
         chars = "abc"
     else:
         chars = "ABC"
+    chars = numpy.array([ord(x) for x in chars], dtype=numpy.uint8)
 
-    last = None
     for cds in gtfs:
 
         c = int(cds.frame)
         if c != 0:
             c = 3 - c
 
-        if is_positive:
-            r = range(cds.start, cds.end)
-        else:
-            r = range(cds.end - 1, cds.start - 1, -1)
+        # codes in direction of transcription
+        codes = chars[(numpy.arange(cds.end - cds.start) + c) % 3]
+        if not is_positive:
+            codes = codes[::-1]
+        setCodes(annotation, cds.start, cds.end, codes)
+
 
-        for x in r:
-            code = chars[c]
-            c += 1
-            if c == len(chars):
-                c = 0
-            setCode(annotation, x, code)
+class GenomeAnnotation(object):
+    """per-contig arrays with one code per base.
+
+    An array is allocated when a contig is annotated first. If
+    *directory* is given, arrays are memory-mapped files in
+    *directory* and only the contig that has been accessed last is
+    kept open. Contigs without annotations are not stored.
+    """
+
+    def __init__(self, contig_sizes, default_code=DEFAULT_CODE,
+                 directory=None):
+        self.mContigSizes = contig_sizes
+        self.mDefaultCode = ord(default_code)
+        self.mDirectory = directory
+        self.mAnnotations = {}
+        self.mFilenames = {}
+
+    def keys(self):
+        return self.mContigSizes.keys()
+
+    def getSize(self, contig):
+        return self.mContigSizes[contig]
+
+    def _getFilename(self, contig):
+        if contig not in self.mFilenames:
+            self.mFilenames[contig] = os.path.join(
+                self.mDirectory, "%i.codes" % len(self.mFilenames))
+        return self.mFilenames[contig]
+
+    def __getitem__(self, contig):
+        """return array of codes for *contig* for modification."""
+        if contig in self.mAnnotations:
+            return self.mAnnotations[contig]
+
+        size = self.mContigSizes[contig]
+        if self.mDirectory is None:
+            E.debug("allocating %s: %i bases" % (contig, size))
+            annotation = numpy.full(size, self.mDefaultCode,
+                                    dtype=numpy.uint8)
+        else:
+            # release previous contig
+            self.flush()
+            filename = self._getFilename(contig)
+            if os.path.exists(filename):
+                annotation = numpy.memmap(filename, dtype=numpy.uint8,
+                                          mode="r+", shape=(size,))
+            else:
+                E.debug("mapping %s: %i bases" % (contig, size))
+                annotation = numpy.memmap(filename, dtype=numpy.uint8,
+                                          mode="w+", shape=(size,))
+                annotation[:] = self.mDefaultCode
+        self.mAnnotations[contig] = annotation
+        return annotation
+
+    def getCodes(self, contig):
+        """return array of codes for *contig* for reading."""
+        if contig in self.mAnnotations:
+            return self.mAnnotations[contig]
+        if contig in self.mFilenames:
+            return numpy.memmap(self.mFilenames[contig], dtype=numpy.uint8,
+                                mode="r", shape=(self.mContigSizes[contig],))
+        return numpy.full(self.mContigSizes[contig], self.mDefaultCode,
+                          dtype=numpy.uint8)
+
+    def flush(self):
+        """write memory-mapped arrays to disk and release them."""
+        if self.mDirectory is None:
+            return
+        for annotation in self.mAnnotations.values():
+            annotation.flush()
+        self.mAnnotations = {}
 
 
 def outputCounts(outfile, annotations):
     """output table into outfile with annotations."""
 
-    total_counts = collections.defaultdict(int)
+    total_counts = numpy.zeros(256, dtype=numpy.int64)
+    codes = [ord(x) for x in ALL_CODES]
 
     outfile.write("contig\ttotal\t%s\n" % ("\t".join(ALL_CODES)))
 
+    total = 0
     for k in sorted(annotations.keys()):
-        counts = collections.defaultdict(int)
-        for x in annotations[k]:
-            counts[x] += 1
+        counts = numpy.bincount(annotations.getCodes(k), minlength=256)
         outfile.write("\t".join((k,
-                                 str(len(annotations[k])),
-                                 "\t".join([str(counts[x]) for x in ALL_CODES]))) + "\n")
-
-        for k, v in counts.items():
-            total_counts[k] += v
+                                 str(annotations.getSize(k)),
+                                 "\t".join([str(counts[x]) for x in codes]))) + "\n")
+        total_counts += counts
+        total += annotations.getSize(k)
 
     outfile.write("\t".join(("total",
-                             str(sum([len(x) for x in list(annotations.values())])),
-                             "\t".join([str(total_counts[x]) for x in ALL_CODES]))) + "\n")
+                             str(total),
+                             "\t".join([str(total_counts[x]) for x in codes]))) + "\n")
+
+
+def outputSequences(outfile, annotations, chunk_size=10000000):
+    """output annotations as fasta formatted sequences."""
+    for k in sorted(annotations.keys()):
+        codes = annotations.getCodes(k)
+        outfile.write(">%s\n" % k)
+        for start in range(0, len(codes), chunk_size):
+            outfile.write(codes[start:start + chunk_size].tobytes().decode("ascii"))
+        outfile.write("\n")
 
 
 def annotateGenome(iterator, fasta, options, default_code=DEFAULT_CODE):
@@ -323,20 +446,19 @@ def annotateGenome(iterator, fasta, options, default_code=DEFAULT_CODE):
     an iterator over gtf annotations.
     """
 
-    annotations = {}
     contig_sizes = fasta.getContigSizes(with_synonyms=False)
-    E.info("allocating memory for %i contigs and %i bytes" %
-           (len(contig_sizes), sum(contig_sizes.values()) * array.array("B").itemsize))
-    # AString.AString( "a").itemsize ))
-
-    for contig, size in list(contig_sizes.items()):
-        E.debug("allocating %s: %i bases" % (contig, size))
-        # annotations[contig] = AString.AString( default_code * size )
-        # annotations[contig] = array.array("", default_code * size)
-        # Go to list for py3 compatibility, patch
-        annotations[contig] = [default_code] * size
+    if options.memory_map:
+        directory = tempfile.mkdtemp()
+        E.info("storing annotations for %i contigs and %i bytes in %s" %
+               (len(contig_sizes), sum(contig_sizes.values()), directory))
+    else:
+        directory = None
+        E.info("annotating %i contigs with up to %i bytes" %
+               (len(contig_sizes), sum(contig_sizes.values())))
 
-    E.info("allocated memory for %i contigs" % len(fasta))
+    annotations = GenomeAnnotation(contig_sizes,
+                                   default_code=default_code,
+                                   directory=directory)
 
     counter = E.Counter()
 
@@ -463,15 +585,18 @@ def annotateGenome(iterator, fasta, options, default_code=DEFAULT_CODE):
 
     outfile_junctions.close()
 
+    annotations.flush()
+
     E.info("started counting")
     outfile = E.open_output_file("counts")
     outputCounts(outfile, annotations)
     outfile.close()
 
     E.info("started output")
-    for k in sorted(annotations.keys()):
-        # options.stdout.write(">%s\n%s\n" % (k, annotations[k].tostring()))
-        options.stdout.write(">%s\n%s\n" % (k, "".join(annotations[k])))
+    outputSequences(options.stdout, annotations)
+
+    if directory is not None:
+        shutil.rmtree(directory)
 
 
 def main(argv=None):
@@ -501,6 +626,10 @@ def main(argv=None):
                         choices=["full"],
                         help="method to apply")
 
+    parser.add_argument("--memory-map", dest="memory_map", action="store_true",
+                        help="store annotations in memory-mapped temporary files "
+                        "instead of memory.")
+
     parser.set_defaults(
         genome_file=None,
         flank=1000,
@@ -509,6 +638,7 @@ def main(argv=None):
         ignore_missing=False,
         restrict_source=None,
         method="full",
+        memory_map=False,
         report_step=1000,
     )
 
@@ -286,6 +286,25 @@ argument ``--upstream-extension`` and ``--downstream-extension``
 If ``--method=tts-regulons``, regulons will be defined around the
 transcription termination site.
 
+Parallel processing
++++++++++++++++++++
+
+The methods ``genome``, ``territories``, ``tss-territories`` and
+``great-domains`` segment the genome one contig at a time. With
+``--num-jobs``, contigs are segmented in separate processes and the
+output is written in contig order.
+
+For ``great-domains``, the full gene set is read before segmentation
+unless ``--stream-contigs`` is set. In this case the input needs to be
+grouped by contig, for example sorted by position::
+
+   cgat gtf2gff \
+   --genome-file=hg19 \
+   --method=great-domains \
+   --stream-contigs \
+   --num-jobs=4 \
+   < in.gtf > out.gff
+
 Usage
 -----
 
@@ -303,11 +322,15 @@ Command line options
 """
 
 import sys
+import argparse
 import collections
+import io
 import itertools
+import multiprocessing
+
+import numpy
 
 import cgatcore.experiment as E
-import cgatcore.iotools as iotools
 import cgat.GTF as GTF
 import cgat.IndexedFasta as IndexedFasta
 import cgat.Genomics as Genomics
@@ -405,159 +428,207 @@ def addIntergenicSegment(last, this, fasta, options):
     return nadded
 
 
-def buildTerritories(iterator, fasta, method, options):
-    """build gene territories.
-
-    Exons in a gene are merged and the resulting segments enlarged by
-    --radius. Territories overlapping are divided in the midpoint
-    between the two genes.
-
-    If *method* is ``gene``, gene territories will be built.
-    If *method* is ``tss``, tss territories will be built.
+def iterator_contigs(iterator, stream=True):
+    """iterate over entries in *iterator* grouped by contig.
 
+    Yields tuples of (contig, entries). If *stream* is True, entries
+    are read one contig at a time and need to be grouped by contig in
+    the input. Otherwise, all entries are collected first and contigs
+    are returned in sorted order.
     """
+    if stream:
+        for contig, entries in itertools.groupby(iterator,
+                                                 key=lambda x: x.contig):
+            yield contig, list(entries)
+    else:
+        contigs = collections.defaultdict(list)
+        for entry in iterator:
+            contigs[entry.contig].append(entry)
+        for contig in sorted(contigs):
+            yield contig, contigs[contig]
 
-    ninput, noutput, nambiguous = 0, 0, 0
-
-    assert method in ("gene", "tss")
 
-    dr = 2 * options.radius
+# options required by the segmentation functions in worker processes
+WORKER_OPTIONS = ("flank", "radius", "upstream", "downstream",
+                  "min_intron_length", "max_frameshift_length",
+                  "ignore_missing")
 
-    prev_pos = 0
-    last_contig = None
-    gff = None
+_worker = {}
 
-    def _iterator(iterator):
-        """yield gene plus the locations of the end of the previous gene and
-        start of next gene"""
 
-        last_end, prev_end = 0, 0
-        last_contig = None
-        last = None
-        for matches in GTF.iterator_overlaps(iterator):
+def _init_worker(genome_file, params):
+    _worker["fasta"] = IndexedFasta.IndexedFasta(genome_file)
+    _worker["params"] = params
 
-            this_start = min([x.start for x in matches])
-            this_end = max([x.end for x in matches])
 
-            if method == "tss":
-                # restrict to tss
-                if matches[0].strand == "+":
-                    this_end = this_start + 1
-                else:
-                    this_start = this_end - 1
+def _segment_contig(args):
+    function, lines, kwargs = args
+    entries = list(GTF.iterator(io.StringIO(lines)))
+    options = argparse.Namespace(stdout=io.StringIO(), **_worker["params"])
+    counter = function(entries, _worker["fasta"], options, **kwargs)
+    return options.stdout.getvalue(), dict(counter.items())
 
-            this_contig = matches[0].contig
 
-            if last_contig != this_contig:
-                if last:
-                    yield prev_end, last, fasta.getLength(last_contig)
-                last_end, prev_end = 0, 0
-            else:
-                yield prev_end, last, this_start
+def segmentContigs(contigs, fasta, function, options, **kwargs):
+    """segment each contig in *contigs* with *function*.
 
-            prev_end = last_end
-            last_end = this_end
-            last = matches
-            last_contig = this_contig
+    *function* is called with the entries on a contig and writes its
+    segments to ``options.stdout``. If ``--num-jobs`` is larger than 1,
+    contigs are segmented in separate processes and the output is
+    written in contig order.
 
-        if last:
-            yield prev_end, last, fasta.getLength(last_contig)
+    Returns a counter with the combined counts.
+    """
+    counter = E.Counter()
 
-    for last_end, matches, next_start in _iterator(iterator):
+    if options.num_jobs > 1:
+        params = dict([(x, getattr(options, x)) for x in WORKER_OPTIONS])
+        pool = multiprocessing.Pool(options.num_jobs,
+                                    initializer=_init_worker,
+                                    initargs=(options.genome_file, params))
+        # entries are sent as text as they can not be pickled
+        tasks = ((function, "".join(["%s\n" % x for x in entries]), kwargs)
+                 for contig, entries in contigs)
+        for output, counts in pool.imap(_segment_contig, tasks):
+            options.stdout.write(output)
+            counter += counts
+        pool.close()
+        pool.join()
+    else:
+        for contig, entries in contigs:
+            counter += function(entries, fasta, options, **kwargs)
 
-        gff = GTF.Entry().copy(matches[0])
+    return counter
 
-        start = min([x.start for x in matches])
-        end = max([x.end for x in matches])
 
-        if method == "tss":
-            # restrict to tss
-            if matches[0].strand == "+":
-                end = start + 1
-            else:
-                start = end - 1
+def buildTerritoriesContig(entries, fasta, options, method="gene"):
+    """build gene territories for *entries* on a single contig.
 
-        d = start - last_end
-        if d < dr:
-            start -= d // 2
-        else:
-            start -= options.radius
+    See :func:`buildTerritories`.
+    """
+    counter = E.Counter()
 
-        d = next_start - end
-        if d < dr:
-            end += d // 2
-        else:
-            end += options.radius
+    groups = list(GTF.iterator_overlaps(iter(entries)))
+    starts = numpy.array([min([x.start for x in g]) for g in groups],
+                         dtype=numpy.int64)
+    ends = numpy.array([max([x.end for x in g]) for g in groups],
+                       dtype=numpy.int64)
+
+    if method == "tss":
+        # restrict to tss
+        is_positive = numpy.array([g[0].strand == "+" for g in groups])
+        starts, ends = (numpy.where(is_positive, starts, ends - 1),
+                        numpy.where(is_positive, starts + 1, ends))
+
+    # end of previous and start of next gene, 0 and the contig
+    # length at the telomeres
+    last_ends = numpy.concatenate(([0], ends[:-1]))
+    next_starts = numpy.concatenate(
+        (starts[1:], [fasta.getLength(entries[0].contig)]))
+
+    # divide territories closer than twice the radius at the midpoint
+    dr = 2 * options.radius
+    d = starts - last_ends
+    starts = numpy.where(d < dr, starts - d // 2, starts - options.radius)
+    d = next_starts - ends
+    ends = numpy.where(d < dr, ends + d // 2, ends + options.radius)
 
+    for matches, start, end in zip(groups, starts, ends):
+        gff = GTF.Entry().copy(matches[0])
         gff.gene_id = ":".join(sorted(set([x.gene_id for x in matches])))
         gff.transcript_id = gff.gene_id
-        gff.start, gff.end = start, end
+        gff.start, gff.end = int(start), int(end)
 
         nsegments = len(matches)
         if nsegments > 1:
             gff.addAttribute("ambiguous", nsegments)
-            nambiguous += 1
+            counter.nambiguous += 1
 
         assert gff.start < gff.end, "invalid segment: %s" % str(gff)
         options.stdout.write(str(gff) + "\n")
-        noutput += 1
+        counter.noutput += 1
+
+    return counter
+
+
+def buildTerritories(iterator, fasta, method, options):
+    """build gene territories.
+
+    Exons in a gene are merged and the resulting segments enlarged by
+    --radius. Territories overlapping are divided in the midpoint
+    between the two genes.
+
+    If *method* is ``gene``, gene territories will be built.
+    If *method* is ``tss``, tss territories will be built.
+
+    The input is processed one contig at a time.
+    """
+
+    assert method in ("gene", "tss")
+
+    counter = segmentContigs(iterator_contigs(iterator),
+                             fasta,
+                             buildTerritoriesContig,
+                             options,
+                             method=method)
 
     E.info("ninput=%i, noutput=%i, nambiguous=%i" %
-           (ninput, noutput, nambiguous))
+           (counter.ninput, counter.noutput, counter.nambiguous))
 
 
-def annotateGenome(iterator, fasta, options):
-    """perform a full segmentation of the genome (UTR, exon, intron ...)
+def annotateGenomeContig(entries, fasta, options):
+    """perform a full segmentation of a single contig.
+
+    See :func:`annotateGenome`.
     """
 
-    ninput, noutput, nadded, nambiguous, nframeshifts, nunknown = 0, 0, 0, 0, 0, 0
+    counter = E.Counter()
     last = None
     is_ambiguous = False
 
-    for this in iterator:
-        ninput += 1
-
-        E.debug("last=%s" % str(last))
-        E.debug("this=%s" % str(this))
-        E.debug("is_ambiguous=%s" % str(is_ambiguous))
+    for this in entries:
+        counter.ninput += 1
 
-        if last and last.contig == this.contig:
+        if last is None:
+            counter.nadded += addIntergenicSegment(None, this, fasta, options)
+            last = this
+        else:
             # check if file is sorted correctly
             assert last.start <= this.start, "input file needs to be sorted by contig, start"
             if last.end <= this.start:
                 if not is_ambiguous:
                     if last.gene_id != this.gene_id:
-                        nadded += addIntergenicSegment(last,
-                                                       this, fasta, options)
+                        counter.nadded += addIntergenicSegment(
+                            last, this, fasta, options)
                     else:
                         d = this.start - last.end
                         if d >= options.min_intron_length:
-                            nadded += addSegment("intronic",
-                                                 last.end,
-                                                 this.start,
-                                                 last,
-                                                 options)
+                            counter.nadded += addSegment("intronic",
+                                                         last.end,
+                                                         this.start,
+                                                         last,
+                                                         options)
                         elif d <= options.max_frameshift_length:
-                            nframeshifts += addSegment("frameshift",
-                                                       last.end,
-                                                       this.start,
-                                                       last,
-                                                       options)
+                            counter.nframeshifts += addSegment("frameshift",
+                                                               last.end,
+                                                               this.start,
+                                                               last,
+                                                               options)
                         else:
-                            nunknown += addSegment("unknown",
-                                                   last.end,
-                                                   this.start,
-                                                   last,
-                                                   options)
+                            counter.nunknown += addSegment("unknown",
+                                                           last.end,
+                                                           this.start,
+                                                           last,
+                                                           options)
                 else:
                     if last.feature == this.feature and \
                        last.gene_id == this.gene_id:
-                        nambiguous += addSegment(
+                        counter.nambiguous += addSegment(
                             last.feature,
                             last.end, this.start,
                             last, options)
                     else:
-                        nambiguous += addSegment(
+                        counter.nambiguous += addSegment(
                             "ambiguous",
                             last.end, this.start,
                             last, options)
@@ -568,17 +639,30 @@ def annotateGenome(iterator, fasta, options):
                     # flag next region as ambiguous
                     is_ambiguous = True
                 last.end = this.end
-        else:
-            nadded += addIntergenicSegment(last, None, fasta, options)
-            nadded += addIntergenicSegment(None, this, fasta, options)
-            last = this
 
         options.stdout.write("%s\n" % str(this))
-        noutput += 1
+        counter.noutput += 1
+
+    counter.nadded += addIntergenicSegment(last, None, fasta, options)
+
+    return counter
+
+
+def annotateGenome(iterator, fasta, options):
+    """perform a full segmentation of the genome (UTR, exon, intron ...)
+
+    The input is processed one contig at a time.
+    """
+
+    counter = segmentContigs(iterator_contigs(iterator),
+                             fasta,
+                             annotateGenomeContig,
+                             options)
 
     E.info(
         "ninput=%i, noutput=%i, nadded=%i, nambiguous=%i, nframeshifts=%i, nunknown=%i" %
-        (ninput, noutput, nadded, nambiguous, nframeshifts, nunknown))
+        (counter.ninput, counter.noutput, counter.nadded,
+         counter.nambiguous, counter.nframeshifts, counter.nunknown))
 
 
 def annotateExons(iterator, fasta, options):
@@ -754,139 +838,127 @@ def annotateRegulons(iterator, fasta, tss, options):
            (ngenes, ntranscripts, nregulons))
 
 
-def annotateGREATDomains(iterator, fasta, options):
-    """build great domains
-
-    extend from TSS a basal region.
+def annotateGREATDomainsContig(entries, fasta, options):
+    """build great domains for *entries* on a single contig.
 
+    See :func:`annotateGREATDomains`.
     """
 
-    gene_iterator = GTF.gene_iterator(iterator)
-
     counter = E.Counter()
 
     upstream, downstream = options.upstream, options.downstream
     radius = options.radius
-    outfile = options.stdout
+    lcontig = fasta.getLength(entries[0].contig)
+
+    # collect transcripts per gene in order of appearance
+    genes = {}
+    for entry in entries:
+        genes.setdefault(entry.gene_id, {}).setdefault(
+            entry.transcript_id, []).append(entry)
 
-    regions = []
     ####################################################################
     # define basal regions for each gene
     # take all basal regions per transcript and merge them
     # Thus, the basal region of a gene might be larger than the sum
     # of options.upstream + options.downstream
-    for gene in gene_iterator:
+    regions, offsets, tx_starts, tx_ends = [], [], [], []
+    for transcripts in genes.values():
         counter.genes += 1
-        is_negative_strand = Genomics.IsNegativeStrand(gene[0][0].strand)
-
-        lcontig = fasta.getLength(gene[0][0].contig)
-        regulons = []
-        transcript_ids = []
-
-        # collect every basal region per transcript
-        for transcript in gene:
+        offsets.append(len(tx_starts))
+        for transcript in transcripts.values():
             counter.transcripts += 1
-            mi, ma = min([x.start for x in transcript]), max(
-                [x.end for x in transcript])
-            # add range to both sides of tss
-            if is_negative_strand:
-                interval = ma - options.downstream, ma + options.upstream
-            else:
-                interval = mi - options.upstream, mi + options.downstream
-
-            interval = (min(lcontig, max(0, interval[0])),
-                        min(lcontig, max(0, interval[1])))
-
-            regulons.append(interval)
-            transcript_ids.append(transcript[0].transcript_id)
-
-        # take first/last entry
-        start, end = min(x[0] for x in regulons), max(x[1] for x in regulons)
+            tx_starts.append(min([x.start for x in transcript]))
+            tx_ends.append(max([x.end for x in transcript]))
 
+        template = next(iter(transcripts.values()))[0]
         gtf = GTF.Entry()
-        gtf.fromGTF(gene[0][0], gene[0][0].gene_id, gene[0][0].gene_id)
+        gtf.fromGTF(template, template.gene_id, template.gene_id)
         gtf.source = "greatdomain"
-        gtf.start, gtf.end = start, end
         regions.append(gtf)
 
-    regions.sort(key=lambda x: (x.contig, x.start))
-
-    outf = iotools.open_file("test.gff", "w")
-    for x in regions:
-        outf.write(str(x) + "\n")
-    outf.close()
+    tx_starts = numpy.array(tx_starts, dtype=numpy.int64)
+    tx_ends = numpy.array(tx_ends, dtype=numpy.int64)
+    is_negative_strand = numpy.repeat(
+        [Genomics.IsNegativeStrand(x.strand) for x in regions],
+        numpy.diff(offsets + [len(tx_starts)]))
+
+    # add range to both sides of tss and take first/last entry per gene
+    starts = numpy.where(is_negative_strand,
+                         tx_ends - downstream,
+                         tx_starts - upstream).clip(0, lcontig)
+    ends = numpy.where(is_negative_strand,
+                       tx_ends + upstream,
+                       tx_starts + downstream).clip(0, lcontig)
+    starts = numpy.minimum.reduceat(starts, offsets)
+    ends = numpy.maximum.reduceat(ends, offsets)
 
     ####################################################################
     # extend basal regions
-    regions.sort(key=lambda x: (x.contig, x.start))
-
-    # iterate within groups of overlapping basal regions
-    groups = list(GTF.iterator_overlaps(iter(regions)))
-    counter.groups = len(groups)
+    order = numpy.argsort(starts, kind="stable")
+    regions = [regions[x] for x in order]
+    starts, ends = starts[order], ends[order]
+    is_positive = numpy.array([x.strand == "+" for x in regions])
+
+    # groups of overlapping basal regions
+    nregions = len(regions)
+    max_ends = numpy.maximum.accumulate(ends)
+    is_first = numpy.ones(nregions, dtype=bool)
+    is_first[1:] = starts[1:] >= max_ends[:-1]
+    first = numpy.flatnonzero(is_first)
+    group_ids = numpy.cumsum(is_first) - 1
+    group_sizes = numpy.diff(numpy.append(first, nregions))
+
+    # last_end = basal extension of previous group
+    # next_start = basal_extension of next group
+    last_ends = numpy.append(0, max_ends[first[1:] - 1])[group_ids]
+    next_starts = numpy.append(starts[first[1:]], lcontig)[group_ids]
+
+    # a position overlaps another basal region within its group if
+    # that region starts before and ends after it. Regions in other
+    # groups end before or start after any position in the group.
+    pos = numpy.where(is_positive, starts, ends)
+    nbefore = numpy.searchsorted(starts, pos, side="left")
+    overlaps_basal = (nbefore > 0) & \
+        (max_ends[numpy.maximum(nbefore - 1, 0)] > pos)
+
+    # extend region to previous/next group always extend
+    # dowstream, but upstream only extend if basal region of an
+    # interval is not already overlapping another basal region
+    # within the group
+    starts = numpy.where(is_positive & overlaps_basal,
+                         starts,
+                         numpy.maximum(starts - radius, last_ends))
+    ends = numpy.where(~is_positive & overlaps_basal,
+                       ends,
+                       numpy.minimum(ends + radius, next_starts))
+
+    for gtf, start, end in zip(regions, starts, ends):
+        gtf.start, gtf.end = int(start), int(end)
+        options.stdout.write(str(gtf) + "\n")
+
+    counter.groups += len(first)
+    counter.regulons += nregions
+    counter.overlaps += int(group_sizes[group_sizes > 1].sum())
+    counter.nonoverlaps += int((group_sizes == 1).sum())
+
+    return counter
 
-    last_end = 0
-    reset = False
 
-    for region_id, group in enumerate(groups):
+def annotateGREATDomains(iterator, fasta, options):
+    """build great domains
 
-        # collect basal intervals in group
-        intervals = [(x.start, x.end) for x in group]
+    extend from TSS a basal region.
 
-        def overlapsBasalRegion(pos):
-            for start, end in intervals:
-                if start == pos or end == pos:
-                    continue
-                if start <= pos < end:
-                    return True
-                if start > pos:
-                    return False
-            return False
-
-        # deal with boundary cases - end of contig
-        if region_id < len(groups) - 1:
-            nxt = groups[region_id + 1]
-            if nxt[0].contig == group[0].contig:
-                next_start = min([x.start for x in nxt])
-            else:
-                next_start = fasta.getLength(group[0].contig)
-                reset = True
-        else:
-            next_start = fasta.getLength(group[0].contig)
-            reset = True
-
-        # last_end = basal extension of previous group
-        # next_start = basal_extension of next group
-
-        # extend region to previous/next group always extend
-        # dowstream, but upstream only extend if basal region of an
-        # interval is not already overlapping another basal region
-        # within the group
-        save_end = 0
-        for gtf in group:
-            save_end = max(save_end, gtf.end)
-            if gtf.strand == "+":
-                if not overlapsBasalRegion(gtf.start):
-                    gtf.start = max(gtf.start - radius, last_end)
-                # always extend downstream
-                gtf.end = min(gtf.end + radius, next_start)
-            else:
-                # always extend downstream
-                gtf.start = max(gtf.start - radius, last_end)
-                if not overlapsBasalRegion(gtf.end):
-                    gtf.end = min(gtf.end + radius, next_start)
-            outfile.write(str(gtf) + "\n")
-            counter.regulons += 1
-
-        if len(group) > 1:
-            counter.overlaps += len(group)
-        else:
-            counter.nonoverlaps += 1
+    Basal regions and their extensions are computed per contig. If
+    ``--stream-contigs`` is set, the input is read one contig at a
+    time, otherwise all genes are collected first.
+    """
 
-        if reset:
-            last_end = 0
-            reset = False
-        else:
-            last_end = save_end
+    counter = segmentContigs(
+        iterator_contigs(iterator, stream=options.stream_contigs),
+        fasta,
+        annotateGREATDomainsContig,
+        options)
 
     E.info("%s" % str(counter))
 
@@ -1153,6 +1225,17 @@ def main(argv=None):
         help="sort input before processing. Otherwise, the input is assumed "
         "to be sorted.")
 
+    parser.add_argument(
+        "--stream-contigs", dest="stream_contigs", action="store_true",
+        help="read the input one contig at a time for --method=great-domains "
+        "instead of collecting the full gene set. The input needs to be "
+        "grouped by contig.")
+
+    parser.add_argument(
+        "--num-jobs", dest="num_jobs", type=int,
+        help="number of processes segmenting contigs in parallel for "
+        "--method=genome, territories, tss-territories and great-domains.")
+
     parser.set_defaults(
         genome_file=None,
         flank=1000,
@@ -1169,6 +1252,8 @@ def main(argv=None):
         downstream=5000,
         detail="exons",
         is_sorted=True,
+        stream_contigs=False,
+        num_jobs=1,
     )
 
     (args) = E.start(parser)
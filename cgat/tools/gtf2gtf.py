@@ -52,6 +52,12 @@ Sorting gene sets
    N.B. position+gene sorts by gene_id, start, then subsequently sorts
    flattened gene lists by contig, start
 
+   By default, the gene set is sorted in memory. Use
+   ``--sort-method=external`` to sort large gene sets with bounded
+   memory. Entries are then sorted in runs of ``--sort-buffer-size``
+   entries, which are written to temporary files and merged. The
+   output is the same for both methods.
+
 
 Manipulating gene-models
 ++++++++++++++++++++++++
@@ -167,6 +173,12 @@ appear consecutively within the file. This can be achevied using
     When filtering on the basis of gene-id, transcript-id or longest-gene,
     ``--invert-filter`` may be used to invert the selection.
 
+    When filtering on the basis of gene-id or transcript-id, the
+    entries can be read from a :term:`gtf` file indexed with tabix
+    (``--indexed-gtf-file``) instead of the standard input. Only the
+    regions containing the selected genes or transcripts are read.
+    An index can be built with :func:`GTF.buildIndexedGTF`.
+
 ``remove-overlapping``
     Given a second :term:`gff` formatted file (``--file-gff``) removes
     any features overlapping. Any transcripts that intersect intervals
@@ -387,6 +399,19 @@ def main(argv=None):
                                  "gene+exon"),
                         help="sort input data.")
 
+    parser.add_argument("--sort-method",
+                        dest="sort_method",
+                        type=str,
+                        choices=("memory", "external"),
+                        help="sort in memory or with bounded memory "
+                        "using temporary files.")
+
+    parser.add_argument("--sort-buffer-size",
+                        dest="sort_buffer_size",
+                        type=int,
+                        help="number of entries to keep in memory when "
+                        "sorting with --sort-method=external.")
+
     parser.add_argument("--mark-utr",
                         dest="mark_utr",
                         action="store_true",
@@ -433,6 +458,13 @@ def main(argv=None):
         help="second filename of features (see --remove-overlapping) "
         )
 
+    parser.add_argument("--indexed-gtf-file", dest="filename_indexed",
+                        type=str,
+                        metavar="GTF",
+                        help="bgzip compressed and tabix indexed gtf file "
+                        "to read entries from when filtering by gene or "
+                        "transcript with --map-tsv-file. ")
+
     parser.add_argument("--invert-filter",
                         dest="invert_filter",
                         action="store_true",
@@ -519,6 +551,8 @@ def main(argv=None):
 
     parser.set_defaults(
         sort_order="gene",
+        sort_method="memory",
+        sort_buffer_size=1000000,
         filter_method="gene",
         pattern="%i",
         merge_exons_distance=0,
@@ -531,6 +565,7 @@ def main(argv=None):
         mark_utr=False,
         with_utr=True,
         invert_filter=False,
+        filename_indexed=None,
         duplicate_feature=None,
         strict=True,
         method=None,
@@ -674,8 +709,16 @@ def main(argv=None):
 
     elif "sort" == args.method:
 
-        for gff in GTF.iterator_sorted(GTF.iterator(args.stdin),
-                                       sort_order=args.sort_order):
+        if args.sort_method == "external":
+            iterator = GTF.iterator_sorted_external(
+                GTF.iterator(args.stdin),
+                sort_order=args.sort_order,
+                max_entries=args.sort_buffer_size)
+        else:
+            iterator = GTF.iterator_sorted(GTF.iterator(args.stdin),
+                                           sort_order=args.sort_order)
+
+        for gff in iterator:
             ninput += 1
             args.stdout.write("%s\n" % str(gff))
             noutput += 1
@@ -1024,7 +1067,20 @@ def main(argv=None):
                 invert = args.invert_filter
 
                 ignore_strand = args.ignore_strand
-                for gff in GTF.iterator(args.stdin):
+                if args.filename_indexed:
+                    if invert:
+                        raise ValueError(
+                            "--invert-filter can not be used with "
+                            "--indexed-gtf-file")
+                    index = GTF.IndexedGTF(args.filename_indexed)
+                    if by_gene:
+                        iterator = index.iterator_ids(ids, by="gene")
+                    else:
+                        iterator = index.iterator_ids(ids, by="transcript")
+                else:
+                    iterator = GTF.iterator(args.stdin)
+
+                for gff in iterator:
 
                     ninput += 1
 
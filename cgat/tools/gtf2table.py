@@ -113,6 +113,11 @@ composition-cgp
    output CpG count, CpG density and CpG observed / expected for
    each transcript/gene.
 
+motif
+   output number of occurrences of one or more nucleotide motifs in
+   IUPAC notation in the sequence of each transcript/gene (see options
+   ``--motif-sequence`` and ``--motif-both-strands``).
+
 splice
    output splicing summary of transcript/gene. Outputs the number of
    canonical and non-canonical splice sites.
@@ -444,6 +449,19 @@ convention. A summary is `here
 For unstranded protocols, all reads and pairs are considered to matching
 in the sense direction.
 
+Index cache
+-----------
+
+The ``distance`` and ``proximity`` counters build an index of the
+intervals in ``--gff-file`` before counting. For large annotation
+sets this can take longer than the counting itself. With the option
+``--index-cache-dir``, built indices are saved in a directory and
+memory-mapped by subsequent runs. Indices are looked up by a checksum
+of the contents of ``--gff-file`` together with the counter and the
+``--restrict-source`` and ``--restrict-feature`` options, so changes
+to the file cause the index to be rebuilt. The least recently used
+indices are removed if the cache exceeds ``--index-cache-size``.
+
 Usage
 -----
 
@@ -465,8 +483,10 @@ import cgatcore.experiment as E
 import cgat.GTF as GTF
 import cgat.IndexedFasta as IndexedFasta
 import cgat.GeneModelAnalysis as GeneModelAnalysis
+import cgat.Motifs as Motifs
 
-import pyBigWig
+import cgat.LazyImport as LazyImport
+pyBigWig = LazyImport.LazyModule("pyBigWig")
 
 
 def main(argv=None):
@@ -538,6 +558,7 @@ def main(argv=None):
                                  "distance-genes",
                                  "distance-tss",
                                  "length",
+                                 "motif",
                                  'neighbours',
                                  "overlap",
                                  "overlap-stranded",
@@ -560,6 +581,18 @@ def main(argv=None):
                                  "territories"),
                         help="select counters to apply to input ")
 
+    parser.add_argument("--motif-sequence", dest="motif_sequences",
+                        type=str,
+                        action="append",
+                        help="nucleotide motif in IUPAC notation to count "
+                        "(for counter: motif). The option can be given "
+                        "multiple times.")
+
+    parser.add_argument("--motif-both-strands", dest="motif_both_strands",
+                        action="store_true",
+                        help="count motifs on both strands "
+                        "(for counter: motif).")
+
     parser.add_argument("--add-gtf-source", dest="add_gtf_source",
                         action="store_true",
                         help="add gtf field of source to output ")
@@ -569,6 +602,19 @@ def main(argv=None):
                         help="distance to be considered proximal to "
                         "an interval.")
 
+    parser.add_argument("--index-cache-dir", dest="index_cache_dir",
+                        type=str,
+                        help="directory to cache indices built from "
+                        "--gff-file. Subsequent runs with the same file "
+                        "and counter load the index from the cache. "
+                        "Applies to the distance and proximity counters.")
+
+    parser.add_argument("--index-cache-size", dest="index_cache_size",
+                        type=float,
+                        help="maximum size of the index cache in Mb. "
+                        "The least recently used indices are removed "
+                        "if the cache is larger.")
+
     parser.add_argument("--multi-mapping-method",
                         dest="multi_mapping",
                         type=str,
@@ -630,13 +676,17 @@ def main(argv=None):
         gff_sources=[],
         add_gtf_source=False,
         proximal_distance=10000,
+        index_cache_dir=None,
+        index_cache_size=1000,
         bam_files=None,
         multi_mapping='all',
         library_type='fr-unstranded',
         prefixes=[],
         minimum_mapping_quality=0,
         use_barcodes=False,
-        sample_probability=1.0
+        sample_probability=1.0,
+        motif_sequences=[],
+        motif_both_strands=False,
     )
 
     if not argv:
@@ -803,6 +853,20 @@ def main(argv=None):
                     fasta=fasta,
                     section=section,
                     options=args, prefix=prefix))
+        elif c == "motif":
+            if fasta is None:
+                raise ValueError('motif requires a genomic sequence')
+            if not args.motif_sequences:
+                raise ValueError('motif requires a motif sequence')
+            scanner = Motifs.MotifScanner(
+                args.motif_sequences,
+                both_strands=args.motif_both_strands)
+            for section in args.sections:
+                counters.append(GeneModelAnalysis.CounterMotif(
+                    scanner,
+                    fasta=fasta,
+                    section=section,
+                    options=args, prefix=prefix))
 
         elif c in ("overlap",
                    "overlap-stranded",
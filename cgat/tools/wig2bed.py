@@ -41,7 +41,8 @@ import cgatcore.experiment as E
 import cgat.IndexedFasta as IndexedFasta
 import cgatcore.iotools as iotools
 
-import pyBigWig
+import cgat.LazyImport as LazyImport
+pyBigWig = LazyImport.LazyModule("pyBigWig")
 
 
 def block_iterator(infile, contig, size, chunk_size=10000000):
@@ -0,0 +1,161 @@
+'''
+cgat_benchmark_intervals.py - compare list and array interval algebra
+=====================================================================
+
+Purpose
+-------
+
+Time the list-based functions in :mod:`cgat.Intervals` against their
+numpy array equivalents such as :func:`cgat.Intervals.combineArray`
+on genome-scale interval sets.
+
+By default, exon-like intervals are simulated. Alternatively, exons
+are read from a :term:`gtf` formatted file and the algebra is applied
+to the exons of each contig.
+
+Usage
+-----
+
+Example::
+
+   python scripts/cgat_benchmark_intervals.py --num-intervals=500000
+   python scripts/cgat_benchmark_intervals.py --gtf-file=geneset.gtf.gz
+
+The output is a tab-separated table with the time in seconds for each
+function and implementation. Times for the array functions exclude the
+conversion from lists.
+
+Command line options
+--------------------
+
+'''
+
+import argparse
+import collections
+import random
+import sys
+import timeit
+
+import cgatcore.iotools as iotools
+import cgat.Intervals as Intervals
+import cgat.GTF as GTF
+
+
+def simulateIntervals(num_intervals, seed=1):
+    '''simulate two sets of exon-like intervals on a single contig.'''
+    random.seed(seed)
+    sets = []
+    for x in range(2):
+        intervals = []
+        position = 0
+        for y in range(num_intervals):
+            # overlapping exons of alternative transcripts
+            position += random.randint(-100, 2000)
+            position = max(0, position)
+            intervals.append((position, position + random.randint(50, 300)))
+        sets.append(intervals)
+    return {"sim": sets}
+
+
+def readIntervals(filename):
+    '''read exons per contig from *filename*. The second set are the
+    introns between exons of each transcript.'''
+    exons = collections.defaultdict(list)
+    introns = collections.defaultdict(list)
+    with iotools.open_file(filename) as inf:
+        for transcript in GTF.transcript_iterator(GTF.iterator(inf)):
+            segments = sorted([(x.start, x.end) for x in transcript
+                               if x.feature == "exon"])
+            exons[transcript[0].contig].extend(segments)
+            introns[transcript[0].contig].extend(
+                Intervals.complement(segments))
+    return dict([(contig, (exons[contig], introns[contig]))
+                 for contig in exons])
+
+
+def timeFunction(function, data, repeats):
+    '''return time of best run of *function* over all contigs.'''
+    def run():
+        for a, b in data.values():
+            function(a, b)
+    return min(timeit.repeat(run, number=1, repeat=repeats))
+
+
+def main(argv=None):
+    """script main.
+    parses command line options in sys.argv, unless *argv* is given.
+    """
+
+    if argv is None:
+        argv = sys.argv
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark interval algebra.')
+
+    parser.add_argument("-n", "--num-intervals", dest="num_intervals",
+                        type=int, default=500000,
+                        help="number of intervals to simulate")
+
+    parser.add_argument("-g", "--gtf-file", dest="gtf_file",
+                        type=str, default=None,
+                        help="read exons from gtf file instead of "
+                        "simulating")
+
+    parser.add_argument("-r", "--repeats", dest="repeats",
+                        type=int, default=3,
+                        help="number of repeats, the best time is "
+                        "reported")
+
+    options = parser.parse_args(argv[1:])
+
+    if options.gtf_file:
+        data = readIntervals(options.gtf_file)
+    else:
+        data = simulateIntervals(options.num_intervals)
+
+    # merged sets are required by the intersection functions
+    merged = dict([(contig, (Intervals.combine(list(a)),
+                             Intervals.combine(list(b))))
+                   for contig, (a, b) in data.items()])
+    arrays = dict([(contig, (Intervals.asIntervalArray(a),
+                             Intervals.asIntervalArray(b)))
+                   for contig, (a, b) in merged.items()])
+    raw_arrays = dict([(contig, (Intervals.asIntervalArray(a),
+                                 Intervals.asIntervalArray(b)))
+                       for contig, (a, b) in data.items()])
+
+    functions = (
+        ("combine", data, raw_arrays,
+         lambda a, b: Intervals.combine(list(a)),
+         lambda a, b: Intervals.combineArray(a)),
+        ("complement", data, raw_arrays,
+         lambda a, b: Intervals.complement(list(a)),
+         lambda a, b: Intervals.complementArray(a)),
+        ("combineAtDistance", data, raw_arrays,
+         lambda a, b: Intervals.combineAtDistance(list(a), 100),
+         lambda a, b: Intervals.combineAtDistanceArray(a, 100)),
+        ("intersect", merged, arrays,
+         lambda a, b: Intervals.intersect(list(a), list(b)),
+         lambda a, b: Intervals.intersectArray(a, b)),
+        ("truncate", merged, arrays,
+         lambda a, b: Intervals.truncate(list(a), list(b)),
+         lambda a, b: Intervals.truncateArray(a, b)),
+        ("calculateOverlap", merged, arrays,
+         lambda a, b: Intervals.calculateOverlap(list(a), list(b)),
+         lambda a, b: Intervals.calculateOverlapArray(a, b)))
+
+    ninput = sum([len(a) for a, b in data.values()])
+    sys.stdout.write("# contigs=%i intervals=%i\n" % (len(data), ninput))
+    sys.stdout.write("function\tlist\tarray\tspeedup\n")
+
+    for name, list_data, array_data, list_function, array_function in \
+            functions:
+        list_time = timeFunction(list_function, list_data, options.repeats)
+        array_time = timeFunction(
+            array_function, array_data, options.repeats)
+        sys.stdout.write("%s\t%.4f\t%.4f\t%.1f\n" % (
+            name, list_time, array_time, list_time / max(array_time, 1e-9)))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
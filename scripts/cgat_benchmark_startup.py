@@ -0,0 +1,185 @@
+'''
+cgat_benchmark_startup.py - measure and compare start-up time of cgat tools
+===========================================================================
+
+Purpose
+-------
+
+Measure the time it takes to start cgat tools, that is the time to
+start a new interpreter and to import a tool, and the time for
+``cgat --help`` to list the tools.
+
+The timings can be saved and used as a baseline for later runs to
+detect regressions in start-up latency, for example after adding a
+module level import of a heavy module to a tool. A tool is reported
+as a regression if its start-up time exceeds the baseline by more
+than a factor of ``--max-slowdown`` and by more than
+``--min-difference`` seconds.
+
+Usage
+-----
+
+Example::
+
+   python scripts/cgat_benchmark_startup.py > baseline.tsv
+   python scripts/cgat_benchmark_startup.py --baseline=baseline.tsv
+
+The output is a tab-separated table with the best time in seconds
+for each tool. Tools that can not be imported are reported with the
+status ``error``. If a baseline is given, the baseline time, the
+ratio and the status ``regression`` are added and the script exits
+with status 1 if there are any regressions.
+
+Use ``cgat --profile-startup <tool>`` to find the modules
+responsible for a regression.
+
+Command line options
+--------------------
+
+'''
+
+import argparse
+import os
+import subprocess
+import sys
+import timeit
+
+import cgat.ToolRegistry as ToolRegistry
+
+# root directory of the cgat package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def buildEnvironment():
+    '''return environment for child processes that imports cgat from
+    this repository.'''
+    environ = os.environ.copy()
+    environ["PYTHONPATH"] = os.pathsep.join(
+        [ROOT] + [x for x in environ.get("PYTHONPATH", "").split(os.pathsep)
+                  if x])
+    return environ
+
+
+def timeStatement(statement, environ, repeats, python=None):
+    '''return time of best run of python *statement* in a new
+    interpreter or None if the statement fails.'''
+    if python is None:
+        python = sys.executable
+
+    def run():
+        return subprocess.call([python, "-c", statement],
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL,
+                               env=environ)
+
+    if run() != 0:
+        return None
+    return min(timeit.repeat(run, number=1, repeat=repeats))
+
+
+def readBaseline(filename):
+    '''read times from output of a previous run.'''
+    baseline = {}
+    with open(filename) as inf:
+        for line in inf:
+            if line.startswith("#") or line.startswith("tool\t"):
+                continue
+            fields = line[:-1].split("\t")
+            if fields[2] == "error":
+                continue
+            baseline[fields[0]] = float(fields[1])
+    return baseline
+
+
+def main(argv=None):
+    """script main.
+    parses command line options in sys.argv, unless *argv* is given.
+    """
+
+    if argv is None:
+        argv = sys.argv
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark start-up time of cgat tools.')
+
+    parser.add_argument("-t", "--tools", dest="tools",
+                        type=str, default=None,
+                        help="comma separated list of tools to benchmark. "
+                        "The default is to benchmark all tools")
+
+    parser.add_argument("-r", "--repeats", dest="repeats",
+                        type=int, default=5,
+                        help="number of repeats, the best time is "
+                        "reported")
+
+    parser.add_argument("-b", "--baseline", dest="baseline",
+                        type=str, default=None,
+                        help="output of a previous run to compare to")
+
+    parser.add_argument("--max-slowdown", dest="max_slowdown",
+                        type=float, default=1.25,
+                        help="maximum ratio of time to baseline time")
+
+    parser.add_argument("--min-difference", dest="min_difference",
+                        type=float, default=0.05,
+                        help="minimum difference in seconds to baseline "
+                        "time to report a regression")
+
+    options = parser.parse_args(argv[1:])
+
+    if options.tools:
+        tools = options.tools.split(",")
+    else:
+        tools = ToolRegistry.listTools(os.path.join(ROOT, "cgat", "tools"))
+
+    baseline = {}
+    if options.baseline:
+        baseline = readBaseline(options.baseline)
+
+    environ = buildEnvironment()
+
+    statements = [("python", "pass"),
+                  ("cgat --help",
+                   "import sys; sys.argv = ['cgat', '--help']; "
+                   "from cgat.cgat import main; main()")]
+    statements.extend([(tool, "import cgat.tools.%s" % tool)
+                       for tool in tools])
+
+    header = ["tool", "time", "status"]
+    if baseline:
+        header.extend(["baseline", "ratio"])
+    sys.stdout.write("\t".join(header) + "\n")
+
+    nregressions = 0
+    for name, statement in statements:
+        t = timeStatement(statement, environ, options.repeats)
+        if t is None:
+            sys.stdout.write("%s\t\terror\n" % name)
+            continue
+
+        status, extra = "ok", []
+        if baseline:
+            reference = baseline.get(name, None)
+            if reference is None:
+                extra = ["", ""]
+            else:
+                if t > reference * options.max_slowdown and \
+                   t - reference > options.min_difference:
+                    status = "regression"
+                    nregressions += 1
+                extra = ["%.4f" % reference,
+                         "%.2f" % (t / max(reference, 1e-9))]
+
+        sys.stdout.write("\t".join(
+            [name, "%.4f" % t, status] + extra) + "\n")
+        sys.stdout.flush()
+
+    if nregressions:
+        sys.stderr.write("%i tools start more slowly than the baseline\n" %
+                         nregressions)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -54,6 +54,7 @@ if LooseVersion(setuptools.__version__) < LooseVersion('1.1'):
     raise ImportError(
         "the CGAT code collection requires setuptools 1.1 higher")
 
+from setuptools.command.build_py import build_py
 from Cython.Distutils import build_ext
 
 ########################################################################
@@ -68,6 +69,9 @@ import version
 
 version = version.__version__
 
+# registry of tools and keywords used by "cgat --help"
+import ToolRegistry
+
 ###############################################################
 ###############################################################
 # Check for external dependencies
@@ -293,6 +297,26 @@ extensions = [
 ]
 
 
+class build_py_with_registry(build_py):
+    '''build python modules and the registry of tools.'''
+
+    def run(self):
+        build_py.run(self)
+        path = os.path.join(self.build_lib, "cgat", "tools")
+        if os.path.exists(path):
+            ToolRegistry.writeRegistry(path)
+
+
+class build_ext_with_registry(build_ext):
+    '''build extensions and, for in-place builds, the registry of
+    tools.'''
+
+    def run(self):
+        build_ext.run(self)
+        if self.inplace:
+            ToolRegistry.writeRegistry(os.path.join("cgat", "tools"))
+
+
 setup(
     # package information
     name='cgat',
@@ -318,7 +342,8 @@ setup(
     dependency_links=dependency_links,
     # extension modules
     ext_modules=extensions,
-    cmdclass={'build_ext': build_ext},
+    cmdclass={'build_py': build_py_with_registry,
+              'build_ext': build_ext_with_registry},
     # other options
     zip_safe=False,
     test_suite="tests",
@@ -0,0 +1,223 @@
+"""unit testing module for the Blat.py module."""
+
+import gzip
+import io
+import os
+import random
+import unittest
+
+import cgat.Blat as Blat
+
+
+def buildMatch(sbjct_id, sbjct_starts, block_sizes, query_id="read"):
+    match = Blat.Match()
+    match.mQueryId = query_id
+    match.mSbjctId = sbjct_id
+    match.mBlockSizes = list(block_sizes)
+    match.mSbjctBlockStarts = list(sbjct_starts)
+    match.mQueryBlockStarts = []
+    offset = 0
+    for size in block_sizes:
+        match.mQueryBlockStarts.append(offset)
+        offset += size
+    match.mNBlocks = len(block_sizes)
+    match.mSbjctFrom = sbjct_starts[0]
+    match.mSbjctTo = sbjct_starts[-1] + block_sizes[-1]
+    match.mQueryFrom, match.mQueryTo = 0, offset
+    return match
+
+
+def buildMatches(n, size=2000):
+    matches = []
+    for x in range(n):
+        start = random.randint(0, size)
+        starts, sizes = [], []
+        for y in range(random.randint(1, 3)):
+            starts.append(start)
+            sizes.append(random.randint(1, 20))
+            start += sizes[-1] + random.randint(1, 50)
+        matches.append(buildMatch("chr1", starts, sizes))
+    return matches
+
+
+def getResidues(match):
+    residues = set()
+    for start, size in zip(match.mSbjctBlockStarts, match.mBlockSizes):
+        residues.update(range(start, start + size))
+    return residues
+
+
+def getComponentsBruteForce(matches, max_distance=0, min_overlap=0):
+    """link all pairs of matches by comparing residues."""
+    residues = [getResidues(x) for x in matches]
+    parent = list(range(len(matches)))
+
+    def find(x):
+        while parent[x] != x:
+            x = parent[x]
+        return x
+
+    for x in range(len(matches)):
+        for y in range(x):
+            if min_overlap > 0:
+                linked = len(residues[x] & residues[y]) >= min_overlap
+            else:
+                linked = min([abs(a - b) for a in residues[x]
+                              for b in residues[y]]) <= max_distance
+            if linked:
+                parent[find(x)] = find(y)
+
+    components = {}
+    for x in range(len(matches)):
+        components.setdefault(find(x), []).append(x)
+    return normalize(components.values())
+
+
+def normalize(components):
+    return sorted([sorted(x) for x in components])
+
+
+class ComponentsCheck(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+        self.matches = buildMatches(150)
+
+    def testDistance(self):
+        for max_distance in (0, 1, 5, 30):
+            self.assertEqual(
+                normalize(Blat.getComponents(self.matches,
+                                             max_distance=max_distance)),
+                getComponentsBruteForce(self.matches,
+                                        max_distance=max_distance))
+
+    def testOverlap(self):
+        for min_overlap in (1, 5, 10):
+            self.assertEqual(
+                normalize(Blat.getComponents(self.matches,
+                                             min_overlap=min_overlap)),
+                getComponentsBruteForce(self.matches,
+                                        min_overlap=min_overlap))
+
+    def testAdjacent(self):
+        matches = [buildMatch("chr1", [0], [10]),
+                   buildMatch("chr1", [10], [10]),
+                   buildMatch("chr1", [25], [10])]
+        self.assertEqual(normalize(Blat.getComponents(matches)),
+                         [[0], [1], [2]])
+        self.assertEqual(
+            normalize(Blat.getComponents(matches, max_distance=1)),
+            [[0, 1], [2]])
+        self.assertEqual(
+            normalize(Blat.getComponents(matches, max_distance=6)),
+            [[0, 1, 2]])
+
+    def testGapsAreNotAligned(self):
+        # the second match lies within the intron of the first
+        matches = [buildMatch("chr1", [0, 100], [10, 10]),
+                   buildMatch("chr1", [40], [10])]
+        self.assertEqual(normalize(Blat.getComponents(matches)),
+                         [[0], [1]])
+        self.assertEqual(
+            normalize(Blat.getComponents(matches, max_distance=31)),
+            [[0, 1]])
+
+    def testBothThresholds(self):
+        self.assertRaises(ValueError, Blat.getComponents, self.matches,
+                          max_distance=1, min_overlap=1)
+
+    def testEmpty(self):
+        self.assertEqual(list(Blat.getComponents([])), [])
+
+
+class OverlapIteratorCheck(unittest.TestCase):
+
+    def testTargetOverlap(self):
+        matches = [buildMatch("chr1", [0], [10]),
+                   buildMatch("chr1", [5], [10]),
+                   buildMatch("chr1", [20], [10]),
+                   buildMatch("chr2", [0], [10])]
+        chunks = list(Blat.iterator_target_overlap(iter(matches), 0))
+        self.assertEqual([len(x) for x in chunks], [2, 1, 1])
+        chunks = list(Blat.iterator_target_overlap(iter(matches), 6))
+        self.assertEqual([len(x) for x in chunks], [3, 1])
+
+    def testUnsorted(self):
+        matches = [buildMatch("chr1", [20], [10]),
+                   buildMatch("chr1", [0], [10])]
+        self.assertRaises(ValueError, list,
+                          Blat.iterator_target_overlap(iter(matches), 0))
+        matches = [buildMatch("chr1", [0], [10]),
+                   buildMatch("chr2", [0], [10]),
+                   buildMatch("chr1", [20], [10])]
+        self.assertRaises(ValueError, list,
+                          Blat.iterator_target_overlap(iter(matches), 0))
+
+    def testQueryOverlap(self):
+        matches = [buildMatch("chr1", [0], [10], query_id="a"),
+                   buildMatch("chr2", [0], [10], query_id="a"),
+                   buildMatch("chr1", [0], [10], query_id="b")]
+        chunks = list(Blat.iterator_query_overlap(iter(matches), 0))
+        self.assertEqual([len(x) for x in chunks], [2, 1])
+
+
+class RecordsCheck(unittest.TestCase):
+
+    filename = os.path.join(os.path.dirname(__file__),
+                            "gff2psl.py", "withoutseqs.psl.gz")
+
+    def setUp(self):
+        with gzip.open(self.filename, "rt") as inf:
+            self.text = inf.read()
+        self.lines = [x for x in self.text.split("\n")
+                      if x and x[0].isdigit()]
+
+    def testRecords(self):
+        records = list(Blat.iterator_records(io.StringIO(self.text)))
+        self.assertEqual(len(records), len(self.lines))
+        for record, line in zip(records, self.lines):
+            match = Blat.Match()
+            match.fromTable(line.split("\t"))
+            self.assertEqual(str(record), line)
+            self.assertEqual(str(record.toMatch()), line)
+            self.assertEqual(record.getBlocks(), match.getBlocks())
+            self.assertEqual(record.mPid, match.mPid)
+            self.assertEqual(record.mQueryCoverage, match.mQueryCoverage)
+
+    def testRecordsAreSlotted(self):
+        record = next(Blat.iterator_records(io.StringIO(self.text)))
+        self.assertRaises(AttributeError, setattr, record, "mOther", 1)
+        other = record.copy()
+        other.mSbjctBlockStarts += 10
+        self.assertNotEqual(str(other), str(record))
+
+    def testColumns(self):
+        records = list(Blat.iterator_records(io.StringIO(self.text)))
+        chunks = list(Blat.iterator_columns(io.StringIO(self.text),
+                                            chunk_size=10))
+        self.assertEqual(sum([len(x["matches"]) for x in chunks]),
+                         len(records))
+        idx = 0
+        for chunk in chunks:
+            offsets = chunk["blockOffsets"]
+            for x in range(len(chunk["matches"])):
+                record = records[idx]
+                self.assertEqual(chunk["qName"][x], record.mQueryId)
+                self.assertEqual(chunk["tEnd"][x], record.mSbjctTo)
+                self.assertEqual(
+                    chunk["tStarts"][offsets[x]:offsets[x + 1]].tolist(),
+                    record.mSbjctBlockStarts.tolist())
+                idx += 1
+
+    def testParsingError(self):
+        self.assertRaises(Blat.ParsingError, list,
+                          Blat.iterator_records(io.StringIO("1\t2\n")))
+        line = self.lines[0].split("\t")
+        line[17] = "5"
+        self.assertRaises(Blat.ParsingError, list,
+                          Blat.iterator_columns(
+                              io.StringIO("\t".join(line) + "\n")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+"""unit testing module for the Components extension."""
+
+import random
+import unittest
+
+import numpy
+
+import cgat.Components as Components
+
+
+def normalize(components):
+    return sorted([sorted(x) for x in components])
+
+
+class IComponentsCheck(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+        self.edges = [(random.randint(0, 500), random.randint(0, 500))
+                      for x in range(400)]
+
+    def testAddEdges(self):
+        single = Components.IComponents()
+        njoined = sum([single.add(a, b) for a, b in self.edges])
+        bulk = Components.IComponents()
+        a, b = list(zip(*self.edges))
+        self.assertEqual(bulk.addEdges(numpy.array(a), numpy.array(b)),
+                         njoined)
+        self.assertEqual(normalize(bulk.getComponents()),
+                         normalize(single.getComponents()))
+
+    def testLabels(self):
+        c = Components.IComponents()
+        c.addEdges([1, 1, 4, 6], [2, 3, 5, 6])
+        self.assertEqual(c.getTokens().tolist(), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(c.getLabels().tolist(), [0, 0, 0, 1, 1, 2])
+        self.assertEqual(c.getComponents(), [[1, 2, 3], [4, 5], [6]])
+
+    def testLabelsMatchComponents(self):
+        c = Components.IComponents()
+        a, b = list(zip(*self.edges))
+        c.addEdges(a, b)
+        tokens, labels = c.getTokens(), c.getLabels()
+        for token, label in zip(tokens, labels):
+            self.assertEqual(c.get(token), c.get(tokens[labels == label][0]))
+
+    def testEmpty(self):
+        c = Components.IComponents()
+        self.assertEqual(c.addEdges([], []), 0)
+        self.assertEqual(c.getComponents(), [])
+        self.assertEqual(len(c.getLabels()), 0)
+
+    def testLengthMismatch(self):
+        c = Components.IComponents()
+        self.assertRaises(ValueError, c.addEdges, [1, 2], [1])
+
+
+class SComponentsCheck(unittest.TestCase):
+
+    def testAddEdges(self):
+        c = Components.SComponents()
+        self.assertEqual(c.addEdges([b"1", b"1", b"4"], [b"2", b"3", b"5"]), 3)
+        self.assertEqual(c.getTokens(), [b"1", b"2", b"3", b"4", b"5"])
+        self.assertEqual(c.getLabels().tolist(), [0, 0, 0, 1, 1])
+        self.assertEqual(c.getComponents(),
+                         [[b"1", b"2", b"3"], [b"4", b"5"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
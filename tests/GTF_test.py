@@ -1,5 +1,7 @@
 import unittest
 import os
+import shutil
+import tempfile
 import cgatcore.iotools as iotools
 import cgat.GTF as GTF
 
@@ -17,5 +19,103 @@ class TestIteration(unittest.TestCase):
                          100)
 
 
+class TestSorting(unittest.TestCase):
+
+    filename = os.path.join(os.path.dirname(__file__), "gtf2gtf.py",
+                            "hg19.small.gtf.gz")
+
+    sort_orders = ("gene", "gene+transcript", "contig+gene", "transcript",
+                   "position", "position+gene", "gene+position")
+
+    def read(self):
+        with iotools.open_file(self.filename) as inf:
+            return list(GTF.iterator(inf))
+
+    def test_external_sort_is_same_as_sort_in_memory(self):
+
+        records = self.read()
+        for sort_order in self.sort_orders:
+            expected = [str(x) for x in
+                        GTF.iterator_sorted(records, sort_order=sort_order)]
+            for max_entries in (1, 7, len(records) + 1):
+                result = [str(x) for x in GTF.iterator_sorted_external(
+                    records, sort_order=sort_order, max_entries=max_entries)]
+                self.assertEqual(result, expected)
+
+    def test_external_sort_fails_for_unknown_sort_order(self):
+
+        self.assertRaises(ValueError, list,
+                          GTF.iterator_sorted_external(
+                              self.read(), sort_order="unknown"))
+
+
+class TestIndexedGTF(unittest.TestCase):
+
+    filename = os.path.join(os.path.dirname(__file__), "gtf2gtf.py",
+                            "hg19.small.gtf.gz")
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename_indexed = os.path.join(self.tmpdir, "test.gtf.gz")
+        with iotools.open_file(self.filename) as inf:
+            self.records = list(GTF.iterator_sorted(GTF.iterator(inf),
+                                                    sort_order="position"))
+        self.index = GTF.buildIndexedGTF(self.records,
+                                         self.filename_indexed,
+                                         max_entries=7)
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_fetch_returns_all_entries_sorted_by_position(self):
+
+        self.assertEqual([str(x) for x in self.index.fetch()],
+                         [str(x) for x in self.records])
+        self.assertEqual([str(x) for x in self.index.fetch()],
+                         [str(x) for x in self.records])
+
+    def test_fetch_region(self):
+
+        contig = self.records[0].contig
+        start, end = self.records[0].start, self.records[0].start + 10000
+        expected = [str(x) for x in self.records
+                    if x.contig == contig and x.start < end and x.end > start]
+        self.assertEqual(
+            [str(x) for x in self.index.fetch(contig, start, end)],
+            expected)
+        self.assertEqual(list(self.index.fetch("unknown")), [])
+
+    def test_ids_are_same_as_filter(self):
+
+        gene_ids = set([x.gene_id for x in self.records][::3])
+        self.assertEqual(
+            [str(x) for x in self.index.iterator_ids(gene_ids)],
+            [str(x) for x in self.records if x.gene_id in gene_ids])
+
+        transcript_ids = set([x.transcript_id for x in self.records][::5])
+        self.assertEqual(
+            [str(x) for x in self.index.iterator_ids(transcript_ids,
+                                                     by="transcript")],
+            [str(x) for x in self.records
+             if x.transcript_id in transcript_ids])
+
+    def test_unknown_ids(self):
+
+        self.assertEqual(list(self.index.iterator_ids(["unknown"])), [])
+        self.assertFalse(self.index.hasId("unknown"))
+        self.assertRaises(KeyError, list, self.index.getGenes(["unknown"]))
+
+    def test_side_index_is_rebuilt(self):
+
+        gene_id = self.records[0].gene_id
+        expected = [str(x) for x in self.index.getGene(gene_id)]
+        os.unlink(self.filename_indexed + ".ids.gz")
+        index = GTF.IndexedGTF(self.filename_indexed)
+        self.assertEqual([str(x) for x in index.getGene(gene_id)], expected)
+        self.assertTrue(os.path.exists(self.filename_indexed + ".ids.gz"))
+        index.close()
+
+
 if __name__ == "__main__":
     unittest.main()
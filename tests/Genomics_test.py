@@ -0,0 +1,87 @@
+"""unit testing module for the Genomics.py module."""
+
+import random
+import unittest
+
+import cgat.Genomics as Genomics
+
+
+def translateCodons(sequence, **kwargs):
+    """translate codon by codon with MapCodon2AA."""
+    residues = []
+    for x in range(0, len(sequence), 3):
+        codon = sequence[x:x + 3]
+        if kwargs.get("prefer_lowercase", True):
+            is_lower = any([c in "acgtnx" for c in codon])
+        else:
+            is_lower = all([c in "acgtnx" for c in codon])
+        aa = Genomics.MapCodon2AA(codon,
+                                  is_seleno=kwargs.get("is_seleno", False),
+                                  ignore_n=kwargs.get("ignore_n", False))
+        if is_lower:
+            residues.append(aa.lower())
+        else:
+            residues.append(aa.upper())
+    return "".join(residues)
+
+
+class TranslateCheck(unittest.TestCase):
+
+    def testTranslate(self):
+        self.assertEqual(Genomics.translate("ATGTGGTAA"), "MWX")
+        self.assertEqual(Genomics.translate("ATGtggTAA"), "MwX")
+        self.assertEqual(Genomics.translate("ATGTGA", is_seleno=True), "MU")
+
+    def testGapsAndAmbiguousCodons(self):
+        self.assertEqual(Genomics.translate("---ATG"), "-M")
+        self.assertEqual(Genomics.translate("GCNAAN"), "AX")
+        self.assertEqual(Genomics.translate("GCNAAN", ignore_n=True), "A?")
+
+    def testIncompleteCodon(self):
+        self.assertEqual(Genomics.translate("ATGGC"), "MA")
+        self.assertEqual(Genomics.translate("ATGA"), "MX")
+
+    def testCase(self):
+        self.assertEqual(Genomics.translate("GAtatg"), "dm")
+        self.assertEqual(
+            Genomics.translate("GAtatg", prefer_lowercase=False), "Dm")
+
+    def testRandom(self):
+        random.seed(1)
+        for x in range(1000):
+            sequence = "".join(
+                [random.choice("ACGTacgtNnXx-.R")
+                 for y in range(random.randint(0, 20))])
+            for kwargs in ({},
+                           {"is_seleno": True},
+                           {"prefer_lowercase": False},
+                           {"ignore_n": True}):
+                self.assertEqual(Genomics.translate(sequence, **kwargs),
+                                 translateCodons(sequence, **kwargs))
+
+    def testBatch(self):
+        random.seed(1)
+        sequences = ["".join([random.choice("ACGTacgtN")
+                              for y in range(random.randint(0, 50))])
+                     for x in range(100)]
+        self.assertEqual(Genomics.translateBatch(sequences),
+                         [translateCodons(x) for x in sequences])
+        self.assertEqual(Genomics.translateBatch([]), [])
+
+    def testSixFrames(self):
+        sequence = "ATGAAACCCGGGTTTAGC"
+        frames = Genomics.translateSixFrames(sequence)
+        reverse = Genomics.reverse_complement(sequence)
+        self.assertEqual(frames[0], "MKPGFS")
+        self.assertEqual(frames[1], translateCodons(sequence[1:16]))
+        self.assertEqual(frames[2], translateCodons(sequence[2:17]))
+        self.assertEqual(frames[3], translateCodons(reverse))
+        self.assertEqual(frames[4], translateCodons(reverse[1:16]))
+        self.assertEqual(frames[5], translateCodons(reverse[2:17]))
+
+    def testSixFramesShortSequence(self):
+        self.assertEqual(Genomics.translateSixFrames("AT"), [""] * 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,193 @@
+"""unit testing module for the IndexedGenome.py module."""
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+import cgat.IndexedGenome as IndexedGenome
+
+
+class SortedArrayCheck(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+        self.intervals = []
+        self.index = IndexedGenome.SortedArray()
+        for x in range(500):
+            start = random.randint(0, 100000)
+            end = start + random.randint(1, 2000)
+            self.intervals.append((start, end, x))
+            self.index.add("chr1", start, end, x)
+
+        self.queries = []
+        for x in range(200):
+            start = random.randint(0, 100000)
+            self.queries.append((start, start + random.randint(1, 500)))
+
+    def overlapping(self, start, end):
+        return sorted([x for x in self.intervals
+                       if x[0] < end and start < x[1]])
+
+    def testGet(self):
+        for start, end in self.queries:
+            self.assertEqual(sorted(self.index.get("chr1", start, end)),
+                             self.overlapping(start, end))
+
+    def testUnknownContig(self):
+        self.assertRaises(KeyError, self.index.get, "chr2", 0, 100)
+        self.assertFalse(self.index.contains("chr2", 0, 100))
+
+    def testBatch(self):
+        starts, ends = numpy.array(self.queries).T
+        result = self.index.get_batch("chr1", starts, ends)
+        counts = self.index.count_batch("chr1", starts, ends)
+        for (start, end), hits, count in zip(self.queries, result, counts):
+            expected = self.overlapping(start, end)
+            self.assertEqual(sorted(hits), expected)
+            self.assertEqual(count, len(expected))
+
+    def testBeforeAfter(self):
+        def closest(intervals, n, key):
+            # the n closest intervals and all tied with the last one
+            if len(intervals) > n:
+                return [x for x in intervals
+                        if key(x) <= key(intervals[n - 1])]
+            return intervals
+
+        for start, end in self.queries:
+            before = sorted([x for x in self.intervals if x[1] < start],
+                            key=lambda x: -x[1])
+            after = sorted([x for x in self.intervals if x[0] >= end],
+                           key=lambda x: x[0])
+            result = self.index.before("chr1", start, end,
+                                       num_intervals=3, max_dist=None)
+            self.assertEqual([x[1] for x in result],
+                             [x[1] for x in closest(before, 3,
+                                                    lambda x: -x[1])])
+            result = self.index.after("chr1", start, end,
+                                      num_intervals=3, max_dist=None)
+            self.assertEqual([x[0] for x in result],
+                             [x[0] for x in closest(after, 3,
+                                                    lambda x: x[0])])
+            result = self.index.before("chr1", start, end,
+                                       num_intervals=3, max_dist=500)
+            self.assertEqual([x[1] for x in result],
+                             [x[1] for x in closest(before, 3,
+                                                    lambda x: -x[1])
+                              if start - x[1] <= 500])
+
+    def testTies(self):
+        quicksect = IndexedGenome.Quicksect()
+        index = IndexedGenome.SortedArray()
+        for x in range(200):
+            start = random.choice((100, 110, 120))
+            end = random.choice((200, 210, 220))
+            quicksect.add("chr1", start, end, x)
+            index.add("chr1", start, end, x)
+
+        for num_intervals in (1, 2):
+            self.assertEqual(
+                index.before("chr1", 300, 310, num_intervals, None),
+                quicksect.before("chr1", 300, 310, num_intervals, 1000))
+            self.assertEqual(
+                index.after("chr1", 0, 10, num_intervals, None),
+                quicksect.after("chr1", 0, 10, num_intervals, 1000))
+
+    def testBeforeBoundary(self):
+        index = IndexedGenome.SortedArray()
+        index.add("chr1", 100, 200, "touching")
+        index.add("chr1", 50, 150, "before")
+        index.add("chr1", 300, 400, "after")
+        self.assertEqual(index.before("chr1", 200, 250, 1, None),
+                         [(50, 150, "before")])
+        self.assertEqual(index.before("chr1", 201, 250, 1, None),
+                         [(100, 200, "touching")])
+        self.assertEqual(index.before("chr1", 150, 250, 1, None), [])
+
+    def testDistance(self):
+        starts, ends = numpy.array(self.queries).T
+        distances, before, after = self.index.distance_batch(
+            "chr1", starts, ends)
+        for (start, end), distance in zip(self.queries, distances):
+            if self.overlapping(start, end):
+                expected = 0
+            else:
+                expected = min([start - x[1] for x in self.intervals
+                                if x[1] <= start] +
+                               [x[0] - end for x in self.intervals
+                                if x[0] >= end])
+            self.assertEqual(distance, expected)
+
+    def testEmptyBatch(self):
+        offsets, indices = self.index.mIndex["chr1"].find_batch([], [])
+        self.assertEqual(list(offsets), [0])
+        self.assertEqual(len(indices), 0)
+
+
+class IndexCacheCheck(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "intervals.txt")
+        with open(self.filename, "w") as outf:
+            outf.write("some intervals")
+
+        self.index = IndexedGenome.SortedArray()
+        for x in range(100):
+            start = random.randint(0, 10000)
+            contig = random.choice(("chr1", "chr2"))
+            self.index.add(contig, start, start + random.randint(1, 500),
+                           {"id": x})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testRoundTrip(self):
+        cache = IndexedGenome.IndexCache(os.path.join(self.tmpdir, "cache"))
+        key = cache.getKey(self.filename, "counter", None)
+        self.assertEqual(cache.get(key), None)
+        cache.put(key, self.index)
+        loaded = cache.get(key)
+        self.assertEqual(sorted(loaded.mIndex.keys()), ["chr1", "chr2"])
+        for contig in ("chr1", "chr2"):
+            for start in range(0, 10000, 500):
+                self.assertEqual(
+                    self.index.get(contig, start, start + 100),
+                    loaded.get(contig, start, start + 100))
+                self.assertEqual(
+                    self.index.closest(contig, start, start + 100),
+                    loaded.closest(contig, start, start + 100))
+
+    def testKey(self):
+        cache = IndexedGenome.IndexCache(os.path.join(self.tmpdir, "cache"))
+        key = cache.getKey(self.filename, "counter", None)
+        self.assertEqual(key, cache.getKey(self.filename, "counter", None))
+        self.assertNotEqual(key, cache.getKey(self.filename, "other", None))
+        with open(self.filename, "a") as outf:
+            outf.write("more intervals")
+        self.assertNotEqual(key, cache.getKey(self.filename, "counter", None))
+
+    def testEviction(self):
+        cache = IndexedGenome.IndexCache(os.path.join(self.tmpdir, "cache"))
+        cache.put("a", self.index)
+        size = cache.getEntries()[0][1]
+        os.utime(os.path.join(self.tmpdir, "cache", "a"), (0, 0))
+        cache = IndexedGenome.IndexCache(os.path.join(self.tmpdir, "cache"),
+                                         max_size=int(size * 1.5))
+        cache.put("b", self.index)
+        self.assertFalse("a" in cache)
+        self.assertTrue("b" in cache)
+
+    def testReadOnly(self):
+        cache = IndexedGenome.IndexCache(os.path.join(self.tmpdir, "cache"))
+        cache.put("a", self.index)
+        self.assertRaises(ValueError, cache.get("a").add, "chr1", 0, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
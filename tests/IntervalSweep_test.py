@@ -0,0 +1,127 @@
+"""unit testing module for the IntervalSweep.py module."""
+
+import random
+import unittest
+
+import cgat.IntervalSweep as IntervalSweep
+
+I = IntervalSweep.Interval
+
+
+def buildIntervals(n, contigs=("chr1", "chr2"), size=1000):
+    intervals = []
+    for x in range(n):
+        start = random.randint(0, 10000)
+        intervals.append(I(random.choice(contigs),
+                           start,
+                           start + random.randint(1, size),
+                           x))
+    return sorted(intervals, key=lambda x: (x.contig, x.start))
+
+
+def overlap(a, b):
+    return a.contig == b.contig and a.start < b.end and b.start < a.end
+
+
+class OverlapCheck(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+        self.query = buildIntervals(300)
+        self.reference = buildIntervals(200, contigs=("chr1", "chr3"))
+
+    def testOverlaps(self):
+        for query, hits in IntervalSweep.iterate_overlaps(
+                self.query, self.reference):
+            expected = [x for x in self.reference if overlap(query, x)]
+            self.assertEqual(sorted(hits[0]), sorted(expected))
+
+    def testMultipleReferences(self):
+        result = list(IntervalSweep.iterate_overlaps(
+            self.query, self.reference, self.query))
+        self.assertEqual(len(result), len(self.query))
+        for query, hits in result:
+            self.assertEqual(len(hits), 2)
+            self.assertTrue(query in hits[1])
+
+    def testCoveredBases(self):
+        for query, hits in IntervalSweep.iterate_overlaps(
+                self.query, self.reference):
+            covered = set()
+            for x in hits[0]:
+                covered.update(range(max(x.start, query.start),
+                                     min(x.end, query.end)))
+            self.assertEqual(
+                IntervalSweep.covered_bases(query.start, query.end, hits[0]),
+                len(covered))
+
+    def testNearest(self):
+        for query, upstream, overlapping, downstream in \
+                IntervalSweep.iterate_nearest(self.query, self.reference):
+            same_contig = [x for x in self.reference
+                           if x.contig == query.contig]
+            before = [x for x in same_contig if x.end <= query.start]
+            after = [x for x in same_contig if x.start >= query.end]
+            if before:
+                self.assertEqual(upstream.end, max([x.end for x in before]))
+            else:
+                self.assertEqual(upstream, None)
+            if after:
+                self.assertEqual(downstream.start,
+                                 min([x.start for x in after]))
+            else:
+                self.assertEqual(downstream, None)
+
+    def testUnsortedQuery(self):
+        self.assertRaises(
+            ValueError, list,
+            IntervalSweep.iterate_overlaps(self.query[::-1], self.reference))
+
+    def testUnsortedReference(self):
+        reference = [I("chr1", 100, 200, 0), I("chr1", 50, 200, 1)]
+        self.assertRaises(
+            ValueError, list,
+            IntervalSweep.iterate_overlaps(self.query, reference))
+
+
+class ChunksCheck(unittest.TestCase):
+
+    def testEmpty(self):
+        self.assertEqual(list(IntervalSweep.iterate_chunks([])), [])
+
+    def testOverlapping(self):
+        intervals = [I("chr1", 0, 10, 0),
+                     I("chr1", 5, 15, 1),
+                     I("chr1", 15, 20, 2),
+                     I("chr1", 21, 30, 3),
+                     I("chr2", 0, 10, 4)]
+        self.assertEqual(
+            [[x.value for x in chunk]
+             for chunk in IntervalSweep.iterate_chunks(intervals)],
+            [[0, 1, 2], [3], [4]])
+        self.assertEqual(
+            [[x.value for x in chunk]
+             for chunk in IntervalSweep.iterate_chunks(
+                 intervals, max_distance=1)],
+            [[0, 1, 2, 3], [4]])
+
+    def testPartition(self):
+        intervals = [I("chr1", 0, 10, "+"),
+                     I("chr1", 5, 15, "-"),
+                     I("chr1", 8, 20, "+")]
+        self.assertEqual(
+            [[x.start for x in chunk]
+             for chunk in IntervalSweep.iterate_chunks(
+                 intervals, partition=lambda x: x.value)],
+            [[0, 8], [5]])
+
+    def testMergeStreams(self):
+        a = [I("chr1", 0, 10, 0), I("chr2", 0, 10, 0)]
+        b = [I("chr1", 5, 10, 1), I("chr1", 20, 30, 1)]
+        self.assertEqual(
+            [(x.contig, x.start) for x in IntervalSweep.merge_streams(a, b)],
+            [("chr1", 0), ("chr1", 5), ("chr1", 20), ("chr2", 0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
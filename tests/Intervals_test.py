@@ -1,6 +1,7 @@
 """unit testing module for the Tree.py class."""
 
 import cgat.Intervals as Intervals
+import random
 import unittest
 
 
@@ -109,5 +110,53 @@ class FromArrayCheck(unittest.TestCase):
             Intervals.fromArray([not x for x in a]), [(3, 6), (9, 12)])
 
 
+class ArrayCheck(unittest.TestCase):
+    """check that array functions agree with list functions."""
+
+    def setUp(self):
+        random.seed(1)
+
+    def buildIntervals(self, n):
+        intervals = []
+        for x in range(n):
+            start = random.randint(0, 1000)
+            intervals.append((start, start + random.randint(0, 50)))
+        return intervals
+
+    def check(self, list_result, array_result):
+        self.assertEqual(list_result, Intervals.toList(array_result))
+
+    def testEmpty(self):
+        self.assertEqual(Intervals.combineArray([]).shape, (0, 2))
+        self.assertEqual(Intervals.intersectArray([], [(0, 5)]).shape, (0, 2))
+        self.check([(0, 10)], Intervals.complementArray([], 0, 10))
+        self.check([(0, 5)], Intervals.truncateArray([(0, 5)], []))
+
+    def testCombine(self):
+        for x in range(100):
+            intervals = self.buildIntervals(random.randint(1, 50))
+            self.check(Intervals.combine(list(intervals)),
+                       Intervals.combineArray(intervals))
+            self.check(Intervals.combineAtDistance(list(intervals), 10),
+                       Intervals.combineAtDistanceArray(intervals, 10))
+            self.check(Intervals.complement(list(intervals), 0, 2000),
+                       Intervals.complementArray(intervals, 0, 2000))
+
+    def testIntersect(self):
+        for x in range(100):
+            a = Intervals.combine(self.buildIntervals(random.randint(1, 50)))
+            b = Intervals.combine(self.buildIntervals(random.randint(1, 50)))
+            self.check(Intervals.intersect(list(a), list(b)),
+                       Intervals.intersectArray(a, b))
+            self.assertEqual(Intervals.calculateOverlap(list(a), list(b)),
+                             Intervals.calculateOverlapArray(a, b))
+            self.check(Intervals.truncate(list(a), list(b)),
+                       Intervals.truncateArray(a, b))
+
+    def testInvalidShape(self):
+        self.assertRaises(ValueError, Intervals.asIntervalArray,
+                          [(0, 1, 2)])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,71 @@
+"""unit testing module for the LazyImport.py module."""
+
+import sys
+import unittest
+
+import cgat.LazyImport as LazyImport
+
+
+class LazyModuleCheck(unittest.TestCase):
+
+    def testImportOnAccess(self):
+        module = LazyImport.LazyModule("json")
+        self.assertFalse(LazyImport.isLoaded(module))
+        self.assertEqual(module.dumps([1]), "[1]")
+        self.assertTrue(LazyImport.isLoaded(module))
+        # attributes are copied after the import
+        self.assertTrue("dumps" in module.__dict__)
+
+    def testSubmodule(self):
+        module = LazyImport.LazyModule("xml")
+        self.assertEqual(module.dom.__name__, "xml.dom")
+        self.assertRaises(AttributeError, getattr, module, "no_such_module")
+
+    def testMissingModule(self):
+        # no error until the module is used
+        module = LazyImport.LazyModule("cgat_no_such_module")
+        self.assertRaises(ImportError, getattr, module, "open")
+
+    def testIsAvailable(self):
+        self.assertTrue(LazyImport.isAvailable("json"))
+        self.assertFalse(LazyImport.isAvailable("cgat_no_such_module"))
+        self.assertFalse(LazyImport.isAvailable("json.no_such_module"))
+
+    def testNotImportedByIsAvailable(self):
+        name = "xml.sax.saxutils"
+        if name in sys.modules:
+            return
+        self.assertTrue(LazyImport.isAvailable(name))
+        self.assertFalse(name in sys.modules)
+
+
+class ProfileImportsCheck(unittest.TestCase):
+
+    lines = [
+        "import time: self [us] | cumulative | imported package",
+        "import time:       150 |        150 |   _json",
+        "import time:       300 |        450 | json.decoder",
+        "import time:      1200 |       1650 | json",
+        "some other output"]
+
+    def testParse(self):
+        self.assertEqual(LazyImport.parseImportTime(self.lines),
+                         [("_json", 1, 150, 150),
+                          ("json.decoder", 0, 300, 450),
+                          ("json", 0, 1200, 1650)])
+
+    def testProfile(self):
+        result = LazyImport.profileImports("json")
+        names = [x[0] for x in result]
+        self.assertTrue("json" in names)
+        for name, depth, self_time, cumulative_time in result:
+            self.assertTrue(depth >= 0)
+            self.assertTrue(cumulative_time >= self_time)
+
+    def testProfileMissing(self):
+        self.assertRaises(ImportError,
+                          LazyImport.profileImports, "cgat_no_such_module")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""unit testing module for the Motifs.py module."""
+
+import random
+import re
+import unittest
+
+import numpy
+
+import cgat.Genomics as Genomics
+import cgat.Motifs as Motifs
+
+
+def countRegex(motif, sequence):
+    """count overlapping matches of IUPAC *motif* with a regex."""
+    pattern = "".join(["[%s]" % Motifs.iupacdict[x] for x in motif])
+    return len(re.findall("(?=%s)" % pattern, sequence))
+
+
+class DictFasta(object):
+    """minimal indexed fasta file from a dictionary of sequences."""
+
+    def __init__(self, sequences):
+        self.sequences = sequences
+        self.nrequests = 0
+
+    def getSequence(self, contig, strand="+", start=0, end=0):
+        self.nrequests += 1
+        return self.sequences[contig][start:end]
+
+
+class MotifScannerCheck(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+
+    def testCount(self):
+        scanner = Motifs.MotifScanner(["ACG", "NN"], both_strands=False)
+        self.assertEqual(list(scanner.count("ACGTACGN")), [2, 6])
+
+    def testBothStrands(self):
+        scanner = Motifs.MotifScanner(["AAC", "GATC"])
+        # GTT is the reverse complement of AAC, palindromes match twice
+        self.assertEqual(list(scanner.count("AACGTTGATC")), [2, 2])
+        self.assertEqual(scanner.scan("AACGTTGATC"),
+                         [("AAC", "+", 0, 3),
+                          ("AAC", "-", 3, 6),
+                          ("GATC", "+", 6, 10),
+                          ("GATC", "-", 6, 10)])
+
+    def testCase(self):
+        scanner = Motifs.MotifScanner(["AC"], both_strands=False)
+        self.assertEqual(list(scanner.count("ACacAc")), [3])
+        scanner = Motifs.MotifScanner(["AC", "ac"], both_strands=False,
+                                      ignore_case=False)
+        self.assertEqual(list(scanner.count("ACacAc")), [1, 1])
+
+    def testInvalidMotif(self):
+        self.assertRaises(ValueError, Motifs.MotifScanner, ["AC.G"])
+        self.assertRaises(ValueError, Motifs.MotifScanner, [""])
+
+    def testRandom(self):
+        for x in range(200):
+            sequence = "".join([random.choice("ACGTN")
+                                for y in range(random.randint(0, 200))])
+            motifs = ["".join([random.choice("ACGTRYSWN")
+                               for y in range(random.randint(1, 5))])
+                      for z in range(3)]
+            scanner = Motifs.MotifScanner(motifs)
+            reverse = Genomics.reverse_complement(sequence)
+            self.assertEqual(
+                list(scanner.count(sequence)),
+                [countRegex(m, sequence) + countRegex(m, reverse)
+                 for m in motifs])
+
+    def testCountIntervals(self):
+        fasta = DictFasta(
+            dict([("chr%i" % x, "".join([random.choice("ACGT")
+                                         for y in range(5000)]))
+                  for x in range(1, 3)]))
+        intervals = []
+        for x in range(200):
+            start = random.randint(0, 4500)
+            intervals.append((random.choice(["chr1", "chr2"]),
+                              start,
+                              start + random.randint(0, 500)))
+        scanner = Motifs.MotifScanner(["TTA", "GATC", "RYN"])
+        counts = scanner.countIntervals(fasta, intervals)
+        self.assertEqual(counts.shape, (len(intervals), 3))
+        self.assertTrue(fasta.nrequests < len(intervals))
+        expected = numpy.array(
+            [scanner.count(fasta.getSequence(contig, "+", start, end))
+             for contig, start, end in intervals])
+        self.assertTrue((counts == expected).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
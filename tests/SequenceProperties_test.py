@@ -0,0 +1,100 @@
+"""unit testing module for the SequenceProperties.py module."""
+
+import random
+import unittest
+
+import cgat.SequenceProperties as SequenceProperties
+
+
+class CompositionCheck(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+        self.sequence = "".join(
+            [random.choice("ACGTacgtNX-") for x in range(3001)])
+
+    def testCounts(self):
+        composition = SequenceProperties.SequenceComposition(self.sequence)
+        counts, others = composition.countCharacters("ACGTN", upper=True)
+        for x in "ACGTN":
+            self.assertEqual(counts[x], self.sequence.upper().count(x))
+        self.assertEqual(others, len(self.sequence) - sum(counts.values()))
+
+    def testDinucleotides(self):
+        composition = SequenceProperties.SequenceComposition(self.sequence)
+        counts, others = composition.getDinucleotideCounts()
+        dinucleotides = [self.sequence[x:x + 2]
+                         for x in range(len(self.sequence) - 1)]
+        for x, a in enumerate("ACGT"):
+            for y, b in enumerate("ACGT"):
+                self.assertEqual(counts[x, y], dinucleotides.count(a + b))
+        self.assertEqual(others, len(dinucleotides) - counts.sum())
+
+    def testCodons(self):
+        composition = SequenceProperties.SequenceComposition(self.sequence)
+        codons = [self.sequence[x:x + 3]
+                  for x in range(0, len(self.sequence), 3)]
+        expected = {}
+        for codon in codons:
+            expected[codon] = expected.get(codon, 0) + 1
+        self.assertEqual(composition.getCodonCounts(), expected)
+
+    def testRegions(self):
+        composition = SequenceProperties.SequenceComposition("NNACGNxTT")
+        self.assertEqual(composition.getRegions("N"), (3, 2, 2))
+        self.assertEqual(composition.getRegions("xN"), (4, 2, 2))
+
+    def testCompositionIsShared(self):
+        a = SequenceProperties.getComposition(self.sequence)
+        b = SequenceProperties.getComposition(self.sequence)
+        self.assertTrue(a is b)
+        c = SequenceProperties.getComposition(self.sequence[:-1])
+        self.assertFalse(a is c)
+
+
+class CounterCheck(unittest.TestCase):
+
+    def testNA(self):
+        counter = SequenceProperties.SequencePropertiesNA()
+        counter.loadSequence("AACGtn-X")
+        self.assertEqual(counter.mCountsNA,
+                         {"G": 1, "A": 2, "T": 1, "C": 1, "N": 1})
+        self.assertEqual(counter.mCountsOthers, 2)
+        self.assertEqual(counter.mCountsGC, 2)
+        self.assertEqual(counter.mCountsAT, 3)
+
+    def testCpg(self):
+        counter = SequenceProperties.SequencePropertiesCpg()
+        counter.loadSequence("ACGCGT")
+        self.assertEqual(counter.mCountsDinuc["CG"], 2)
+        self.assertEqual(counter.getFields(), ["2", "0.6667", "3.0000"])
+
+    def testDegeneracy(self):
+        counter = SequenceProperties.SequencePropertiesDegeneracy()
+        counter.loadSequence("GCTTAAATGNNN")
+        counter.updateProperties()
+        self.assertEqual(counter.mNStopCodons, 1)
+        self.assertEqual(counter.mCounts[0]["N"], 1)
+        # GCT: 4-fold degenerate third position
+        self.assertEqual(counter.mCountsDegeneracy[2][4]["T"], 1)
+
+    def testDegeneracyUnknownCharacter(self):
+        counter = SequenceProperties.SequencePropertiesDegeneracy()
+        self.assertRaises(KeyError, counter.loadSequence, "GCTRAA")
+
+    def testAminoAcids(self):
+        counter = SequenceProperties.SequencePropertiesAminoAcids()
+        counter.loadSequence("MKV-K*")
+        self.assertEqual(counter.mCountsAA["K"], 2)
+        self.assertEqual(counter.mOtherCounts, 1)
+
+    def testGaps(self):
+        counter = SequenceProperties.SequencePropertiesGaps()
+        counter.loadSequence("ACNNNGTnnA")
+        self.assertEqual((counter.ngaps,
+                          counter.nseq_regions,
+                          counter.ngap_regions), (5, 3, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+"""unit testing module for the ToolRegistry.py module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import cgat.ToolRegistry as ToolRegistry
+
+
+def writeTool(path, name, tags):
+    with open(os.path.join(path, name + ".py"), "w") as outf:
+        outf.write("'''\n%s.py - a tool\n\n" % name)
+        if tags is not None:
+            outf.write(":Tags: %s\n" % tags)
+        outf.write("'''\n")
+
+
+class RegistryCheck(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        writeTool(self.path, "bed2bed", "Genomics Intervals BED")
+        writeTool(self.path, "gtf2gtf", "Genomics  Genesets")
+        writeTool(self.path, "notags", None)
+        writeTool(self.path, "__init__", None)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def testBuild(self):
+        registry = ToolRegistry.buildRegistry(self.path)
+        self.assertEqual(sorted(registry["tools"].keys()),
+                         ["bed2bed", "gtf2gtf", "notags"])
+        self.assertEqual(registry["tools"]["gtf2gtf"]["tags"],
+                         ["Genomics", "Genesets"])
+        self.assertEqual(registry["tools"]["notags"]["tags"], [])
+
+    def testKeywords(self):
+        keywords = ToolRegistry.mapKeyword2Tool(
+            ToolRegistry.buildRegistry(self.path))
+        self.assertEqual(keywords["Genomics"], ["bed2bed", "gtf2gtf"])
+        self.assertEqual(keywords["BED"], ["bed2bed"])
+
+    def testSavedRegistryIsUsed(self):
+        ToolRegistry.writeRegistry(self.path)
+        registry = ToolRegistry.readRegistry(
+            os.path.join(self.path, ToolRegistry.REGISTRY_FILENAME))
+        self.assertEqual(registry, ToolRegistry.buildRegistry(self.path))
+
+        # unchanged tools are not read again
+        registry["tools"]["bed2bed"]["tags"] = ["Cached"]
+        self.assertEqual(
+            ToolRegistry.buildRegistry(
+                self.path, registry)["tools"]["bed2bed"]["tags"],
+            ["Cached"])
+
+    def testChangedToolIsRead(self):
+        ToolRegistry.writeRegistry(self.path)
+        writeTool(self.path, "bed2bed", "Genomics Intervals BED Modified")
+        writeTool(self.path, "bed2gff", "Conversion")
+        os.unlink(os.path.join(self.path, "notags.py"))
+
+        registry = ToolRegistry.getRegistry(self.path)
+        self.assertEqual(sorted(registry["tools"].keys()),
+                         ["bed2bed", "bed2gff", "gtf2gtf"])
+        self.assertEqual(registry["tools"]["bed2bed"]["tags"][-1],
+                         "Modified")
+
+    def testInvalidRegistry(self):
+        filename = os.path.join(self.path, ToolRegistry.REGISTRY_FILENAME)
+        with open(filename, "w") as outf:
+            outf.write("not json")
+        self.assertEqual(ToolRegistry.readRegistry(filename), None)
+        self.assertEqual(
+            sorted(ToolRegistry.getRegistry(self.path)["tools"].keys()),
+            ["bed2bed", "gtf2gtf", "notags"])
+
+
+if __name__ == "__main__":
+    unittest.main()
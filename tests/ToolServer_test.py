@@ -0,0 +1,94 @@
+"""unit testing module for the ToolServer.py module."""
+
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import cgat.ToolServer as ToolServer
+
+CLIENT = """
+import sys
+import cgat.ToolServer as ToolServer
+code = ToolServer.run(sys.argv[1], sys.argv[2:])
+sys.exit(255 if code is None else code)
+"""
+
+
+def echoRunner(argv):
+    """copy stdin to stdout in upper case and exit with the status
+    given on the command line."""
+    sys.stdout.write(sys.stdin.read().upper())
+    sys.stderr.write("cwd=%s\n" % os.getcwd())
+    if argv[1] == "fail":
+        raise ValueError("failure")
+    sys.exit(int(argv[1]))
+
+
+class ToolServerCheck(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmpdir, "cgat.sock")
+        self.server = multiprocessing.get_context("fork").Process(
+            target=ToolServer.serve,
+            args=(self.socket_path, echoRunner),
+            kwargs={"workers": 2, "modules": ()})
+        self.server.start()
+        for x in range(100):
+            if ToolServer.isListening(self.socket_path):
+                break
+            time.sleep(0.05)
+
+    def tearDown(self):
+        self.server.terminate()
+        self.server.join()
+        shutil.rmtree(self.tmpdir)
+
+    def runClient(self, *args):
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(
+            [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))] +
+            env.get("PYTHONPATH", "").split(os.pathsep))
+        return subprocess.run(
+            [sys.executable, "-c", CLIENT, self.socket_path, "cgat"] +
+            list(args),
+            input=b"some input\n",
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=self.tmpdir,
+            env=env)
+
+    def testRun(self):
+        # more requests than workers
+        for x in range(5):
+            result = self.runClient("0")
+            self.assertEqual(result.returncode, 0)
+            self.assertEqual(result.stdout, b"SOME INPUT\n")
+            self.assertEqual(result.stderr.decode().strip(),
+                             "cwd=%s" % os.path.realpath(self.tmpdir))
+
+    def testExitCode(self):
+        self.assertEqual(self.runClient("3").returncode, 3)
+
+    def testException(self):
+        result = self.runClient("fail")
+        self.assertEqual(result.returncode, 1)
+        self.assertTrue(b"ValueError: failure" in result.stderr)
+
+    def testNoServer(self):
+        self.assertEqual(
+            ToolServer.run(os.path.join(self.tmpdir, "other.sock"), []),
+            None)
+
+    def testServerRunning(self):
+        self.assertRaises(OSError, ToolServer.serve,
+                          self.socket_path, echoRunner, 1, ())
+
+
+if __name__ == "__main__":
+    unittest.main()
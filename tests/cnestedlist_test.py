@@ -88,6 +88,57 @@ class TestIntervalDB(unittest.TestCase):
             self.assertRaises(IndexError, index.find_overlap, x, x)
 
 
+class TestIntervalDBBatch(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+        self.l = []
+        for x in range(500):
+            start = random.randint(0, 10000)
+            self.l.append((start, start + random.randint(1, 500), x))
+        self.index = IntervalDB()
+        self.index.fromlist(self.l)
+        self.starts = [random.randint(0, 10000) for x in range(200)]
+        self.ends = [x + random.randint(1, 1000) for x in self.starts]
+
+    def testFindOverlapsBatch(self):
+        offsets, indices, starts, ends = self.index.find_overlaps_batch(
+            self.starts, self.ends)
+        self.assertEqual(len(offsets), len(self.starts) + 1)
+        for x, (start, end) in enumerate(zip(self.starts, self.ends)):
+            a, b = offsets[x], offsets[x + 1]
+            result = sorted(zip(starts[a:b], ends[a:b], indices[a:b]))
+            expected = sorted(self.index.find_overlap_list(start, end))
+            self.assertEqual(result, expected)
+
+    def testCountOverlapsBatch(self):
+        counts = self.index.count_overlaps_batch(self.starts, self.ends)
+        for x, (start, end) in enumerate(zip(self.starts, self.ends)):
+            self.assertEqual(
+                counts[x], len(self.index.find_overlap_list(start, end)))
+
+    def testBasesOverlappedBatch(self):
+        bases = self.index.bases_overlapped_batch(self.starts, self.ends)
+        for x, (start, end) in enumerate(zip(self.starts, self.ends)):
+            covered = set()
+            for a, b, v in self.index.find_overlap_list(start, end):
+                covered.update(range(max(a, start), min(b, end)))
+            self.assertEqual(bases[x], len(covered))
+
+    def testEmptyBatch(self):
+        offsets, indices, starts, ends = self.index.find_overlaps_batch(
+            [], [])
+        self.assertEqual(list(offsets), [0])
+        self.assertEqual(len(indices), 0)
+        self.assertEqual(len(self.index.count_overlaps_batch([], [])), 0)
+
+    def testEmptyIntervals(self):
+        self.assertRaises(IndexError, self.index.find_overlaps_batch,
+                          [10, 20], [20, 20])
+        self.assertRaises(IndexError, self.index.count_overlaps_batch,
+                          [20], [10])
+
+
 class TestIntervalFileDB(TestIntervalDB):
 
     def setUp(self):
@@ -94,6 +94,19 @@ class TestNCLSimple(unittest.TestCase):
         for x in range(0, len(bits)):
             self.assertRaises(IndexError, index.find, x, x)
 
+    def testBatch(self):
+        index = self.buildIndex(self.l)
+        starts = [a[0] for a, b in self.tests]
+        ends = [a[1] for a, b in self.tests]
+        offsets, indices, hit_starts, hit_ends = index.find_batch(starts, ends)
+        for x, (a, b) in enumerate(self.tests):
+            self.assertEqual(
+                tuple(sorted(indices[offsets[x]:offsets[x + 1]])), b)
+        self.assertEqual(list(index.count_batch(starts, ends)),
+                         [len(b) for a, b in self.tests])
+        self.assertEqual(list(index.bases_overlapped_batch(starts, ends)),
+                         [5, 15, 0, 35, 0])
+
 
 class TestNCL(TestNCLSimple):
 
@@ -137,5 +150,38 @@ class TestNCLDisk(TestNCLSimple):
     def tearDown(self):
         shutil.rmtree(self.tmpdir)
 
+
+class TestValueStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.tmpfile = os.path.join(self.tmpdir, "tmp")
+
+    def testRoundTrip(self):
+        values = ["gene1", "", 10, -5, 2 ** 70, (1, "a"), None, b"x"]
+        writeValueStore(self.tmpfile, values)
+        store = ValueStore(self.tmpfile)
+        self.assertEqual(len(store), len(values))
+        self.assertEqual([store[x] for x in range(len(values))], values)
+        self.assertRaises(IndexError, store.__getitem__, len(values))
+
+    def testEmpty(self):
+        writeValueStore(self.tmpfile, [])
+        store = ValueStore(self.tmpfile)
+        self.assertEqual(len(store), 0)
+
+    def testNCLValues(self):
+        index = NCL(filestem=self.tmpfile)
+        index.add(10, 20, "a")
+        index.add(15, 30, ("b", 1))
+        del index
+        index = NCL(filestem=self.tmpfile)
+        self.assertEqual(sorted([x[2] for x in index.find(0, 100)], key=str),
+                         [("b", 1), "a"])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
 if __name__ == '__main__':
     unittest.main()